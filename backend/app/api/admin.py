@@ -1,7 +1,10 @@
 from typing import List, Optional
 from fastapi import APIRouter, Depends, Query, HTTPException
 from sqlmodel import Session, select
+from ..core import async_database, database
 from ..core.database import get_session
+from ..core.db_pool import async_pool_monitor, sync_pool_monitor
+from ..core.executors import executor_stats
 from ..core.deps import get_current_admin_user
 from ..core.security import get_password_hash
 from ..models.user import User, UserResponse, UserUpdate, UserCreate
@@ -696,3 +699,24 @@ async def remove_team_member_admin(
     db.commit()
     
     return success_response(message="成员已移除")
+
+
+# ==================== 运行状态 ====================
+
+@router.get("/db-pool", response_model=dict)
+async def get_db_pool_stats(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """数据库连接池统计（管理员）：借出 / 溢出连接数、获取连接等待时间直方图、连接存活时间"""
+    pools = {"sync": sync_pool_monitor.stats(database.engine.pool)}
+    if async_database.async_engine is not None:
+        pools["async"] = async_pool_monitor.stats(async_database.async_engine.sync_engine.pool)
+    return success_response(data=pools)
+
+
+@router.get("/executors", response_model=dict)
+async def get_executor_stats(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """数据库 / 加密 / 文件线程池统计（管理员）：排队数、执行中任务数、排队等待和执行耗时"""
+    return success_response(data=executor_stats())
@@ -8,12 +8,19 @@ from ..models.user import User
 from ..models.ai_config import AIConfig, AIConfigCreate, AIConfigUpdate, AIConfigResponse
 from ..core.database import get_session
 from ..core.deps import get_current_active_user
+from ..core.executors import run_in_crypto
 from ..utils.response import success_response, error_response
+from ..services.ai_config_cache import ai_config_cache
 from ..services.encryption_service import EncryptionService
 
 router = APIRouter()
 
 
+def invalidate_ai_config_cache(config: AIConfig):
+    """配置变更后清除解析缓存（全局配置影响所有用户）"""
+    ai_config_cache.invalidate(None if config.is_global else config.user_id)
+
+
 @router.get("/list")
 async def get_ai_configs(
     current_user: User = Depends(get_current_active_user),
@@ -73,8 +80,8 @@ async def create_ai_config(
             detail="配置名称已存在"
         )
     
-    # 加密 API Key
-    encrypted_api_key = EncryptionService.encrypt_api_key(data.api_key)
+    # 加密 API Key（首次加密需要派生密钥，在加密线程池中执行）
+    encrypted_api_key = await run_in_crypto(EncryptionService.encrypt_api_key, data.api_key)
     
     # 创建配置
     config = AIConfig(
@@ -88,6 +95,7 @@ async def create_ai_config(
     db.add(config)
     db.commit()
     db.refresh(config)
+    ai_config_cache.invalidate(current_user.id)
     
     return success_response(
         data=AIConfigResponse(
@@ -136,7 +144,7 @@ async def update_ai_config(
     if 'api_key' in update_data and update_data['api_key']:
         # 如果包含*号，说明是脱敏的，不更新
         if '*' not in update_data['api_key']:
-            update_data['api_key'] = EncryptionService.encrypt_api_key(update_data['api_key'])
+            update_data['api_key'] = await run_in_crypto(EncryptionService.encrypt_api_key, update_data['api_key'])
         else:
             # 删除这个字段，不更新
             del update_data['api_key']
@@ -148,6 +156,7 @@ async def update_ai_config(
     db.add(config)
     db.commit()
     db.refresh(config)
+    invalidate_ai_config_cache(config)
     
     return success_response(
         data=AIConfigResponse(
@@ -192,6 +201,7 @@ async def delete_ai_config(
     
     db.delete(config)
     db.commit()
+    invalidate_ai_config_cache(config)
     
     return success_response(message="删除成功")
 
@@ -5,7 +5,10 @@ from pathlib import Path
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
 from fastapi.responses import FileResponse
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from ..core.async_database import get_async_session
 from ..core.database import get_session
+from ..core.executors import run_in_crypto, run_in_file
 from ..core.security import verify_password, get_password_hash, create_access_token
 from ..core.config import settings
 from ..core.deps import get_current_active_user
@@ -22,23 +25,23 @@ router = APIRouter(prefix="/api/auth", tags=["认证"])
 
 
 @router.post("/register", response_model=dict)
-async def register(user_data: UserCreate, db: Session = Depends(get_session)):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_async_session)):
     """用户注册"""
     
     # 检查用户名是否已存在
     statement = select(User).where(User.username == user_data.username)
-    existing_user = db.exec(statement).first()
+    existing_user = (await db.exec(statement)).first()
     if existing_user:
         return error_response(code=1001, message="用户名已存在")
     
     # 检查邮箱是否已存在
     statement = select(User).where(User.email == user_data.email)
-    existing_email = db.exec(statement).first()
+    existing_email = (await db.exec(statement)).first()
     if existing_email:
         return error_response(code=1002, message="邮箱已被注册")
     
-    # 创建新用户
-    hashed_password = get_password_hash(user_data.password)
+    # 创建新用户（bcrypt 哈希在加密线程池中计算，不阻塞事件循环）
+    hashed_password = await run_in_crypto(get_password_hash, user_data.password)
     new_user = User(
         username=user_data.username,
         email=user_data.email,
@@ -46,8 +49,8 @@ async def register(user_data: UserCreate, db: Session = Depends(get_session)):
     )
     
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
     # 生成 token
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -77,18 +80,18 @@ async def register(user_data: UserCreate, db: Session = Depends(get_session)):
 
 
 @router.post("/login", response_model=dict)
-async def login(login_data: UserLogin, db: Session = Depends(get_session)):
+async def login(login_data: UserLogin, db: AsyncSession = Depends(get_async_session)):
     """用户登录"""
     
     # 查找用户
     statement = select(User).where(User.username == login_data.username)
-    user = db.exec(statement).first()
+    user = (await db.exec(statement)).first()
     
     if not user:
         return error_response(code=1003, message="用户名或密码错误")
     
-    # 验证密码
-    if not verify_password(login_data.password, user.hashed_password):
+    # 验证密码（bcrypt 校验在加密线程池中计算，不阻塞事件循环）
+    if not await run_in_crypto(verify_password, login_data.password, user.hashed_password):
         return error_response(code=1003, message="用户名或密码错误")
     
     # 检查用户是否激活
@@ -187,7 +190,7 @@ async def update_profile(
     
     # 更新密码
     if profile_data.password:
-        user.hashed_password = get_password_hash(profile_data.password)
+        user.hashed_password = await run_in_crypto(get_password_hash, profile_data.password)
     
     # 更新其他个人资料字段 (只支持 full_name，因为其他字段数据库中不存在)
     # 注意: nickname, phone, bio, company, location, website 字段暂不支持
@@ -266,8 +269,7 @@ async def upload_avatar(
     
     # 保存新文件
     try:
-        with open(file_path, 'wb') as f:
-            f.write(file_content)
+        await run_in_file(file_path.write_bytes, file_content)
     except Exception as e:
         return error_response(code=1009, message=f"文件保存失败: {str(e)}")
     
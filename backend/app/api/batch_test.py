@@ -1,51 +1,128 @@
 """批量测试API - 支持多组输入数据的自动化测试"""
-import time
+import logging
 from typing import List, Dict
 from fastapi import APIRouter, Depends, Query
 from sqlmodel import Session, select, func
 from datetime import datetime
 
-from ..core.database import get_session
+from ..core.database import engine, get_session
 from ..core.deps import get_current_active_user
+from ..core.executors import run_in_db
 from ..models.user import User
 from ..models.prompt import Prompt
 from ..models.quality_evaluation import (
-    BatchTestResult, BatchTestRequest, BatchTestResponse,
+    BatchTestResult, BatchTestRequest, BatchTestEstimateRequest, BatchTestResponse,
     QualityEvaluation
 )
-from ..services.openai_service import OpenAIService
-from ..services.evaluation_service import EvaluationService
+from ..services.batch_test_service import BatchTestService
+from ..services.cost_estimator import CostEstimator
+from ..services.job_service import JobService, job_service
+from ..services.quota_service import QuotaService
 from ..services.rate_limit import rate_limiter
+from ..utils.prompt_template import replace_variables
 from ..utils.response import success_response, error_response
-from .run import replace_variables
 from .prompt import check_prompt_access
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/api/batch-test", tags=["批量测试"])
 
+# 单次批量测试的最大用例数
+MAX_TEST_CASES = 50
 
-@router.post("", response_model=dict)
-async def create_batch_test(
-    test_data: BatchTestRequest,
+
+def validate_test_cases(test_cases: List[Dict]):
+    """验证测试用例数量，返回错误响应或 None"""
+    if len(test_cases) == 0:
+        return error_response(code=4001, message="至少需要1个测试用例")
+    
+    if len(test_cases) > MAX_TEST_CASES:
+        return error_response(code=4002, message=f"最多支持{MAX_TEST_CASES}个测试用例")
+    
+    return None
+
+
+def estimate_batch_test(prompt_content: str, test_cases: List[Dict], model: str, enable_evaluation: bool) -> Dict:
+    """预估批量测试的 token 用量和费用（执行 + 评测）"""
+    return CostEstimator.estimate(
+        templates=[prompt_content],
+        test_cases=test_cases,
+        model=model,
+        render=replace_variables,
+        enable_evaluation=enable_evaluation
+    )
+
+
+@router.post("/estimate", response_model=dict)
+async def estimate_batch_test_cost(
+    estimate_data: BatchTestEstimateRequest,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_session)
 ):
-    """创建并执行批量测试"""
+    """预估批量测试的 token 用量和费用，并检查剩余配额是否足够（不调用模型）"""
     
-    # 检查频率限制
-    allowed, error_msg = rate_limiter.check_rate_limit(current_user.id)
-    if not allowed:
-        return error_response(code=3001, message=error_msg)
+    error = validate_test_cases(estimate_data.test_cases)
+    if error:
+        return error
     
-    # 验证测试用例数量
-    if len(test_data.test_cases) == 0:
-        return error_response(code=4001, message="至少需要1个测试用例")
+    prompt, _ = check_prompt_access(estimate_data.prompt_id, current_user, db)
     
-    if len(test_data.test_cases) > 50:
-        return error_response(code=4002, message="最多支持50个测试用例")
+    estimates = []
+    for model in estimate_data.models or [estimate_data.model]:
+        estimate = estimate_batch_test(
+            prompt.content, estimate_data.test_cases, model, estimate_data.enable_evaluation
+        )
+        allowed, reason = QuotaService.check_budget(
+            db, current_user.id,
+            requests=estimate["call_count"],
+            tokens=estimate["total_tokens"],
+            cost=estimate["estimated_cost"]
+        )
+        estimates.append({**estimate, "quota_allowed": allowed, "quota_error": reason})
+    
+    return success_response(data={"estimates": estimates})
+
+
+def _prepare_batch_test(test_data: BatchTestRequest, current_user: User):
+    """
+    批量测试执行前的检查并创建记录（在数据库线程池中调用，使用独立会话）
+
+    提交后不过期对象，返回的 prompt / batch_test 脱离会话后仍可读取属性。
+
+    Returns:
+        (错误响应, None, None) 或 (None, prompt, batch_test)
+    """
+    with Session(engine, expire_on_commit=False) as db:
+        return _prepare_batch_test_in_session(db, test_data, current_user)
+
+
+def _prepare_batch_test_in_session(db: Session, test_data: BatchTestRequest, current_user: User):
+    # 检查配额限制
+    quota_allowed, quota_error = QuotaService.check_quota(db, current_user.id)
+    if not quota_allowed:
+        return error_response(code=3006, message=quota_error), None, None
+    
+    # 验证测试用例数量
+    error = validate_test_cases(test_data.test_cases)
+    if error:
+        return error, None, None
     
     # 加载Prompt - 统一权限检查
     prompt, _ = check_prompt_access(test_data.prompt_id, current_user, db)
     
+    # 预估整批用量，剩余配额不足时在调用模型之前拒绝
+    estimate = estimate_batch_test(
+        prompt.content, test_data.test_cases, test_data.model, test_data.enable_evaluation
+    )
+    budget_allowed, budget_error = QuotaService.check_budget(
+        db, current_user.id,
+        requests=estimate["call_count"],
+        tokens=estimate["total_tokens"],
+        cost=estimate["estimated_cost"]
+    )
+    if not budget_allowed:
+        return error_response(code=3006, message=budget_error, data=estimate), None, None
+    
     # 创建批量测试记录
     batch_test = BatchTestResult(
         user_id=current_user.id,
@@ -64,159 +141,54 @@ async def create_batch_test(
     db.commit()
     db.refresh(batch_test)
     
-    # 执行每个测试用例
-    results = []
-    total_response_time = 0
-    total_token_count = 0
-    total_cost = 0
-    total_quality_score = 0
-    success_count = 0
-    failure_count = 0
-    
-    print(f"开始执行批量测试: {test_data.test_name}, 共 {len(test_data.test_cases)} 个用例")
-    
-    for idx, test_case in enumerate(test_data.test_cases, 1):
-        print(f"执行测试用例 {idx}/{len(test_data.test_cases)}...")
-        
-        try:
-            # 替换变量
-            variables = test_case.get("variables", {})
-            final_prompt = replace_variables(prompt.content, variables)
-            
-            # 执行AI调用
-            start_time = time.time()
-            ai_result = await OpenAIService.chat_completion(
-                prompt=final_prompt,
-                model=test_data.model,
-                temperature=test_data.temperature,
-                max_tokens=2000,
-                db=db,
-                user_id=current_user.id
-            )
-            response_time = time.time() - start_time
-            
-            # 评测输出质量（如果启用）
-            quality_score = 0
-            evaluation_data = {}
-            
-            if test_data.enable_evaluation:
-                try:
-                    evaluation_result = await EvaluationService.evaluate_output_quality(
-                        output_content=ai_result["output"],
-                        prompt_content=final_prompt,
-                        db=db,
-                        user_id=current_user.id
-                    )
-                    quality_score = evaluation_result.get("overall_score", 0)
-                    evaluation_data = evaluation_result
-                    
-                    # 保存评测记录
-                    quality_eval = QualityEvaluation(
-                        user_id=current_user.id,
-                        test_type="batch",
-                        test_id=batch_test.id,
-                        prompt_id=test_data.prompt_id,
-                        prompt_content=final_prompt,
-                        output_content=ai_result["output"],
-                        accuracy_score=evaluation_result.get("accuracy_score", 0),
-                        relevance_score=evaluation_result.get("relevance_score", 0),
-                        fluency_score=evaluation_result.get("fluency_score", 0),
-                        creativity_score=evaluation_result.get("creativity_score", 0),
-                        safety_score=evaluation_result.get("safety_score", 0),
-                        overall_score=quality_score,
-                        evaluation_details=evaluation_result.get("evaluation_details", {}),
-                        safety_issues=evaluation_result.get("safety_issues", []),
-                        has_sensitive_content=evaluation_result.get("has_sensitive_content", False),
-                        response_time=response_time,
-                        token_count=ai_result["total_tokens"],
-                        cost=ai_result["cost"],
-                        cost_efficiency_score=EvaluationService.calculate_cost_efficiency(
-                            quality_score, ai_result["cost"], response_time
-                        ),
-                        strengths=evaluation_result.get("strengths", []),
-                        weaknesses=evaluation_result.get("weaknesses", []),
-                        suggestions=evaluation_result.get("suggestions", []),
-                        evaluation_model=test_data.model
-                    )
-                    db.add(quality_eval)
-                    
-                except Exception as eval_error:
-                    print(f"评测失败: {str(eval_error)}")
-                    quality_score = 0
-            
-            # 记录结果
-            test_result = {
-                "test_case_index": idx,
-                "variables": variables,
-                "expected_output": test_case.get("expected_output"),
-                "actual_output": ai_result["output"],
-                "input_tokens": ai_result["input_tokens"],
-                "output_tokens": ai_result["output_tokens"],
-                "total_tokens": ai_result["total_tokens"],
-                "response_time": round(response_time, 3),
-                "cost": ai_result["cost"],
-                "quality_score": quality_score,
-                "evaluation_data": evaluation_data,
-                "success": True,
-                "error": None
-            }
-            
-            results.append(test_result)
-            success_count += 1
-            
-            # 累计统计
-            total_response_time += response_time
-            total_token_count += ai_result["total_tokens"]
-            total_cost += ai_result["cost"]
-            total_quality_score += quality_score
-            
-            # 记录请求
-            rate_limiter.record_request(current_user.id)
-            
-        except Exception as e:
-            print(f"测试用例 {idx} 执行失败: {str(e)}")
-            
-            test_result = {
-                "test_case_index": idx,
-                "variables": test_case.get("variables", {}),
-                "expected_output": test_case.get("expected_output"),
-                "actual_output": None,
-                "input_tokens": 0,
-                "output_tokens": 0,
-                "total_tokens": 0,
-                "response_time": 0,
-                "cost": 0,
-                "quality_score": 0,
-                "evaluation_data": {},
-                "success": False,
-                "error": str(e)
-            }
-            
-            results.append(test_result)
-            failure_count += 1
-    
-    # 计算平均值
-    test_count = len(test_data.test_cases)
-    avg_response_time = total_response_time / test_count if test_count > 0 else 0
-    avg_token_count = total_token_count // test_count if test_count > 0 else 0
-    avg_cost = total_cost / test_count if test_count > 0 else 0
-    avg_quality_score = total_quality_score / success_count if success_count > 0 else 0
-    
-    # 更新批量测试记录
-    batch_test.results = results
-    batch_test.success_count = success_count
-    batch_test.failure_count = failure_count
-    batch_test.avg_response_time = round(avg_response_time, 3)
-    batch_test.avg_token_count = avg_token_count
-    batch_test.avg_cost = round(avg_cost, 6)
-    batch_test.avg_quality_score = round(avg_quality_score, 2)
-    batch_test.completed_at = datetime.utcnow()
+    return None, prompt, batch_test
+
+
+@router.post("", response_model=dict)
+async def create_batch_test(
+    test_data: BatchTestRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_session)
+):
+    """创建并执行批量测试"""
+    
+    # 检查频率限制
+    allowed, error_msg = await rate_limiter.check_rate_limit_async(current_user.id)
+    if not allowed:
+        return error_response(code=3001, message=error_msg)
     
-    db.add(batch_test)
-    db.commit()
-    db.refresh(batch_test)
+    # 配额检查、Prompt 加载、预估和写入记录都是同步数据库操作，在数据库线程池中用独立会话执行
+    error, prompt, batch_test = await run_in_db(_prepare_batch_test, test_data, current_user)
+    if error:
+        return error
+    
+    # 默认提交后台任务，立即返回任务 ID
+    if not test_data.sync:
+        # submit 会操作事件循环中的任务队列，必须在事件循环线程中调用
+        job = job_service.submit(
+            db=db,
+            user_id=current_user.id,
+            job_type="batch_test",
+            payload={
+                "prompt_content": prompt.content,
+                "enable_evaluation": test_data.enable_evaluation
+            },
+            resource_id=batch_test.id,
+            progress_total=batch_test.total_cases
+        )
+        return success_response(data=JobService.to_response(job), message="批量测试已提交")
+    
+    logger.info("开始执行批量测试: %s, 共 %d 个用例", test_data.test_name, len(test_data.test_cases))
+    
+    # 并发执行所有测试用例（结果按 test_case_index 排序）
+    batch_test = await BatchTestService.run_batch(
+        db=db,
+        batch_test=batch_test,
+        prompt_content=prompt.content,
+        enable_evaluation=test_data.enable_evaluation
+    )
     
-    print(f"批量测试完成: 成功 {success_count}/{test_count}")
+    logger.info("批量测试完成: 成功 %d/%d", batch_test.success_count, batch_test.total_cases)
     
     # 构造响应
     response = BatchTestResponse(
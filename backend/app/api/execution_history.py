@@ -1,8 +1,9 @@
 from typing import List, Optional
 from datetime import datetime
 from fastapi import APIRouter, Depends, Query
-from sqlmodel import Session, select, and_, func
-from ..core.database import get_session
+from sqlmodel import select, and_, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+from ..core.async_database import get_async_session
 from ..core.deps import get_current_active_user
 from ..models.user import User
 from ..models.execution_history import ExecutionHistory, ExecutionHistoryResponse
@@ -21,7 +22,7 @@ async def search_execution_history(
     temperature: Optional[float] = None,
     max_tokens: Optional[int] = None,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_async_session)
 ):
     """
     搜索执行历史记录
@@ -54,7 +55,7 @@ async def search_execution_history(
         ExecutionHistory.created_at.desc()
     ).limit(1)  # 只取最新的一条
     
-    result = db.exec(statement).first()
+    result = (await db.exec(statement)).first()
     
     if result:
         # 如果提供了 variables，需要精确匹配
@@ -99,7 +100,7 @@ async def get_execution_history_list(
     skip: int = Query(0, ge=0),
     limit: int = Query(20, ge=1, le=100),
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_async_session)
 ):
     """获取执行历史列表"""
     
@@ -114,11 +115,11 @@ async def get_execution_history_list(
 
     # 统计总数（高效方式）
     count_stmt = select(func.count()).select_from(statement.subquery())
-    total = db.exec(count_stmt).one()
+    total = (await db.exec(count_stmt)).one()
 
     # 分页查询
     statement = statement.offset(skip).limit(limit)
-    results = db.exec(statement).all()
+    results = (await db.exec(statement)).all()
     
     items = []
     for result in results:
@@ -156,11 +157,11 @@ async def get_execution_history_list(
 async def delete_execution_history(
     history_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_async_session)
 ):
     """删除执行历史记录"""
     
-    history = db.get(ExecutionHistory, history_id)
+    history = await db.get(ExecutionHistory, history_id)
     
     if not history:
         return error_response(code=4001, message="历史记录不存在")
@@ -169,8 +170,8 @@ async def delete_execution_history(
     if history.user_id != current_user.id:
         return error_response(code=4002, message="无权删除该历史记录")
     
-    db.delete(history)
-    db.commit()
+    await db.delete(history)
+    await db.commit()
     
     return success_response(message="历史记录删除成功")
 
@@ -7,6 +7,7 @@ from ..models.user import User
 from ..models.uploaded_file import UploadedFile, UploadedFileResponse
 from ..core.database import get_session
 from ..core.deps import get_current_active_user
+from ..core.executors import run_in_file
 from ..services.file_service import FileService
 from ..utils.response import success_response, error_response
 
@@ -54,7 +55,8 @@ async def upload_file(
     
     # 保存文件
     try:
-        file_path, file_type = FileService.save_file(
+        file_path, file_type = await run_in_file(
+            FileService.save_file,
             file_content,
             file.filename,
             current_user.id
@@ -65,8 +67,8 @@ async def upload_file(
             detail=f"文件保存失败: {str(e)}"
         )
     
-    # 处理文件（提取内容）
-    processed = FileService.process_file(file_path, file_type)
+    # 处理文件（提取内容，文件读取和 PDF 解析在文件线程池中执行）
+    processed = await run_in_file(FileService.process_file, file_path, file_type)
     
     # 保存到数据库
     uploaded_file = UploadedFile(
@@ -150,7 +152,7 @@ async def get_file(
         )
     
     # 重新处理文件（获取最新内容）
-    processed = FileService.process_file(uploaded_file.file_path, uploaded_file.file_type)
+    processed = await run_in_file(FileService.process_file, uploaded_file.file_path, uploaded_file.file_type)
     
     response_dict = {
         'id': uploaded_file.id,
@@ -0,0 +1,87 @@
+"""后台任务API - 查询进度、取消任务"""
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+from sqlmodel import Session, select, func
+
+from ..core.database import get_session
+from ..core.deps import get_current_active_user
+from ..models.user import User
+from ..models.background_job import BackgroundJob
+from ..services.job_service import JobService, job_service
+from ..utils.response import success_response, error_response
+
+router = APIRouter(prefix="/api/jobs", tags=["后台任务"])
+
+
+@router.get("/list", response_model=dict)
+async def get_job_list(
+    job_type: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_session)
+):
+    """获取当前用户的后台任务列表"""
+    
+    statement = select(BackgroundJob).where(BackgroundJob.user_id == current_user.id)
+    if job_type:
+        statement = statement.where(BackgroundJob.job_type == job_type)
+    if status:
+        statement = statement.where(BackgroundJob.status == status)
+    statement = statement.order_by(BackgroundJob.created_at.desc())
+
+    # 统计总数
+    count_stmt = select(func.count()).select_from(statement.subquery())
+    total_count = db.exec(count_stmt).one()
+
+    # 分页
+    jobs = db.exec(statement.offset(skip).limit(limit)).all()
+    
+    return success_response(data={
+        "items": [JobService.to_response(job) for job in jobs],
+        "total": total_count,
+        "skip": skip,
+        "limit": limit
+    })
+
+
+@router.get("/{job_id}", response_model=dict)
+async def get_job_detail(
+    job_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_session)
+):
+    """获取任务状态和进度"""
+    
+    job = db.get(BackgroundJob, job_id)
+    
+    if not job:
+        return error_response(code=4003, message="任务不存在")
+    
+    # 权限检查
+    if job.user_id != current_user.id:
+        return error_response(code=4004, message="无权访问该任务")
+    
+    return success_response(data=JobService.to_response(job))
+
+
+@router.post("/{job_id}/cancel", response_model=dict)
+async def cancel_job(
+    job_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_session)
+):
+    """取消任务（已完成的用例结果会保留）"""
+    
+    job = db.get(BackgroundJob, job_id)
+    
+    if not job:
+        return error_response(code=4003, message="任务不存在")
+    
+    # 权限检查
+    if job.user_id != current_user.id:
+        return error_response(code=4004, message="无权操作该任务")
+    
+    job = job_service.cancel(db, job)
+    return success_response(data=JobService.to_response(job), message="已请求取消任务")
@@ -1,7 +1,9 @@
 from typing import List, Optional, Tuple
 from datetime import datetime
 from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
-from sqlmodel import Session, select, or_
+from sqlmodel import Session, func, select, or_
+from sqlmodel.ext.asyncio.session import AsyncSession
+from ..core.async_database import get_async_session
 from ..core.database import get_session
 from ..core.deps import get_current_active_user
 from ..models.user import User
@@ -141,7 +143,7 @@ async def get_prompt_list(
     is_public: Optional[bool] = None,
     include_team: Optional[bool] = Query(True, description="是否包含团队共享的 Prompt"),
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_async_session)
 ):
     """获取 Prompt 列表"""
     
@@ -151,30 +153,30 @@ async def get_prompt_list(
     
     if include_team:
         # 获取用户加入的团队
-        user_teams = db.exec(
+        user_teams = (await db.exec(
             select(TeamMember).where(
                 TeamMember.user_id == current_user.id
             )
-        ).all()
+        )).all()
         
         team_ids = [tm.team_id for tm in user_teams]
         
         if team_ids:
-            # 获取这些团队共享的 Prompt
-            from ..models.team import Team
-            team_prompts = db.exec(
-                select(TeamPrompt).where(TeamPrompt.team_id.in_(team_ids))
-            ).all()
+            # 获取这些团队共享的 Prompt（连同 Prompt 作者和团队名称一次查询）
+            team_prompts = (await db.exec(
+                select(TeamPrompt, Prompt.user_id, Team.name)
+                .join(Prompt, Prompt.id == TeamPrompt.prompt_id)
+                .join(Team, Team.id == TeamPrompt.team_id, isouter=True)
+                .where(TeamPrompt.team_id.in_(team_ids))
+            )).all()
             
-            for tp in team_prompts:
+            for tp, prompt_owner_id, team_name in team_prompts:
                 # 排除自己创建的 Prompt（避免重复）
-                prompt = db.get(Prompt, tp.prompt_id)
-                if prompt and prompt.user_id != current_user.id:
+                if prompt_owner_id != current_user.id:
                     team_prompt_ids.add(tp.prompt_id)
-                    team = db.get(Team, tp.team_id)
                     team_prompt_info[tp.prompt_id] = {
                         "team_id": tp.team_id,
-                        "team_name": team.name if team else None,
+                        "team_name": team_name,
                         "permission": tp.permission
                     }
     
@@ -215,14 +217,14 @@ async def get_prompt_list(
             favorite_statement = select(UserPromptFavorite.prompt_id).where(
                 UserPromptFavorite.user_id == current_user.id
             )
-            favorite_ids = db.exec(favorite_statement).all()
+            favorite_ids = (await db.exec(favorite_statement)).all()
             statement = statement.where(Prompt.id.in_(favorite_ids))
         else:
             # 只显示未收藏的
             favorite_statement = select(UserPromptFavorite.prompt_id).where(
                 UserPromptFavorite.user_id == current_user.id
             )
-            favorite_ids = db.exec(favorite_statement).all()
+            favorite_ids = (await db.exec(favorite_statement)).all()
             if favorite_ids:
                 statement = statement.where(~Prompt.id.in_(favorite_ids))
     
@@ -234,19 +236,18 @@ async def get_prompt_list(
     statement = statement.order_by(Prompt.updated_at.desc())
 
     # 获取总数
-    from sqlmodel import func
     count_statement = select(func.count()).select_from(statement)
-    total_count = db.exec(count_statement).one()
+    total_count = (await db.exec(count_statement)).one()
 
     # 分页
     statement = statement.offset(skip).limit(limit)
-    prompts = db.exec(statement).all()
+    prompts = (await db.exec(statement)).all()
 
     # 获取当前用户的所有收藏
     favorite_statement = select(UserPromptFavorite.prompt_id).where(
         UserPromptFavorite.user_id == current_user.id
     )
-    favorite_ids = set(db.exec(favorite_statement).all())
+    favorite_ids = set((await db.exec(favorite_statement)).all())
 
     # 转换为列表项
     items = []
@@ -2,7 +2,9 @@
 from typing import List, Optional
 from fastapi import APIRouter, Depends, Query
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from ..core.async_database import get_async_session
 from ..core.database import get_session
 from ..core.deps import get_current_active_user, get_current_admin_user
 from ..models.user import User
@@ -16,10 +18,10 @@ router = APIRouter(prefix="/api/quota", tags=["配额管理"])
 @router.get("/status")
 async def get_my_quota_status(
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_async_session)
 ):
     """获取当前用户的配额状态"""
-    status = QuotaService.get_quota_status(db, current_user.id)
+    status = await db.run_sync(QuotaService.get_quota_status, current_user.id)
     return success_response(data=status)
 
 
@@ -27,19 +29,22 @@ async def get_my_quota_status(
 async def get_usage_history(
     days: int = Query(default=30, ge=1, le=365),
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_async_session)
 ):
     """获取使用历史"""
     from datetime import datetime, timedelta
     
     start_date = datetime.utcnow() - timedelta(days=days)
     
+    # 先回写内存中尚未保存的使用量
+    await db.run_sync(QuotaService.flush_usage, current_user.id)
+    
     statement = select(ApiUsage).where(
         ApiUsage.user_id == current_user.id,
         ApiUsage.usage_date >= start_date
     ).order_by(ApiUsage.usage_date.desc())
     
-    usages = db.exec(statement).all()
+    usages = (await db.exec(statement)).all()
     
     return success_response(data=[{
         'date': u.usage_date.strftime('%Y-%m-%d'),
@@ -185,6 +190,7 @@ async def delete_quota(
     
     db.delete(quota)
     db.commit()
+    QuotaService.invalidate_quota_cache()
     
     return success_response(message="配额配置已删除")
 
@@ -218,6 +224,9 @@ async def get_all_usage(
     
     start_date = datetime.utcnow() - timedelta(days=days)
     
+    # 先回写内存中尚未保存的使用量
+    QuotaService.flush_usage(db)
+    
     # 按用户汇总
     statement = select(
         ApiUsage.user_id,
@@ -1,11 +1,17 @@
+import asyncio
+import json
 import time
-import re
-from typing import Dict, Optional
-from fastapi import APIRouter, Depends, HTTPException
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Set
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from sqlmodel import Session
-from ..core.database import get_session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from ..core.async_database import get_async_session
+from ..core.database import engine, get_session
 from ..core.deps import get_current_active_user
+from ..core.executors import run_in_db
 from ..models.user import User
 from ..models.prompt import Prompt
 from ..models.execution_history import ExecutionHistory
@@ -16,7 +22,8 @@ from ..services.file_service import FileService
 from ..services.quota_service import QuotaService
 from ..services.pipeline_service import pipeline_service
 from ..utils.response import success_response, error_response
-from ..utils.token_counter import count_tokens, analyze_prompt_complexity
+from ..utils.prompt_template import render_template
+from ..utils.token_counter import count_tokens, estimate_cost, analyze_prompt_complexity
 from .prompt import check_prompt_access
 
 router = APIRouter(prefix="/api/run", tags=["执行Prompt"])
@@ -31,41 +38,19 @@ class RunPromptRequest(BaseModel):
     model: str = "gpt-3.5-turbo"
     temperature: float = 0.7
     max_tokens: int = 2000
+    # 是否复用完全相同请求的历史结果；不传时仅 temperature=0 的确定性调用使用缓存
+    use_cache: Optional[bool] = None
 
 
-def replace_variables(content: str, variables: Dict[str, str]) -> str:
-    """替换 Prompt 中的变量（支持简单格式和增强格式）"""
-    if not variables:
-        return content
-    
-    result = content
-    for key, value in variables.items():
-        # 支持简单格式 {{变量名}} 和增强格式 {{变量名:类型:默认值:选项}}
-        pattern = r'\{\{\s*' + re.escape(key) + r'(?::[^}]*)?\s*\}\}'
-        result = re.sub(pattern, value, result)
-    
-    return result
-
-
-@router.post("", response_model=dict)
-async def run_prompt(
-    request: RunPromptRequest,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_session)
-):
-    """执行单个 Prompt"""
-    
-    # 检查频率限制（保留原有逻辑）
-    allowed, error_msg = rate_limiter.check_rate_limit(current_user.id)
-    if not allowed:
-        return error_response(code=3001, message=error_msg)
-    
-    # 检查配额限制
-    quota_allowed, quota_error = QuotaService.check_quota(db, current_user.id)
-    if not quota_allowed:
-        return error_response(code=3006, message=quota_error)
+def _prepare_run(request: RunPromptRequest, current_user: User, db: Session):
+    """
+    执行前需要数据库的检查：Prompt 权限、文件变量与变量替换（频率限制和配额由 _prepare 检查）
     
+    Returns:
+        (error, context)：检查失败时 error 为错误响应，否则 context 包含执行所需的数据
+    """
     # 获取 Prompt 内容
+    prompt = None
     prompt_content = ""
     prompt_title = "临时 Prompt"
     
@@ -80,7 +65,7 @@ async def run_prompt(
         prompt_content = request.prompt_content
     
     else:
-        return error_response(code=3002, message="必须提供 prompt_id 或 prompt_content")
+        return error_response(code=3002, message="必须提供 prompt_id 或 prompt_content"), None
     
     # 处理文件变量
     all_variables = dict(request.variables or {})
@@ -91,11 +76,11 @@ async def run_prompt(
             uploaded_file = db.get(UploadedFile, file_id)
             
             if not uploaded_file or uploaded_file.is_deleted:
-                return error_response(code=3004, message=f"文件不存在: {var_name}")
+                return error_response(code=3004, message=f"文件不存在: {var_name}"), None
             
             # 权限检查
             if uploaded_file.user_id != current_user.id:
-                return error_response(code=3005, message=f"无权访问文件: {var_name}")
+                return error_response(code=3005, message=f"无权访问文件: {var_name}"), None
             
             # 根据文件类型处理
             if uploaded_file.file_type in ['text', 'code']:
@@ -118,45 +103,69 @@ async def run_prompt(
                 # 其他：显示文件信息
                 all_variables[var_name] = f"[文件: {uploaded_file.filename}, 大小: {uploaded_file.file_size} 字节]"
     
-    # 替换变量
-    final_prompt = replace_variables(prompt_content, all_variables)
+    # 替换变量（未填写且没有默认值的变量保留占位符，在结果中返回）
+    final_prompt, missing_variables = render_template(prompt_content, all_variables)
     
-    # 分析 Prompt 复杂度
-    complexity = analyze_prompt_complexity(final_prompt)
+    return None, {
+        "user_id": current_user.id,
+        "prompt_id": request.prompt_id,
+        "prompt_version": prompt.version if prompt else 1,
+        "branch_id": (prompt.default_branch_id or 0) if prompt else 0,
+        "prompt_title": prompt_title,
+        "prompt_content": prompt_content,
+        "final_prompt": final_prompt,
+        "missing_variables": missing_variables,
+    }
+
+
+def _run_prepare(db: Session, request: RunPromptRequest, current_user: User):
+    """_prepare_run 的 run_sync 版本（会话为第一个参数）"""
+    return _prepare_run(request, current_user, db)
+
+
+async def _prepare(db: AsyncSession, request: RunPromptRequest, current_user: User):
+    """
+    执行前的公共检查：频率限制、Prompt 权限与变量、配额
     
-    # 记录开始时间
-    start_time = time.time()
+    频率限制和配额计数在共享状态后端时是阻塞 I/O，使用异步接口在线程池中执行，
+    不放进 run_sync（异步驱动下 run_sync 在事件循环线程中执行）。
+    检查通过时会预留一次配额，调用方必须 _record_usage() 或 QuotaService.release_quota_async()。
+    """
+    allowed, error_msg = await rate_limiter.check_rate_limit_async(current_user.id)
+    if not allowed:
+        return error_response(code=3001, message=error_msg), None
     
-    # 调用模型
-    try:
-        result = await OpenAIService.chat_completion(
-            prompt=final_prompt,
-            model=request.model,
-            temperature=request.temperature,
-            max_tokens=request.max_tokens,
-            db=db,
-            user_id=current_user.id
-        )
-    except ValueError as e:
-        return error_response(code=3003, message=str(e))
-    except Exception as e:
-        return error_response(code=3003, message=f"模型调用失败: {str(e)}")
+    error, context = await db.run_sync(_run_prepare, request, current_user)
+    if error:
+        return error, None
     
-    # 计算响应时间
-    response_time = time.time() - start_time
+    # 检查并预留配额（放在最后，前面的校验失败不会占用额度）
+    quota_allowed, quota_error = await QuotaService.check_quota_async(current_user.id, reserve=True)
+    if not quota_allowed:
+        return error_response(code=3006, message=quota_error), None
     
-    # 记录请求
-    rate_limiter.record_request(current_user.id)
+    return None, context
+
+
+def _record_execution(
+    db: Session,
+    request: RunPromptRequest,
+    context: Dict,
+    result: Dict,
+    response_time: float
+):
+    """保存执行历史并更新 PR Pipeline 状态（请求次数和配额用量由 _record_usage 记录）"""
+    user_id = context["user_id"]
     
     # 保存执行历史
     try:
         execution_history = ExecutionHistory(
-            user_id=current_user.id,
-            prompt_id=request.prompt_id,
-            prompt_content=prompt_content,
-            prompt_version=prompt.version if request.prompt_id and prompt else 1,
+            user_id=user_id,
+            prompt_id=context["prompt_id"],
+            prompt_content=context["prompt_content"],
+            prompt_version=context["prompt_version"],
             variables=request.variables,
-            final_prompt=final_prompt,
+            final_prompt=context["final_prompt"],
             model=request.model,
             temperature=request.temperature,
             max_tokens=request.max_tokens,
@@ -165,18 +174,35 @@ async def run_prompt(
             output_tokens=result["output_tokens"],
             total_tokens=result["total_tokens"],
             cost=result["cost"],
-            response_time=round(response_time, 3)
+            response_time=round(response_time, 3),
+            cache_key=result.get("cache_key")
         )
         db.add(execution_history)
         db.commit()
+    except Exception:
+        db.rollback()
+
+    # 更新 PR Pipeline 状态
+    try:
+        if context["prompt_id"]:
+            pipeline_service.update_pr_status_after_execution(
+                db=db,
+                prompt_id=context["prompt_id"],
+                branch_id=context["branch_id"],
+                execution_success=True,
+                execution_result=result["output"][:200] if result.get("output") else None
+            )
     except Exception:
         pass
-    
-    # 记录配额使用量
+
+
+async def _record_usage(request: RunPromptRequest, context: Dict, result: Dict):
+    """记录请求次数和配额使用量（同时释放预留）"""
+    user_id = context["user_id"]
+    await rate_limiter.record_request_async(user_id)
     try:
-        QuotaService.record_usage(
-            db=db,
-            user_id=current_user.id,
+        await QuotaService.record_usage_async(
+            user_id=user_id,
             input_tokens=result["input_tokens"],
             output_tokens=result["output_tokens"],
             cost=result["cost"],
@@ -184,13 +210,48 @@ async def run_prompt(
         )
     except Exception:
         pass
-    
-    # 构造响应
-    response_data = {
-        "prompt_title": prompt_title,
-        "prompt_content": prompt_content,
-        "final_prompt": final_prompt,
+
+
+def _record_execution_in_session(request: RunPromptRequest, context: Dict, result: Dict, response_time: float):
+    """在独立会话中记录执行（流式响应结束时依赖注入的会话已关闭），在数据库线程池中调用"""
+    with Session(engine) as db:
+        _record_execution(db, request, context, result, response_time)
+
+
+@asynccontextmanager
+async def _call_session() -> AsyncIterator[Session]:
+    """
+    模型调用使用的独立同步会话
+
+    会话内的查询由服务代码放到数据库线程池中执行，关闭会话（归还连接时回滚）同样在线程池中执行。
+    """
+    session = Session(engine)
+    try:
+        yield session
+    finally:
+        await run_in_db(session.close)
+
+
+# 客户端断开后仍在后台完成的收尾任务（保持引用，避免任务被回收）
+_pending_finish: Set[asyncio.Task] = set()
+
+
+async def _run_to_completion(coro):
+    """执行 coro；当前任务被取消（如客户端断开）时 coro 在后台继续执行完"""
+    task = asyncio.ensure_future(coro)
+    _pending_finish.add(task)
+    task.add_done_callback(_pending_finish.discard)
+    await asyncio.shield(task)
+
+
+def _build_response_data(request: RunPromptRequest, context: Dict, result: Dict, response_time: float) -> Dict:
+    """构造执行结果响应"""
+    return {
+        "prompt_title": context["prompt_title"],
+        "prompt_content": context["prompt_content"],
+        "final_prompt": context["final_prompt"],
         "variables": request.variables,
+        "missing_variables": context["missing_variables"],
         "output": result["output"],
         "model": result["model"],
         "input_tokens": result["input_tokens"],
@@ -198,26 +259,161 @@ async def run_prompt(
         "total_tokens": result["total_tokens"],
         "cost": result["cost"],
         "response_time": round(response_time, 3),
-        "complexity": complexity,
-        "is_cached": False  # 新执行的结果
+        "complexity": analyze_prompt_complexity(context["final_prompt"]),
+        "is_cached": result.get("is_cached", False)  # 是否复用了历史结果
     }
 
-    # 更新 PR Pipeline 状态
+
+def _sse_event(event: str, data: Dict) -> str:
+    """格式化一条 Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("", response_model=dict)
+async def run_prompt(
+    request: RunPromptRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_session)
+):
+    """执行单个 Prompt"""
+    
+    # 执行前后的数据库操作不阻塞事件循环（异步驱动或线程池）
+    error, context = await _prepare(db, request, current_user)
+    if error:
+        return error
+    
+    # 记录开始时间
+    start_time = time.time()
+    
+    # 调用模型（模型调用内部的配置和结果缓存查询通常命中内存，使用独立的同步会话）
     try:
-        if request.prompt_id and prompt:
-            pipeline_service.update_pr_status_after_execution(
-                db=db,
-                prompt_id=request.prompt_id,
-                branch_id=prompt.default_branch_id or 0,
-                execution_success=True,
-                execution_result=result["output"][:200] if result.get("output") else None
+        async with _call_session() as call_db:
+            result = await OpenAIService.chat_completion(
+                prompt=context["final_prompt"],
+                model=request.model,
+                temperature=request.temperature,
+                max_tokens=request.max_tokens,
+                db=call_db,
+                user_id=current_user.id,
+                use_cache=request.use_cache
             )
-    except Exception:
-        pass
-
+    except ValueError as e:
+        await QuotaService.release_quota_async(current_user.id)
+        return error_response(code=3003, message=str(e))
+    except Exception as e:
+        await QuotaService.release_quota_async(current_user.id)
+        return error_response(code=3003, message=f"模型调用失败: {str(e)}")
+    
+    # 计算响应时间
+    response_time = time.time() - start_time
+    
+    # 命中结果缓存时没有调用模型，不记录请求和配额
+    if result.get("is_cached"):
+        await QuotaService.release_quota_async(current_user.id)
+    else:
+        await _record_usage(request, context, result)
+        await db.run_sync(_record_execution, request, context, result, response_time)
+    
+    response_data = _build_response_data(request, context, result, response_time)
     return success_response(data=response_data, message="执行成功")
 
 
+@router.post("/stream")
+async def run_prompt_stream(
+    request: RunPromptRequest,
+    http_request: Request,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_session)
+):
+    """
+    流式执行单个 Prompt（Server-Sent Events）
+    
+    事件:
+        delta: {"content": 增量文本, "output_tokens": 累计输出 token}
+        done:  与 /api/run 相同的完整结果
+        error: {"code": 错误码, "message": 错误信息}
+    
+    执行历史和配额在流结束后写入；客户端断开时会取消上游请求，并按已生成的部分记账。
+    """
+    error, context = await _prepare(db, request, current_user)
+    if error:
+        return error
+    
+    async def event_stream():
+        start_time = time.time()
+        output_parts = []
+        output_tokens = 0
+        result = None
+        
+        # 依赖注入的会话在响应开始前就会关闭，流式过程使用独立会话
+        async with _call_session() as stream_db:
+            stream = OpenAIService.chat_completion_stream(
+                prompt=context["final_prompt"],
+                model=request.model,
+                temperature=request.temperature,
+                max_tokens=request.max_tokens,
+                db=stream_db,
+                user_id=context["user_id"]
+            )
+            try:
+                async for event in stream:
+                    if event["type"] == "done":
+                        result = event
+                        break
+                    
+                    output_parts.append(event["content"])
+                    output_tokens = event["output_tokens"]
+                    
+                    # 客户端已断开：停止读取，finally 中会关闭上游请求
+                    if await http_request.is_disconnected():
+                        break
+                    
+                    yield _sse_event("delta", {
+                        "content": event["content"],
+                        "output_tokens": output_tokens
+                    })
+            except ValueError as e:
+                yield _sse_event("error", {"code": 3003, "message": str(e)})
+            except Exception as e:
+                yield _sse_event("error", {"code": 3003, "message": f"模型调用失败: {str(e)}"})
+            finally:
+                response_time = time.time() - start_time
+                
+                record = result
+                if record is None and output_parts:
+                    # 中途断开或出错：按已生成的内容记账
+                    input_tokens = count_tokens(context["final_prompt"], request.model)
+                    record = {
+                        "output": "".join(output_parts),
+                        "model": request.model,
+                        "input_tokens": input_tokens,
+                        "output_tokens": output_tokens,
+                        "total_tokens": input_tokens + output_tokens,
+                        "cost": estimate_cost(input_tokens, output_tokens, request.model)
+                    }
+                
+                async def finish():
+                    # 关闭上游 HTTP 流，停止继续生成（和计费）
+                    await stream.aclose()
+                    if record is None:
+                        await QuotaService.release_quota_async(context["user_id"])
+                    else:
+                        await _record_usage(request, context, record)
+                        await run_in_db(_record_execution_in_session, request, context, record, response_time)
+                
+                # 客户端断开导致任务被取消时，关闭上游和写入记录在后台完成
+                await _run_to_completion(finish())
+            
+            if result is not None:
+                yield _sse_event("done", _build_response_data(request, context, result, response_time))
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/models", response_model=dict)
 async def get_available_models(
     current_user: User = Depends(get_current_active_user),
@@ -234,7 +430,7 @@ async def get_usage_stats(
 ):
     """获取用户的 API 使用统计"""
     
-    stats = rate_limiter.get_usage_stats(current_user.id)
+    stats = await rate_limiter.get_usage_stats_async(current_user.id)
     
     return success_response(data=stats)
 
@@ -1,10 +1,12 @@
 """安全管理 API"""
+import json
 from typing import List, Optional
 from fastapi import APIRouter, Depends, Request, Query
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session, select, func
 from datetime import datetime, timedelta
 
-from ..core.database import get_session
+from ..core.database import get_session, engine
 from ..core.deps import get_current_active_user, require_admin
 from ..models.user import User
 from ..models.audit_log import (
@@ -13,6 +15,8 @@ from ..models.audit_log import (
     SensitiveWord, SensitiveWordCreate, SensitiveWordResponse
 )
 from ..services.security_service import SecurityService
+from ..services.audit_pool import audit_pool
+from ..services.sensitive_word_store import sensitive_word_store
 from ..services.audit_service import AuditService
 from ..utils.response import success_response, error_response
 
@@ -57,6 +61,79 @@ async def audit_content(
         return error_response(code=5001, message=f"审核失败: {str(e)}")
 
 
+@router.post("/audit/batch", response_model=dict)
+async def audit_content_batch(
+    data: dict,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_session)
+):
+    """
+    批量内容安全审核
+    
+    大批量内容在进程池中并行审核；stream=true 时以 Server-Sent Events 按输入顺序逐条返回结果
+    """
+    contents = data.get('contents') or []
+    auto_mask = data.get('auto_mask', False)
+    stream = data.get('stream', False)
+    
+    if not isinstance(contents, list) or not contents:
+        return error_response(code=4001, message="内容列表不能为空")
+    if len(contents) > 1000:
+        return error_response(code=4001, message="单次最多审核 1000 条内容")
+    if not all(isinstance(content, str) for content in contents):
+        return error_response(code=4001, message="内容必须是字符串")
+    
+    def log_blocked(log_db: Session, blocked: List[int]):
+        if not blocked:
+            return
+        AuditService.log(
+            db=log_db,
+            action='content_audit_blocked',
+            resource='content',
+            description=f"批量内容审核未通过 {len(blocked)} 条",
+            user_id=current_user.id,
+            username=current_user.username,
+            details={'blocked_indexes': blocked},
+            status='warning'
+        )
+    
+    if stream:
+        async def event_stream():
+            blocked = []
+            try:
+                async for result in audit_pool.iter_audit(contents, auto_mask):
+                    if not result['is_approved']:
+                        blocked.append(result['index'])
+                    yield f"event: item\ndata: {json.dumps(result, ensure_ascii=False)}\n\n"
+            except Exception as e:
+                yield f"event: error\ndata: {json.dumps({'message': f'审核失败: {str(e)}'}, ensure_ascii=False)}\n\n"
+                return
+            # 依赖注入的会话在流式响应开始前已关闭，使用独立会话记录审计日志
+            with Session(engine) as log_db:
+                log_blocked(log_db, blocked)
+            done = {'total': len(contents), 'blocked': len(blocked)}
+            yield f"event: done\ndata: {json.dumps(done, ensure_ascii=False)}\n\n"
+        
+        return StreamingResponse(
+            event_stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    
+    try:
+        results = await audit_pool.audit(contents, auto_mask)
+    except Exception as e:
+        return error_response(code=5001, message=f"审核失败: {str(e)}")
+    
+    blocked = [result['index'] for result in results if not result['is_approved']]
+    log_blocked(db, blocked)
+    return success_response(data={
+        'total': len(results),
+        'blocked': len(blocked),
+        'results': results
+    })
+
+
 @router.post("/mask/sensitive-info", response_model=dict)
 async def mask_sensitive_info(
     data: dict,
@@ -387,11 +464,12 @@ async def add_sensitive_word(
     )
     
     db.add(word)
+    sensitive_word_store.bump_version(db)
     db.commit()
     db.refresh(word)
     
-    # 同时添加到运行时敏感词库
-    SecurityService.add_custom_sensitive_word(data.word, data.category)
+    # 当前进程立即生效，其他进程在下一次版本检查时重新加载
+    sensitive_word_store.refresh(db)
     
     # 记录审计日志
     AuditService.log_from_request(
@@ -428,13 +506,13 @@ async def delete_sensitive_word(
     
     # 删除
     word_text = word.word
-    word_category = word.category
     
     db.delete(word)
+    sensitive_word_store.bump_version(db)
     db.commit()
     
-    # 从运行时敏感词库移除
-    SecurityService.remove_custom_sensitive_word(word_text, word_category)
+    # 当前进程立即生效，其他进程在下一次版本检查时重新加载
+    sensitive_word_store.refresh(db)
     
     # 记录审计日志
     AuditService.log_from_request(
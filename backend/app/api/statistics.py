@@ -5,10 +5,11 @@
 from datetime import datetime, timedelta
 from typing import List, Optional
 from fastapi import APIRouter, Depends, Query
-from sqlmodel import Session, select, func, desc
+from sqlmodel import select, func, desc
+from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy import cast, Date
 
-from ..core.database import get_session
+from ..core.async_database import get_async_session
 from ..core.deps import get_current_active_user
 from ..models.user import User
 from ..models.execution_history import ExecutionHistory
@@ -20,7 +21,7 @@ router = APIRouter(prefix="/api/statistics", tags=["使用统计"])
 @router.get("/overview")
 async def get_overview(
     days: int = Query(default=30, ge=1, le=365, description="统计天数"),
-    db: Session = Depends(get_session),
+    db: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_active_user)
 ):
     """
@@ -43,7 +44,7 @@ async def get_overview(
         ExecutionHistory.created_at >= start_date
     )
     
-    result = db.exec(statement).first()
+    result = (await db.exec(statement)).first()
     
     return {
         "code": 0,
@@ -62,7 +63,7 @@ async def get_overview(
 @router.get("/daily")
 async def get_daily_stats(
     days: int = Query(default=30, ge=1, le=365, description="统计天数"),
-    db: Session = Depends(get_session),
+    db: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_active_user)
 ):
     """
@@ -88,7 +89,7 @@ async def get_daily_stats(
         cast(ExecutionHistory.created_at, Date)
     )
     
-    results = db.exec(statement).all()
+    results = (await db.exec(statement)).all()
     
     # 填充缺失的日期
     daily_data = []
@@ -126,7 +127,7 @@ async def get_daily_stats(
 async def get_top_prompts(
     limit: int = Query(default=10, ge=1, le=50, description="返回数量"),
     days: int = Query(default=30, ge=1, le=365, description="统计天数"),
-    db: Session = Depends(get_session),
+    db: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_active_user)
 ):
     """
@@ -153,12 +154,20 @@ async def get_top_prompts(
         desc("use_count")
     ).limit(limit)
     
-    results = db.exec(statement).all()
+    results = (await db.exec(statement)).all()
+    
+    # 获取 Prompt 详情（一次查询）
+    prompt_ids = [r.prompt_id for r in results]
+    prompts = {}
+    if prompt_ids:
+        prompts = {
+            prompt.id: prompt
+            for prompt in (await db.exec(select(Prompt).where(Prompt.id.in_(prompt_ids)))).all()
+        }
     
-    # 获取 Prompt 详情
     top_prompts = []
     for r in results:
-        prompt = db.get(Prompt, r.prompt_id)
+        prompt = prompts.get(r.prompt_id)
         if prompt:
             top_prompts.append({
                 "prompt_id": r.prompt_id,
@@ -178,7 +187,7 @@ async def get_top_prompts(
 @router.get("/model-usage")
 async def get_model_usage(
     days: int = Query(default=30, ge=1, le=365, description="统计天数"),
-    db: Session = Depends(get_session),
+    db: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_active_user)
 ):
     """
@@ -204,7 +213,7 @@ async def get_model_usage(
         desc("calls")
     )
     
-    results = db.exec(statement).all()
+    results = (await db.exec(statement)).all()
     
     model_usage = []
     for r in results:
@@ -225,7 +234,7 @@ async def get_model_usage(
 @router.get("/hourly")
 async def get_hourly_stats(
     days: int = Query(default=7, ge=1, le=30, description="统计天数"),
-    db: Session = Depends(get_session),
+    db: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_active_user)
 ):
     """
@@ -246,7 +255,7 @@ async def get_hourly_stats(
         func.extract('hour', ExecutionHistory.created_at)
     ).order_by("hour")
     
-    results = db.exec(statement).all()
+    results = (await db.exec(statement)).all()
     
     # 填充 24 小时
     hourly_data = [0] * 24
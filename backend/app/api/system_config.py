@@ -6,6 +6,7 @@ from typing import Dict, Any
 from ..core.deps import get_db, get_current_admin_user
 from ..models.user import User
 from ..models.ai_config import AIConfig, AIConfigCreate
+from ..services.ai_config_cache import ai_config_cache
 from ..services.encryption_service import EncryptionService
 
 router = APIRouter(prefix="/api/system", tags=["系统配置"])
@@ -85,6 +86,7 @@ def update_global_ai_config(
             if global_config:
                 db.delete(global_config)
                 db.commit()
+            ai_config_cache.invalidate()
             
             # 记录审计日志
             from ..services.audit_service import AuditService
@@ -132,6 +134,7 @@ def update_global_ai_config(
             db.commit()
             db.refresh(global_config)
             
+            ai_config_cache.invalidate()
             action = "update_global_ai"
             message = "全局AI配置更新成功"
         else:
@@ -154,6 +157,7 @@ def update_global_ai_config(
             db.commit()
             db.refresh(global_config)
             
+            ai_config_cache.invalidate()
             action = "create_global_ai"
             message = "全局AI配置创建成功"
         
@@ -14,6 +14,8 @@ from ..models.test_suite import (
     PromptTestSuiteUpdate,
 )
 from ..models.user import User
+from ..services.job_service import JobService, job_service
+from ..services.quota_service import QuotaService
 from ..services.test_runner_service import TestRunnerService
 from ..utils.response import error_response, success_response
 from .prompt import check_prompt_access
@@ -51,6 +53,23 @@ async def get_prompt_test_suites(
     return success_response(data=[dump_model(suite) for suite in suites])
 
 
+@router.delete("/prompt/{prompt_id}/baselines", response_model=dict)
+async def invalidate_baseline_outputs(
+    prompt_id: int,
+    version: Optional[int] = None,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_session),
+):
+    """Drop memoized baseline outputs for a Prompt (optionally a single version)."""
+    try:
+        prompt, _ = check_prompt_access(prompt_id, current_user, db, require_edit=True)
+    except Exception as exc:
+        return error_response(code=4001, message=str(exc))
+
+    deleted = TestRunnerService.invalidate_baselines(db, prompt.id, version)
+    return success_response(data={"deleted": deleted}, message="基线缓存已清除")
+
+
 @router.post("", response_model=dict)
 async def create_test_suite(
     suite_data: PromptTestSuiteCreate,
@@ -119,6 +138,46 @@ async def update_test_suite(
     return success_response(data=dump_model(suite), message="测试集更新成功")
 
 
+def check_run_budget(db: Session, user_id: int, estimate: dict):
+    """剩余配额是否足够执行整个测试集"""
+    return QuotaService.check_budget(
+        db,
+        user_id,
+        requests=estimate["call_count"],
+        tokens=estimate["total_tokens"],
+        cost=estimate["estimated_cost"],
+    )
+
+
+@router.post("/{suite_id}/estimate", response_model=dict)
+async def estimate_test_suite_run(
+    suite_id: int,
+    run_data: PromptTestRunRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_session),
+):
+    """Estimate tokens and cost of a test suite run without calling the model."""
+    suite = db.get(PromptTestSuite, suite_id)
+    if not suite:
+        return error_response(code=4004, message="测试集不存在")
+
+    check_prompt_access(suite.prompt_id, current_user, db)
+    try:
+        estimate = TestRunnerService.estimate_run(
+            db=db,
+            suite=suite,
+            candidate_version=run_data.candidate_version,
+            baseline_version=run_data.baseline_version,
+            model=run_data.model,
+            enable_evaluation=run_data.enable_evaluation,
+        )
+    except ValueError as exc:
+        return error_response(code=4001, message=str(exc))
+
+    allowed, reason = check_run_budget(db, current_user.id, estimate)
+    return success_response(data={**estimate, "quota_allowed": allowed, "quota_error": reason})
+
+
 @router.post("/{suite_id}/run", response_model=dict)
 async def run_test_suite(
     suite_id: int,
@@ -133,6 +192,51 @@ async def run_test_suite(
 
     try:
         check_prompt_access(suite.prompt_id, current_user, db, require_edit=True)
+
+        # 预估整个测试集的用量，剩余配额不足时在调用模型之前拒绝；
+        # 版本不存在时运行会直接记为失败（不调用模型），无需预检
+        try:
+            estimate = TestRunnerService.estimate_run(
+                db=db,
+                suite=suite,
+                candidate_version=run_data.candidate_version,
+                baseline_version=run_data.baseline_version,
+                model=run_data.model,
+                enable_evaluation=run_data.enable_evaluation,
+            )
+        except ValueError:
+            estimate = None
+        if estimate is not None:
+            budget_allowed, budget_error = check_run_budget(db, current_user.id, estimate)
+            if not budget_allowed:
+                return error_response(code=3006, message=budget_error, data=estimate)
+
+        if not run_data.sync:
+            # 默认提交后台任务，立即返回任务 ID
+            run = TestRunnerService.create_run(
+                db=db,
+                suite=suite,
+                runner_user_id=current_user.id,
+                candidate_version=run_data.candidate_version,
+                baseline_version=run_data.baseline_version,
+                trigger_source=run_data.trigger_source,
+                status="pending",
+            )
+            job = job_service.submit(
+                db=db,
+                user_id=current_user.id,
+                job_type="test_suite",
+                payload={
+                    "model": run_data.model,
+                    "temperature": run_data.temperature,
+                    "enable_evaluation": run_data.enable_evaluation,
+                    "force_refresh": run_data.force_refresh,
+                },
+                resource_id=run.id,
+                progress_total=len(suite.test_cases or []),
+            )
+            return success_response(data=JobService.to_response(job), message="测试集运行已提交")
+
         run = await TestRunnerService.run_suite(
             db=db,
             suite=suite,
@@ -143,6 +247,7 @@ async def run_test_suite(
             model=run_data.model,
             temperature=run_data.temperature,
             enable_evaluation=run_data.enable_evaluation,
+            force_refresh=run_data.force_refresh,
         )
     except Exception as exc:
         return error_response(code=4005, message=f"测试集运行失败: {str(exc)}")
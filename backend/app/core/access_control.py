@@ -1,31 +1,73 @@
-"""访问控制中间件 - IP白名单、频率限制"""
-from fastapi import Request, HTTPException
-from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
-from typing import Optional
+"""
+访问控制中间件 - IP白名单、频率限制、安全响应头、请求日志、请求指标、SQL 查询分析
+
+均为纯 ASGI 中间件：直接包装 send 修改响应头，不像 BaseHTTPMiddleware 那样
+为每个请求创建额外的任务和内存流，流式响应（SSE）和后台任务按原样透传。
+"""
+import logging
+import random
 import time
-from collections import defaultdict
-from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import settings
+from .metrics import (
+    HTTP_REQUEST_DB_DURATION,
+    HTTP_REQUEST_DB_QUERIES,
+    HTTP_REQUEST_DURATION,
+    HTTP_REQUESTS,
+    HTTP_REQUESTS_IN_PROGRESS,
+    RATE_LIMIT_REJECTIONS,
+    end_request_queries,
+    method_label,
+    route_template,
+    start_request_queries,
+)
+from .query_profiler import profile_queries
+from .rate_limiter import create_window_limiter
+from .state_backend import StateBackend
+
+
+def get_client_ip(scope: Scope) -> str:
+    """获取真实客户端IP"""
+    headers = Headers(scope=scope)
+    # 考虑代理服务器
+    forwarded_for = headers.get('x-forwarded-for')
+    if forwarded_for is not None:
+        return forwarded_for.split(',')[0].strip()
+    real_ip = headers.get('x-real-ip')
+    if real_ip is not None:
+        return real_ip
+    client = scope.get('client')
+    if client:
+        return client[0]
+    return '0.0.0.0'
 
 
-class IPWhitelistMiddleware(BaseHTTPMiddleware):
+access_logger = logging.getLogger("app.access")
+profile_logger = logging.getLogger("app.db_profile")
+
+
+class IPWhitelistMiddleware:
     """IP白名单中间件"""
     
-    def __init__(self, app, whitelist: Optional[list] = None, enabled: bool = False):
-        super().__init__(app)
+    def __init__(self, app: ASGIApp, whitelist: Optional[list] = None, enabled: bool = False):
+        self.app = app
         self.whitelist = set(whitelist or [])
         self.enabled = enabled
     
-    async def dispatch(self, request: Request, call_next):
-        if not self.enabled:
-            return await call_next(request)
-        
-        # 获取客户端IP
-        client_ip = self._get_client_ip(request)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http' or not self.enabled:
+            await self.app(scope, receive, send)
+            return
         
         # 检查白名单
-        if client_ip not in self.whitelist:
-            return JSONResponse(
+        if get_client_ip(scope) not in self.whitelist:
+            response = JSONResponse(
                 status_code=403,
                 content={
                     "code": 403,
@@ -33,72 +75,56 @@ class IPWhitelistMiddleware(BaseHTTPMiddleware):
                     "data": None
                 }
             )
+            await response(scope, receive, send)
+            return
         
-        return await call_next(request)
+        await self.app(scope, receive, send)
     
     @staticmethod
     def _get_client_ip(request: Request) -> str:
         """获取真实客户端IP"""
-        # 考虑代理服务器
-        if 'x-forwarded-for' in request.headers:
-            return request.headers['x-forwarded-for'].split(',')[0].strip()
-        elif 'x-real-ip' in request.headers:
-            return request.headers['x-real-ip']
-        elif request.client:
-            return request.client.host
-        return '0.0.0.0'
+        return get_client_ip(request.scope)
 
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
+class RateLimitMiddleware:
     """频率限制中间件"""
     
     def __init__(
         self, 
-        app,
+        app: ASGIApp,
         requests_per_minute: int = 60,
         requests_per_hour: int = 1000,
-        enabled: bool = True
+        enabled: bool = True,
+        max_keys: int = 100000,
+        backend: Optional[StateBackend] = None
     ):
-        super().__init__(app)
+        self.app = app
         self.requests_per_minute = requests_per_minute
         self.requests_per_hour = requests_per_hour
         self.enabled = enabled
         
-        # 存储请求记录 {ip: [(timestamp, count)]}
-        self.minute_requests = defaultdict(list)
-        self.hour_requests = defaultdict(list)
+        # 按 IP 计数的滑动窗口（分钟 / 小时）
+        self.limiter = create_window_limiter((60, 3600), "ip", max_keys=max_keys, backend=backend)
     
-    async def dispatch(self, request: Request, call_next):
-        if not self.enabled:
-            return await call_next(request)
-        
-        # 排除OPTIONS预检请求（CORS）
-        if request.method == "OPTIONS":
-            return await call_next(request)
-        
-        # 获取客户端IP
-        client_ip = IPWhitelistMiddleware._get_client_ip(request)
-        
-        # 排除某些路径（如健康检查、静态资源）
-        # 使用 request.url.path 而不是 request.path
-        request_path = str(request.url.path) if hasattr(request, 'url') else '/'
-        if self._is_excluded_path(request_path):
-            return await call_next(request)
-        
-        # 检查频率限制
-        now = time.time()
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        # 排除OPTIONS预检请求（CORS）和某些路径（如健康检查、静态资源）
+        if (
+            scope['type'] != 'http'
+            or not self.enabled
+            or scope['method'] == 'OPTIONS'
+            or self._is_excluded_path(scope['path'])
+        ):
+            await self.app(scope, receive, send)
+            return
         
-        # 清理过期记录
-        self._cleanup_old_records(client_ip, now)
-        
-        # 检查分钟级限制
-        minute_count = len([
-            ts for ts in self.minute_requests[client_ip]
-            if now - ts < 60
-        ])
+        # 检查并记录请求（原子操作，超限时不计数）
+        exceeded, (minute_count, hour_count) = await self.limiter.acquire_async(
+            get_client_ip(scope), (self.requests_per_minute, self.requests_per_hour)
+        )
         
-        if minute_count >= self.requests_per_minute:
-            return JSONResponse(
+        if exceeded == 0:
+            RATE_LIMIT_REJECTIONS.labels(scope="ip", window="minute").inc()
+            response = JSONResponse(
                 status_code=429,
                 content={
                     "code": 429,
@@ -110,15 +136,12 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
                     }
                 }
             )
+            await response(scope, receive, send)
+            return
         
-        # 检查小时级限制
-        hour_count = len([
-            ts for ts in self.hour_requests[client_ip]
-            if now - ts < 3600
-        ])
-        
-        if hour_count >= self.requests_per_hour:
-            return JSONResponse(
+        if exceeded == 1:
+            RATE_LIMIT_REJECTIONS.labels(scope="ip", window="hour").inc()
+            response = JSONResponse(
                 status_code=429,
                 content={
                     "code": 429,
@@ -130,114 +153,225 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
                     }
                 }
             )
-        
-        # 记录请求
-        self.minute_requests[client_ip].append(now)
-        self.hour_requests[client_ip].append(now)
+            await response(scope, receive, send)
+            return
         
         # 添加rate limit headers
-        response = await call_next(request)
-        response.headers['X-RateLimit-Limit-Minute'] = str(self.requests_per_minute)
-        response.headers['X-RateLimit-Limit-Hour'] = str(self.requests_per_hour)
-        response.headers['X-RateLimit-Remaining-Minute'] = str(
-            max(0, self.requests_per_minute - minute_count - 1)
-        )
-        response.headers['X-RateLimit-Remaining-Hour'] = str(
-            max(0, self.requests_per_hour - hour_count - 1)
-        )
+        rate_limit_headers = {
+            'X-RateLimit-Limit-Minute': str(self.requests_per_minute),
+            'X-RateLimit-Limit-Hour': str(self.requests_per_hour),
+            'X-RateLimit-Remaining-Minute': str(max(0, int(self.requests_per_minute - minute_count - 1))),
+            'X-RateLimit-Remaining-Hour': str(max(0, int(self.requests_per_hour - hour_count - 1))),
+        }
         
-        return response
-    
-    def _cleanup_old_records(self, client_ip: str, now: float):
-        """清理过期记录"""
-        # 清理1分钟前的记录
-        self.minute_requests[client_ip] = [
-            ts for ts in self.minute_requests[client_ip]
-            if now - ts < 60
-        ]
+        async def send_with_headers(message: Message):
+            if message['type'] == 'http.response.start':
+                headers = MutableHeaders(scope=message)
+                for name, value in rate_limit_headers.items():
+                    headers[name] = value
+            await send(message)
         
-        # 清理1小时前的记录
-        self.hour_requests[client_ip] = [
-            ts for ts in self.hour_requests[client_ip]
-            if now - ts < 3600
-        ]
-        
-        # 清理空记录
-        if not self.minute_requests[client_ip]:
-            del self.minute_requests[client_ip]
-        if not self.hour_requests[client_ip]:
-            del self.hour_requests[client_ip]
+        await self.app(scope, receive, send_with_headers)
     
     @staticmethod
     def _is_excluded_path(path: str) -> bool:
         """判断路径是否排除在频率限制之外"""
-        excluded_paths = [
+        excluded_paths = (
             '/health',
             '/docs',
             '/redoc',
             '/openapi.json',
             '/static/',
-        ]
+        )
         
-        return any(path.startswith(excluded) for excluded in excluded_paths)
+        return path.startswith(excluded_paths)
 
 
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
+class SecurityHeadersMiddleware:
     """安全响应头中间件"""
     
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
+    # 添加的安全响应头
+    SECURITY_HEADERS = {
+        'X-Content-Type-Options': 'nosniff',
+        'X-Frame-Options': 'DENY',
+        'X-XSS-Protection': '1; mode=block',
+        'Strict-Transport-Security': 'max-age=31536000; includeSubDomains',
+        'Content-Security-Policy': "default-src 'self'",
+        'Referrer-Policy': 'strict-origin-when-cross-origin',
+        'Permissions-Policy': 'geolocation=(), microphone=(), camera=()',
+    }
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
         
-        # 添加安全响应头
-        response.headers['X-Content-Type-Options'] = 'nosniff'
-        response.headers['X-Frame-Options'] = 'DENY'
-        response.headers['X-XSS-Protection'] = '1; mode=block'
-        response.headers['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains'
-        response.headers['Content-Security-Policy'] = "default-src 'self'"
-        response.headers['Referrer-Policy'] = 'strict-origin-when-cross-origin'
-        response.headers['Permissions-Policy'] = 'geolocation=(), microphone=(), camera=()'
+        async def send_with_headers(message: Message):
+            if message['type'] == 'http.response.start':
+                headers = MutableHeaders(scope=message)
+                for name, value in self.SECURITY_HEADERS.items():
+                    headers[name] = value
+            await send(message)
         
-        return response
+        await self.app(scope, receive, send_with_headers)
+
 
+class RequestLoggingMiddleware:
+    """
+    请求日志中间件（结构化访问日志，经日志队列异步输出）
 
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
-    """请求日志中间件"""
+    - 耗时计算到响应头发出为止，流式响应不包含后续的传输时间
+    - 超过慢请求阈值的请求以 WARNING 级别记录并标记 slow
+    - 高频路径按前缀采样记录（记录中带 sample_rate），5xx 和慢请求总是记录
+    """
     
-    async def dispatch(self, request: Request, call_next):
-        start_time = time.time()
+    def __init__(
+        self,
+        app: ASGIApp,
+        slow_threshold: Optional[float] = None,
+        sample_rates: Optional[Dict[str, float]] = None
+    ):
+        self.app = app
+        self.slow_threshold = settings.SLOW_REQUEST_THRESHOLD if slow_threshold is None else slow_threshold
+        rates = settings.ACCESS_LOG_SAMPLE_RATES if sample_rates is None else sample_rates
+        # 最长前缀优先匹配
+        self.sample_rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+    
+    def _sample_rate(self, path: str) -> float:
+        for prefix, rate in self.sample_rates:
+            if path.startswith(prefix):
+                return rate
+        return 1.0
+    
+    def _log(self, scope: Scope, status_code: int, process_time: float):
+        slow = process_time > self.slow_threshold
+        sample_rate = self._sample_rate(scope['path'])
+        if not slow and status_code < 500 and sample_rate < 1.0 and random.random() >= sample_rate:
+            return
+        
+        fields = {
+            "method": scope['method'],
+            "path": scope['path'],
+            "status": status_code,
+            "duration_ms": round(process_time * 1000, 1),
+            "client_ip": get_client_ip(scope),
+        }
+        if slow:
+            fields["slow"] = True
+        if sample_rate < 1.0:
+            fields["sample_rate"] = sample_rate
+        access_logger.log(
+            logging.WARNING if slow else logging.INFO,
+            "%s %s %s",
+            scope['method'], scope['path'], status_code,
+            extra=fields
+        )
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        
+        start_time = time.perf_counter()
+        logged = False
         
-        # 获取客户端信息
-        client_ip = IPWhitelistMiddleware._get_client_ip(request)
-        user_agent = request.headers.get('user-agent', 'Unknown')
-        request_path = str(request.url.path) if hasattr(request, 'url') else '/'
-        request_method = request.method if hasattr(request, 'method') else 'UNKNOWN'
+        async def send_with_logging(message: Message):
+            nonlocal logged
+            if message['type'] == 'http.response.start' and not logged:
+                logged = True
+                self._log(scope, message['status'], time.perf_counter() - start_time)
+            await send(message)
         
-        # 处理请求
-        status_code = 200
         try:
-            response = await call_next(request)
-            status_code = response.status_code
-        except Exception as e:
-            status_code = 500
+            await self.app(scope, receive, send_with_logging)
+        except Exception:
+            if not logged:
+                logged = True
+                self._log(scope, 500, time.perf_counter() - start_time)
             raise
+
+
+class MetricsMiddleware:
+    """
+    请求指标中间件：按路由模板统计请求数、耗时，以及每个请求的 SQL 语句数和耗时
+
+    耗时计算到应用返回为止，流式响应包含传输时间。
+    """
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        
+        start_time = time.perf_counter()
+        status_code = 500
+        queries, token = start_request_queries()
+        
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+        
+        HTTP_REQUESTS_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
         finally:
-            # 计算请求时间
-            process_time = time.time() - start_time
-            
-            # 记录日志（简单打印，实际应该记录到日志系统）
-            log_message = (
-                f"[{datetime.now().isoformat()}] "
-                f"{request_method} {request_path} "
-                f"- IP: {client_ip} "
-                f"- Status: {status_code} "
-                f"- Time: {process_time:.3f}s"
+            HTTP_REQUESTS_IN_PROGRESS.dec()
+            end_request_queries(token)
+            # 路由匹配后 scope 中才有 endpoint
+            route = route_template(scope)
+            method = method_label(scope['method'])
+            HTTP_REQUESTS.labels(method=method, route=route, status=status_code).inc()
+            HTTP_REQUEST_DURATION.labels(method=method, route=route).observe(
+                time.perf_counter() - start_time
             )
-            
-            # 高延迟警告
-            if process_time > 5.0:
-                log_message += " [SLOW]"
-            
-            print(log_message)
-        
-        return response
+            HTTP_REQUEST_DB_QUERIES.labels(route=route).observe(queries.count)
+            HTTP_REQUEST_DB_DURATION.labels(route=route).observe(queries.duration)
 
+
+class QueryProfilerMiddleware:
+    """
+    SQL 查询分析中间件（DB_PROFILING_ENABLED 开启，用于开发和排查）
+
+    - 响应头返回响应开始前执行的查询数、数据库耗时（毫秒）和疑似 N+1 的语句模板数
+    - 请求结束后记录完整统计：发现 N+1 时为 WARNING（附重复的语句），否则为 DEBUG
+    """
+    
+    def __init__(self, app: ASGIApp, threshold: Optional[int] = None):
+        self.app = app
+        self.threshold = settings.DB_N_PLUS_ONE_THRESHOLD if threshold is None else threshold
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        
+        with profile_queries() as profile:
+            async def send_with_profile(message: Message):
+                if message['type'] == 'http.response.start':
+                    headers = MutableHeaders(scope=message)
+                    headers['X-DB-Query-Count'] = str(profile.count)
+                    headers['X-DB-Query-Time'] = f"{profile.duration * 1000:.2f}"
+                    headers['X-DB-N-Plus-One'] = str(len(profile.repeated(self.threshold)))
+                await send(message)
+            
+            try:
+                await self.app(scope, receive, send_with_profile)
+            finally:
+                summary = profile.summary(self.threshold)
+                level = logging.WARNING if summary['repeated'] else logging.DEBUG
+                if profile_logger.isEnabledFor(level):
+                    route = route_template(scope)
+                    profile_logger.log(
+                        level,
+                        "%s %s 执行 %d 条 SQL，%d 个语句模板疑似 N+1",
+                        scope['method'], route, summary['query_count'], len(summary['repeated']),
+                        extra={"method": scope['method'], "path": scope['path'], "route": route, **summary}
+                    )
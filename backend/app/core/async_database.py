@@ -0,0 +1,137 @@
+"""
+异步数据库会话 - 处理函数中的数据库往返不阻塞事件循环
+
+- 异步引擎使用 SQLAlchemy asyncio + 异步驱动（MySQL: aiomysql，SQLite: aiosqlite），
+  连接 URL 默认由 DATABASE_URL 替换驱动名得到，也可以用 ASYNC_DATABASE_URL 单独指定
+- 没有安装异步驱动时退回同步引擎，数据库操作在数据库线程池（executors.db_executor）中执行，同样不阻塞事件循环
+- 同步引擎（database.engine / get_session）保留给尚未迁移的代码
+
+尚未改为异步的服务代码（参数为同步 Session）通过 run_sync 调用：
+    status = await db.run_sync(QuotaService.get_quota_status, user_id)
+"""
+import logging
+from typing import Any, AsyncGenerator, Callable, Optional, Union
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import database
+from .config import settings
+from .db_pool import async_pool_monitor, pool_options
+from .executors import run_in_db
+
+logger = logging.getLogger(__name__)
+
+# 同步驱动 -> 异步驱动
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
+
+
+def to_async_url(url: str) -> str:
+    """把同步连接 URL 的驱动替换为对应的异步驱动"""
+    parsed = make_url(url)
+    drivername = ASYNC_DRIVERS.get(parsed.drivername, parsed.drivername)
+    return parsed.set(drivername=drivername).render_as_string(hide_password=False)
+
+
+def create_async_db_engine(url: Optional[str] = None) -> Optional[AsyncEngine]:
+    """
+    创建异步引擎（MySQL 的连接池参数与同步引擎一致）
+
+    Returns:
+        异步引擎；没有安装异步驱动时返回 None
+    """
+    url = url or settings.ASYNC_DATABASE_URL or to_async_url(settings.DATABASE_URL)
+    kwargs = {}
+    if make_url(url).get_backend_name() == "mysql":
+        kwargs = {"connect_args": {"charset": "utf8mb4"}, **pool_options(async_pool_monitor, async_engine=True)}
+    try:
+        engine = create_async_engine(url, echo=settings.DEBUG, **kwargs)
+    except ImportError as e:
+        logger.warning("未安装异步数据库驱动（%s），异步会话退回线程池执行", e)
+        return None
+    async_pool_monitor.attach(engine.sync_engine)
+    return engine
+
+
+class ThreadedSession:
+    """
+    没有异步驱动时 AsyncSession 的替代
+
+    接口与 AsyncSession 一致（本项目用到的部分），同步会话的每个操作在数据库线程池中执行。
+    同一个会话只被一个请求顺序使用，不会被多个线程同时访问。
+    """
+
+    def __init__(self, session: Session):
+        self.sync_session = session
+
+    async def exec(self, statement, **kwargs):
+        return await run_in_db(self.sync_session.exec, statement, **kwargs)
+
+    async def execute(self, statement, **kwargs):
+        return await run_in_db(self.sync_session.execute, statement, **kwargs)
+
+    async def get(self, entity, ident, **kwargs):
+        return await run_in_db(self.sync_session.get, entity, ident, **kwargs)
+
+    async def scalar(self, statement, **kwargs):
+        return await run_in_db(self.sync_session.scalar, statement, **kwargs)
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    async def delete(self, instance):
+        await run_in_db(self.sync_session.delete, instance)
+
+    async def flush(self):
+        await run_in_db(self.sync_session.flush)
+
+    async def commit(self):
+        await run_in_db(self.sync_session.commit)
+
+    async def rollback(self):
+        await run_in_db(self.sync_session.rollback)
+
+    async def refresh(self, instance, **kwargs):
+        await run_in_db(self.sync_session.refresh, instance, **kwargs)
+
+    async def close(self):
+        await run_in_db(self.sync_session.close)
+
+    async def run_sync(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """在线程中以同步会话调用 fn(session, *args, **kwargs)"""
+        return await run_in_db(fn, self.sync_session, *args, **kwargs)
+
+
+AnyAsyncSession = Union[AsyncSession, ThreadedSession]
+
+# 全局异步引擎
+async_engine = create_async_db_engine()
+
+
+async def get_async_session() -> AsyncGenerator[AnyAsyncSession, None]:
+    """获取异步数据库会话（提交后不过期对象，避免在事件循环中隐式加载属性）"""
+    if async_engine is None:
+        session = Session(database.engine, expire_on_commit=False)
+        try:
+            yield ThreadedSession(session)
+        finally:
+            await run_in_db(session.close)
+        return
+
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
+async def dispose_async_engine():
+    """关闭异步引擎的连接池"""
+    if async_engine is not None:
+        await async_engine.dispose()
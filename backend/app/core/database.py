@@ -1,12 +1,14 @@
 from sqlmodel import create_engine, Session, SQLModel
 from typing import Generator
 from .config import settings
+from .db_pool import pool_options, sync_pool_monitor
 
 # 导入所有模型确保表被创建
 from ..models.abtest import ABTestResult
 from ..models.ai_config import AIConfig
 from ..models.api_quota import ApiQuota, ApiUsage
-from ..models.audit_log import AuditLog, SecurityConfig, SensitiveWord
+from ..models.audit_log import AuditLog, SecurityConfig, SensitiveWord, SensitiveWordVersion
+from ..models.background_job import BackgroundJob
 from ..models.branch import PromptBranch
 from ..models.comment import PromptComment
 from ..models.commit import PromptCommit
@@ -18,20 +20,20 @@ from ..models.quality_evaluation import ComparisonReport, QualityEvaluation
 from ..models.site_settings import SiteSettings
 from ..models.team import Team, TeamInvite, TeamMember, TeamPrompt
 from ..models.template import PromptTemplate, TemplateCategory, TemplateRating, UserTemplateFavorite
-from ..models.test_suite import PromptTestRun, PromptTestSuite
+from ..models.test_suite import PromptBaselineOutput, PromptTestRun, PromptTestSuite
 from ..models.uploaded_file import UploadedFile
 from ..models.user import User
 
-# 创建数据库引擎（配置 utf8mb4 支持 emoji）
+# 创建数据库引擎（配置 utf8mb4 支持 emoji，连接池参数见 DB_POOL_*）
 engine = create_engine(
     settings.DATABASE_URL,
     echo=settings.DEBUG,
-    pool_pre_ping=True,
-    pool_recycle=3600,
     connect_args={
         "charset": "utf8mb4"
-    }
+    },
+    **pool_options(sync_pool_monitor)
 )
+sync_pool_monitor.attach(engine)
 
 
 def create_db_and_tables():
@@ -0,0 +1,212 @@
+"""
+数据库连接池配置与统计
+
+- 连接池大小、溢出、获取超时、回收时间由 Settings 中的 DB_POOL_* 配置
+- 统计获取连接的等待时间（直方图）、超时次数、当前借出 / 溢出连接数和连接存活时间
+- 获取连接等待超过 DB_POOL_SLOW_CHECKOUT 秒时输出警告，便于定位 "QueuePool limit reached"
+"""
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Type
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# 等待时间直方图的桶上界（秒）
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class PoolMonitor:
+    """
+    单个连接池的统计
+
+    连接事件在各个工作线程中触发，计数在锁内更新。
+    """
+
+    def __init__(self, name: str, slow_checkout: Optional[float] = None):
+        self.name = name
+        self.slow_checkout = settings.DB_POOL_SLOW_CHECKOUT if slow_checkout is None else slow_checkout
+        self._lock = threading.Lock()
+        # {id(dbapi 连接): 建立时间}
+        self._opened: Dict[int, float] = {}
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.checkins = 0
+            self.connects = 0
+            self.disconnects = 0
+            self.invalidations = 0
+            self.timeouts = 0
+            self.slow_checkouts = 0
+            self.wait_count = 0
+            self.wait_sum = 0.0
+            self.wait_max = 0.0
+            self.wait_buckets = [0] * len(WAIT_BUCKETS)
+
+    # ---------- 事件 ----------
+
+    def attach(self, engine: Engine):
+        """监听引擎连接池的事件（异步引擎传入 async_engine.sync_engine）"""
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "close", self._on_close)
+        event.listen(engine, "detach", self._on_close)
+        event.listen(engine, "invalidate", self._on_invalidate)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+            self._opened[id(dbapi_connection)] = time.monotonic()
+
+    def _on_close(self, dbapi_connection, connection_record):
+        with self._lock:
+            if self._opened.pop(id(dbapi_connection), None) is not None:
+                self.disconnects += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checkins += 1
+
+    def record_wait(self, seconds: float, pool: Optional[Pool] = None, timed_out: bool = False):
+        """记录一次获取连接的等待时间"""
+        with self._lock:
+            self.wait_count += 1
+            self.wait_sum += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            for i, bound in enumerate(WAIT_BUCKETS):
+                if seconds <= bound:
+                    self.wait_buckets[i] += 1
+                    break
+            if timed_out:
+                self.timeouts += 1
+            slow = self.slow_checkout > 0 and seconds >= self.slow_checkout
+            if slow:
+                self.slow_checkouts += 1
+
+        if timed_out or slow:
+            logger.warning(
+                "数据库连接池 %s %s：等待 %.3fs",
+                self.name, "获取连接超时" if timed_out else "获取连接较慢", seconds,
+                extra={
+                    "pool": self.name,
+                    "wait": round(seconds, 6),
+                    "timed_out": timed_out,
+                    "pool_status": pool.status() if pool is not None else None,
+                }
+            )
+
+    # ---------- 统计 ----------
+
+    def _histogram(self) -> List[Dict]:
+        """累计直方图（le 为桶上界，最后一个桶为 +Inf）"""
+        histogram = []
+        total = 0
+        for bound, count in zip(WAIT_BUCKETS, self.wait_buckets):
+            total += count
+            histogram.append({"le": bound, "count": total})
+        histogram.append({"le": "+Inf", "count": self.wait_count})
+        return histogram
+
+    def stats(self, pool: Optional[Pool] = None) -> Dict:
+        """连接池统计；传入连接池时附带当前的借出 / 空闲 / 溢出连接数"""
+        now = time.monotonic()
+        with self._lock:
+            ages = [now - opened for opened in self._opened.values()]
+            data = {
+                "name": self.name,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "connects": self.connects,
+                "disconnects": self.disconnects,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "slow_checkouts": self.slow_checkouts,
+                "slow_checkout_threshold": self.slow_checkout,
+                "wait": {
+                    "count": self.wait_count,
+                    "sum": round(self.wait_sum, 6),
+                    "avg": round(self.wait_sum / self.wait_count, 6) if self.wait_count else 0.0,
+                    "max": round(self.wait_max, 6),
+                    "histogram": self._histogram(),
+                },
+                "connection_age": {
+                    "open": len(ages),
+                    "min": round(min(ages), 3) if ages else 0.0,
+                    "avg": round(sum(ages) / len(ages), 3) if ages else 0.0,
+                    "max": round(max(ages), 3) if ages else 0.0,
+                },
+            }
+
+        if pool is not None:
+            data["pool_class"] = type(pool).__name__
+            if isinstance(pool, QueuePool):
+                data.update({
+                    "size": pool.size(),
+                    "max_overflow": pool._max_overflow,
+                    "timeout": pool.timeout(),
+                    "checked_out": pool.checkedout(),
+                    "checked_in": pool.checkedin(),
+                    "overflow": max(0, pool.overflow()),
+                })
+        return data
+
+
+def instrumented_pool_class(base: Type[QueuePool], monitor: PoolMonitor) -> Type[QueuePool]:
+    """
+    生成记录获取连接等待时间的连接池类
+
+    SQLAlchemy 没有"开始等待连接"的事件，因此覆盖 _do_get 计时。
+    连接池重建（engine.dispose）时沿用同一个类，统计不会丢失。
+    """
+
+    class InstrumentedPool(base):
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except exc.TimeoutError:
+                monitor.record_wait(time.perf_counter() - started, self, timed_out=True)
+                raise
+            monitor.record_wait(time.perf_counter() - started, self)
+            return connection
+
+    InstrumentedPool.__name__ = f"Instrumented{base.__name__}"
+    InstrumentedPool.__qualname__ = InstrumentedPool.__name__
+    # SQLAlchemy 按类所在模块命名连接池日志器，保持在 sqlalchemy.pool 下
+    InstrumentedPool.__module__ = base.__module__
+    return InstrumentedPool
+
+
+def pool_options(monitor: PoolMonitor, async_engine: bool = False) -> Dict:
+    """create_engine / create_async_engine 的连接池参数"""
+    base = AsyncAdaptedQueuePool if async_engine else QueuePool
+    return {
+        "poolclass": instrumented_pool_class(base, monitor),
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+# 全局统计（同步引擎 / 异步引擎各一个）
+sync_pool_monitor = PoolMonitor("sync")
+async_pool_monitor = PoolMonitor("async")
@@ -2,8 +2,10 @@ from typing import Generator, Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer
 from fastapi.security.http import HTTPAuthorizationCredentials
-from sqlmodel import Session, select
+from sqlmodel import Session
+from . import database
 from .database import get_session
+from .executors import run_in_db
 from .security import decode_access_token
 from ..models.user import User
 
@@ -15,11 +17,21 @@ def get_db() -> Generator[Session, None, None]:
     yield from get_session()
 
 
+def _load_user(user_id: int) -> Optional[User]:
+    """使用独立会话查询用户（在数据库线程池中调用），返回脱离会话的对象"""
+    with Session(database.engine) as db:
+        return db.get(User, user_id)
+
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
 ) -> User:
-    """获取当前用户"""
+    """
+    获取当前用户
+
+    在数据库线程池中用独立的短会话查询，连接在处理函数执行前就已归还，
+    不论处理函数使用同步还是异步会话，一个请求都不会同时占用两个连接。
+    """
     token = credentials.credentials
 
     payload = decode_access_token(token)
@@ -46,7 +58,7 @@ async def get_current_user(
             detail="无效的认证凭证",
         )
 
-    user = db.get(User, user_id)
+    user = await run_in_db(_load_user, user_id)
 
     if user is None:
         raise HTTPException(
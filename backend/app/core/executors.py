@@ -0,0 +1,171 @@
+"""
+线程池 - 把阻塞的数据库、加密和文件操作移出事件循环
+
+按用途划分独立的线程池，一类操作变慢（如大量登录的 bcrypt 校验）不会占满其他操作的线程：
+- db: 同步数据库会话的查询和提交（大小默认与数据库连接池容量一致）
+- crypto: bcrypt 密码哈希、Fernet 加解密等 CPU 密集操作（这些库在计算时释放 GIL）
+- file: 上传文件的读写和内容提取
+- state: 共享状态后端（SQLite / Redis）的限流与配额计数器读写
+
+用法：
+    user = await run_in_db(load_user, db, user_id)
+    ok = await run_in_crypto(verify_password, password, hashed)
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from .config import settings
+
+T = TypeVar("T")
+
+
+class ManagedExecutor:
+    """
+    带统计的线程池
+
+    统计排队中 / 执行中的任务数，以及任务的排队等待时间和执行时间。
+    线程池在第一次提交任务时创建，shutdown 后再次提交会重新创建。
+    """
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max(1, int(max_workers))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.queued = 0
+            self.active = 0
+            self.completed = 0
+            self.errors = 0
+            self.wait_sum = 0.0
+            self.wait_max = 0.0
+            self.run_sum = 0.0
+            self.run_max = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix=f"{self.name}-pool",
+                )
+            return self._executor
+
+    def _call(self, submitted: float, fn: Callable[..., T], *args, **kwargs) -> T:
+        started = time.perf_counter()
+        wait = started - submitted
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+            self.wait_sum += wait
+            self.wait_max = max(self.wait_max, wait)
+
+        failed = False
+        try:
+            return fn(*args, **kwargs)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+                self.errors += failed
+                self.run_sum += elapsed
+                self.run_max = max(self.run_max, elapsed)
+
+    def _on_done(self, future: Future):
+        # 排队中被取消（调用方协程被取消）的任务不会执行 _call
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+    async def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """在线程池中执行 fn(*args, **kwargs)（与 asyncio.to_thread 一样传递 contextvars）"""
+        executor = self._get_executor()
+        context = contextvars.copy_context()
+        with self._lock:
+            self.queued += 1
+        try:
+            future = executor.submit(context.run, self._call, time.perf_counter(), fn, *args, **kwargs)
+        except BaseException:
+            with self._lock:
+                self.queued -= 1
+            raise
+        future.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> Dict:
+        """线程池统计（时间单位为秒）"""
+        with self._lock:
+            completed = self.completed
+            return {
+                "name": self.name,
+                "max_workers": self.max_workers,
+                "queued": self.queued,
+                "active": self.active,
+                "completed": completed,
+                "errors": self.errors,
+                "wait_avg": round(self.wait_sum / completed, 6) if completed else 0.0,
+                "wait_max": round(self.wait_max, 6),
+                "run_avg": round(self.run_sum / completed, 6) if completed else 0.0,
+                "run_max": round(self.run_max, 6),
+            }
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+# 全局线程池（DB_EXECUTOR_WORKERS 为 0 时与数据库连接池容量一致，线程不会空等连接）
+db_executor = ManagedExecutor(
+    "db",
+    settings.DB_EXECUTOR_WORKERS or settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW,
+)
+crypto_executor = ManagedExecutor("crypto", settings.CRYPTO_EXECUTOR_WORKERS)
+file_executor = ManagedExecutor("file", settings.FILE_EXECUTOR_WORKERS)
+state_executor = ManagedExecutor("state", settings.STATE_EXECUTOR_WORKERS)
+
+EXECUTORS = {
+    executor.name: executor
+    for executor in (db_executor, crypto_executor, file_executor, state_executor)
+}
+
+
+async def run_in_db(fn: Callable[..., T], *args, **kwargs) -> T:
+    """在数据库线程池中执行"""
+    return await db_executor.run(fn, *args, **kwargs)
+
+
+async def run_in_crypto(fn: Callable[..., T], *args, **kwargs) -> T:
+    """在加密线程池中执行"""
+    return await crypto_executor.run(fn, *args, **kwargs)
+
+
+async def run_in_file(fn: Callable[..., T], *args, **kwargs) -> T:
+    """在文件线程池中执行"""
+    return await file_executor.run(fn, *args, **kwargs)
+
+
+async def run_in_state(fn: Callable[..., T], *args, **kwargs) -> T:
+    """在状态后端线程池中执行"""
+    return await state_executor.run(fn, *args, **kwargs)
+
+
+def executor_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: executor.stats() for name, executor in EXECUTORS.items()}
+
+
+def shutdown_executors(wait: bool = True):
+    for executor in EXECUTORS.values():
+        executor.shutdown(wait=wait)
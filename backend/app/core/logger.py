@@ -0,0 +1,171 @@
+"""
+日志 - 队列异步输出的结构化日志
+
+- 业务代码使用标准库 logging：logger = logging.getLogger(__name__)，结构化字段通过 extra 传入
+- 根日志器只挂一个 QueueHandler，记录放入内存队列后立即返回；
+  后台线程（QueueListener）负责格式化和写 stdout，慢速的 stdout 不会阻塞事件循环
+- 队列满时丢弃记录并计数，不等待
+- LOG_FORMAT=json 时每条记录输出一行 JSON，便于日志系统解析
+
+    logger.warning("获取连接较慢", extra={"pool": "sync", "wait": 0.8})
+    -> {"ts": "...", "level": "WARNING", "logger": "app.core.db_pool", "message": "获取连接较慢", "pool": "sync", "wait": 0.8}
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+from .config import settings
+
+# LogRecord 自带的属性，其余属性视为 extra 传入的结构化字段
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+def record_fields(record: logging.LogRecord) -> Dict:
+    """通过 extra 传入的结构化字段"""
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+
+
+class JSONFormatter(logging.Formatter):
+    """每条记录格式化为一行 JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        data.update(record_fields(record))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """便于本地开发阅读的单行文本（结构化字段以 key=value 追加在末尾）"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        ts = datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds")
+        line = f"[{ts}] {record.levelname} {record.name}: {record.getMessage()}"
+        fields = record_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+
+class StdoutHandler(logging.StreamHandler):
+    """写入当前的 sys.stdout（而不是创建时的 stdout，便于测试和重定向）"""
+
+    def __init__(self):
+        super().__init__(sys.stdout)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃记录（计入 dropped），调用方永远不等待"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 在调用方线程中合并消息参数和异常堆栈（参数对象可能在之后被修改），保留结构化字段
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_lock = threading.Lock()
+_handler: Optional[NonBlockingQueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging(
+    level: Optional[str] = None,
+    log_format: Optional[str] = None,
+    queue_size: Optional[int] = None,
+) -> NonBlockingQueueHandler:
+    """
+    配置根日志器（重复调用时替换之前的配置）
+
+    Args:
+        level: 日志级别，默认 LOG_LEVEL
+        log_format: json 或 text，默认 LOG_FORMAT
+        queue_size: 队列容量，默认 LOG_QUEUE_SIZE
+    """
+    global _handler, _listener
+
+    level = (level or settings.LOG_LEVEL).upper()
+    log_format = log_format or settings.LOG_FORMAT
+    queue_size = settings.LOG_QUEUE_SIZE if queue_size is None else queue_size
+
+    output = StdoutHandler()
+    output.setFormatter(JSONFormatter() if log_format == "json" else TextFormatter())
+
+    with _lock:
+        stop_logging()
+        _handler = NonBlockingQueueHandler(queue.Queue(maxsize=queue_size))
+        _listener = logging.handlers.QueueListener(_handler.queue, output)
+        _listener.start()
+
+        root = logging.getLogger()
+        root.addHandler(_handler)
+        root.setLevel(level)
+        # 第三方库只输出警告以上（SQLAlchemy 的 echo 会单独设置 sqlalchemy.engine 的级别）
+        for name in ("sqlalchemy", "httpx", "httpcore", "openai"):
+            logging.getLogger(name).setLevel(logging.WARNING)
+    return _handler
+
+
+def stop_logging():
+    """停止后台输出线程并输出队列中剩余的记录"""
+    global _handler, _listener
+    if _handler is not None:
+        logging.getLogger().removeHandler(_handler)
+    if _listener is not None:
+        try:
+            _listener.stop()
+        except queue.Full:
+            # 队列已满放不下结束标记，输出线程为守护线程，随进程退出
+            pass
+    _handler = None
+    _listener = None
+
+
+def logging_stats() -> Dict:
+    """日志队列状态"""
+    if _handler is None:
+        return {"queued": 0, "dropped": 0}
+    return {"queued": _handler.queue.qsize(), "dropped": _handler.dropped}
+
+
+atexit.register(stop_logging)
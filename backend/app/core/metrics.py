@@ -0,0 +1,574 @@
+"""
+监控指标 - Prometheus 文本格式的 /metrics
+
+- Counter / Gauge / Histogram 的用法与 prometheus_client 一致（未引入该依赖）：
+    LLM_REQUESTS.labels(provider="openai", model="gpt-4o", status="ok").inc()
+- 记录指标只在锁内更新几个数字，文本在抓取时才生成，热路径开销很小
+- 连接池、线程池、日志队列、缓存等已有的统计通过 collector 在抓取时读取各自的 stats()
+- 每个请求的 SQL 语句数和耗时通过 SQLAlchemy 事件累计到当前请求（contextvars，线程池中同样可见）
+
+标签值必须是有限集合，避免时间序列无限增长：HTTP 方法、路由模板（而不是实际路径），
+服务商和模型只保留已知的名称，用户自定义的值归为 other（见 provider_label / model_label）。
+"""
+import contextvars
+import math
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .config import settings
+from ..utils.token_counter import MODEL_PRICES
+from ..utils.tokenizer import MODEL_PREFIX_TO_ENCODING, MODEL_TO_ENCODING
+
+# 指标族：(名称, 类型, 说明, [(名称后缀, 标签, 值), ...])
+Sample = Tuple[str, Dict[str, str], float]
+MetricFamily = Tuple[str, str, str, List[Sample]]
+
+# 默认的耗时直方图桶上界（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _CounterValue:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        return [("", {}, self.value)]
+
+
+class _GaugeValue(_CounterValue):
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = value
+
+
+class _HistogramValue:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个为 +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            counts = list(self.counts)
+            total_sum = self.sum
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            samples.append(("_bucket", {"le": "+Inf" if bound == math.inf else repr(float(bound))}, cumulative))
+        samples.append(("_sum", {}, total_sum))
+        samples.append(("_count", {}, cumulative))
+        return samples
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, **labels):
+        """按标签取子指标（标签必须与 labelnames 完全一致）"""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            if len(labels) != len(self.labelnames):
+                raise ValueError(f"指标 {self.name} 的标签为 {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def clear(self):
+        with self._lock:
+            self._children.clear()
+
+    def collect(self) -> MetricFamily:
+        with self._lock:
+            children = list(self._children.items())
+        samples = []
+        for key, child in children:
+            labels = dict(zip(self.labelnames, key))
+            for suffix, extra, value in child.samples():
+                samples.append((suffix, {**labels, **extra}, value))
+        return self.name, self.type, self.documentation, samples
+
+
+class Counter(_Metric):
+    """只增不减的计数"""
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    """可增可减的当前值"""
+    type = "gauge"
+
+    def _new_child(self):
+        return _GaugeValue()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class Histogram(_Metric):
+    """分布（累计桶 + 总和 + 次数）"""
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+
+class MetricsRegistry:
+    """指标注册表：注册的指标和 collector 在 render() 时输出为 Prometheus 文本格式"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[MetricFamily]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"指标 {metric.name} 已注册")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable[MetricFamily]]):
+        """注册抓取时调用的 collector（返回指标族列表）"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def collect(self) -> List[MetricFamily]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        families = [metric.collect() for metric in metrics]
+        for collector in collectors:
+            families.extend(collector())
+
+        # 多个 collector 输出的同名指标族合并为一个（文本格式要求同名指标连续）
+        merged: Dict[str, MetricFamily] = {}
+        for name, metric_type, documentation, samples in families:
+            if name in merged:
+                merged[name][3].extend(samples)
+            else:
+                merged[name] = (name, metric_type, documentation, list(samples))
+        return list(merged.values())
+
+    def clear(self):
+        """清空所有指标的已有数据（测试使用）"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.clear()
+
+    def render(self) -> str:
+        """Prometheus 文本格式（text/plain; version=0.0.4）"""
+        lines = []
+        for name, metric_type, documentation, samples in self.collect():
+            lines.append(f"# HELP {name} {_escape_help(documentation)}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for suffix, labels, value in samples:
+                lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for key, value in labels.items()
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+# 全局注册表
+registry = MetricsRegistry()
+
+# ---------- HTTP ----------
+HTTP_REQUESTS = registry.counter(
+    "http_requests_total", "HTTP 请求数", ("method", "route", "status")
+)
+HTTP_REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds", "HTTP 请求耗时（到响应发送完毕）", ("method", "route")
+)
+HTTP_REQUESTS_IN_PROGRESS = registry.gauge(
+    "http_requests_in_progress", "正在处理的 HTTP 请求数"
+)
+HTTP_REQUEST_DB_QUERIES = registry.histogram(
+    "http_request_db_queries", "每个 HTTP 请求执行的 SQL 语句数", ("route",),
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100),
+)
+HTTP_REQUEST_DB_DURATION = registry.histogram(
+    "http_request_db_duration_seconds", "每个 HTTP 请求的 SQL 执行总耗时", ("route",)
+)
+
+# ---------- 数据库 ----------
+DB_QUERIES = registry.counter(
+    "db_queries_total", "SQL 语句执行数", ("operation",)
+)
+DB_QUERY_DURATION = registry.histogram(
+    "db_query_duration_seconds", "单条 SQL 语句执行耗时", ("operation",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+# ---------- LLM ----------
+LLM_REQUESTS = registry.counter(
+    "llm_requests_total", "LLM 调用次数（不含命中结果缓存的请求）", ("provider", "model", "status")
+)
+LLM_REQUEST_DURATION = registry.histogram(
+    "llm_request_duration_seconds", "LLM 调用耗时（流式调用到最后一个 chunk）", ("provider", "model"),
+    buckets=(0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0),
+)
+LLM_TOKENS = registry.counter(
+    "llm_tokens_total", "LLM 调用消耗的 token 数", ("provider", "model", "type")
+)
+LLM_COST = registry.counter(
+    "llm_cost_usd_total", "LLM 调用的估算费用（美元）", ("provider", "model")
+)
+
+# ---------- 限流 / 配额 ----------
+RATE_LIMIT_REJECTIONS = registry.counter(
+    "rate_limit_rejections_total", "频率限制拒绝的请求数", ("scope", "window")
+)
+QUOTA_REJECTIONS = registry.counter(
+    "quota_rejections_total", "配额不足拒绝的请求数", ("check",)
+)
+
+
+# ---------- 标签归一化 ----------
+
+# 已知服务商的域名；用户自定义的 base_url 归为 other（DEFAULT_AI_BASE_URL 为 default）
+PROVIDER_HOSTS = {
+    "api.openai.com": "openai",
+    "api.deepseek.com": "deepseek",
+    "api.moonshot.cn": "moonshot",
+    "dashscope.aliyuncs.com": "dashscope",
+    "open.bigmodel.cn": "zhipu",
+    "api.anthropic.com": "anthropic",
+}
+
+# 已知模型（精确匹配），其余按模型族前缀归类，都不匹配时为 other
+KNOWN_MODELS = frozenset(MODEL_PRICES) | frozenset(MODEL_TO_ENCODING)
+MODEL_FAMILY_PREFIXES = tuple(sorted(
+    {prefix for prefix, _ in MODEL_PREFIX_TO_ENCODING}
+    | {"deepseek", "moonshot", "kimi", "qwen", "glm", "claude"},
+    key=len,
+    reverse=True,
+))
+
+HTTP_METHODS = frozenset(("GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"))
+
+
+def provider_label(base_url: Optional[str]) -> str:
+    """服务商标签（有限集合）：已知服务商名、default 或 other"""
+    host = urlparse(base_url or "").hostname or ""
+    if host in PROVIDER_HOSTS:
+        return PROVIDER_HOSTS[host]
+    if host and host == urlparse(settings.DEFAULT_AI_BASE_URL).hostname:
+        return "default"
+    return "other"
+
+
+@lru_cache(maxsize=1024)
+def model_label(model: Optional[str]) -> str:
+    """模型标签（有限集合）：已知模型名、模型族前缀或 other"""
+    if not model:
+        return "other"
+    if model in KNOWN_MODELS or model == settings.DEFAULT_AI_MODEL:
+        return model
+    for prefix in MODEL_FAMILY_PREFIXES:
+        if model.startswith(prefix):
+            return prefix
+    return "other"
+
+
+def method_label(method: str) -> str:
+    """HTTP 方法标签（客户端可以发送任意方法名）"""
+    return method if method in HTTP_METHODS else "other"
+
+
+def record_llm_call(
+    base_url: Optional[str],
+    model: Optional[str],
+    status: str,
+    duration: float,
+    input_tokens: int = 0,
+    output_tokens: int = 0,
+    cost: float = 0.0,
+):
+    """
+    记录一次 LLM 调用（status: ok / error）
+
+    base_url 和 model 来自用户配置和请求参数，记录前归一化为有限的标签值。
+    """
+    provider = provider_label(base_url)
+    model = model_label(model)
+    LLM_REQUESTS.labels(provider=provider, model=model, status=status).inc()
+    LLM_REQUEST_DURATION.labels(provider=provider, model=model).observe(duration)
+    if input_tokens:
+        LLM_TOKENS.labels(provider=provider, model=model, type="input").inc(input_tokens)
+    if output_tokens:
+        LLM_TOKENS.labels(provider=provider, model=model, type="output").inc(output_tokens)
+    if cost:
+        LLM_COST.labels(provider=provider, model=model).inc(cost)
+
+
+# ---------- 每个请求的 SQL 统计 ----------
+
+class RequestQueryStats:
+    """当前请求执行的 SQL 语句数和总耗时"""
+    __slots__ = ("count", "duration")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+_request_queries: contextvars.ContextVar[Optional[RequestQueryStats]] = contextvars.ContextVar(
+    "request_queries", default=None
+)
+
+
+def start_request_queries() -> Tuple[RequestQueryStats, contextvars.Token]:
+    """开始统计当前请求的 SQL（返回的 token 传给 end_request_queries）"""
+    stats = RequestQueryStats()
+    return stats, _request_queries.set(stats)
+
+
+def end_request_queries(token: contextvars.Token):
+    _request_queries.reset(token)
+
+
+def _query_operation(statement: str) -> str:
+    keyword = statement.lstrip()[:8].split(None, 1)
+    operation = keyword[0].lower() if keyword else ""
+    return operation if operation in ("select", "insert", "update", "delete") else "other"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    operation = _query_operation(statement)
+    DB_QUERIES.labels(operation=operation).inc()
+    DB_QUERY_DURATION.labels(operation=operation).observe(elapsed)
+    stats = _request_queries.get()
+    if stats is not None:
+        # 同一个请求的语句按顺序执行，不需要加锁
+        stats.count += 1
+        stats.duration += elapsed
+
+
+_db_instrumented = False
+
+
+def instrument_db():
+    """监听所有引擎（包括异步引擎底层的同步引擎）的 SQL 执行事件（重复调用无副作用）"""
+    global _db_instrumented
+    if _db_instrumented:
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    _db_instrumented = True
+
+
+# ---------- 路由模板 ----------
+
+# {endpoint: [(路径正则, 路由模板), ...]}
+_route_templates: Dict[object, List[Tuple[object, str]]] = {}
+
+
+def route_template(scope: Dict) -> str:
+    """
+    请求匹配到的路由模板（如 /api/prompts/{prompt_id}），没有匹配的路由时为 unmatched
+
+    路由匹配后 Starlette 会在 scope 中写入 endpoint，按 endpoint 反查路由（结果缓存）。
+    """
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    candidates = _route_templates.get(endpoint)
+    if candidates is None:
+        router = scope.get("router")
+        candidates = [
+            (route.path_regex, route.path_format)
+            for route in getattr(router, "routes", ())
+            if getattr(route, "endpoint", None) is endpoint and hasattr(route, "path_format")
+        ]
+        _route_templates[endpoint] = candidates
+    if len(candidates) == 1:
+        return candidates[0][1]
+    for path_regex, template in candidates:
+        if path_regex.match(scope["path"]):
+            return template
+    return "unmatched"
+
+
+# ---------- 已有统计的 collector ----------
+
+def _collect_runtime() -> List[MetricFamily]:
+    """数据库连接池、线程池和日志队列"""
+    from . import async_database, database
+    from .db_pool import async_pool_monitor, sync_pool_monitor
+    from .executors import executor_stats
+    from .logger import logging_stats
+
+    pools = [sync_pool_monitor.stats(database.engine.pool)]
+    if async_database.async_engine is not None:
+        pools.append(async_pool_monitor.stats(async_database.async_engine.sync_engine.pool))
+
+    def pool_family(name, metric_type, documentation, key):
+        return (name, metric_type, documentation, [
+            ("", {"pool": pool["name"]}, pool[key]) for pool in pools if key in pool
+        ])
+
+    families = [
+        pool_family("db_pool_checked_out", "gauge", "借出中的数据库连接数", "checked_out"),
+        pool_family("db_pool_overflow", "gauge", "超出 pool_size 的溢出连接数", "overflow"),
+        pool_family("db_pool_size", "gauge", "数据库连接池大小", "size"),
+        pool_family("db_pool_timeouts_total", "counter", "获取数据库连接超时次数", "timeouts"),
+        ("db_pool_checkout_wait_seconds", "summary", "获取数据库连接的等待时间", [
+            sample
+            for pool in pools
+            for sample in (
+                ("_sum", {"pool": pool["name"]}, pool["wait"]["sum"]),
+                ("_count", {"pool": pool["name"]}, pool["wait"]["count"]),
+            )
+        ]),
+    ]
+
+    executors = executor_stats().values()
+    for key, metric_type, documentation in (
+        ("queued", "gauge", "线程池中排队的任务数"),
+        ("active", "gauge", "线程池中执行中的任务数"),
+        ("completed", "counter", "线程池已完成的任务数"),
+        ("errors", "counter", "线程池中抛出异常的任务数"),
+    ):
+        name = f"executor_{key}" + ("_total" if metric_type == "counter" else "")
+        families.append((name, metric_type, documentation, [
+            ("", {"executor": stats["name"]}, stats[key]) for stats in executors
+        ]))
+
+    log_stats = logging_stats()
+    families.append(("log_queue_size", "gauge", "日志队列中等待输出的记录数", [("", {}, log_stats["queued"])]))
+    families.append(("log_records_dropped_total", "counter", "日志队列满时丢弃的记录数", [("", {}, log_stats["dropped"])]))
+    return families
+
+
+registry.add_collector(_collect_runtime)
+
+
+def cache_collector(cache: str, stats: Callable[[], Dict]) -> Callable[[], List[MetricFamily]]:
+    """
+    缓存命中统计的 collector（stats() 返回 hits / misses / size，可选 db_hits）
+
+    输出 cache_requests_total{cache, result="hit|db_hit|miss"} 和 cache_entries{cache}。
+    """
+
+    def collect() -> List[MetricFamily]:
+        data = stats()
+        requests = [
+            ("", {"cache": cache, "result": result}, data[key])
+            for key, result in (("hits", "hit"), ("db_hits", "db_hit"), ("misses", "miss"))
+            if key in data
+        ]
+        return [
+            ("cache_requests_total", "counter", "缓存查询次数", requests),
+            ("cache_entries", "gauge", "缓存条目数", [("", {"cache": cache}, data.get("size", 0))]),
+        ]
+
+    return collect
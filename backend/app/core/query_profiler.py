@@ -0,0 +1,164 @@
+"""
+SQL 查询分析 - 统计每个请求的查询数、数据库耗时和重复的语句，发现 N+1 查询
+
+- 设置 DB_PROFILING_ENABLED=true 后，QueryProfilerMiddleware 为每个请求开启分析：
+  响应头返回 X-DB-Query-Count / X-DB-Query-Time / X-DB-N-Plus-One，
+  同一语句模板在一个请求中执行超过 DB_N_PLUS_ONE_THRESHOLD 次时输出 WARNING 日志
+- 语句模板即 SQLAlchemy 生成的参数化 SQL，IN (?, ?, ...) 的参数个数归一化后比较
+- 没有开启分析时，事件监听只检查一次 contextvar 后返回
+
+测试中断言查询预算：
+    with assert_query_budget(max_queries=3, max_repeats=1):
+        client.get("/api/prompt/list")
+"""
+import contextvars
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .config import settings
+
+# 日志和断言信息中语句的最大长度
+STATEMENT_PREVIEW_CHARS = 300
+
+_PLACEHOLDER = r"(?:\?|%s|%\(\w+\)s|:\w+|\$\d+)"
+_PLACEHOLDER_LIST = re.compile(rf"\(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+_SELECT_COLUMNS = re.compile(r"^SELECT .+? FROM ", re.IGNORECASE)
+
+
+@lru_cache(maxsize=2048)
+def statement_template(statement: str) -> str:
+    """语句模板：合并空白，IN 列表的多个参数占位符归一化为 (?)"""
+    return _PLACEHOLDER_LIST.sub("(?)", _WHITESPACE.sub(" ", statement).strip())
+
+
+def statement_preview(template: str) -> str:
+    """日志和断言信息中显示的语句：省略 SELECT 的列清单，保留 FROM / WHERE"""
+    return _SELECT_COLUMNS.sub("SELECT ... FROM ", template, count=1)[:STATEMENT_PREVIEW_CHARS]
+
+
+class QueryProfile:
+    """一个请求（或一段代码）执行的 SQL 统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.duration = 0.0
+        # {语句模板: [执行次数, 总耗时]}
+        self.statements: Dict[str, List] = {}
+
+    def record(self, statement: str, elapsed: float):
+        template = statement_template(statement)
+        # 同一请求的查询可能在多个线程中执行（如并发的批量任务）
+        with self._lock:
+            self.count += 1
+            self.duration += elapsed
+            entry = self.statements.get(template)
+            if entry is None:
+                self.statements[template] = [1, elapsed]
+            else:
+                entry[0] += 1
+                entry[1] += elapsed
+
+    def repeated(self, threshold: int) -> List[Dict]:
+        """执行次数超过 threshold 的语句模板（按次数从多到少）"""
+        with self._lock:
+            items = [(template, count, duration) for template, (count, duration) in self.statements.items()]
+        return [
+            {
+                "statement": statement_preview(template),
+                "count": count,
+                "duration_ms": round(duration * 1000, 2),
+            }
+            for template, count, duration in sorted(items, key=lambda item: -item[1])
+            if count > threshold
+        ]
+
+    def summary(self, threshold: Optional[int] = None) -> Dict:
+        threshold = settings.DB_N_PLUS_ONE_THRESHOLD if threshold is None else threshold
+        return {
+            "query_count": self.count,
+            "db_time_ms": round(self.duration * 1000, 2),
+            "distinct_statements": len(self.statements),
+            "repeated": self.repeated(threshold),
+        }
+
+
+_current_profile: contextvars.ContextVar[Optional[QueryProfile]] = contextvars.ContextVar(
+    "query_profile", default=None
+)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _current_profile.get() is not None:
+        context._profile_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current_profile.get()
+    started = getattr(context, "_profile_started", None)
+    if profile is not None and started is not None:
+        profile.record(statement, time.perf_counter() - started)
+
+
+_instrumented = False
+
+
+def instrument_queries():
+    """监听所有引擎的 SQL 执行事件（重复调用无副作用）"""
+    global _instrumented
+    if _instrumented:
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    _instrumented = True
+
+
+@contextmanager
+def profile_queries() -> Iterator[QueryProfile]:
+    """
+    统计代码块中执行的 SQL（包括在线程池中执行、复制了当前上下文的查询）
+
+    可以嵌套，内层代码块的查询只计入内层。
+    """
+    instrument_queries()
+    profile = QueryProfile()
+    token = _current_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _current_profile.reset(token)
+
+
+@contextmanager
+def assert_query_budget(max_queries: Optional[int] = None, max_repeats: Optional[int] = None) -> Iterator[QueryProfile]:
+    """
+    断言代码块的查询预算（测试使用）
+
+    Args:
+        max_queries: 最多执行的语句数
+        max_repeats: 同一语句模板最多执行的次数（发现 N+1 查询）
+
+    Raises:
+        AssertionError: 超出预算，信息中列出执行次数最多的语句
+    """
+    with profile_queries() as profile:
+        yield profile
+
+    problems = []
+    if max_queries is not None and profile.count > max_queries:
+        problems.append(f"执行了 {profile.count} 条 SQL，预算为 {max_queries} 条")
+    if max_repeats is not None:
+        for item in profile.repeated(max_repeats):
+            problems.append(f"语句执行了 {item['count']} 次（最多 {max_repeats} 次）: {item['statement']}")
+    if problems:
+        top = profile.repeated(0)[:5]
+        detail = "\n".join(f"  {item['count']} x {item['statement']}" for item in top)
+        raise AssertionError("\n".join(problems) + "\n执行次数最多的语句:\n" + detail)
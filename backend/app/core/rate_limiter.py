@@ -0,0 +1,236 @@
+"""滑动窗口限流引擎 - 每个键每个窗口只保存两个计数桶"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, List, Optional, Sequence, Tuple
+
+from .executors import run_in_state
+from .state_backend import StateBackend, state_backend
+
+
+class _KeyState:
+    """单个键的计数状态：每个窗口一组 (桶序号, 上一桶计数, 当前桶计数)"""
+
+    __slots__ = ("buckets", "previous", "current", "last_seen")
+
+    def __init__(self, size: int):
+        self.buckets = [0] * size
+        self.previous = [0] * size
+        self.current = [0] * size
+        self.last_seen = 0.0
+
+
+class SlidingWindowLimiter:
+    """
+    滑动窗口计数器（两桶加权近似）
+
+    每个窗口按窗口长度对齐切分为固定桶，只保存当前桶和上一桶的计数，
+    窗口内请求数估算为：上一桶计数 × 上一桶仍在窗口内的比例 + 当前桶计数。
+    单次检查的开销与请求量无关（O(窗口数)），每个键的内存是固定的。
+
+    键按最近访问时间排列，超过最长窗口两倍未访问的键计数必然为 0，
+    会在后续调用中被顺带清理；max_keys 限制键的总数，超出时淘汰最久未访问的键。
+    """
+
+    def __init__(
+        self,
+        windows: Sequence[int],
+        max_keys: int = 100000,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.windows: Tuple[int, ...] = tuple(int(w) for w in windows)
+        if not self.windows or min(self.windows) <= 0:
+            raise ValueError("windows 必须是正整数秒数")
+        self.max_keys = max(1, int(max_keys))
+        self.idle_ttl = max(self.windows) * 2
+        self._clock = clock
+        self._keys: "OrderedDict[Hashable, _KeyState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # 内部工具
+    # ------------------------------------------------------------------
+
+    def _state(self, key: Hashable, now: float, create: bool) -> Optional[_KeyState]:
+        state = self._keys.get(key)
+        if state is None:
+            if not create:
+                return None
+            state = _KeyState(len(self.windows))
+            self._keys[key] = state
+        else:
+            self._keys.move_to_end(key)
+        state.last_seen = now
+        self._evict(now)
+        return state
+
+    def _evict(self, now: float):
+        """淘汰空闲键（从最久未访问的一端开始，均摊 O(1)）"""
+        keys = self._keys
+        cutoff = now - self.idle_ttl
+        while keys:
+            oldest = next(iter(keys.values()))
+            if oldest.last_seen >= cutoff and len(keys) <= self.max_keys:
+                break
+            keys.popitem(last=False)
+
+    def _advance(self, state: _KeyState, now: float) -> List[float]:
+        """把各窗口的桶推进到当前时间，并返回各窗口的估算请求数"""
+        counts = []
+        for i, window in enumerate(self.windows):
+            bucket = int(now // window)
+            if bucket != state.buckets[i]:
+                state.previous[i] = state.current[i] if bucket == state.buckets[i] + 1 else 0
+                state.current[i] = 0
+                state.buckets[i] = bucket
+            weight = 1.0 - (now - bucket * window) / window
+            counts.append(state.previous[i] * weight + state.current[i])
+        return counts
+
+    # ------------------------------------------------------------------
+    # 公共接口
+    # ------------------------------------------------------------------
+
+    def counts(self, key: Hashable) -> List[float]:
+        """各窗口内的估算请求数（不记录请求）"""
+        now = self._clock()
+        with self._lock:
+            state = self._keys.get(key)
+            if state is None:
+                self._evict(now)
+                return [0.0] * len(self.windows)
+            return self._advance(state, now)
+
+    def hit(self, key: Hashable, amount: int = 1):
+        """记录请求"""
+        now = self._clock()
+        with self._lock:
+            state = self._state(key, now, create=True)
+            self._advance(state, now)
+            for i in range(len(self.windows)):
+                state.current[i] += amount
+
+    def acquire(self, key: Hashable, limits: Sequence[int]) -> Tuple[Optional[int], List[float]]:
+        """
+        原子地检查并记录一次请求
+
+        Args:
+            key: 限流键（用户ID、IP 等）
+            limits: 与 windows 一一对应的上限
+
+        Returns:
+            (超限窗口的下标或 None, 记录前各窗口的估算请求数)；超限时不记录请求
+        """
+        now = self._clock()
+        with self._lock:
+            state = self._state(key, now, create=True)
+            counts = self._advance(state, now)
+            for i, limit in enumerate(limits):
+                if counts[i] >= limit:
+                    return i, counts
+            for i in range(len(self.windows)):
+                state.current[i] += 1
+            return None, counts
+
+    # 异步接口与共享限流器一致；进程内计数没有 I/O，直接在事件循环中执行
+    async def counts_async(self, key: Hashable) -> List[float]:
+        return self.counts(key)
+
+    async def hit_async(self, key: Hashable, amount: int = 1):
+        self.hit(key, amount)
+
+    async def acquire_async(self, key: Hashable, limits: Sequence[int]) -> Tuple[Optional[int], List[float]]:
+        return self.acquire(key, limits)
+
+    def reset(self):
+        """清空全部计数"""
+        with self._lock:
+            self._keys.clear()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+class SharedWindowLimiter:
+    """
+    基于共享状态后端的滑动窗口计数器（多进程 / 多实例共享计数）
+
+    算法与 SlidingWindowLimiter 相同；每个窗口的桶是后端中的一个带过期时间的计数键，
+    检查并记录通过后端的 check_and_incr 原子完成。空闲键由过期时间自动清理。
+    后端读写是阻塞 I/O（SQLite 可能等待写锁），事件循环中使用 *_async 接口，在状态后端线程池中执行。
+    """
+
+    def __init__(
+        self,
+        backend: StateBackend,
+        windows: Sequence[int],
+        namespace: str,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.backend = backend
+        self.windows: Tuple[int, ...] = tuple(int(w) for w in windows)
+        if not self.windows or min(self.windows) <= 0:
+            raise ValueError("windows 必须是正整数秒数")
+        self.namespace = namespace
+        self._clock = clock
+
+    def _terms(self, key: Hashable, now: float):
+        """每个窗口的 (上一桶键, 权重, 当前桶键)"""
+        terms = []
+        for window in self.windows:
+            bucket = int(now // window)
+            weight = 1.0 - (now - bucket * window) / window
+            prefix = f"rl:{self.namespace}:{key}:{window}:"
+            terms.append((f"{prefix}{bucket - 1}", weight, f"{prefix}{bucket}"))
+        return terms
+
+    @staticmethod
+    def _estimate(terms, values) -> List[float]:
+        return [values.get(previous, 0.0) * weight + values.get(current, 0.0) for previous, weight, current in terms]
+
+    def _increments(self, terms, amount: int):
+        # 当前桶在下一个桶结束前都会被用到，过期时间取两个窗口长度
+        return [(current, amount, window * 2) for (_, _, current), window in zip(terms, self.windows)]
+
+    def counts(self, key: Hashable) -> List[float]:
+        terms = self._terms(key, self._clock())
+        values = self.backend.get_many([k for previous, _, current in terms for k in (previous, current)])
+        return self._estimate(terms, values)
+
+    def hit(self, key: Hashable, amount: int = 1):
+        terms = self._terms(key, self._clock())
+        self.backend.incr(self._increments(terms, amount))
+
+    def acquire(self, key: Hashable, limits: Sequence[int]) -> Tuple[Optional[int], List[float]]:
+        terms = self._terms(key, self._clock())
+        conditions = [
+            ([(previous, weight), (current, 1.0)], limit)
+            for (previous, weight, current), limit in zip(terms, limits)
+        ]
+        exceeded, values = self.backend.check_and_incr(self._increments(terms, 1), conditions)
+        return exceeded, self._estimate(terms, values)
+
+    async def counts_async(self, key: Hashable) -> List[float]:
+        return await run_in_state(self.counts, key)
+
+    async def hit_async(self, key: Hashable, amount: int = 1):
+        await run_in_state(self.hit, key, amount)
+
+    async def acquire_async(self, key: Hashable, limits: Sequence[int]) -> Tuple[Optional[int], List[float]]:
+        return await run_in_state(self.acquire, key, limits)
+
+    def reset(self):
+        self.backend.clear(f"rl:{self.namespace}:")
+
+
+def create_window_limiter(
+    windows: Sequence[int],
+    namespace: str,
+    max_keys: int = 100000,
+    backend: Optional[StateBackend] = None,
+):
+    """按状态后端创建限流器：进程内后端使用本地计数器，共享后端使用 SharedWindowLimiter"""
+    backend = backend or state_backend
+    if backend.shared:
+        return SharedWindowLimiter(backend, windows, namespace)
+    return SlidingWindowLimiter(windows, max_keys=max_keys)
@@ -0,0 +1,511 @@
+"""共享状态后端 - 限流与配额计数器的存储（进程内 / SQLite 共享文件 / Redis）"""
+import os
+import select
+import socket
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import unquote, urlparse
+
+from .config import settings
+
+# (键, 增量, 过期秒数)；过期秒数为 None 表示不过期，每次写入都会刷新过期时间
+Increment = Tuple[str, float, Optional[float]]
+# (加权键列表, 上限)：sum(值 × 权重) < 上限 时条件成立
+Condition = Tuple[Sequence[Tuple[str, float]], float]
+
+
+def _condition_keys(conditions: Sequence[Condition]) -> List[str]:
+    return [key for terms, _ in conditions for key, _ in terms]
+
+
+def _first_failed(conditions: Sequence[Condition], values: Dict[str, float]) -> Optional[int]:
+    for index, (terms, limit) in enumerate(conditions):
+        if sum(values.get(key, 0.0) * weight for key, weight in terms) >= limit:
+            return index
+    return None
+
+
+class StateBackend:
+    """
+    计数器存储接口
+
+    所有写操作都通过 check_and_incr 完成：先按条件检查当前值，全部成立时才应用增量，
+    检查和写入是一个原子操作（多进程、多实例同时调用时也不会超出上限）。
+    """
+
+    # 是否跨进程共享（进程内存储为 False）
+    shared = False
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, float]:
+        """读取多个计数器，不存在或已过期的键返回 0"""
+        raise NotImplementedError
+
+    def check_and_incr(
+        self,
+        increments: Sequence[Increment],
+        conditions: Sequence[Condition] = (),
+    ) -> Tuple[Optional[int], Dict[str, float]]:
+        """
+        原子地检查条件并应用增量
+
+        Returns:
+            (第一个不成立的条件下标或 None, 涉及的全部键在写入前的值)；条件不成立时不写入
+        """
+        raise NotImplementedError
+
+    def set_many(self, items: Sequence[Increment]):
+        """覆盖写入多个计数器（用于从数据库重新加载）"""
+        raise NotImplementedError
+
+    def clear(self, prefix: str = ""):
+        """删除指定前缀的全部键"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def incr(self, increments: Sequence[Increment]) -> Dict[str, float]:
+        """无条件应用增量，返回写入前的值"""
+        return self.check_and_incr(increments)[1]
+
+
+class MemoryStateBackend(StateBackend):
+    """
+    进程内存储（单进程部署；多 worker 时每个进程独立计数）
+
+    计数器只按过期时间清理，不做 LRU 淘汰：淘汰配额计数等于把用户的用量清零。
+    键数超过 max_keys 时清理一次已过期的键；清理后仍然超出时上限翻倍，避免每次写入都全量扫描。
+    """
+
+    shared = False
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max(1, int(max_keys))
+        # {key: [值, 过期时间戳或 None]}
+        self._data: Dict[str, list] = {}
+        self._purge_at = self.max_keys
+        self._lock = threading.Lock()
+
+    def _get(self, key: str, now: float) -> float:
+        entry = self._data.get(key)
+        if entry is None:
+            return 0.0
+        if entry[1] is not None and entry[1] <= now:
+            del self._data[key]
+            return 0.0
+        return entry[0]
+
+    def _put(self, key: str, value: float, ttl: Optional[float], now: float):
+        self._data[key] = [value, now + ttl if ttl is not None else None]
+        if len(self._data) > self._purge_at:
+            self._purge(now)
+            self._purge_at = max(self.max_keys, 2 * len(self._data))
+
+    def _purge(self, now: float):
+        expired = [key for key, (_, expires_at) in self._data.items() if expires_at is not None and expires_at <= now]
+        for key in expired:
+            del self._data[key]
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, float]:
+        now = time.monotonic()
+        with self._lock:
+            return {key: self._get(key, now) for key in keys}
+
+    def check_and_incr(self, increments, conditions=()):
+        now = time.monotonic()
+        with self._lock:
+            keys = _condition_keys(conditions) + [key for key, _, _ in increments]
+            values = {key: self._get(key, now) for key in keys}
+            failed = _first_failed(conditions, values)
+            if failed is None:
+                current = dict(values)
+                for key, amount, ttl in increments:
+                    current[key] += amount
+                    self._put(key, current[key], ttl, now)
+            return failed, values
+
+    def set_many(self, items):
+        now = time.monotonic()
+        with self._lock:
+            for key, value, ttl in items:
+                self._put(key, value, ttl, now)
+
+    def clear(self, prefix: str = ""):
+        with self._lock:
+            if not prefix:
+                self._data.clear()
+                return
+            for key in [key for key in self._data if key.startswith(prefix)]:
+                del self._data[key]
+
+
+class SQLiteStateBackend(StateBackend):
+    """
+    SQLite 共享文件存储（同一台机器上的多个 worker 进程共享计数）
+
+    每次 check_and_incr 在 BEGIN IMMEDIATE 事务中完成，SQLite 的写锁保证跨进程原子性。
+    """
+
+    shared = True
+
+    # 每写入多少次清理一次过期键
+    PURGE_EVERY = 1000
+
+    def __init__(self, path: str, timeout: float = 30.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS state_counters ("
+            "key TEXT PRIMARY KEY, value REAL NOT NULL, expires_at REAL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _select(conn: sqlite3.Connection, keys: Sequence[str], now: float) -> Dict[str, float]:
+        values = {key: 0.0 for key in keys}
+        unique = list(values)
+        if unique:
+            placeholders = ",".join("?" * len(unique))
+            rows = conn.execute(
+                f"SELECT key, value FROM state_counters WHERE key IN ({placeholders}) "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (*unique, now),
+            )
+            for key, value in rows:
+                values[key] = value
+        return values
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, float]:
+        return self._select(self._conn(), list(keys), time.time())
+
+    def check_and_incr(self, increments, conditions=()):
+        conn = self._conn()
+        now = time.time()
+        keys = _condition_keys(conditions) + [key for key, _, _ in increments]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            values = self._select(conn, keys, now)
+            failed = _first_failed(conditions, values)
+            if failed is None and increments:
+                current = dict(values)
+                rows = []
+                for key, amount, ttl in increments:
+                    current[key] += amount
+                    rows.append((key, current[key], now + ttl if ttl is not None else None))
+                conn.executemany(
+                    "INSERT INTO state_counters (key, value, expires_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+                    rows,
+                )
+                self._maybe_purge(conn, now)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return failed, values
+
+    def _maybe_purge(self, conn: sqlite3.Connection, now: float):
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            conn.execute("DELETE FROM state_counters WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+
+    def set_many(self, items):
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO state_counters (key, value, expires_at) VALUES (?, ?, ?)",
+                [(key, value, now + ttl if ttl is not None else None) for key, value, ttl in items],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def clear(self, prefix: str = ""):
+        escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        self._conn().execute("DELETE FROM state_counters WHERE key LIKE ? ESCAPE '\\'", (escaped + "%",))
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class RedisError(Exception):
+    """Redis 返回的错误"""
+
+
+class _RedisConnection:
+    """最小的 RESP 协议客户端（只实现本模块用到的命令）"""
+
+    def __init__(self, host: str, port: int, db: int = 0, password: Optional[str] = None, timeout: float = 5.0):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+        # 是否已经发出过命令（之后的连接异常无法确定服务端是否已执行）
+        self.sent = False
+        if password:
+            self.execute("AUTH", password)
+        if db:
+            self.execute("SELECT", db)
+
+    @staticmethod
+    def _encode(args: Sequence) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    def _read(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("Redis 连接已断开")
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b"+":
+            return payload.decode("utf-8")
+        if prefix == b"-":
+            return RedisError(payload.decode("utf-8"))
+        if prefix == b":":
+            return int(payload)
+        if prefix == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2]
+        if prefix == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [self._read() for _ in range(length)]
+        raise RedisError(f"无法解析的响应: {line!r}")
+
+    def pipeline(self, commands: Sequence[Sequence]) -> List:
+        """一次发送多条命令并按顺序读取响应"""
+        self.sent = True
+        self.sock.sendall(b"".join(self._encode(command) for command in commands))
+        return [self._read() for _ in commands]
+
+    def execute(self, *args):
+        reply = self.pipeline([args])[0]
+        if isinstance(reply, RedisError):
+            raise reply
+        return reply
+
+    def is_stale(self) -> bool:
+        """
+        空闲连接是否已不可用（不阻塞）
+
+        所有响应都已读完时连接不应可读；可读说明服务端已关闭连接（或有多余数据）。
+        """
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return bool(readable)
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisStateBackend(StateBackend):
+    """
+    Redis 存储（多台机器共享计数）
+
+    check_and_incr 使用 WATCH / MULTI / EXEC 乐观事务：检查期间被其他客户端修改时 EXEC 失败并重试。
+    连接异常时只重试幂等操作（读取、覆盖写入、删除）；INCRBYFLOAT 发出后连接断开时
+    无法确定事务是否已执行，直接抛出，不重复计数。
+    """
+
+    shared = True
+
+    MAX_RETRIES = 50
+
+    def __init__(self, url: str, prefix: str = "promptlab:", timeout: float = 5.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.prefix = prefix
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections: List[_RedisConnection] = []
+        self._connections_lock = threading.Lock()
+
+    def _conn(self) -> _RedisConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and conn.is_stale():
+            # 服务端已关闭的空闲连接（超时、重启）：发送命令前换新连接
+            self._drop()
+            conn = None
+        if conn is None:
+            conn = _RedisConnection(self.host, self.port, self.db, self.password, self.timeout)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _run(self, func, idempotent: bool = False):
+        """
+        执行操作；连接异常时丢弃连接，幂等操作或命令尚未发出时重试一次
+
+        非幂等操作（计数累加）的命令发出后再失败时，服务端可能已经执行，重试会重复累加。
+        """
+        conn = None
+        try:
+            conn = self._conn()
+            conn.sent = False
+            return func(conn)
+        except (ConnectionError, OSError):
+            self._drop()
+            if not idempotent and conn is not None and conn.sent:
+                raise
+            return func(self._conn())
+
+    def _drop(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+            with self._connections_lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+
+    @staticmethod
+    def _float(value) -> float:
+        return float(value) if value is not None else 0.0
+
+    def _mget(self, conn: _RedisConnection, keys: Sequence[str]) -> Dict[str, float]:
+        unique = list(dict.fromkeys(keys))
+        if not unique:
+            return {}
+        replies = conn.execute("MGET", *(self.prefix + key for key in unique))
+        return {key: self._float(value) for key, value in zip(unique, replies)}
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, float]:
+        keys = list(keys)
+        return self._run(lambda conn: self._mget(conn, keys), idempotent=True)
+
+    def _write_commands(self, increments: Sequence[Increment]) -> List[Tuple]:
+        commands = [("MULTI",)]
+        for key, amount, ttl in increments:
+            commands.append(("INCRBYFLOAT", self.prefix + key, repr(float(amount))))
+            if ttl is not None:
+                commands.append(("PEXPIRE", self.prefix + key, int(ttl * 1000)))
+        commands.append(("EXEC",))
+        return commands
+
+    def check_and_incr(self, increments, conditions=()):
+        if not conditions:
+            return None, self._run(lambda conn: self._incr(conn, increments))
+        return self._run(lambda conn: self._check_and_incr(conn, increments, conditions))
+
+    def _incr(self, conn: _RedisConnection, increments) -> Dict[str, float]:
+        """无条件写入：MULTI 本身是原子的，写入前的值由写入后的值倒推"""
+        if not increments:
+            return {}
+        replies = conn.pipeline(self._write_commands(increments))
+        results = replies[-1]
+        if isinstance(results, RedisError) or results is None:
+            raise RedisError(f"Redis 事务执行失败: {results}")
+        values: Dict[str, float] = {}
+        position = 0
+        for key, amount, ttl in increments:
+            after = self._float(results[position])
+            values.setdefault(key, after - amount)
+            position += 2 if ttl is not None else 1
+        return values
+
+    def _check_and_incr(self, conn: _RedisConnection, increments, conditions):
+        keys = _condition_keys(conditions) + [key for key, _, _ in increments]
+        watched = [self.prefix + key for key in dict.fromkeys(keys)]
+        for _ in range(self.MAX_RETRIES):
+            conn.execute("WATCH", *watched)
+            values = self._mget(conn, keys)
+            failed = _first_failed(conditions, values)
+            if failed is not None or not increments:
+                conn.execute("UNWATCH")
+                return failed, values
+            replies = conn.pipeline(self._write_commands(increments))
+            if isinstance(replies[-1], RedisError):
+                raise replies[-1]
+            if replies[-1] is not None:
+                return None, values
+        raise RedisError("Redis 计数器竞争激烈，事务多次重试失败")
+
+    def set_many(self, items):
+        def run(conn: _RedisConnection):
+            commands = [("MULTI",)]
+            for key, value, ttl in items:
+                if ttl is not None:
+                    commands.append(("SET", self.prefix + key, repr(float(value)), "PX", int(ttl * 1000)))
+                else:
+                    commands.append(("SET", self.prefix + key, repr(float(value))))
+            commands.append(("EXEC",))
+            conn.pipeline(commands)
+        self._run(run, idempotent=True)
+
+    def clear(self, prefix: str = ""):
+        def run(conn: _RedisConnection):
+            cursor = b"0"
+            pattern = self.prefix + prefix + "*"
+            while True:
+                cursor, keys = conn.execute("SCAN", cursor, "MATCH", pattern, "COUNT", 1000)
+                if keys:
+                    conn.execute("DEL", *keys)
+                if cursor in (b"0", "0", 0):
+                    break
+        self._run(run, idempotent=True)
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+
+def create_state_backend(kind: str, url: str = "") -> StateBackend:
+    """
+    按配置创建状态后端
+
+    Args:
+        kind: memory / sqlite / redis
+        url: sqlite 文件路径或 redis://[:password@]host:port/db
+    """
+    kind = (kind or "memory").lower()
+    if kind == "memory":
+        return MemoryStateBackend()
+    if kind == "sqlite":
+        return SQLiteStateBackend(url or "./data/state.db")
+    if kind == "redis":
+        return RedisStateBackend(url or "redis://localhost:6379/0")
+    raise ValueError(f"不支持的状态后端: {kind}")
+
+
+# 全局实例
+state_backend = create_state_backend(settings.STATE_BACKEND, settings.STATE_BACKEND_URL)
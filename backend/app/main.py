@@ -1,8 +1,17 @@
-from fastapi import FastAPI
+import hmac
+import logging
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from .core.config import settings
+from .core.logger import setup_logging
+
+# 日志经队列异步输出（LOG_FORMAT=json 时为 JSON 行），在导入其他模块之前配置，导入时的警告也走同一管道
+setup_logging()
+logger = logging.getLogger(__name__)
+
 from .core.database import create_db_and_tables
-from .api import auth, prompt, run, abtest, ai_config, execution_history, admin, site, template, batch_test, optimization, security, system_config, file_upload, prompt_analysis, statistics, comment, team, quota, branch, commit, diff, pull_request, test_suite
+from .api import auth, prompt, run, abtest, ai_config, execution_history, admin, site, template, batch_test, optimization, security, system_config, file_upload, prompt_analysis, statistics, comment, team, quota, branch, commit, diff, pull_request, test_suite, job
 
 # 创建 FastAPI 应用
 app = FastAPI(
@@ -25,10 +34,13 @@ app.add_middleware(
 
 # 添加安全中间件
 from .core.access_control import (
+    MetricsMiddleware,
+    QueryProfilerMiddleware,
     RateLimitMiddleware,
     SecurityHeadersMiddleware,
     RequestLoggingMiddleware
 )
+from .core.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, instrument_db, registry as metrics_registry
 
 # 请求日志中间件
 app.add_middleware(RequestLoggingMiddleware)
@@ -44,6 +56,15 @@ app.add_middleware(
     enabled=True
 )
 
+# SQL 查询分析（默认关闭）
+if settings.DB_PROFILING_ENABLED:
+    app.add_middleware(QueryProfilerMiddleware)
+
+# 请求指标中间件（最外层，频率限制拒绝的请求也计入）和 SQL 执行统计
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    instrument_db()
+
 
 # 注册路由
 app.include_router(auth.router)
@@ -52,6 +73,7 @@ app.include_router(run.router)
 app.include_router(abtest.router)
 app.include_router(batch_test.router)
 app.include_router(test_suite.router)
+app.include_router(job.router)
 app.include_router(optimization.router)
 app.include_router(security.router)
 app.include_router(system_config.router)
@@ -83,8 +105,66 @@ async def on_startup():
     #     print(f"[WARNING] 数据库初始化失败: {e}")
     #     print("   请检查数据库配置或手动运行 python init_db.py")
 
-    print(f"[SUCCESS] {settings.APP_NAME} 启动成功!")
-    print(f"[INFO] API 文档: http://localhost:8000/docs")
+    # 启动配额使用量的定期回写
+    from .services.quota_engine import quota_engine
+    quota_engine.start()
+
+    # 从数据库加载敏感词库，并定期检查版本号热加载
+    from .services.sensitive_word_store import sensitive_word_store
+    try:
+        sensitive_word_store.refresh_from_db()
+    except Exception as e:
+        logger.warning("敏感词库加载失败，使用内置敏感词: %s", e)
+    sensitive_word_store.start()
+
+    # 恢复未完成的后台任务（上次关闭或崩溃时中断的任务）
+    try:
+        from .services.job_service import job_service
+
+        recovered = await job_service.recover()
+        if recovered:
+            logger.info("已恢复 %d 个后台任务", recovered)
+    except Exception as e:
+        logger.warning("后台任务恢复失败: %s", e)
+
+    logger.info("%s 启动成功", settings.APP_NAME)
+    logger.info("API 文档: http://localhost:8000/docs")
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """应用关闭时执行"""
+    from .core.async_database import dispose_async_engine
+    from .core.executors import shutdown_executors
+    from .services.audit_pool import audit_pool
+    from .services.job_service import job_service
+    from .services.openai_client_pool import openai_client_pool
+    from .services.quota_engine import quota_engine
+    from .services.sensitive_word_store import sensitive_word_store
+
+    # 停止敏感词库版本检查
+    await sensitive_word_store.stop()
+
+    # 停止后台任务工作协程（执行中的任务会在下次启动时继续）
+    await job_service.stop()
+
+    # 回写内存中尚未保存的配额使用量
+    try:
+        await quota_engine.stop()
+    except Exception as e:
+        logger.warning("配额使用量回写失败: %s", e)
+
+    # 关闭复用的 OpenAI 客户端连接
+    await openai_client_pool.aclose()
+
+    # 关闭异步数据库连接池
+    await dispose_async_engine()
+
+    # 关闭批量审核进程池
+    audit_pool.shutdown()
+
+    # 关闭数据库 / 加密 / 文件线程池（等待执行中的操作完成）
+    shutdown_executors()
 
 
 @app.get("/")
@@ -110,6 +190,17 @@ async def health_check():
     }
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """Prometheus 指标（需要 Bearer METRICS_TOKEN，未配置令牌时不提供）"""
+    if not settings.METRICS_ENABLED or not settings.METRICS_TOKEN:
+        return JSONResponse(status_code=404, content={"code": 404, "message": "监控指标未启用", "data": None})
+    authorization = request.headers.get("authorization", "")
+    if not hmac.compare_digest(authorization.encode(), f"Bearer {settings.METRICS_TOKEN}".encode()):
+        return JSONResponse(status_code=401, content={"code": 401, "message": "无效的指标访问令牌", "data": None})
+    return Response(metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
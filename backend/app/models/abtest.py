@@ -35,6 +35,7 @@ class ABTestCreate(SQLModel):
     ai_config_id: Optional[int] = None
     enable_evaluation: bool = True  # 是否启用AI评测
     generate_report: bool = True  # 是否生成对比报告
+    sync: bool = False  # 是否同步执行（默认提交后台任务并立即返回任务 ID）
 
 
 class ABTestResponse(SQLModel):
@@ -104,6 +104,15 @@ class SensitiveWord(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
+class SensitiveWordVersion(SQLModel, table=True):
+    """敏感词库版本表（单行）：敏感词每次变化时递增，各进程据此判断是否需要重新加载"""
+    __tablename__ = "sensitive_word_versions"
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    version: int = Field(default=0)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 # ============ 请求/响应模型 ============
 
 class AuditLogCreate(SQLModel):
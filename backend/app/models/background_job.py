@@ -0,0 +1,60 @@
+"""后台任务模型"""
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlmodel import Column, Field, JSON, SQLModel, Text
+
+
+class JobStatus:
+    """任务状态"""
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    FINISHED = {COMPLETED, FAILED, CANCELLED}
+
+
+class BackgroundJob(SQLModel, table=True):
+    """后台任务表（批量测试、测试集运行、A/B 测试）"""
+
+    __tablename__ = "background_jobs"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="users.id", index=True)
+
+    job_type: str = Field(max_length=50, index=True)  # batch_test | test_suite | abtest
+    status: str = Field(default=JobStatus.PENDING, max_length=20, index=True)
+    payload: Dict = Field(default_factory=dict, sa_column=Column(JSON))
+
+    # 关联的业务记录（batch_test_results / prompt_test_runs / abtest_results 的 ID）
+    resource_id: Optional[int] = Field(default=None, index=True)
+
+    # 进度
+    progress_total: int = Field(default=0)
+    progress_done: int = Field(default=0)
+
+    cancel_requested: bool = Field(default=False)
+    error: Optional[str] = Field(default=None, sa_column=Column(Text))
+
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class BackgroundJobResponse(SQLModel):
+    """后台任务响应"""
+    id: int
+    job_type: str
+    status: str
+    resource_id: Optional[int] = None
+    progress_total: int
+    progress_done: int
+    progress_percent: float = 0.0
+    cancel_requested: bool
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
@@ -30,6 +30,9 @@ class ExecutionHistory(SQLModel, table=True):
     cost: float = Field(default=0.0)
     response_time: float = Field(default=0.0)
     
+    # 结果缓存键：规范化请求参数的 SHA-256（见 result_cache.make_cache_key）
+    cache_key: Optional[str] = Field(default=None, max_length=64, index=True)
+    
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
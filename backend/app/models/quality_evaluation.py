@@ -145,6 +145,16 @@ class BatchTestRequest(SQLModel):
     model: str = "gpt-3.5-turbo"
     temperature: float = 0.7
     enable_evaluation: bool = True  # 是否启用AI评测
+    sync: bool = False  # 是否同步执行（默认提交后台任务并立即返回任务 ID）
+
+
+class BatchTestEstimateRequest(SQLModel):
+    """批量测试费用预估请求"""
+    prompt_id: int
+    test_cases: List[Dict]
+    model: str = "gpt-3.5-turbo"
+    models: Optional[List[str]] = None  # 同时预估多个模型的费用（用于对比），默认只预估 model
+    enable_evaluation: bool = True
 
 
 class BatchTestResponse(SQLModel):
@@ -48,6 +48,29 @@ class PromptTestRun(SQLModel, table=True):
     completed_at: Optional[datetime] = None
 
 
+class PromptBaselineOutput(SQLModel, table=True):
+    """Memoized baseline output and score for one test case."""
+
+    __tablename__ = "prompt_baseline_outputs"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    prompt_id: int = Field(foreign_key="prompts.id", index=True)
+    version: int = Field(index=True)
+    # SHA-256 of the rendered baseline prompt (content + variables)
+    case_hash: str = Field(max_length=64, index=True)
+    model: str = Field(max_length=100)
+    temperature: float = Field(default=0.0)
+
+    output: str = Field(sa_column=Column(Text))
+    score: Optional[float] = Field(default=None)
+    response_time: float = Field(default=0.0)
+    total_tokens: int = Field(default=0)
+    cost: float = Field(default=0.0)
+
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 class PromptTestSuiteCreate(SQLModel):
     prompt_id: int
     name: str
@@ -78,3 +101,5 @@ class PromptTestRunRequest(SQLModel):
     model: Optional[str] = None
     temperature: float = 0.0
     enable_evaluation: bool = True
+    force_refresh: bool = False  # 忽略已保存的基线输出，重新执行基线版本
+    sync: bool = False  # 是否同步执行（默认提交后台任务并立即返回任务 ID）
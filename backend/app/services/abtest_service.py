@@ -0,0 +1,343 @@
+"""A/B 测试执行服务 - 合并调用生成多个版本并评测、生成对比报告"""
+import logging
+import re
+import time
+from typing import Callable, List, Optional
+
+from sqlmodel import Session
+
+from ..models.abtest import ABTestCreate, ABTestResult
+from ..models.prompt import Prompt
+from ..models.quality_evaluation import ComparisonReport, QualityEvaluation
+from .evaluation_service import EvaluationService
+from .openai_service import OpenAIService
+from .rate_limit import rate_limiter
+from ..utils.prompt_template import replace_variables
+
+logger = logging.getLogger(__name__)
+
+
+class ABTestService:
+    """A/B 测试执行器"""
+
+    # 执行阶段数：生成 + 评测、保存结果、生成报告
+    TOTAL_STEPS = 3
+
+    @staticmethod
+    async def run_abtest(
+        db: Session,
+        abtest: ABTestResult,
+        prompts: List[Prompt],
+        test_data: ABTestCreate,
+        user_id: int,
+        on_progress: Optional[Callable[[int], None]] = None,
+    ) -> ABTestResult:
+        """
+        执行 A/B 测试并把结果写入已创建的 abtest 记录
+
+        Args:
+            db: 数据库会话
+            abtest: 预先创建的测试记录
+            prompts: 参与对比的 Prompt（已完成权限检查）
+            test_data: 测试参数
+            user_id: 用户 ID
+            on_progress: 进度回调（参数为已完成的阶段数）
+        """
+        # 执行测试 - 优化：合并为一次调用
+        results = []
+    
+        # 构建合并的prompt - 使用严格的格式控制
+        merged_prompt_parts = []
+    
+        # 系统角色和任务说明
+        merged_prompt_parts.append("# 任务说明\n")
+        merged_prompt_parts.append("你是一个专业的文案生成助手。我将提供多个不同风格的Prompt要求，你需要严格按照每个Prompt的要求，生成对应的文案内容。\n\n")
+    
+        # 格式要求 - 极其重要
+        merged_prompt_parts.append("# 输出格式要求（必须严格遵守）\n")
+        merged_prompt_parts.append("1. 必须使用指定的分隔符标记每个版本\n")
+        merged_prompt_parts.append("2. 分隔符格式：===VERSION_N===（N为版本号，从1开始）\n")
+        merged_prompt_parts.append("3. 每个版本的内容只包含文案本身，不要添加任何说明、标题或其他文字\n")
+        merged_prompt_parts.append("4. 版本之间用空行分隔\n")
+        merged_prompt_parts.append("5. 不要输出任何额外的解释、总结或评论\n\n")
+    
+        # 输出示例
+        merged_prompt_parts.append("# 输出示例\n")
+        merged_prompt_parts.append("===VERSION_1===\n")
+        merged_prompt_parts.append("[第一个版本的文案内容]\n\n")
+        merged_prompt_parts.append("===VERSION_2===\n")
+        merged_prompt_parts.append("[第二个版本的文案内容]\n\n")
+        merged_prompt_parts.append("===VERSION_3===\n")
+        merged_prompt_parts.append("[第三个版本的文案内容]\n\n")
+    
+        # 各个版本的具体要求
+        merged_prompt_parts.append("# 各版本具体要求\n")
+        merged_prompt_parts.append(f"请生成 {len(prompts)} 个版本的文案，要求如下：\n\n")
+    
+        for idx, prompt in enumerate(prompts, 1):
+            final_content = replace_variables(prompt.content, test_data.input_variables or {})
+            merged_prompt_parts.append(f"## 版本{idx}：{prompt.title}\n")
+            merged_prompt_parts.append(f"{final_content}\n\n")
+    
+        # 再次强调格式
+        merged_prompt_parts.append("# 最终输出\n")
+        merged_prompt_parts.append("请现在开始生成，直接输出内容，格式如下：\n")
+        merged_prompt_parts.append("===VERSION_1===\n")
+        merged_prompt_parts.append("[版本1的文案]\n\n")
+        merged_prompt_parts.append("===VERSION_2===\n")
+        merged_prompt_parts.append("[版本2的文案]\n\n")
+        for idx in range(3, len(prompts) + 1):
+            merged_prompt_parts.append(f"===VERSION_{idx}===\n")
+            merged_prompt_parts.append(f"[版本{idx}的文案]\n\n")
+    
+        merged_prompt_parts.append("\n【重要】请严格按照上述格式输出，不要添加任何其他内容！")
+    
+        merged_prompt = "".join(merged_prompt_parts)
+    
+        # 记录开始时间
+        start_time = time.time()
+        logger.info("开始调用模型(合并模式): %s, 测试 %d 个版本", test_data.model, len(prompts))
+    
+        try:
+            # 一次性调用AI
+            result = await OpenAIService.chat_completion(
+                prompt=merged_prompt,
+                model=test_data.model,
+                db=db,
+                user_id=user_id,
+                ai_config_id=test_data.ai_config_id
+            )
+        
+            # 计算总响应时间
+            total_response_time = time.time() - start_time
+        
+            # 解析AI返回的内容，分离各个版本
+            output_content = result["output"]
+            version_outputs = []
+        
+            logger.debug("AI返回的原始内容长度: %d", len(output_content))
+        
+            # 尝试按照===VERSION_N===分割
+            version_pattern = r'===VERSION_(\d+)===\s*\n(.*?)(?====VERSION_\d+===|\Z)'
+            matches = re.findall(version_pattern, output_content, re.DOTALL | re.MULTILINE)
+        
+            logger.debug("正则匹配到 %d 个版本", len(matches))
+        
+            if matches and len(matches) >= len(prompts):
+                # 成功分离出各个版本
+                logger.debug("成功按格式分离各个版本")
+                for idx, match in enumerate(matches[:len(prompts)], 1):
+                    content = match[1].strip()
+                    # 移除可能的markdown代码块标记
+                    content = re.sub(r'^```.*\n', '', content)
+                    content = re.sub(r'\n```$', '', content)
+                    version_outputs.append(content)
+                    logger.debug("版本%d内容长度: %d", idx, len(content))
+            else:
+                # 如果格式不符合预期，尝试其他方式
+                logger.warning("格式不符合预期，尝试备用解析方案")
+            
+                # 方案2：尝试按VERSION_N分割（不要求===）
+                alt_pattern = r'VERSION[_\s]*(\d+)[:\s]*\n(.*?)(?=VERSION[_\s]*\d+|\Z)'
+                alt_matches = re.findall(alt_pattern, output_content, re.DOTALL | re.IGNORECASE)
+            
+                if alt_matches and len(alt_matches) >= len(prompts):
+                    logger.info("使用备用方案1成功")
+                    for match in alt_matches[:len(prompts)]:
+                        version_outputs.append(match[1].strip())
+                else:
+                    # 方案3：按段落分割
+                    logger.warning("使用备用方案2：段落分割")
+                    # 先尝试按两个换行符分割
+                    parts = output_content.split('\n\n')
+                    clean_parts = []
+                    for p in parts:
+                        p = p.strip()
+                        # 过滤掉标题、分隔符等
+                        if p and len(p) > 30 and not p.startswith('#') and not p.startswith('==='):
+                            # 移除可能的版本标记
+                            p = re.sub(r'^VERSION[_\s]*\d+[:\s]*\n*', '', p, flags=re.IGNORECASE)
+                            clean_parts.append(p)
+                
+                    version_outputs = clean_parts[:len(prompts)]
+                    logger.debug("段落分割得到 %d 个版本", len(version_outputs))
+        
+            # 确保有足够的输出
+            if len(version_outputs) < len(prompts):
+                logger.warning("版本数量不足，需要%d个，实际%d个", len(prompts), len(version_outputs))
+                # 如果完全没有分离成功，就把整个内容分配给第一个版本
+                if len(version_outputs) == 0:
+                    version_outputs.append(output_content)
+                # 其他版本使用第一个版本的内容（总比没有好）
+                while len(version_outputs) < len(prompts):
+                    version_outputs.append(version_outputs[0])
+        
+            # 最终检查：确保每个版本都有内容
+            for idx, content in enumerate(version_outputs):
+                if not content or len(content) < 10:
+                    logger.warning("版本%d内容为空或过短，使用完整内容", idx + 1)
+                    version_outputs[idx] = output_content
+        
+            # 为每个版本分配token和成本（按输出长度比例）
+            total_output_tokens = result["output_tokens"]
+            total_cost = result["cost"]
+        
+            output_lengths = [len(output) for output in version_outputs]
+            total_length = sum(output_lengths)
+        
+            # 构造每个版本的结果
+            for idx, prompt in enumerate(prompts):
+                # 计算该版本的token和成本比例
+                if total_length > 0:
+                    ratio = output_lengths[idx] / total_length
+                else:
+                    ratio = 1.0 / len(prompts)
+            
+                execution_result = {
+                    "prompt_id": prompt.id,
+                    "prompt_title": prompt.title,
+                    "output": version_outputs[idx],
+                    "input_tokens": result["input_tokens"] // len(prompts),  # 平均分配
+                    "output_tokens": int(total_output_tokens * ratio),
+                    "total_tokens": result["input_tokens"] // len(prompts) + int(total_output_tokens * ratio),
+                    "response_time": round(total_response_time, 3),  # 所有版本使用相同的总时间
+                    "model": result["model"],
+                    "cost": round(total_cost * ratio, 6),  # 按比例分配成本
+                    "success": True,
+                    "error": None
+                }
+                results.append(execution_result)
+            
+            logger.info("成功生成 %d 个版本的内容", len(results))
+        
+            # AI评测（如果启用）
+            if test_data.enable_evaluation:
+                logger.info("开始AI质量评测")
+                quality_scores_list = []
+            
+                for idx, (prompt, result_item) in enumerate(zip(prompts, results)):
+                    try:
+                        evaluation_result = await EvaluationService.evaluate_output_quality(
+                            output_content=result_item["output"],
+                            prompt_content=prompt.content,
+                            db=db,
+                            user_id=user_id
+                        )
+                    
+                        # 添加评分到结果
+                        result_item["quality_score"] = evaluation_result.get("overall_score", 0)
+                        result_item["evaluation_details"] = evaluation_result
+                    
+                        # 保存评测记录
+                        quality_eval = QualityEvaluation(
+                            user_id=user_id,
+                            test_type="abtest",
+                            test_id=None,  # 稍后更新
+                            prompt_id=prompt.id,
+                            prompt_content=result_item.get("output", ""),
+                            output_content=result_item.get("output", ""),
+                            accuracy_score=evaluation_result.get("accuracy_score", 0),
+                            relevance_score=evaluation_result.get("relevance_score", 0),
+                            fluency_score=evaluation_result.get("fluency_score", 0),
+                            creativity_score=evaluation_result.get("creativity_score", 0),
+                            safety_score=evaluation_result.get("safety_score", 0),
+                            overall_score=evaluation_result.get("overall_score", 0),
+                            evaluation_details=evaluation_result.get("evaluation_details", {}),
+                            safety_issues=evaluation_result.get("safety_issues", []),
+                            has_sensitive_content=evaluation_result.get("has_sensitive_content", False),
+                            response_time=result_item.get("response_time", 0),
+                            token_count=result_item.get("total_tokens", 0),
+                            cost=result_item.get("cost", 0),
+                            cost_efficiency_score=EvaluationService.calculate_cost_efficiency(
+                                evaluation_result.get("overall_score", 0),
+                                result_item.get("cost", 0),
+                                result_item.get("response_time", 0)
+                            ),
+                            strengths=evaluation_result.get("strengths", []),
+                            weaknesses=evaluation_result.get("weaknesses", []),
+                            suggestions=evaluation_result.get("suggestions", []),
+                            evaluation_model=test_data.model
+                        )
+                        db.add(quality_eval)
+                        quality_scores_list.append(evaluation_result)
+                    
+                    except Exception as eval_error:
+                        logger.warning("评测版本%d失败: %s", idx + 1, eval_error)
+                        result_item["quality_score"] = 0
+                        result_item["evaluation_details"] = {}
+            
+                # 更新测试结果
+                results = results  # Already updated in place
+        
+        except Exception as e:
+            logger.error("合并调用失败: %s", e)
+            # 如果合并调用失败，记录所有版本的失败
+            for prompt in prompts:
+                execution_result = {
+                    "prompt_id": prompt.id,
+                    "prompt_title": prompt.title,
+                    "output": None,
+                    "input_tokens": 0,
+                    "output_tokens": 0,
+                    "total_tokens": 0,
+                    "response_time": 0,
+                    "model": test_data.model,
+                    "cost": 0,
+                    "success": False,
+                    "error": str(e)
+                }
+                results.append(execution_result)
+    
+        if on_progress:
+            on_progress(1)
+
+        # 保存测试结果
+        abtest.results = results
+        db.add(abtest)
+        db.commit()
+        db.refresh(abtest)
+        if on_progress:
+            on_progress(2)
+    
+        # 记录请求（合并模式只算一次请求）
+        await rate_limiter.record_request_async(user_id)
+    
+        # 生成对比报告（如果启用）
+        comparison_report_id = None
+        if test_data.generate_report and len(results) > 0:
+            try:
+                logger.info("生成对比分析报告")
+                prompt_titles = [p.title for p in prompts]
+            
+                report_data = await EvaluationService.generate_comparison_report(
+                    abtest_results=results,
+                    prompt_titles=prompt_titles,
+                    db=db,
+                    user_id=user_id
+                )
+            
+                # 保存报告
+                comparison_report = ComparisonReport(
+                    user_id=user_id,
+                    abtest_id=abtest.id,
+                    winner_prompt_id=report_data.get("winner_prompt_id"),
+                    winner_reason=report_data.get("winner_reason", ""),
+                    comparison_data=report_data.get("comparison_data", {}),
+                    chart_data=report_data.get("chart_data", {}),
+                    summary=report_data.get("summary", ""),
+                    recommendations=report_data.get("recommendations", [])
+                )
+                db.add(comparison_report)
+                db.commit()
+                db.refresh(comparison_report)
+            
+                comparison_report_id = comparison_report.id
+                logger.info("对比报告已生成 (ID: %s)", comparison_report_id)
+            
+            except Exception as report_error:
+                logger.warning("生成对比报告失败: %s", report_error)
+
+        if on_progress:
+            on_progress(ABTestService.TOTAL_STEPS)
+
+        return abtest
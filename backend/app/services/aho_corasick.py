@@ -0,0 +1,161 @@
+"""Aho-Corasick 多模式匹配 - 一次扫描文本找出全部敏感词"""
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Pattern, Set
+
+
+class AhoCorasickMatcher:
+    """
+    Aho-Corasick 自动机
+
+    - 扫描文本的开销与词库大小无关：O(文本长度 + 命中数)
+    - 添加词：增量插入字典树，失败链接在下一次匹配前统一重新计算（BFS，O(字典树节点数)）
+    - 删除词：只清除终止节点上的输出，不需要重建
+    - 自动机处于根节点时，用词首字符组成的正则直接跳到下一个可能命中的位置
+    """
+
+    def __init__(self, words: Iterable[str] = ()):
+        # 节点 i 的转移、失败链接、输出链接（最近的带输出的后缀节点）、输出词
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._dict_link: List[int] = [0]
+        self._output: List[str] = [""]
+        # 每个词的引用计数（同一个词可能属于多个分类）
+        self._counts: Dict[str, int] = {}
+        # 所有词首字符组成的字符类（为 None 时表示没有词）
+        self._starts: Optional[Pattern] = None
+        self._dirty = False
+        self._lock = threading.Lock()
+        for word in words:
+            self.add(word)
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self._counts
+
+    def add(self, word: str):
+        """添加一个词（重复添加只增加引用计数）"""
+        if not word:
+            return
+        with self._lock:
+            if word in self._counts:
+                self._counts[word] += 1
+                return
+            self._counts[word] = 1
+
+            state = 0
+            for char in word:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._dict_link.append(0)
+                    self._output.append("")
+                    self._goto[state][char] = next_state
+                    self._dirty = True
+                state = next_state
+            self._output[state] = word
+            # 已有节点变成终止节点时，其他节点的输出链接也需要更新
+            self._dirty = True
+
+    def remove(self, word: str):
+        """移除一个词（引用计数归零时才真正移除）"""
+        with self._lock:
+            count = self._counts.get(word)
+            if not count:
+                return
+            if count > 1:
+                self._counts[word] = count - 1
+                return
+            del self._counts[word]
+
+            state = 0
+            for char in word:
+                state = self._goto[state][char]
+            # 节点保留在字典树中；匹配时沿输出链接遍历会跳过没有输出的节点
+            self._output[state] = ""
+
+    def _build(self):
+        """按 BFS 顺序计算失败链接和输出链接"""
+        goto, fail, dict_link, output = self._goto, self._fail, self._dict_link, self._output
+        queue = []
+        for child in goto[0].values():
+            fail[child] = 0
+            dict_link[child] = 0
+            queue.append(child)
+
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for char, child in goto[state].items():
+                link = fail[state]
+                while link and char not in goto[link]:
+                    link = fail[link]
+                target = goto[link].get(char, 0)
+                fail[child] = target if target != child else 0
+                dict_link[child] = fail[child] if output[fail[child]] else dict_link[fail[child]]
+                queue.append(child)
+
+        first_chars = "".join(goto[0])
+        self._starts = re.compile("[" + "".join(re.escape(char) for char in first_chars) + "]") if first_chars else None
+        self._dirty = False
+
+    def build(self):
+        """立即计算失败链接（否则在下一次匹配时计算），用于在替换词库前准备好自动机"""
+        with self._lock:
+            if self._dirty:
+                self._build()
+
+    def find_all(self, text: str) -> Dict[str, List[int]]:
+        """
+        一次扫描找出所有命中的词及其起始位置
+
+        与 re.finditer(re.escape(word)) 的语义一致：同一个词的多次命中互不重叠，从左到右取。
+
+        Returns:
+            {word: [起始位置, ...]}
+        """
+        with self._lock:
+            if self._dirty:
+                self._build()
+            goto, fail, dict_link, output = self._goto, self._fail, self._dict_link, self._output
+
+            found: Dict[str, List[int]] = {}
+            starts = self._starts
+            if starts is None:
+                return found
+            # 每个词上一次命中的结束位置，用于去除重叠命中
+            last_end: Dict[str, int] = {}
+            state = 0
+            index = 0
+            length = len(text)
+            while index < length:
+                if not state:
+                    # 根节点：跳到下一个词首字符
+                    match = starts.search(text, index)
+                    if match is None:
+                        break
+                    index = match.start()
+                char = text[index]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(char, 0)
+
+                node = state if output[state] else dict_link[state]
+                while node:
+                    word = output[node]
+                    if word:
+                        start = index - len(word) + 1
+                        if start >= last_end.get(word, 0):
+                            found.setdefault(word, []).append(start)
+                            last_end[word] = index + 1
+                    node = dict_link[node]
+                index += 1
+            return found
+
+    def words(self) -> Set[str]:
+        return set(self._counts)
@@ -0,0 +1,117 @@
+"""AI 配置解析缓存 - 缓存每个用户解析后的 AI 配置和解密后的 API Key"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from ..core.config import settings
+from ..core.metrics import cache_collector, registry
+
+
+class ResolvedAIConfig:
+    """解析后的 AI 配置（只包含调用模型需要的字段，API Key 已解密）"""
+
+    __slots__ = ("id", "name", "base_url", "model", "api_key")
+
+    def __init__(
+        self,
+        id: Optional[int],
+        name: str,
+        base_url: str,
+        model: str,
+        api_key: str,
+    ):
+        self.id = id  # 环境变量配置为 None
+        self.name = name
+        self.base_url = base_url
+        self.model = model
+        self.api_key = api_key
+
+
+class AIConfigCache:
+    """
+    AI 配置解析缓存
+
+    以 (user_id, ai_config_id) 为键缓存解析结果，命中时不查询数据库、不解密 API Key。
+    - 用户的配置增删改后清除该用户的缓存；全局配置变更后清除全部缓存
+    - 多实例部署时其他进程的缓存在 TTL 内过期
+    - 找不到配置、解密失败等错误不缓存
+    - 事件循环和数据库线程池都会访问，读写都在锁内完成
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 60):
+        self.max_size = max_size
+        self.ttl = ttl
+        # {(user_id, ai_config_id): (过期时间戳, 解析结果)}
+        self._entries: "OrderedDict[Tuple[int, Optional[int]], Tuple[float, ResolvedAIConfig]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # 统计计数
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int, ai_config_id: Optional[int] = None) -> Optional[ResolvedAIConfig]:
+        key = (user_id, ai_config_id or None)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, resolved = entry
+                if expires_at >= time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return resolved
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def peek(self, user_id: int, ai_config_id: Optional[int] = None) -> Optional[ResolvedAIConfig]:
+        """查看未过期的缓存项（不计入命中统计、不调整淘汰顺序）"""
+        with self._lock:
+            entry = self._entries.get((user_id, ai_config_id or None))
+        if entry is not None and entry[0] >= time.monotonic():
+            return entry[1]
+        return None
+
+    def set(self, user_id: int, ai_config_id: Optional[int], resolved: ResolvedAIConfig):
+        if self.ttl <= 0:
+            return
+        key = (user_id, ai_config_id or None)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, resolved)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: Optional[int] = None):
+        """清除某个用户的缓存；不指定用户时清除全部（全局配置变更）"""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """缓存统计"""
+        with self._lock:
+            hits, misses, size = self.hits, self.misses, len(self._entries)
+        total = hits + misses
+        return {
+            "size": size,
+            "max_size": self.max_size,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+        }
+
+
+# 全局实例
+ai_config_cache = AIConfigCache(
+    max_size=settings.AI_CONFIG_CACHE_SIZE,
+    ttl=settings.AI_CONFIG_CACHE_TTL,
+)
+registry.add_collector(cache_collector("ai_config", ai_config_cache.stats))
@@ -0,0 +1,130 @@
+"""批量内容审核 - 大批量时分块提交到进程池，按输入顺序逐条返回结果"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from ..core.config import settings
+from .security_service import SecurityService
+
+# 子进程中当前生效的敏感词库版本
+_worker_words_version: Optional[int] = None
+
+
+def _init_worker(words: Dict[str, List[str]], version: int):
+    """进程池初始化：加载父进程的敏感词库快照"""
+    global _worker_words_version
+    SecurityService.set_sensitive_words(words)
+    SecurityService._words_version = version
+    _worker_words_version = version
+
+
+def _audit_chunk(start: int, contents: List[str], auto_mask: bool) -> List[Dict]:
+    """在子进程中审核一个分块（必须是模块级函数才能被序列化）"""
+    return SecurityService.batch_audit(contents, auto_mask, start)
+
+
+class AuditPool:
+    """
+    批量审核进程池
+
+    SecurityService.batch_audit 在事件循环线程里逐条执行 content_audit（纯 CPU 的正则 / 自动机计算），
+    大批量时会阻塞同一 worker 的其他请求。
+    总字符数超过阈值时，输入被切分为若干分块提交到进程池并行审核；结果按输入顺序逐条产出。
+    进程池按敏感词库版本创建，词库变更后下一次批量审核会使用新的进程池。
+    """
+
+    def __init__(self, workers: int = 0, inline_threshold: int = 100000, chunk_size: int = 0):
+        self.workers = workers or os.cpu_count() or 1
+        self.inline_threshold = inline_threshold
+        self.chunk_size = chunk_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_version: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        version = SecurityService._words_version
+        with self._lock:
+            if self._executor is None or self._executor_version != version:
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False, cancel_futures=False)
+                # 使用 spawn 启动子进程，避免 fork 复制事件循环和数据库连接等状态
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(SecurityService.get_sensitive_words(), version),
+                )
+                self._executor_version = version
+            return self._executor
+
+    def should_inline(self, contents: List[str]) -> bool:
+        """总字符数低于阈值或只有一个 CPU 时直接在当前线程审核"""
+        if self.workers <= 1 or len(contents) <= 1:
+            return True
+        return sum(len(content) for content in contents) < self.inline_threshold
+
+    def _chunks(self, contents: List[str]) -> List[Tuple[int, List[str]]]:
+        # 默认每个进程分到约 4 个分块，兼顾负载均衡和进程间通信开销
+        size = self.chunk_size or max(1, -(-len(contents) // (self.workers * 4)))
+        return [(start, contents[start:start + size]) for start in range(0, len(contents), size)]
+
+    async def iter_audit(
+        self,
+        contents: List[str],
+        auto_mask: bool = False,
+        inline: Optional[bool] = None,
+    ) -> AsyncIterator[Dict]:
+        """
+        按输入顺序逐条产出审核结果
+
+        Args:
+            contents: 内容列表
+            auto_mask: 是否自动脱敏
+            inline: 强制内联（True）或强制使用进程池（False），默认按阈值判断
+        """
+        if inline is None:
+            inline = self.should_inline(contents)
+
+        if inline:
+            for index, content in enumerate(contents):
+                result = SecurityService.content_audit(content, auto_mask)
+                result['index'] = index
+                yield result
+            return
+
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        futures = [
+            loop.run_in_executor(executor, _audit_chunk, start, chunk, auto_mask)
+            for start, chunk in self._chunks(contents)
+        ]
+        try:
+            # 分块并行执行，按顺序等待；先完成的后续分块会在等待期间缓存在 future 中
+            for future in futures:
+                for result in await future:
+                    yield result
+        finally:
+            for future in futures:
+                future.cancel()
+
+    async def audit(self, contents: List[str], auto_mask: bool = False, inline: Optional[bool] = None) -> List[Dict]:
+        """批量审核，返回按输入顺序排列的结果列表"""
+        return [result async for result in self.iter_audit(contents, auto_mask, inline)]
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+                self._executor_version = None
+
+
+# 全局实例
+audit_pool = AuditPool(
+    workers=settings.AUDIT_POOL_WORKERS,
+    inline_threshold=settings.AUDIT_POOL_MIN_CHARS,
+    chunk_size=settings.AUDIT_POOL_CHUNK_SIZE,
+)
@@ -0,0 +1,273 @@
+"""批量测试执行服务 - 有界并发执行测试用例"""
+import logging
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlmodel import Session
+
+from ..core.config import settings
+from ..models.quality_evaluation import BatchTestResult, QualityEvaluation
+from .concurrency import gather_bounded, user_llm_limiter
+from .evaluation_service import EvaluationService
+from .openai_service import OpenAIService
+from .quota_service import QuotaService
+from .rate_limit import rate_limiter
+from ..utils.prompt_template import render_template
+
+logger = logging.getLogger(__name__)
+
+
+class BatchTestService:
+    """批量测试执行器"""
+
+    @staticmethod
+    def failed_result(index: int, test_case: Dict, error: str) -> Dict:
+        """构造失败用例的结果"""
+        return {
+            "test_case_index": index,
+            "variables": test_case.get("variables", {}),
+            "expected_output": test_case.get("expected_output"),
+            "actual_output": None,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "total_tokens": 0,
+            "response_time": 0,
+            "cost": 0,
+            "quality_score": 0,
+            "evaluation_data": {},
+            "success": False,
+            "error": error
+        }
+
+    @staticmethod
+    async def run_case(
+        db: Session,
+        user_id: int,
+        batch_test_id: int,
+        prompt_id: int,
+        prompt_content: str,
+        index: int,
+        test_case: Dict,
+        model: str,
+        temperature: float,
+        enable_evaluation: bool,
+    ) -> Tuple[Dict, Optional[QualityEvaluation]]:
+        """
+        执行单个测试用例（含评测），异常只影响当前用例
+
+        多个用例并发共用 db，用例本身不向会话写入：评测记录随结果返回，由 run_batch 统一保存。
+
+        Returns:
+            (用例结果, 待保存的评测记录或 None)
+        """
+        reserved = False
+        quality_eval = None
+        try:
+            # 每个用例都需要经过频率限制和配额检查
+            allowed, error_msg = await rate_limiter.check_rate_limit_async(user_id)
+            if not allowed:
+                return BatchTestService.failed_result(index, test_case, error_msg), None
+
+            quota_allowed, quota_error = await QuotaService.check_quota_async(user_id, reserve=True)
+            if not quota_allowed:
+                return BatchTestService.failed_result(index, test_case, quota_error), None
+            reserved = True
+
+            variables = test_case.get("variables", {})
+            final_prompt, missing_variables = render_template(prompt_content, variables)
+
+            async with user_llm_limiter.acquire(user_id):
+                start_time = time.time()
+                ai_result = await OpenAIService.chat_completion(
+                    prompt=final_prompt,
+                    model=model,
+                    temperature=temperature,
+                    max_tokens=2000,
+                    db=db,
+                    user_id=user_id
+                )
+                response_time = time.time() - start_time
+
+            # 命中结果缓存时没有调用模型，不记录请求和配额
+            reserved = False
+            if ai_result.get("is_cached"):
+                await QuotaService.release_quota_async(user_id)
+            else:
+                await rate_limiter.record_request_async(user_id)
+                try:
+                    await QuotaService.record_usage_async(
+                        user_id=user_id,
+                        input_tokens=ai_result["input_tokens"],
+                        output_tokens=ai_result["output_tokens"],
+                        cost=ai_result["cost"],
+                        model=model
+                    )
+                except Exception:
+                    pass
+
+            # 评测输出质量（如果启用）
+            quality_score = 0
+            evaluation_data = {}
+
+            if enable_evaluation:
+                try:
+                    async with user_llm_limiter.acquire(user_id):
+                        evaluation_result = await EvaluationService.evaluate_output_quality(
+                            output_content=ai_result["output"],
+                            prompt_content=final_prompt,
+                            db=db,
+                            user_id=user_id
+                        )
+                    quality_score = evaluation_result.get("overall_score", 0)
+                    evaluation_data = evaluation_result
+
+                    # 评测记录由 run_batch 与用例结果一起保存
+                    quality_eval = QualityEvaluation(
+                        user_id=user_id,
+                        test_type="batch",
+                        test_id=batch_test_id,
+                        prompt_id=prompt_id,
+                        prompt_content=final_prompt,
+                        output_content=ai_result["output"],
+                        accuracy_score=evaluation_result.get("accuracy_score", 0),
+                        relevance_score=evaluation_result.get("relevance_score", 0),
+                        fluency_score=evaluation_result.get("fluency_score", 0),
+                        creativity_score=evaluation_result.get("creativity_score", 0),
+                        safety_score=evaluation_result.get("safety_score", 0),
+                        overall_score=quality_score,
+                        evaluation_details=evaluation_result.get("evaluation_details", {}),
+                        safety_issues=evaluation_result.get("safety_issues", []),
+                        has_sensitive_content=evaluation_result.get("has_sensitive_content", False),
+                        response_time=response_time,
+                        token_count=ai_result["total_tokens"],
+                        cost=ai_result["cost"],
+                        cost_efficiency_score=EvaluationService.calculate_cost_efficiency(
+                            quality_score, ai_result["cost"], response_time
+                        ),
+                        strengths=evaluation_result.get("strengths", []),
+                        weaknesses=evaluation_result.get("weaknesses", []),
+                        suggestions=evaluation_result.get("suggestions", []),
+                        evaluation_model=model
+                    )
+
+                except Exception as eval_error:
+                    logger.warning("评测失败: %s", eval_error)
+                    quality_score = 0
+
+            return {
+                "test_case_index": index,
+                "variables": variables,
+                "missing_variables": missing_variables,
+                "expected_output": test_case.get("expected_output"),
+                "actual_output": ai_result["output"],
+                "input_tokens": ai_result["input_tokens"],
+                "output_tokens": ai_result["output_tokens"],
+                "total_tokens": ai_result["total_tokens"],
+                "response_time": round(response_time, 3),
+                "cost": ai_result["cost"],
+                "quality_score": quality_score,
+                "evaluation_data": evaluation_data,
+                "is_cached": ai_result.get("is_cached", False),
+                "success": True,
+                "error": None
+            }, quality_eval
+
+        except Exception as e:
+            logger.warning("测试用例 %d 执行失败: %s", index, e)
+            if reserved:
+                await QuotaService.release_quota_async(user_id)
+            return BatchTestService.failed_result(index, test_case, str(e)), None
+
+    @staticmethod
+    def apply_results(batch_test: BatchTestResult, results: List[Dict]) -> BatchTestResult:
+        """把用例结果汇总到批量测试记录"""
+        results = sorted(results, key=lambda item: item["test_case_index"])
+        success_results = [item for item in results if item.get("success")]
+
+        test_count = batch_test.total_cases or len(results)
+        success_count = len(success_results)
+        total_response_time = sum(item["response_time"] for item in success_results)
+        total_token_count = sum(item["total_tokens"] for item in success_results)
+        total_cost = sum(item["cost"] for item in success_results)
+        total_quality_score = sum(item["quality_score"] for item in success_results)
+
+        batch_test.results = results
+        batch_test.success_count = success_count
+        batch_test.failure_count = len(results) - success_count
+        batch_test.avg_response_time = round(total_response_time / test_count, 3) if test_count > 0 else 0
+        batch_test.avg_token_count = total_token_count // test_count if test_count > 0 else 0
+        batch_test.avg_cost = round(total_cost / test_count, 6) if test_count > 0 else 0
+        batch_test.avg_quality_score = round(total_quality_score / success_count, 2) if success_count > 0 else 0
+        return batch_test
+
+    @staticmethod
+    async def run_batch(
+        db: Session,
+        batch_test: BatchTestResult,
+        prompt_content: str,
+        enable_evaluation: bool,
+        concurrency: Optional[int] = None,
+        on_progress: Optional[Callable[[int], None]] = None,
+    ) -> BatchTestResult:
+        """
+        并发执行批量测试的全部用例
+
+        整体耗时约为 ceil(N / concurrency) 轮 LLM 调用，结果按 test_case_index 排序。
+        每个用例完成后立即持久化结果；已保存结果的用例不会重复执行（用于任务恢复）。
+
+        并发的用例共用 db，只有这里写入会话：每个用例完成后在一段没有 await 的同步代码中
+        添加评测记录、更新汇总并提交，会话中不会留下其他用例未提交的对象。
+        """
+        limit = concurrency or settings.BATCH_TEST_CONCURRENCY
+        test_cases = batch_test.test_cases or []
+        completed = {
+            item["test_case_index"]: item
+            for item in (batch_test.results or [])
+            if "test_case_index" in item
+        }
+
+        async def run_and_save(idx: int, test_case: Dict) -> Dict:
+            result, quality_eval = await BatchTestService.run_case(
+                db=db,
+                user_id=batch_test.user_id,
+                batch_test_id=batch_test.id,
+                prompt_id=batch_test.prompt_id,
+                prompt_content=prompt_content,
+                index=idx,
+                test_case=test_case,
+                model=batch_test.model,
+                temperature=batch_test.temperature,
+                enable_evaluation=enable_evaluation,
+            )
+            completed[idx] = result
+
+            # 增量保存，进程中断后已完成的用例不会丢失
+            try:
+                if quality_eval is not None:
+                    db.add(quality_eval)
+                BatchTestService.apply_results(batch_test, list(completed.values()))
+                db.add(batch_test)
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+
+            if on_progress:
+                on_progress(len(completed))
+            return result
+
+        factories = [
+            (lambda idx=idx, test_case=test_case: run_and_save(idx, test_case))
+            for idx, test_case in enumerate(test_cases, 1)
+            if idx not in completed
+        ]
+        await gather_bounded(factories, limit)
+
+        BatchTestService.apply_results(batch_test, list(completed.values()))
+        batch_test.completed_at = datetime.utcnow()
+
+        db.add(batch_test)
+        db.commit()
+        db.refresh(batch_test)
+        return batch_test
@@ -0,0 +1,77 @@
+"""并发控制服务 - 有界并发执行与按键限流的信号量"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Sequence, TypeVar
+
+from ..core.config import settings
+
+T = TypeVar("T")
+
+
+class KeyedSemaphore:
+    """
+    按键分组的信号量
+    例如按用户 ID 或 AI 服务商限制同时进行的 LLM 调用数量。
+    空闲的键会被自动清理，内存占用只与活跃键数量有关。
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(1, int(limit))
+        # {key: [semaphore, 持有/等待数]}
+        self._entries: Dict[Hashable, list] = {}
+
+    @asynccontextmanager
+    async def acquire(self, key: Hashable):
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = [asyncio.Semaphore(self.limit), 0]
+            self._entries[key] = entry
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] <= 0 and self._entries.get(key) is entry:
+                del self._entries[key]
+
+    def active(self, key: Hashable) -> int:
+        """当前持有或等待该键的调用数"""
+        entry = self._entries.get(key)
+        return entry[1] if entry else 0
+
+
+async def gather_bounded(
+    factories: Sequence[Callable[[], Awaitable[T]]],
+    limit: int,
+) -> List[T]:
+    """
+    以最多 limit 的并发度执行一组协程工厂，结果顺序与输入一致
+
+    Args:
+        factories: 无参协程工厂列表（延迟创建协程，避免一次性全部启动）
+        limit: 最大并发数
+    """
+    if not factories:
+        return []
+
+    semaphore = asyncio.Semaphore(max(1, int(limit)))
+
+    async def run(factory: Callable[[], Awaitable[Any]]):
+        async with semaphore:
+            return await factory()
+
+    tasks = [asyncio.ensure_future(run(factory)) for factory in factories]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        # 任一任务失败或被取消时，取消其余任务，避免它们在后台继续占用资源
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+# 全局实例：每个用户 / 每个 AI 服务商同时进行的 LLM 调用上限
+user_llm_limiter = KeyedSemaphore(settings.USER_LLM_CONCURRENCY)
+provider_llm_limiter = KeyedSemaphore(settings.PROVIDER_LLM_CONCURRENCY)
@@ -0,0 +1,128 @@
+"""费用预估 - 执行批量测试、测试集之前预估 token 用量和费用"""
+from typing import Callable, Dict, List, Optional
+
+from ..core.config import settings
+from ..utils.token_counter import count_tokens_batch, estimate_cost
+from .evaluation_service import EvaluationService
+
+# 单次调用的最大输出 token 数（与执行、评测时的 max_tokens 一致）
+DEFAULT_MAX_TOKENS = 2000
+
+
+class CostEstimator:
+    """
+    批量调用的费用预估
+
+    - 先渲染所有模板 × 测试用例，再对全部 Prompt 一次批量计数（count_tokens_batch），
+      相同的渲染结果只计数一次，模板中重复的文本共享 BPE 片段缓存
+    - 输出 token 数：有期望输出时按期望输出计，否则按 ESTIMATE_OUTPUT_TOKENS 计，最多 max_tokens
+    - 评测调用的输入 = 评测 Prompt（含渲染后的 Prompt）+ 预计的模型输出
+    - max_cost 按每次调用都输出 max_tokens 计算，是费用的上限
+    """
+
+    @staticmethod
+    def estimate(
+        templates: List[str],
+        test_cases: List[Dict],
+        model: str,
+        render: Callable[[str, Dict], str],
+        enable_evaluation: bool = False,
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        output_tokens: Optional[int] = None,
+    ) -> Dict:
+        """
+        预估执行 templates 中每个模板 × 每个测试用例的用量和费用
+
+        Args:
+            templates: Prompt 模板（测试集为候选版本和基线版本）
+            test_cases: 测试用例 [{variables, expected_output, min_quality_score}]
+            render: 变量替换函数 render(template, variables)
+            enable_evaluation: 是否评测输出；测试集用例设置了 min_quality_score 时也会评测
+            output_tokens: 没有期望输出时每次调用的输出 token 数（默认 ESTIMATE_OUTPUT_TOKENS）
+
+        Returns:
+            总用量、费用以及按用途（执行 / 评测）划分的明细
+        """
+        if output_tokens is None:
+            output_tokens = settings.ESTIMATE_OUTPUT_TOKENS
+        evaluation_model = EvaluationService.EVALUATION_MODEL
+
+        prompts: List[str] = []
+        expected_outputs: List[str] = []
+        evaluated: List[bool] = []
+        for test_case in test_cases:
+            variables = test_case.get("variables") or {}
+            evaluate = enable_evaluation or test_case.get("min_quality_score") is not None
+            for template in templates:
+                prompts.append(render(template, variables))
+                expected_outputs.append(test_case.get("expected_output") or "")
+                evaluated.append(evaluate)
+
+        # 一次批量计数：渲染后的 Prompt、期望输出、评测 Prompt
+        input_counts = count_tokens_batch(prompts, model)
+        expected_counts = count_tokens_batch(expected_outputs, model)
+        projected_outputs = [
+            min(expected or output_tokens, max_tokens) for expected in expected_counts
+        ]
+        evaluation_prompts = [
+            EvaluationService._build_evaluation_prompt("", prompt)
+            for prompt, evaluate in zip(prompts, evaluated) if evaluate
+        ]
+        evaluation_counts = count_tokens_batch(evaluation_prompts, evaluation_model)
+
+        execution = CostEstimator._summarize(
+            "execution", model, input_counts, projected_outputs, max_tokens
+        )
+        evaluated_outputs = [
+            projected for projected, evaluate in zip(projected_outputs, evaluated) if evaluate
+        ]
+        evaluation = CostEstimator._summarize(
+            "evaluation",
+            evaluation_model,
+            # 评测 Prompt 中包含模型输出
+            [tokens + projected for tokens, projected in zip(evaluation_counts, evaluated_outputs)],
+            [min(output_tokens, max_tokens)] * len(evaluation_counts),
+            max_tokens,
+            worst_inputs=[tokens + max_tokens for tokens in evaluation_counts],
+        )
+
+        breakdown = [item for item in (execution, evaluation) if item["calls"]]
+        input_total = sum(item["input_tokens"] for item in breakdown)
+        output_total = sum(item["output_tokens"] for item in breakdown)
+        return {
+            "model": model,
+            "case_count": len(test_cases),
+            "call_count": sum(item["calls"] for item in breakdown),
+            "input_tokens": input_total,
+            "output_tokens": output_total,
+            "total_tokens": input_total + output_total,
+            "estimated_cost": round(sum(item["cost"] for item in breakdown), 6),
+            "max_tokens": sum(item["max_tokens"] for item in breakdown),
+            "max_cost": round(sum(item["max_cost"] for item in breakdown), 6),
+            "breakdown": breakdown,
+        }
+
+    @staticmethod
+    def _summarize(
+        purpose: str,
+        model: str,
+        input_counts: List[int],
+        output_counts: List[int],
+        max_tokens: int,
+        worst_inputs: Optional[List[int]] = None,
+    ) -> Dict:
+        """汇总同一用途、同一模型的调用"""
+        input_tokens = sum(input_counts)
+        output_tokens = sum(output_counts)
+        worst_input = sum(worst_inputs) if worst_inputs is not None else input_tokens
+        worst_output = max_tokens * len(input_counts)
+        return {
+            "purpose": purpose,
+            "model": model,
+            "calls": len(input_counts),
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "cost": estimate_cost(input_tokens, output_tokens, model),
+            "max_tokens": worst_input + worst_output,
+            "max_cost": estimate_cost(worst_input, worst_output, model),
+        }
@@ -1,4 +1,5 @@
 """加密服务 - API密钥加密存储"""
+import logging
 import os
 import base64
 from cryptography.fernet import Fernet
@@ -7,6 +8,8 @@ from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.backends import default_backend
 from typing import Optional
 
+logger = logging.getLogger(__name__)
+
 
 class EncryptionService:
     """加密服务 - 用于加密存储敏感信息如API密钥"""
@@ -100,7 +103,7 @@ class EncryptionService:
             decrypted = cipher.decrypt(encrypted_key.encode())
             return decrypted.decode()
         except Exception as e:
-            print(f"解密失败: {str(e)}")
+            logger.warning("解密失败: %s", e)
             raise ValueError("API密钥解密失败")
     
     @staticmethod
@@ -1,14 +1,20 @@
 """AI评测服务 - 自动评分、多维度分析、安全检测"""
 import json
+import logging
 import re
 from typing import Dict, List, Optional
 from sqlmodel import Session
 from .openai_service import OpenAIService
 
+logger = logging.getLogger(__name__)
+
 
 class EvaluationService:
     """AI质量评测服务"""
     
+    # 评测使用的模型
+    EVALUATION_MODEL = "gpt-3.5-turbo"
+    
     @staticmethod
     async def evaluate_output_quality(
         output_content: str,
@@ -42,7 +48,7 @@ class EvaluationService:
             # 调用AI进行评测
             result = await OpenAIService.chat_completion(
                 prompt=evaluation_prompt,
-                model="gpt-3.5-turbo",
+                model=EvaluationService.EVALUATION_MODEL,
                 temperature=0.3,  # 降低温度以获得更一致的评分
                 max_tokens=2000,
                 db=db,
@@ -57,7 +63,7 @@ class EvaluationService:
             return evaluation_result
             
         except Exception as e:
-            print(f"评测失败: {str(e)}")
+            logger.error("评测失败: %s", e)
             return {
                 "accuracy_score": 5.0,
                 "relevance_score": 5.0,
@@ -175,7 +181,7 @@ class EvaluationService:
                 raise ValueError("未找到JSON格式的评测结果")
                 
         except Exception as e:
-            print(f"解析评测结果失败: {str(e)}")
+            logger.warning("解析评测结果失败: %s", e)
             # 返回默认评分
             return {
                 "accuracy_score": 5.0,
@@ -237,7 +243,7 @@ class EvaluationService:
             return optimization_result
             
         except Exception as e:
-            print(f"Prompt优化失败: {str(e)}")
+            logger.error("Prompt优化失败: %s", e)
             return {
                 "original_prompt": prompt_content,
                 "optimized_prompt": prompt_content,
@@ -341,7 +347,7 @@ class EvaluationService:
                 raise ValueError("未找到JSON格式的优化结果")
                 
         except Exception as e:
-            print(f"解析优化结果失败: {str(e)}")
+            logger.warning("解析优化结果失败: %s", e)
             return {
                 "original_prompt": original_prompt,
                 "optimized_prompt": original_prompt,
@@ -424,7 +430,7 @@ class EvaluationService:
             return report
             
         except Exception as e:
-            print(f"生成对比报告失败: {str(e)}")
+            logger.error("生成对比报告失败: %s", e)
             return {
                 "winner_prompt_id": None,
                 "winner_reason": "",
@@ -525,7 +531,7 @@ class EvaluationService:
                 raise ValueError("未找到JSON格式的报告")
                 
         except Exception as e:
-            print(f"解析对比报告失败: {str(e)}")
+            logger.warning("解析对比报告失败: %s", e)
             return {
                 "winner_prompt_id": None,
                 "winner_reason": "",
@@ -1,4 +1,5 @@
 """文件处理服务"""
+import logging
 import os
 import base64
 import mimetypes
@@ -6,6 +7,8 @@ from typing import Optional, Tuple
 from pathlib import Path
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 
 class FileService:
     """文件处理服务"""
@@ -100,7 +103,7 @@ class FileService:
             except:
                 return None
         except Exception as e:
-            print(f"读取文件失败: {str(e)}")
+            logger.warning("读取文件失败: %s", e)
             return None
     
     @classmethod
@@ -118,7 +121,7 @@ class FileService:
                 
                 return f"data:{mime_type};base64,{base64_data}"
         except Exception as e:
-            print(f"图片转 Base64 失败: {str(e)}")
+            logger.warning("图片转 Base64 失败: %s", e)
             return None
     
     @classmethod
@@ -138,7 +141,7 @@ class FileService:
         except ImportError:
             return "需要安装 PyPDF2: pip install PyPDF2"
         except Exception as e:
-            print(f"PDF 文本提取失败: {str(e)}")
+            logger.warning("PDF 文本提取失败: %s", e)
             return None
     
     @classmethod
@@ -180,6 +183,6 @@ class FileService:
                 return True
             return False
         except Exception as e:
-            print(f"删除文件失败: {str(e)}")
+            logger.warning("删除文件失败: %s", e)
             return False
 
@@ -0,0 +1,465 @@
+"""后台任务服务 - 数据库持久化的任务队列 + 各进程轮询认领 + 进程内 asyncio 工作协程池"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from sqlalchemy import update
+from sqlmodel import Session, select
+
+from ..core.config import settings
+from ..core.database import engine
+from ..core.executors import run_in_db
+from ..models.background_job import BackgroundJob, BackgroundJobResponse, JobStatus
+
+logger = logging.getLogger(__name__)
+
+
+class JobCancelled(Exception):
+    """任务已被请求取消"""
+
+
+class JobContext:
+    """
+    任务执行上下文：上报进度、检查取消
+
+    进度写入和取消标记读取都在数据库线程池中使用独立会话执行。report_progress 由处理函数
+    同步调用，只记录进度并在后台写入（写入进行中时合并为下一次写入）；
+    其他进程发起的取消在写入时读到，下一次上报进度时抛出 JobCancelled。
+    """
+
+    def __init__(self, job: BackgroundJob):
+        self.job = job
+        self._cancel_requested = bool(job.cancel_requested)
+        self._saving: Optional[asyncio.Task] = None
+        self._dirty = False
+
+    def is_cancel_requested(self) -> bool:
+        """最近一次写入进度或心跳时读到的取消标记"""
+        return self._cancel_requested
+
+    def report_progress(self, done: int, total: Optional[int] = None):
+        """更新进度并刷新心跳；如果任务已被取消则抛出 JobCancelled"""
+        self.job.progress_done = done
+        if total is not None:
+            self.job.progress_total = total
+        self.save()
+
+        if self._cancel_requested:
+            raise JobCancelled()
+
+    def save(self):
+        """在后台写入当前进度和心跳"""
+        if self._saving is None or self._saving.done():
+            self._saving = asyncio.ensure_future(self._save())
+        else:
+            self._dirty = True
+
+    async def _save(self):
+        while True:
+            self._dirty = False
+            try:
+                self._cancel_requested = await run_in_db(
+                    self._write_progress, self.job.id, self.job.progress_done, self.job.progress_total
+                )
+            except Exception as e:
+                logger.warning("任务 %s 进度写入失败: %s", self.job.id, e)
+            if not self._dirty:
+                return
+
+    async def flush(self):
+        """等待后台进度写入完成"""
+        if self._saving is not None:
+            await asyncio.gather(self._saving, return_exceptions=True)
+
+    @staticmethod
+    def _write_progress(job_id: int, done: int, total: int) -> bool:
+        """写入进度和心跳，返回取消标记（在数据库线程池中调用）"""
+        with Session(engine) as db:
+            db.exec(
+                update(BackgroundJob)
+                .where(BackgroundJob.id == job_id)
+                .values(progress_done=done, progress_total=total, updated_at=datetime.utcnow())
+            )
+            db.commit()
+            flag = db.exec(
+                select(BackgroundJob.cancel_requested).where(BackgroundJob.id == job_id)
+            ).first()
+            return bool(flag)
+
+
+JobHandler = Callable[[Session, BackgroundJob, JobContext], Awaitable[None]]
+
+
+class JobService:
+    """
+    后台任务服务
+    任务行保存在 background_jobs 表中，由进程内的 asyncio 工作协程执行。
+    每个进程定期轮询待执行的任务（包括其他进程提交的任务，以及心跳超时的中断任务），
+    多个进程通过按状态条件更新原子地认领任务，同一个任务只会被一个进程执行；
+    中断的任务从已持久化的进度继续执行。
+
+    任务状态的读写都在数据库线程池中使用独立会话执行，处理函数拿到的会话只在事件循环中使用。
+    """
+
+    def __init__(self, worker_count: int = 4, poll_interval: float = 5.0):
+        self.worker_count = max(1, worker_count)
+        self.poll_interval = poll_interval
+        self._handlers: Dict[str, JobHandler] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._poll_task: Optional[asyncio.Task] = None
+        self._queued: Set[int] = set()
+        self._running: Dict[int, asyncio.Task] = {}
+        self._loop = None
+        self._stopping = False
+
+    def register(self, job_type: str):
+        """注册任务处理函数（装饰器）"""
+        def decorator(handler: JobHandler) -> JobHandler:
+            self._handlers[job_type] = handler
+            return handler
+        return decorator
+
+    # ------------------------------------------------------------------
+    # 工作协程池
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """启动工作协程和定期轮询（必须在事件循环中调用；重复调用是安全的）"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._workers:
+            return
+        self._loop = loop
+        self._stopping = False
+        self._queue = asyncio.Queue()
+        self._queued = set()
+        self._running = {}
+        self._workers = [loop.create_task(self._worker()) for _ in range(self.worker_count)]
+        if self.poll_interval > 0:
+            self._poll_task = loop.create_task(self._poll_loop())
+
+    async def stop(self):
+        """停止工作协程；正在执行的任务会被放回待执行状态，下次启动时继续"""
+        if not self._workers:
+            return
+        self._stopping = True
+        tasks = self._workers + ([self._poll_task] if self._poll_task is not None else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._poll_task = None
+        self._queue = None
+        self._loop = None
+
+    def _enqueue(self, job_id: int) -> bool:
+        """放入本进程队列（已在队列中或执行中的任务不重复放入）"""
+        if job_id in self._queued or job_id in self._running:
+            return False
+        self._queued.add(job_id)
+        self._queue.put_nowait(job_id)
+        return True
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            task = asyncio.ensure_future(self._execute(job_id))
+            self._running[job_id] = task
+            try:
+                await task
+            except asyncio.CancelledError:
+                if self._stopping:
+                    raise
+            except Exception as e:
+                logger.exception("任务 %s 执行异常: %s", job_id, e)
+            finally:
+                self._running.pop(job_id, None)
+                if self._queue is not None:
+                    self._queue.task_done()
+
+    async def _execute(self, job_id: int):
+        job = await run_in_db(self._claim, job_id)
+        if job is None:
+            return
+
+        if job.cancel_requested:
+            await run_in_db(self._finish, job, JobStatus.CANCELLED)
+            return
+
+        handler = self._handlers.get(job.job_type)
+        if handler is None:
+            await run_in_db(self._finish, job, JobStatus.FAILED, f"未知的任务类型: {job.job_type}")
+            return
+
+        ctx = JobContext(job)
+        heartbeat = asyncio.ensure_future(self._heartbeat(ctx, asyncio.current_task()))
+        db = Session(engine)
+        try:
+            await handler(db, job, ctx)
+        except (asyncio.CancelledError, JobCancelled):
+            await self._close(db, heartbeat, ctx)
+            if self._stopping:
+                # 服务关闭：放回待执行状态，重启后从已保存的进度继续
+                await run_in_db(self._finish, job, JobStatus.PENDING)
+                raise
+            await run_in_db(self._finish, job, JobStatus.CANCELLED)
+        except Exception as e:
+            await self._close(db, heartbeat, ctx)
+            await run_in_db(self._finish, job, JobStatus.FAILED, str(e))
+        else:
+            await self._close(db, heartbeat, ctx)
+            await run_in_db(self._finish, job, JobStatus.COMPLETED)
+
+    @staticmethod
+    async def _close(db: Session, heartbeat: asyncio.Task, ctx: JobContext):
+        """停止心跳、等待进度写入完成并关闭处理函数的会话（回滚未提交的修改）"""
+        heartbeat.cancel()
+        await asyncio.gather(heartbeat, return_exceptions=True)
+        await ctx.flush()
+        await run_in_db(db.close)
+
+    @staticmethod
+    async def _heartbeat(ctx: JobContext, task: asyncio.Task):
+        """
+        定期刷新心跳，避免长时间没有进度的任务被其他进程视为中断重新认领；
+        读到取消标记（其他进程发起的取消）时立即中断任务
+        """
+        interval = max(settings.JOB_STALE_SECONDS / 3, 1)
+        while True:
+            await asyncio.sleep(interval)
+            if ctx.is_cancel_requested():
+                task.cancel()
+                return
+            ctx.save()
+
+    @staticmethod
+    def _claim(job_id: int) -> Optional[BackgroundJob]:
+        """原子地认领任务，返回脱离会话的任务记录；已被其他进程认领时返回 None"""
+        with Session(engine, expire_on_commit=False) as db:
+            claimed = db.exec(
+                update(BackgroundJob)
+                .where(BackgroundJob.id == job_id, BackgroundJob.status == JobStatus.PENDING)
+                .values(status=JobStatus.RUNNING, updated_at=datetime.utcnow())
+            )
+            db.commit()
+            if claimed.rowcount != 1:
+                return None
+
+            job = db.get(BackgroundJob, job_id)
+            job.started_at = job.started_at or datetime.utcnow()
+            db.add(job)
+            db.commit()
+            return job
+
+    @staticmethod
+    def _finish(job: BackgroundJob, status: str, error: Optional[str] = None):
+        """写入任务的最终状态（在数据库线程池中调用）；PENDING 表示放回待执行状态"""
+        with Session(engine) as db:
+            row = db.get(BackgroundJob, job.id)
+            now = datetime.utcnow()
+            row.status = status
+            row.updated_at = now
+            row.progress_done = job.progress_done
+            row.progress_total = job.progress_total
+            if status != JobStatus.PENDING:
+                row.error = error
+                row.completed_at = now
+            if status == JobStatus.COMPLETED:
+                row.progress_done = max(row.progress_done, row.progress_total)
+            db.add(row)
+            db.commit()
+
+    # ------------------------------------------------------------------
+    # 轮询 / 恢复
+    # ------------------------------------------------------------------
+
+    async def _poll_loop(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.poll()
+            except Exception as e:
+                logger.warning("后台任务轮询失败: %s", e)
+
+    async def poll(self) -> int:
+        """把待执行的任务放入本进程队列，返回新放入的任务数"""
+        self.start()
+        job_ids = await run_in_db(self._pending_job_ids)
+        return sum(self._enqueue(job_id) for job_id in job_ids)
+
+    @staticmethod
+    def _pending_job_ids() -> List[int]:
+        """心跳超时的运行中任务放回待执行状态，返回全部待执行任务的 ID（在数据库线程池中调用）"""
+        stale_before = datetime.utcnow() - timedelta(seconds=settings.JOB_STALE_SECONDS)
+        with Session(engine) as db:
+            # 按状态和心跳条件更新，多个进程同时轮询时只会更新一次
+            db.exec(
+                update(BackgroundJob)
+                .where(BackgroundJob.status == JobStatus.RUNNING, BackgroundJob.updated_at < stale_before)
+                .values(status=JobStatus.PENDING)
+            )
+            db.commit()
+            return list(db.exec(
+                select(BackgroundJob.id)
+                .where(BackgroundJob.status == JobStatus.PENDING)
+                .order_by(BackgroundJob.id)
+            ).all())
+
+    async def recover(self) -> int:
+        """重新入队未完成的任务（启动时调用）"""
+        return await self.poll()
+
+    async def wait_idle(self):
+        """等待队列中的任务全部执行完毕（测试和优雅关闭使用）"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    # ------------------------------------------------------------------
+    # 提交 / 查询 / 取消
+    # ------------------------------------------------------------------
+
+    def submit(
+        self,
+        db: Session,
+        user_id: int,
+        job_type: str,
+        payload: Optional[Dict] = None,
+        resource_id: Optional[int] = None,
+        progress_total: int = 0,
+    ) -> BackgroundJob:
+        """创建任务记录并放入队列"""
+        if job_type not in self._handlers:
+            raise ValueError(f"未知的任务类型: {job_type}")
+
+        job = BackgroundJob(
+            user_id=user_id,
+            job_type=job_type,
+            payload=payload or {},
+            resource_id=resource_id,
+            progress_total=progress_total,
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+
+        self.start()
+        self._enqueue(job.id)
+        return job
+
+    def cancel(self, db: Session, job: BackgroundJob) -> BackgroundJob:
+        """请求取消任务"""
+        if job.status in JobStatus.FINISHED:
+            return job
+
+        job.cancel_requested = True
+        job.updated_at = datetime.utcnow()
+        if job.status == JobStatus.PENDING:
+            job.status = JobStatus.CANCELLED
+            job.completed_at = datetime.utcnow()
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+
+        # 本进程正在执行的任务立即中断；其他进程中的任务在下次心跳或上报进度时退出
+        task = self._running.get(job.id)
+        if task is not None:
+            task.cancel()
+        return job
+
+    @staticmethod
+    def to_response(job: BackgroundJob) -> Dict:
+        percent = round(job.progress_done / job.progress_total * 100, 2) if job.progress_total else 0.0
+        response = BackgroundJobResponse(
+            id=job.id,
+            job_type=job.job_type,
+            status=job.status,
+            resource_id=job.resource_id,
+            progress_total=job.progress_total,
+            progress_done=job.progress_done,
+            progress_percent=percent,
+            cancel_requested=job.cancel_requested,
+            error=job.error,
+            created_at=job.created_at,
+            started_at=job.started_at,
+            completed_at=job.completed_at,
+        )
+        return response.model_dump(mode="json")
+
+
+# 全局实例
+job_service = JobService(worker_count=settings.JOB_WORKERS, poll_interval=settings.JOB_POLL_INTERVAL)
+
+
+# ----------------------------------------------------------------------
+# 任务处理函数
+# ----------------------------------------------------------------------
+
+@job_service.register("batch_test")
+async def run_batch_test_job(db: Session, job: BackgroundJob, ctx: JobContext):
+    from ..models.quality_evaluation import BatchTestResult
+    from .batch_test_service import BatchTestService
+
+    batch_test = db.get(BatchTestResult, job.resource_id)
+    if not batch_test:
+        raise ValueError("批量测试记录不存在")
+
+    await BatchTestService.run_batch(
+        db=db,
+        batch_test=batch_test,
+        prompt_content=job.payload["prompt_content"],
+        enable_evaluation=job.payload.get("enable_evaluation", True),
+        on_progress=ctx.report_progress,
+    )
+
+
+@job_service.register("test_suite")
+async def run_test_suite_job(db: Session, job: BackgroundJob, ctx: JobContext):
+    from ..models.test_suite import PromptTestRun, PromptTestSuite
+    from .test_runner_service import TestRunnerService
+
+    run = db.get(PromptTestRun, job.resource_id)
+    suite = db.get(PromptTestSuite, run.suite_id) if run else None
+    if not run or not suite:
+        raise ValueError("测试运行记录不存在")
+
+    run = await TestRunnerService.execute_run(
+        db=db,
+        suite=suite,
+        run=run,
+        model=job.payload.get("model"),
+        temperature=job.payload.get("temperature", 0.0),
+        enable_evaluation=job.payload.get("enable_evaluation", True),
+        on_progress=ctx.report_progress,
+        force_refresh=job.payload.get("force_refresh", False),
+    )
+    if run.status == "failed":
+        raise ValueError(run.error or "测试集运行失败")
+
+
+@job_service.register("abtest")
+async def run_abtest_job(db: Session, job: BackgroundJob, ctx: JobContext):
+    from ..models.abtest import ABTestCreate, ABTestResult
+    from ..models.prompt import Prompt
+    from .abtest_service import ABTestService
+
+    abtest = db.get(ABTestResult, job.resource_id)
+    if not abtest:
+        raise ValueError("A/B 测试记录不存在")
+
+    prompts = []
+    for prompt_id in abtest.prompt_ids:
+        prompt = db.get(Prompt, prompt_id)
+        if not prompt:
+            raise ValueError(f"Prompt 不存在: {prompt_id}")
+        prompts.append(prompt)
+
+    await ABTestService.run_abtest(
+        db=db,
+        abtest=abtest,
+        prompts=prompts,
+        test_data=ABTestCreate(**job.payload),
+        user_id=job.user_id,
+        on_progress=ctx.report_progress,
+    )
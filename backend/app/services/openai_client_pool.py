@@ -0,0 +1,180 @@
+"""OpenAI 客户端连接池 - 按 AI 配置复用 AsyncOpenAI 客户端"""
+import asyncio
+import hashlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+import httpx
+from openai import AsyncOpenAI
+
+from ..core.config import settings
+
+
+class _PooledClient:
+    """连接池中的单个客户端及其引用计数"""
+
+    __slots__ = ("client", "in_use", "retired")
+
+    def __init__(self, client: AsyncOpenAI):
+        self.client = client
+        self.in_use = 0
+        self.retired = False
+
+
+class OpenAIClientPool:
+    """
+    AsyncOpenAI 客户端池
+    以 (base_url, API Key 指纹, timeout) 为键复用客户端，
+    避免每次调用都新建 httpx 连接池、重新握手 TLS 和解析 DNS。
+    """
+
+    def __init__(
+        self,
+        max_size: int = 32,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+    ):
+        self.max_size = max_size
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+
+        self._clients: "OrderedDict[Tuple[str, str, float], _PooledClient]" = OrderedDict()
+        self._pending_close = set()
+
+        # 统计计数
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def fingerprint(api_key: str) -> str:
+        """API Key 指纹（不在内存键中保存明文 Key）"""
+        return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+    def make_key(self, api_key: str, base_url: Optional[str], timeout: float) -> Tuple[str, str, float]:
+        return ((base_url or "").rstrip("/"), self.fingerprint(api_key), float(timeout))
+
+    def _create_client(self, api_key: str, base_url: Optional[str], timeout: float) -> AsyncOpenAI:
+        http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+        )
+        return AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            timeout=timeout,
+            http_client=http_client,
+        )
+
+    def _checkout(self, api_key: str, base_url: Optional[str], timeout: float) -> _PooledClient:
+        key = self.make_key(api_key, base_url, timeout)
+        entry = self._clients.get(key)
+
+        if entry is not None:
+            self.hits += 1
+            self._clients.move_to_end(key)
+        else:
+            self.misses += 1
+            entry = _PooledClient(self._create_client(api_key, base_url, timeout))
+            self._clients[key] = entry
+            self._evict_overflow()
+
+        entry.in_use += 1
+        return entry
+
+    def _release(self, entry: _PooledClient):
+        entry.in_use -= 1
+        if entry.retired and entry.in_use <= 0:
+            self._schedule_close(entry)
+
+    def _evict_overflow(self):
+        """LRU 淘汰：超出容量时移除最久未使用的客户端"""
+        while len(self._clients) > self.max_size:
+            _, entry = self._clients.popitem(last=False)
+            self.evictions += 1
+            entry.retired = True
+            # 仍在使用中的客户端等最后一个调用方释放后再关闭
+            if entry.in_use <= 0:
+                self._schedule_close(entry)
+
+    def _schedule_close(self, entry: _PooledClient):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = loop.create_task(entry.client.close())
+        self._pending_close.add(task)
+        task.add_done_callback(self._pending_close.discard)
+
+    @asynccontextmanager
+    async def acquire(
+        self,
+        api_key: str,
+        base_url: Optional[str],
+        timeout: float = 600.0,
+    ) -> AsyncIterator[AsyncOpenAI]:
+        """
+        获取一个可复用的客户端
+
+        用法:
+            async with openai_client_pool.acquire(api_key, base_url) as client:
+                await client.chat.completions.create(...)
+        """
+        entry = self._checkout(api_key, base_url, timeout)
+        try:
+            yield entry.client
+        finally:
+            self._release(entry)
+
+    def invalidate(self, api_key: str, base_url: Optional[str], timeout: Optional[float] = None):
+        """移除指定配置的客户端（配置变更或 Key 轮换时调用）"""
+        fingerprint = self.fingerprint(api_key)
+        normalized_url = (base_url or "").rstrip("/")
+        for key in list(self._clients.keys()):
+            if key[0] == normalized_url and key[1] == fingerprint and (timeout is None or key[2] == float(timeout)):
+                entry = self._clients.pop(key)
+                entry.retired = True
+                if entry.in_use <= 0:
+                    self._schedule_close(entry)
+
+    async def aclose(self):
+        """关闭所有客户端（应用关闭时调用）"""
+        entries = list(self._clients.values())
+        self._clients.clear()
+        for entry in entries:
+            entry.retired = True
+            try:
+                await entry.client.close()
+            except Exception:
+                pass
+        if self._pending_close:
+            await asyncio.gather(*list(self._pending_close), return_exceptions=True)
+
+    def stats(self) -> Dict:
+        """连接池统计"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._clients),
+            "max_size": self.max_size,
+            "in_use": sum(entry.in_use for entry in self._clients.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+# 全局实例
+openai_client_pool = OpenAIClientPool(
+    max_size=settings.OPENAI_CLIENT_POOL_SIZE,
+    max_connections=settings.OPENAI_MAX_CONNECTIONS,
+    max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry=settings.OPENAI_KEEPALIVE_EXPIRY,
+)
@@ -1,9 +1,21 @@
 import time
-from typing import Dict, List, Optional
-from openai import AsyncOpenAI
+from typing import AsyncIterator, Dict, List, Optional, Set
+from openai import BadRequestError, UnprocessableEntityError
 from sqlmodel import Session, select
+from ..core.config import settings
+from ..core.database import engine
+from ..core.executors import run_in_db
+from ..core.metrics import record_llm_call
 from ..utils.token_counter import count_tokens, estimate_cost
 from ..models.ai_config import AIConfig
+from .ai_config_cache import ResolvedAIConfig, ai_config_cache
+from .openai_client_pool import openai_client_pool
+from .concurrency import provider_llm_limiter
+from .result_cache import make_cache_key, result_cache
+
+
+# 拒绝 stream_options 参数的服务商（base_url），之后的流式调用不再携带
+_stream_usage_unsupported: Set[str] = set()
 
 
 class OpenAIService:
@@ -13,35 +25,39 @@ class OpenAIService:
     """
     
     @staticmethod
-    async def chat_completion(
-        prompt: str,
-        model: str = "gpt-3.5-turbo",
-        temperature: float = 0.7,
-        max_tokens: int = 2000,
-        db: Optional[Session] = None,
-        user_id: Optional[int] = None,
-        **kwargs
-    ) -> Dict:
+    def _resolve_ai_config(db: Session, user_id: int, ai_config_id: Optional[int] = None):
         """
-        聊天补全接口 - 真实 AI 调用
-        
-        Args:
-            prompt: 提示词
-            model: 模型名称
-            temperature: 温度参数
-            max_tokens: 最大 token 数
-            db: 数据库会话
-            user_id: 用户 ID
-            **kwargs: 其他参数
-        
+        查找要使用的 AI 配置并解密 API Key（结果按用户缓存，见 ai_config_cache）
+
         Returns:
-            包含响应内容和统计信息的字典
+            (ai_config, api_key)
         """
-        # 获取用户的 AI 配置
-        if not db or not user_id:
-            raise ValueError("需要提供 db 和 user_id 参数")
-        
-        ai_config_id = kwargs.get("ai_config_id")
+        resolved = ai_config_cache.get(user_id, ai_config_id)
+        if resolved is None:
+            resolved = OpenAIService._load_ai_config(db, user_id, ai_config_id)
+            ai_config_cache.set(user_id, ai_config_id, resolved)
+        return resolved, resolved.api_key
+
+    @staticmethod
+    def _resolve_ai_config_in_own_session(user_id: int, ai_config_id: Optional[int] = None):
+        """使用独立会话解析 AI 配置（在数据库线程池中调用）"""
+        with Session(engine) as db:
+            return OpenAIService._resolve_ai_config(db, user_id, ai_config_id)
+
+    @staticmethod
+    async def _resolve_ai_config_async(db: Session, user_id: int, ai_config_id: Optional[int] = None):
+        """
+        异步版本：命中缓存时直接返回；未命中时查询数据库和解密 API Key 在数据库线程池中执行
+
+        线程中使用独立会话：调用方的 Session 可能同时被其他并发用例在事件循环中使用，不能交给其他线程。
+        """
+        if ai_config_cache.peek(user_id, ai_config_id) is not None:
+            return OpenAIService._resolve_ai_config(db, user_id, ai_config_id)
+        return await run_in_db(OpenAIService._resolve_ai_config_in_own_session, user_id, ai_config_id)
+
+    @staticmethod
+    def _load_ai_config(db: Session, user_id: int, ai_config_id: Optional[int] = None) -> ResolvedAIConfig:
+        """从数据库（或环境变量）查找 AI 配置并解密 API Key"""
         ai_config = None
         if ai_config_id:
             statement = select(AIConfig).where(
@@ -70,61 +86,156 @@ class OpenAIService:
             statement = select(AIConfig).where(AIConfig.is_global == True).limit(1)
             ai_config = db.exec(statement).first()
         
-        # 4. 如果还是没有，尝试从环境变量读取
+        # 4. 如果还是没有，尝试从环境变量读取（环境变量的 key 不需要解密）
         if not ai_config:
-            from ..core.config import settings
             if settings.ENABLE_DEFAULT_AI and settings.DEFAULT_AI_API_KEY:
-                # 使用环境变量配置（临时对象）
-                ai_config = type('DefaultAIConfig', (), {
-                    'api_key': settings.DEFAULT_AI_API_KEY,
-                    'base_url': settings.DEFAULT_AI_BASE_URL,
-                    'model': settings.DEFAULT_AI_MODEL,
-                    'provider': settings.DEFAULT_AI_PROVIDER,
-                    'name': '环境变量配置',
-                    'is_encrypted': False  # 环境变量的 key 不需要解密
-                })()
-            else:
-                raise ValueError("未找到 AI 配置，请先在设置页面添加 AI 配置")
+                return ResolvedAIConfig(
+                    id=None,
+                    name='环境变量配置',
+                    base_url=settings.DEFAULT_AI_BASE_URL,
+                    model=settings.DEFAULT_AI_MODEL,
+                    api_key=settings.DEFAULT_AI_API_KEY,
+                )
+            raise ValueError("未找到 AI 配置，请先在设置页面添加 AI 配置")
         
         # 解密 API Key（数据库中的 key 是加密存储的）
-        api_key = ai_config.api_key
-        if hasattr(ai_config, 'id') and ai_config.id:  # 数据库中的配置需要解密
-            from ..services.encryption_service import EncryptionService
+        from ..services.encryption_service import EncryptionService
+        try:
+            api_key = EncryptionService.decrypt_api_key(ai_config.api_key)
+        except Exception as e:
+            raise ValueError(f"API Key 解密失败: {str(e)}")
+
+        return ResolvedAIConfig(
+            id=ai_config.id,
+            name=ai_config.name,
+            base_url=ai_config.base_url,
+            model=ai_config.model,
+            api_key=api_key,
+        )
+
+    @staticmethod
+    def _build_messages(prompt: str, system_prompt: Optional[str] = None) -> List[Dict]:
+        """构建消息列表"""
+        messages = []
+        
+        # 如果提供了 system_prompt，添加系统消息
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    @staticmethod
+    def _translate_error(e: Exception) -> ValueError:
+        """把上游异常转换为用户可读的错误"""
+        error_msg = str(e)
+        if "timeout" in error_msg.lower():
+            return ValueError("AI 调用超时，请检查网络连接")
+        elif "401" in error_msg or "unauthorized" in error_msg.lower():
+            return ValueError("API Key 无效，请检查 AI 配置")
+        elif "404" in error_msg or "not found" in error_msg.lower():
+            return ValueError("模型不存在，请检查 AI 配置中的模型名称")
+        elif "rate_limit" in error_msg.lower():
+            return ValueError("API 调用频率超限，请稍后再试")
+        else:
+            return ValueError(f"AI 调用失败: {error_msg}")
+
+    @staticmethod
+    async def _create_stream(client, base_url: str, **params):
+        """
+        发起流式请求，要求服务商在最后一个 chunk 中返回 usage（stream_options.include_usage）
+
+        不支持该参数的服务商返回 400 / 422 时去掉参数重试，并记住该服务商。
+        openai 1.12 的 create() 没有 stream_options 参数，通过 extra_body 传递。
+        """
+        if base_url not in _stream_usage_unsupported:
             try:
-                api_key = EncryptionService.decrypt_api_key(ai_config.api_key)
-            except Exception as e:
-                raise ValueError(f"API Key 解密失败: {str(e)}")
+                return await client.chat.completions.create(
+                    **params,
+                    stream=True,
+                    extra_body={"stream_options": {"include_usage": True}},
+                )
+            except (BadRequestError, UnprocessableEntityError):
+                # 去掉参数后仍然失败说明是其他原因，直接抛出，不记住该服务商
+                stream = await client.chat.completions.create(**params, stream=True)
+                _stream_usage_unsupported.add(base_url)
+                return stream
+        return await client.chat.completions.create(**params, stream=True)
+
+    @staticmethod
+    async def chat_completion(
+        prompt: str,
+        model: str = "gpt-3.5-turbo",
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        db: Optional[Session] = None,
+        user_id: Optional[int] = None,
+        **kwargs
+    ) -> Dict:
+        """
+        聊天补全接口 - 真实 AI 调用
         
-        # 创建 OpenAI 客户端
-        client = AsyncOpenAI(
-            api_key=api_key,
-            base_url=ai_config.base_url,
-            timeout=600.0
+        Args:
+            prompt: 提示词
+            model: 模型名称
+            temperature: 温度参数
+            max_tokens: 最大 token 数
+            db: 数据库会话
+            user_id: 用户 ID
+            **kwargs: 其他参数
+                system_prompt: 系统提示词
+                ai_config_id: 指定使用的 AI 配置
+                use_cache: 是否复用完全相同请求的历史结果；
+                    默认 None 表示仅 temperature=0 的确定性调用使用缓存
+        
+        Returns:
+            包含响应内容和统计信息的字典；命中缓存时 is_cached 为 True
+        """
+        # 获取用户的 AI 配置
+        if not db or not user_id:
+            raise ValueError("需要提供 db 和 user_id 参数")
+        
+        ai_config, api_key = await OpenAIService._resolve_ai_config_async(db, user_id, kwargs.get("ai_config_id"))
+        
+        # 优先使用用户指定的模型，否则使用配置中的模型
+        actual_model = model if model else ai_config.model
+        
+        # 结果缓存：请求参数完全相同时直接返回历史输出，不调用模型
+        cache_key = make_cache_key(
+            final_prompt=prompt,
+            system_prompt=kwargs.get("system_prompt"),
+            model=actual_model,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            ai_config_id=getattr(ai_config, "id", None),
         )
+        use_cache = kwargs.get("use_cache")
+        if use_cache is None:
+            use_cache = temperature == 0
+        if use_cache:
+            cached = await result_cache.get_async(db, user_id, cache_key)
+            if cached is not None:
+                return cached
         
         try:
             # 调用真实 AI
             start_time = time.time()
             
             # 构建消息列表
-            messages = []
-            
-            # 如果提供了 system_prompt，添加系统消息
-            system_prompt = kwargs.get("system_prompt")
-            if system_prompt:
-                messages.append({"role": "system", "content": system_prompt})
-            
-            messages.append({"role": "user", "content": prompt})
-
-            # 优先使用用户指定的模型，否则使用配置中的模型
-            actual_model = model if model else ai_config.model
+            messages = OpenAIService._build_messages(prompt, kwargs.get("system_prompt"))
 
-            completion = await client.chat.completions.create(
-                model=actual_model,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens
-            )
+            # 从连接池获取 OpenAI 客户端（复用长连接），并限制同一服务商的并发调用数
+            async with provider_llm_limiter.acquire(ai_config.base_url), openai_client_pool.acquire(
+                api_key=api_key,
+                base_url=ai_config.base_url,
+                timeout=settings.OPENAI_TIMEOUT
+            ) as client:
+                completion = await client.chat.completions.create(
+                    model=actual_model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens
+                )
 
             response_time = time.time() - start_time
 
@@ -132,14 +243,18 @@ class OpenAIService:
             output_text = completion.choices[0].message.content or ""
 
             # 获取 token 使用情况
-            input_tokens = completion.usage.prompt_tokens if completion.usage else count_tokens(prompt)
-            output_tokens = completion.usage.completion_tokens if completion.usage else count_tokens(output_text)
+            input_tokens = completion.usage.prompt_tokens if completion.usage else count_tokens(prompt, actual_model)
+            output_tokens = completion.usage.completion_tokens if completion.usage else count_tokens(output_text, actual_model)
             total_tokens = completion.usage.total_tokens if completion.usage else (input_tokens + output_tokens)
 
             # 估算成本
             cost = estimate_cost(input_tokens, output_tokens, actual_model)
+            record_llm_call(
+                ai_config.base_url, actual_model, "ok", response_time,
+                input_tokens, output_tokens, cost
+            )
 
-            return {
+            result = {
                 "output": output_text,
                 "content": output_text,  # 兼容字段
                 "model": actual_model,
@@ -148,22 +263,114 @@ class OpenAIService:
                 "total_tokens": total_tokens,
                 "cost": cost,
                 "finish_reason": completion.choices[0].finish_reason if completion.choices else "stop",
-                "response_time": round(response_time, 3)
+                "response_time": round(response_time, 3),
+                "cache_key": cache_key,
+                "is_cached": False
             }
+            result_cache.set(user_id, cache_key, result)
+            return result
             
         except Exception as e:
             # 处理错误
-            error_msg = str(e)
-            if "timeout" in error_msg.lower():
-                raise ValueError("AI 调用超时，请检查网络连接")
-            elif "401" in error_msg or "unauthorized" in error_msg.lower():
-                raise ValueError("API Key 无效，请检查 AI 配置")
-            elif "404" in error_msg or "not found" in error_msg.lower():
-                raise ValueError("模型不存在，请检查 AI 配置中的模型名称")
-            elif "rate_limit" in error_msg.lower():
-                raise ValueError("API 调用频率超限，请稍后再试")
-            else:
-                raise ValueError(f"AI 调用失败: {error_msg}")
+            record_llm_call(ai_config.base_url, actual_model, "error", time.time() - start_time)
+            raise OpenAIService._translate_error(e)
+
+    @staticmethod
+    async def chat_completion_stream(
+        prompt: str,
+        model: str = "gpt-3.5-turbo",
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        db: Optional[Session] = None,
+        user_id: Optional[int] = None,
+        **kwargs
+    ) -> AsyncIterator[Dict]:
+        """
+        流式聊天补全接口（stream=True）
+        
+        依次产出事件:
+            {"type": "delta", "content": 增量文本, "output_tokens": 累计输出 token}
+            {"type": "done", ...与 chat_completion 相同的统计字段}
+        
+        调用方提前停止迭代（如客户端断开）时，上游请求会被立即关闭。
+        """
+        if not db or not user_id:
+            raise ValueError("需要提供 db 和 user_id 参数")
+        
+        ai_config, api_key = await OpenAIService._resolve_ai_config_async(db, user_id, kwargs.get("ai_config_id"))
+        messages = OpenAIService._build_messages(prompt, kwargs.get("system_prompt"))
+        actual_model = model if model else ai_config.model
+
+        start_time = time.time()
+        output_parts: List[str] = []
+        output_tokens = 0
+        usage = None
+        finish_reason = "stop"
+
+        async with provider_llm_limiter.acquire(ai_config.base_url), openai_client_pool.acquire(
+            api_key=api_key,
+            base_url=ai_config.base_url,
+            timeout=settings.OPENAI_TIMEOUT
+        ) as client:
+            try:
+                stream = await OpenAIService._create_stream(
+                    client,
+                    ai_config.base_url,
+                    model=actual_model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens
+                )
+            except Exception as e:
+                record_llm_call(ai_config.base_url, actual_model, "error", time.time() - start_time)
+                raise OpenAIService._translate_error(e)
+
+            try:
+                async for chunk in stream:
+                    # 携带 include_usage 时最后一个 chunk 的 choices 为空，只包含 usage
+                    if getattr(chunk, "usage", None):
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    choice = chunk.choices[0]
+                    if choice.finish_reason:
+                        finish_reason = choice.finish_reason
+                    delta = choice.delta.content if choice.delta else None
+                    if not delta:
+                        continue
+
+                    output_parts.append(delta)
+                    # 流式返回时每个 chunk 通常对应一个 token，按增量累计
+                    output_tokens += count_tokens(delta, actual_model)
+                    yield {"type": "delta", "content": delta, "output_tokens": output_tokens}
+            except Exception as e:
+                record_llm_call(ai_config.base_url, actual_model, "error", time.time() - start_time)
+                raise OpenAIService._translate_error(e)
+            finally:
+                # 正常结束、出错或调用方中途放弃时都关闭上游连接
+                await stream.close()
+
+        output_text = "".join(output_parts)
+        input_tokens = usage.prompt_tokens if usage else count_tokens(prompt, actual_model)
+        if usage:
+            output_tokens = usage.completion_tokens
+        total_tokens = usage.total_tokens if usage else (input_tokens + output_tokens)
+        cost = estimate_cost(input_tokens, output_tokens, actual_model)
+        response_time = time.time() - start_time
+        record_llm_call(ai_config.base_url, actual_model, "ok", response_time, input_tokens, output_tokens, cost)
+
+        yield {
+            "type": "done",
+            "output": output_text,
+            "content": output_text,  # 兼容字段
+            "model": actual_model,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": total_tokens,
+            "cost": cost,
+            "finish_reason": finish_reason,
+            "response_time": round(response_time, 3)
+        }
     
     @staticmethod
     async def batch_completion(
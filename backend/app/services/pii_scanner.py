@@ -0,0 +1,151 @@
+"""敏感信息扫描器 - 预编译模式 + 候选区域定位，检测与脱敏共用一次扫描结果"""
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+# (起始位置, 结束位置, 匹配文本)
+Span = Tuple[int, int, str]
+
+# 可能包含身份证号 / 信用卡号 / IP 的候选区域：以数字开头、由这些模式用到的字符组成，
+# 长度至少为其中最短的 IP（7 个字符）。任何一个匹配都不可能跨越候选区域的边界。
+_DIGIT_REGION = re.compile(r'\d[\dXx. \-]{6,}')
+# 邮箱候选区域：包含 @ 的连续邮箱字符
+_EMAIL_CHARS = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789._%+-@')
+_EMAIL_RUN = re.compile(r'[a-zA-Z0-9._%+\-@]*')
+
+# 各类型的最短匹配长度，候选区域短于该长度时直接跳过
+_MIN_LENGTH = {'id_card': 18, 'credit_card': 16, 'ip_address': 7}
+
+
+class PIIScanner:
+    """
+    敏感信息扫描器
+
+    检测结果与对每个模式分别执行 re.finditer 完全一致：各类型之间允许重叠，
+    同一类型内从左到右、互不重叠。精确模式只在很短的候选区域内执行，
+    长文本的开销主要是一次候选区域定位。
+
+    脱敏按 手机号 -> 身份证号 -> 邮箱 -> 信用卡号 的固定顺序进行，
+    每一步都作用在上一步的结果上（与依次 re.sub 的结果一致）；
+    前面的步骤没有发生替换时直接复用检测结果，不再扫描。
+    """
+
+    # 在数字候选区域内匹配的类型；手机号以固定字符开头，直接整体扫描更快
+    DIGIT_TYPES = ('id_card', 'credit_card', 'ip_address')
+    # 脱敏涉及的类型
+    MASK_TYPES = ('phone', 'id_card', 'email', 'credit_card')
+
+    def __init__(self, patterns: Dict[str, str]):
+        self.types = tuple(patterns)
+        self.compiled = {name: re.compile(pattern) for name, pattern in patterns.items()}
+
+    # ------------------------------------------------------------------
+    # 候选区域
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _digit_regions(text: str) -> List[Tuple[int, int]]:
+        return [match.span() for match in _DIGIT_REGION.finditer(text)]
+
+    @staticmethod
+    def _email_regions(text: str) -> List[Tuple[int, int]]:
+        regions = []
+        index = text.find('@')
+        while index != -1:
+            start = index
+            while start > 0 and text[start - 1] in _EMAIL_CHARS:
+                start -= 1
+            end = _EMAIL_RUN.match(text, index + 1).end()
+            regions.append((start, end))
+            index = text.find('@', end)
+        return regions
+
+    def _find_in(self, name: str, text: str, regions: List[Tuple[int, int]]) -> List[Span]:
+        pattern = self.compiled[name]
+        min_length = _MIN_LENGTH.get(name, 0)
+        spans = []
+        for start, end in regions:
+            if end - start < min_length:
+                continue
+            for match in pattern.finditer(text, start, end):
+                spans.append((match.start(), match.end(), match.group(0)))
+        return spans
+
+    def _find_digit_types(self, names, text: str, regions: List[Tuple[int, int]]) -> Dict[str, List[Span]]:
+        """一次遍历候选区域，同时得到多个数字类型的匹配"""
+        found: Dict[str, List[Span]] = {name: [] for name in names}
+        checks = [(found[name], self.compiled[name].finditer, _MIN_LENGTH[name]) for name in names]
+        shortest = min((min_length for _, _, min_length in checks), default=0)
+        for start, end in regions:
+            length = end - start
+            if length < shortest:
+                continue
+            for spans, finditer, min_length in checks:
+                if length >= min_length:
+                    for match in finditer(text, start, end):
+                        spans.append((match.start(), match.end(), match.group(0)))
+        return found
+
+    def _find_all(self, name: str, text: str) -> List[Span]:
+        return [(match.start(), match.end(), match.group(0)) for match in self.compiled[name].finditer(text)]
+
+    # ------------------------------------------------------------------
+    # 检测
+    # ------------------------------------------------------------------
+
+    def detect(self, text: str, types: Optional[Tuple[str, ...]] = None) -> Dict[str, List[Span]]:
+        """按类型返回全部匹配（类型顺序与 patterns 一致）；types 限定只检测部分类型"""
+        names = [name for name in self.types if types is None or name in types]
+        digit_names = [name for name in names if name in self.DIGIT_TYPES]
+        digit_found = self._find_digit_types(digit_names, text, self._digit_regions(text)) if digit_names else {}
+
+        found: Dict[str, List[Span]] = {}
+        for name in names:
+            if name in digit_found:
+                found[name] = digit_found[name]
+            elif name == 'email':
+                found[name] = self._find_in(name, text, self._email_regions(text))
+            else:
+                found[name] = self._find_all(name, text)
+        return found
+
+    # ------------------------------------------------------------------
+    # 脱敏
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _replace(text: str, spans: List[Span], replace: Callable[[str], str]) -> str:
+        pieces = []
+        position = 0
+        for start, end, value in spans:
+            pieces.append(text[position:start])
+            pieces.append(replace(value))
+            position = end
+        pieces.append(text[position:])
+        return ''.join(pieces)
+
+    def mask(
+        self,
+        text: str,
+        maskers: Dict[str, Callable[[str], str]],
+        detected: Optional[Dict[str, List[Span]]] = None,
+    ) -> str:
+        """
+        依次对 phone / id_card / email / credit_card 脱敏
+
+        Args:
+            text: 原文
+            maskers: {类型: 把匹配文本转换为脱敏文本的函数}，按调用顺序记录脱敏明细
+            detected: detect(text) 的结果（已有时直接复用）
+        """
+        current = text
+        for name in self.MASK_TYPES:
+            if detected is not None and current is text:
+                # 前面的步骤没有发生替换，直接复用检测结果
+                spans = detected[name]
+            elif name == 'email':
+                spans = self._find_in(name, current, self._email_regions(current))
+            else:
+                spans = self._find_all(name, current)
+            if spans:
+                current = self._replace(current, spans, maskers[name])
+        return current
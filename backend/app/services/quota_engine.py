@@ -0,0 +1,607 @@
+"""配额引擎 - 状态后端中的日/月使用量计数器 + 定期回写 ApiUsage"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import case, func, update
+from sqlmodel import Session, select
+
+from ..core.config import settings
+from ..core.database import engine
+from ..core.executors import run_in_db, run_in_state
+from ..core.state_backend import StateBackend, state_backend
+from ..models.api_quota import ApiUsage
+
+logger = logging.getLogger(__name__)
+
+QuotaLoader = Callable[[Session, int, Optional[int]], Dict]
+
+
+class _Usage:
+    """请求数 / Token / 费用 计数"""
+
+    __slots__ = ("requests", "tokens", "cost")
+
+    def __init__(self, requests: int = 0, tokens: int = 0, cost: float = 0.0):
+        self.requests = requests
+        self.tokens = tokens
+        self.cost = cost
+
+    def add(self, requests: int, tokens: int, cost: float):
+        self.requests += requests
+        self.tokens += tokens
+        self.cost += cost
+
+
+class _PendingUsage:
+    """尚未回写数据库的某一天的使用量增量"""
+
+    __slots__ = ("requests", "input_tokens", "output_tokens", "cost", "models", "team_id")
+
+    def __init__(self):
+        self.requests = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost = 0.0
+        self.models: Dict[str, Dict] = {}
+        self.team_id: Optional[int] = None
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def add(self, input_tokens: int, output_tokens: int, cost: float, model: str, team_id: Optional[int]):
+        self.requests += 1
+        self.input_tokens += input_tokens
+        self.output_tokens += output_tokens
+        self.cost += cost
+        self.team_id = team_id
+        detail = self.models.setdefault(model, {'count': 0, 'tokens': 0, 'cost': 0.0})
+        detail['count'] += 1
+        detail['tokens'] += input_tokens + output_tokens
+        detail['cost'] += cost
+
+    def merge(self, other: "_PendingUsage"):
+        """回写失败时把增量合并回去，下次重试"""
+        self.requests += other.requests
+        self.input_tokens += other.input_tokens
+        self.output_tokens += other.output_tokens
+        self.cost += other.cost
+        self.team_id = other.team_id
+        for model, detail in other.models.items():
+            target = self.models.setdefault(model, {'count': 0, 'tokens': 0, 'cost': 0.0})
+            for key in target:
+                target[key] += detail[key]
+
+
+class _UserCounters:
+    """单个用户的本地状态：计数同步时间和配额配置缓存（使用量本身保存在状态后端）"""
+
+    __slots__ = ("day", "synced_at", "quota", "quota_team_id", "quota_loaded_at")
+
+    def __init__(self):
+        self.day: Optional[datetime] = None
+        self.synced_at = 0.0
+        self.quota: Optional[Dict] = None
+        self.quota_team_id: Optional[int] = None
+        self.quota_loaded_at = 0.0
+
+
+class _Keys:
+    """某个用户某一天的计数器键"""
+
+    __slots__ = ("day_requests", "day_tokens", "day_cost", "day_seeded",
+                 "month_requests", "month_tokens", "month_cost", "month_seeded")
+
+    def __init__(self, user_id: int, day: datetime):
+        day_prefix = f"quota:{user_id}:d:{day:%Y%m%d}:"
+        month_prefix = f"quota:{user_id}:m:{day:%Y%m}:"
+        self.day_requests = day_prefix + "requests"
+        self.day_tokens = day_prefix + "tokens"
+        self.day_cost = day_prefix + "cost"
+        self.day_seeded = day_prefix + "seeded"
+        self.month_requests = month_prefix + "requests"
+        self.month_tokens = month_prefix + "tokens"
+        self.month_cost = month_prefix + "cost"
+        self.month_seeded = month_prefix + "seeded"
+
+
+class QuotaEngine:
+    """
+    配额引擎
+    每个用户的今日/本月使用量保存在状态后端的计数器中，检查配额不访问数据库；
+    用量增量定期批量回写 api_usage 表（write-behind）。
+
+    - 进程内后端：冷启动或超过同步间隔时，用一条聚合 SQL 从数据库重新加载计数（多进程部署时据此收敛）
+    - 共享后端（SQLite / Redis）：所有进程共用同一份计数，检查与预留是跨进程原子的；
+      某天 / 某月的计数器不存在时才从数据库加载一次作为基数
+
+    共享后端的读写是阻塞 I/O，事件循环中使用 check_async / release_async / record_async。
+    """
+
+    # 计数器过期时间：日计数保留到第二天，月计数保留到下个月
+    DAY_TTL = 2 * 24 * 3600
+    MONTH_TTL = 32 * 24 * 3600
+    # 预留按创建时间分到多少个时间片（每片 reservation_ttl / RESERVATION_SLOTS 秒）
+    RESERVATION_SLOTS = 10
+
+    def __init__(
+        self,
+        sync_interval: float = 60.0,
+        flush_interval: float = 5.0,
+        reservation_ttl: float = 600.0,
+        backend: Optional[StateBackend] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.sync_interval = sync_interval
+        self.flush_interval = flush_interval
+        self.reservation_ttl = reservation_ttl
+        self.backend = backend or state_backend
+        # 预留时间片使用墙上时间，多个进程共享后端时片号一致
+        self.clock = clock
+        self._slot_seconds = max(reservation_ttl, 1.0) / self.RESERVATION_SLOTS
+        # 时间片键只需在窗口内存活，之后由后端按过期时间清理
+        self._slot_ttl = self._slot_seconds * (self.RESERVATION_SLOTS + 2)
+
+        self._lock = threading.RLock()
+        self._counters: Dict[int, _UserCounters] = {}
+        # {(user_id, usage_date): 增量}
+        self._pending: Dict[Tuple[int, datetime], _PendingUsage] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    # ------------------------------------------------------------------
+    # 计数器加载
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _today() -> datetime:
+        return datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def _load_usage(
+        self,
+        db: Session,
+        user_id: int,
+        today: datetime,
+        include_pending: bool = True,
+    ) -> Tuple[_Usage, _Usage]:
+        """一条聚合 SQL 同时得到今日和本月使用量"""
+        month_start = today.replace(day=1)
+        is_today = ApiUsage.usage_date == today
+        row = db.exec(
+            select(
+                func.coalesce(func.sum(case((is_today, ApiUsage.request_count), else_=0)), 0),
+                func.coalesce(func.sum(case((is_today, ApiUsage.total_tokens), else_=0)), 0),
+                func.coalesce(func.sum(case((is_today, ApiUsage.total_cost), else_=0.0)), 0.0),
+                func.coalesce(func.sum(ApiUsage.request_count), 0),
+                func.coalesce(func.sum(ApiUsage.total_tokens), 0),
+                func.coalesce(func.sum(ApiUsage.total_cost), 0.0),
+            ).where(
+                ApiUsage.user_id == user_id,
+                ApiUsage.usage_date >= month_start,
+            )
+        ).one()
+        today_usage = _Usage(int(row[0]), int(row[1]), float(row[2]))
+        month_usage = _Usage(int(row[3]), int(row[4]), float(row[5]))
+
+        if not include_pending:
+            return today_usage, month_usage
+
+        # 加上本进程尚未回写的增量
+        for (pending_user, usage_date), pending in self._pending.items():
+            if pending_user != user_id or usage_date < month_start:
+                continue
+            month_usage.add(pending.requests, pending.total_tokens, pending.cost)
+            if usage_date == today:
+                today_usage.add(pending.requests, pending.total_tokens, pending.cost)
+        return today_usage, month_usage
+
+    def _ensure(
+        self,
+        db: Session,
+        user_id: int,
+        team_id: Optional[int],
+        quota_loader: QuotaLoader,
+    ) -> _UserCounters:
+        """返回已加载的计数器；冷启动、跨天或超过同步间隔时从数据库重新加载"""
+        now = time.monotonic()
+        today = self._today()
+        counters = self._counters.get(user_id)
+        if counters is None:
+            counters = _UserCounters()
+            self._counters[user_id] = counters
+
+        if counters.day != today or now - counters.synced_at > self.sync_interval:
+            self._sync(db, user_id, today)
+            counters.day = today
+            counters.synced_at = now
+
+        if self._quota_stale(counters, team_id, now):
+            counters.quota = quota_loader(db, user_id, team_id)
+            counters.quota_team_id = team_id
+            counters.quota_loaded_at = now
+        return counters
+
+    def _quota_stale(self, counters: _UserCounters, team_id: Optional[int], now: float) -> bool:
+        return (
+            counters.quota is None
+            or counters.quota_team_id != team_id
+            or now - counters.quota_loaded_at > self.sync_interval
+        )
+
+    def _loaded(self, user_id: int, team_id: Optional[int]) -> bool:
+        """计数器和配额都已加载且未过期（_ensure 不需要访问数据库）"""
+        now = time.monotonic()
+        with self._lock:
+            counters = self._counters.get(user_id)
+            return (
+                counters is not None
+                and counters.day == self._today()
+                and now - counters.synced_at <= self.sync_interval
+                and not self._quota_stale(counters, team_id, now)
+            )
+
+    def _usage_items(self, keys: _Keys, today_usage: _Usage, month_usage: _Usage):
+        return [
+            (keys.day_requests, today_usage.requests, self.DAY_TTL),
+            (keys.day_tokens, today_usage.tokens, self.DAY_TTL),
+            (keys.day_cost, today_usage.cost, self.DAY_TTL),
+            (keys.month_requests, month_usage.requests, self.MONTH_TTL),
+            (keys.month_tokens, month_usage.tokens, self.MONTH_TTL),
+            (keys.month_cost, month_usage.cost, self.MONTH_TTL),
+        ]
+
+    def _sync(self, db: Session, user_id: int, today: datetime):
+        """从数据库加载使用量到状态后端"""
+        keys = _Keys(user_id, today)
+        if not self.backend.shared:
+            # 进程内计数：直接覆盖为 数据库 + 本进程未回写的增量
+            today_usage, month_usage = self._load_usage(db, user_id, today)
+            self.backend.set_many(self._usage_items(keys, today_usage, month_usage))
+            return
+
+        # 共享计数：只在计数器不存在时加一次数据库基数（用量增量已经直接写入后端）
+        seeded = self.backend.get_many([keys.day_seeded, keys.month_seeded])
+        if seeded[keys.day_seeded] and seeded[keys.month_seeded]:
+            return
+        today_usage, month_usage = self._load_usage(db, user_id, today, include_pending=False)
+        items = self._usage_items(keys, today_usage, month_usage)
+        for seeded_key, seed_items, ttl in (
+            (keys.day_seeded, items[:3], self.DAY_TTL),
+            (keys.month_seeded, items[3:], self.MONTH_TTL),
+        ):
+            if not seeded[seeded_key]:
+                # 标记不存在时才累加基数，多个进程同时加载也只会生效一次
+                self.backend.check_and_incr(
+                    [(seeded_key, 1, ttl)] + seed_items,
+                    [([(seeded_key, 1.0)], 1.0)],
+                )
+
+    # ------------------------------------------------------------------
+    # 检查 / 预留 / 记录
+    # ------------------------------------------------------------------
+
+    def _reserved_slots(self, user_id: int) -> List[str]:
+        """
+        仍然有效的预留计数键（从旧到新，最后一个是当前时间片）
+
+        每个预留计入创建时的时间片，时间片移出窗口后其中的预留不再计入检查，
+        所以没有 record / release 的预留最多存活 reservation_ttl 加一个时间片，
+        不会因为同一用户后续的预留刷新过期时间而一直占用额度。
+        """
+        current = int(self.clock() // self._slot_seconds)
+        return [
+            f"quota:{user_id}:reserved:{slot}"
+            for slot in range(current - self.RESERVATION_SLOTS, current + 1)
+        ]
+
+    def check(
+        self,
+        db: Session,
+        user_id: int,
+        team_id: Optional[int],
+        quota_loader: QuotaLoader,
+        reserve: bool = False,
+    ) -> Tuple[bool, Optional[str]]:
+        """
+        检查配额；reserve=True 时检查通过后原子地预留一次请求
+
+        预留的请求会计入请求数检查，直到 record() 或 release() 被调用。
+        """
+        with self._lock:
+            counters = self._ensure(db, user_id, team_id, quota_loader)
+            quota = counters.quota
+            keys = _Keys(user_id, counters.day)
+            slots = self._reserved_slots(user_id)
+            reserved = [(slot, 1.0) for slot in slots]
+
+            checks: List[Tuple[list, float, str]] = [
+                # 每日 / 每月请求数（包含已预留的请求）
+                ([(keys.day_requests, 1.0)] + reserved, quota['requests_per_day'],
+                 f"今日 API 调用次数已达上限 ({quota['requests_per_day']} 次)"),
+                ([(keys.month_requests, 1.0)] + reserved, quota['requests_per_month'],
+                 f"本月 API 调用次数已达上限 ({quota['requests_per_month']} 次)"),
+                # 每日 / 每月 token
+                ([(keys.day_tokens, 1.0)], quota['tokens_per_day'],
+                 f"今日 Token 使用量已达上限 ({quota['tokens_per_day']})"),
+                ([(keys.month_tokens, 1.0)], quota['tokens_per_month'],
+                 f"本月 Token 使用量已达上限 ({quota['tokens_per_month']})"),
+                # 每日 / 每月费用
+                ([(keys.day_cost, 1.0)], quota['cost_per_day'],
+                 f"今日费用已达上限 (${quota['cost_per_day']:.2f})"),
+                ([(keys.month_cost, 1.0)], quota['cost_per_month'],
+                 f"本月费用已达上限 (${quota['cost_per_month']:.2f})"),
+            ]
+            increments = [(slots[-1], 1, self._slot_ttl)] if reserve else []
+            failed, _ = self.backend.check_and_incr(
+                increments,
+                [(terms, limit) for terms, limit, _ in checks],
+            )
+            if failed is not None:
+                return False, checks[failed][2]
+            return True, None
+
+    def _check_in_own_session(
+        self,
+        user_id: int,
+        team_id: Optional[int],
+        quota_loader: QuotaLoader,
+        reserve: bool,
+    ) -> Tuple[bool, Optional[str]]:
+        # 会话在第一次查询时才借出连接，计数器已加载时不会访问数据库
+        with Session(engine) as db:
+            return self.check(db, user_id, team_id, quota_loader, reserve=reserve)
+
+    async def check_async(
+        self,
+        user_id: int,
+        team_id: Optional[int],
+        quota_loader: QuotaLoader,
+        reserve: bool = False,
+    ) -> Tuple[bool, Optional[str]]:
+        """
+        check 的异步版本，需要加载使用量时使用独立会话
+
+        共享后端在状态后端线程池中执行；进程内后端计数器已加载时直接检查，
+        需要从数据库加载时在数据库线程池中执行。
+        """
+        if self.backend.shared:
+            return await run_in_state(self._check_in_own_session, user_id, team_id, quota_loader, reserve)
+        if self._loaded(user_id, team_id):
+            return self._check_in_own_session(user_id, team_id, quota_loader, reserve)
+        return await run_in_db(self._check_in_own_session, user_id, team_id, quota_loader, reserve)
+
+    async def _run_backend(self, fn: Callable, *args, **kwargs):
+        """共享后端在状态后端线程池中执行，进程内后端直接执行"""
+        if self.backend.shared:
+            return await run_in_state(fn, *args, **kwargs)
+        return fn(*args, **kwargs)
+
+    async def release_async(self, user_id: int):
+        """release 的异步版本"""
+        await self._run_backend(self.release, user_id)
+
+    async def record_async(
+        self,
+        user_id: int,
+        input_tokens: int,
+        output_tokens: int,
+        cost: float,
+        model: str,
+        team_id: Optional[int] = None,
+    ):
+        """record 的异步版本"""
+        await self._run_backend(
+            self.record, user_id, input_tokens, output_tokens, cost, model, team_id=team_id
+        )
+
+    def release(self, user_id: int):
+        """释放一次预留（调用失败或命中缓存、没有产生用量时）"""
+        slots = self._reserved_slots(user_id)
+        values = self.backend.get_many(slots)
+        # 先释放最新的时间片：释放最早的会把泄漏的预留“续”到新的时间片上，永远不过期；
+        # 留下的较早预留最多提前到调用开始后 reservation_ttl 失效，此时调用已经超时
+        for slot in reversed(slots):
+            if values[slot] <= 0:
+                continue
+            # 只在该时间片的预留数大于 0 时递减（其他进程可能同时释放）
+            failed, _ = self.backend.check_and_incr(
+                [(slot, -1, self._slot_ttl)],
+                [([(slot, -1.0)], 0.0)],
+            )
+            if failed is None:
+                return
+
+    def record(
+        self,
+        user_id: int,
+        input_tokens: int,
+        output_tokens: int,
+        cost: float,
+        model: str,
+        team_id: Optional[int] = None,
+    ):
+        """记录一次调用的用量（只更新计数器，由 flush 回写数据库）"""
+        today = self._today()
+        with self._lock:
+            pending = self._pending.get((user_id, today))
+            if pending is None:
+                pending = _PendingUsage()
+                self._pending[(user_id, today)] = pending
+            pending.add(input_tokens, output_tokens, cost, model, team_id)
+
+        usage = _Usage(1, input_tokens + output_tokens, cost)
+        self.backend.incr(self._usage_items(_Keys(user_id, today), usage, usage))
+        self.release(user_id)
+
+    def usage(
+        self,
+        db: Session,
+        user_id: int,
+        team_id: Optional[int],
+        quota_loader: QuotaLoader,
+    ) -> Tuple[Dict, Dict, Dict]:
+        """返回 (有效配额, 今日使用量, 本月使用量)"""
+        with self._lock:
+            counters = self._ensure(db, user_id, team_id, quota_loader)
+            keys = _Keys(user_id, counters.day)
+            values = self.backend.get_many([
+                keys.day_requests, keys.day_tokens, keys.day_cost,
+                keys.month_requests, keys.month_tokens, keys.month_cost,
+            ])
+            today = {
+                'request_count': int(values[keys.day_requests]),
+                'total_tokens': int(values[keys.day_tokens]),
+                'total_cost': values[keys.day_cost],
+            }
+            month = {
+                'request_count': int(values[keys.month_requests]),
+                'total_tokens': int(values[keys.month_tokens]),
+                'total_cost': values[keys.month_cost],
+            }
+            return counters.quota, today, month
+
+    def invalidate_quota(self, user_id: Optional[int] = None):
+        """配额配置变更后调用；不传 user_id 时清除全部用户（如团队配额变更）"""
+        with self._lock:
+            targets = [self._counters.get(user_id)] if user_id is not None else list(self._counters.values())
+            for counters in targets:
+                if counters is not None:
+                    counters.quota = None
+
+    # ------------------------------------------------------------------
+    # 回写
+    # ------------------------------------------------------------------
+
+    def flush(self, db: Optional[Session] = None, user_id: Optional[int] = None) -> int:
+        """
+        把未回写的增量写入 api_usage 表
+
+        Args:
+            db: 数据库会话（不传时使用独立会话）
+            user_id: 只回写指定用户
+
+        Returns:
+            回写的记录数
+        """
+        with self._lock:
+            keys = [key for key in self._pending if user_id is None or key[0] == user_id]
+            batch = {key: self._pending.pop(key) for key in keys}
+        if not batch:
+            return 0
+
+        if db is None:
+            with Session(engine) as own_db:
+                return self._write(own_db, batch)
+        return self._write(db, batch)
+
+    def _write(self, db: Session, batch: Dict[Tuple[int, datetime], _PendingUsage]) -> int:
+        written = 0
+        try:
+            for (user_id, usage_date), pending in batch.items():
+                # 累加使用 SQL 表达式，多个进程同时回写也不会丢失更新
+                result = db.exec(
+                    update(ApiUsage)
+                    .where(ApiUsage.user_id == user_id, ApiUsage.usage_date == usage_date)
+                    .values(
+                        request_count=ApiUsage.request_count + pending.requests,
+                        input_tokens=ApiUsage.input_tokens + pending.input_tokens,
+                        output_tokens=ApiUsage.output_tokens + pending.output_tokens,
+                        total_tokens=ApiUsage.total_tokens + pending.total_tokens,
+                        total_cost=ApiUsage.total_cost + pending.cost,
+                        team_id=pending.team_id,
+                        updated_at=datetime.utcnow(),
+                    )
+                )
+
+                usage = None
+                if result.rowcount:
+                    usage = db.exec(
+                        select(ApiUsage).where(
+                            ApiUsage.user_id == user_id,
+                            ApiUsage.usage_date == usage_date,
+                        )
+                    ).first()
+                if usage is None:
+                    usage = ApiUsage(
+                        user_id=user_id,
+                        team_id=pending.team_id,
+                        usage_date=usage_date,
+                        request_count=pending.requests,
+                        input_tokens=pending.input_tokens,
+                        output_tokens=pending.output_tokens,
+                        total_tokens=pending.total_tokens,
+                        total_cost=pending.cost,
+                    )
+
+                # 合并模型使用详情
+                model_usage_details = {}
+                if usage.model_usage_details:
+                    try:
+                        model_usage_details = json.loads(usage.model_usage_details)
+                    except Exception:
+                        pass
+                for model, detail in pending.models.items():
+                    target = model_usage_details.setdefault(model, {'count': 0, 'tokens': 0, 'cost': 0.0})
+                    target['count'] += detail['count']
+                    target['tokens'] += detail['tokens']
+                    target['cost'] += detail['cost']
+                usage.model_usage_details = json.dumps(model_usage_details)
+
+                db.add(usage)
+                db.commit()
+                written += 1
+        except Exception:
+            db.rollback()
+            # 未写入的增量放回队列，下次重试
+            with self._lock:
+                for index, (key, pending) in enumerate(batch.items()):
+                    if index < written:
+                        continue
+                    existing = self._pending.get(key)
+                    if existing is None:
+                        self._pending[key] = pending
+                    else:
+                        existing.merge(pending)
+            raise
+        return written
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                # 回写数据库在数据库线程池中执行，不阻塞事件循环
+                await run_in_db(self.flush)
+            except Exception as e:
+                logger.warning("使用量回写失败: %s", e)
+
+    def start(self):
+        """启动定期回写（在事件循环中调用）"""
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def stop(self):
+        """停止定期回写并写入剩余增量"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        await run_in_db(self.flush)
+
+    def reset(self):
+        """清空全部计数状态（不回写）"""
+        with self._lock:
+            self._counters.clear()
+            self._pending.clear()
+        self.backend.clear("quota:")
+
+
+# 全局实例
+quota_engine = QuotaEngine(
+    sync_interval=settings.QUOTA_SYNC_INTERVAL,
+    flush_interval=settings.QUOTA_FLUSH_INTERVAL,
+    reservation_ttl=settings.OPENAI_TIMEOUT,
+)
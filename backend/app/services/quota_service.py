@@ -1,11 +1,12 @@
 """API 配额服务"""
-import json
 from typing import Optional, Dict, Tuple
 from datetime import datetime, date
-from sqlmodel import Session, select, and_
+from sqlmodel import Session, select, and_, func
 
+from ..core.metrics import QUOTA_REJECTIONS
 from ..models.api_quota import ApiQuota, ApiUsage, QuotaType
 from ..models.user import User
+from .quota_engine import quota_engine
 
 
 class QuotaService:
@@ -123,22 +124,22 @@ class QuotaService:
         now = datetime.utcnow()
         month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
         
-        statement = select(ApiUsage).where(
+        statement = select(
+            func.coalesce(func.sum(ApiUsage.request_count), 0),
+            func.coalesce(func.sum(ApiUsage.total_tokens), 0),
+            func.coalesce(func.sum(ApiUsage.total_cost), 0.0)
+        ).where(
             and_(
                 ApiUsage.user_id == user_id,
                 ApiUsage.usage_date >= month_start
             )
         )
-        usages = db.exec(statement).all()
-        
-        total_requests = sum(u.request_count for u in usages)
-        total_tokens = sum(u.total_tokens for u in usages)
-        total_cost = sum(u.total_cost for u in usages)
+        total_requests, total_tokens, total_cost = db.exec(statement).one()
         
         return {
-            'request_count': total_requests,
-            'total_tokens': total_tokens,
-            'total_cost': total_cost
+            'request_count': int(total_requests),
+            'total_tokens': int(total_tokens),
+            'total_cost': float(total_cost)
         }
     
     @classmethod
@@ -146,43 +147,83 @@ class QuotaService:
         cls, 
         db: Session, 
         user_id: int, 
-        team_id: Optional[int] = None
+        team_id: Optional[int] = None,
+        reserve: bool = False
     ) -> Tuple[bool, Optional[str]]:
         """
-        检查用户是否超过配额
+        检查用户是否超过配额（使用内存计数，稳定状态下不访问数据库）
+        
+        Args:
+            reserve: 检查通过后原子地预留一次请求，调用结束后必须
+                record_usage() 或 release_quota()（超时未记录的预留会自动过期）
         
         Returns:
             (是否允许, 错误消息)
         """
-        quota = cls.get_effective_quota(db, user_id, team_id)
-        today_usage = cls.get_today_usage(db, user_id)
-        month_usage = cls.get_month_usage(db, user_id)
-        
-        # 检查每日请求数
-        if today_usage.request_count >= quota['requests_per_day']:
-            return False, f"今日 API 调用次数已达上限 ({quota['requests_per_day']} 次)"
-        
-        # 检查每月请求数
-        if month_usage['request_count'] >= quota['requests_per_month']:
-            return False, f"本月 API 调用次数已达上限 ({quota['requests_per_month']} 次)"
-        
-        # 检查每日 token
-        if today_usage.total_tokens >= quota['tokens_per_day']:
-            return False, f"今日 Token 使用量已达上限 ({quota['tokens_per_day']})"
-        
-        # 检查每月 token
-        if month_usage['total_tokens'] >= quota['tokens_per_month']:
-            return False, f"本月 Token 使用量已达上限 ({quota['tokens_per_month']})"
-        
-        # 检查每日费用
-        if today_usage.total_cost >= quota['cost_per_day']:
-            return False, f"今日费用已达上限 (${quota['cost_per_day']:.2f})"
-        
-        # 检查每月费用
-        if month_usage['total_cost'] >= quota['cost_per_month']:
-            return False, f"本月费用已达上限 (${quota['cost_per_month']:.2f})"
-        
+        allowed, reason = quota_engine.check(db, user_id, team_id, cls.get_effective_quota, reserve=reserve)
+        if not allowed:
+            QUOTA_REJECTIONS.labels(check="request").inc()
+        return allowed, reason
+    
+    @classmethod
+    async def check_quota_async(
+        cls,
+        user_id: int,
+        team_id: Optional[int] = None,
+        reserve: bool = False
+    ) -> Tuple[bool, Optional[str]]:
+        """check_quota 的异步版本（事件循环中调用，需要加载使用量时使用独立会话）"""
+        allowed, reason = await quota_engine.check_async(user_id, team_id, cls.get_effective_quota, reserve=reserve)
+        if not allowed:
+            QUOTA_REJECTIONS.labels(check="request").inc()
+        return allowed, reason
+
+    @classmethod
+    def check_budget(
+        cls,
+        db: Session,
+        user_id: int,
+        requests: int,
+        tokens: int,
+        cost: float,
+        team_id: Optional[int] = None
+    ) -> Tuple[bool, Optional[str]]:
+        """
+        检查剩余配额是否足够执行一批调用（批量测试、测试集执行前的预检，不预留配额）
+
+        Args:
+            requests: 预计调用次数
+            tokens: 预计 token 用量
+            cost: 预计费用（美元）
+
+        Returns:
+            (是否允许, 错误消息)
+        """
+        quota, today, month = quota_engine.usage(db, user_id, team_id, cls.get_effective_quota)
+        checks = [
+            (today['request_count'], requests, quota['requests_per_day'], "今日 API 调用次数", "{:.0f} 次"),
+            (month['request_count'], requests, quota['requests_per_month'], "本月 API 调用次数", "{:.0f} 次"),
+            (today['total_tokens'], tokens, quota['tokens_per_day'], "今日 Token 使用量", "{:.0f}"),
+            (month['total_tokens'], tokens, quota['tokens_per_month'], "本月 Token 使用量", "{:.0f}"),
+            (today['total_cost'], cost, quota['cost_per_day'], "今日费用", "${:.2f}"),
+            (month['total_cost'], cost, quota['cost_per_month'], "本月费用", "${:.2f}"),
+        ]
+        for used, needed, limit, name, fmt in checks:
+            if used + needed > limit:
+                remaining = fmt.format(max(0, limit - used))
+                QUOTA_REJECTIONS.labels(check="budget").inc()
+                return False, f"{name}剩余 {remaining}，不足以执行本次任务 (预计 {fmt.format(needed)})"
         return True, None
+
+    @classmethod
+    def release_quota(cls, user_id: int):
+        """释放 check_quota(reserve=True) 的预留（调用失败、没有产生用量时）"""
+        quota_engine.release(user_id)
+
+    @classmethod
+    async def release_quota_async(cls, user_id: int):
+        """release_quota 的异步版本"""
+        await quota_engine.release_async(user_id)
     
     @classmethod
     def record_usage(
@@ -195,49 +236,55 @@ class QuotaService:
         model: str,
         team_id: Optional[int] = None
     ):
-        """记录 API 使用"""
-        usage = cls.get_today_usage(db, user_id)
-        
-        # 更新使用量
-        usage.request_count += 1
-        usage.input_tokens += input_tokens
-        usage.output_tokens += output_tokens
-        usage.total_tokens += input_tokens + output_tokens
-        usage.total_cost += cost
-        usage.team_id = team_id
-        usage.updated_at = datetime.utcnow()
-        
-        # 更新模型使用详情
-        model_usage_details = {}
-        if usage.model_usage_details:
-            try:
-                model_usage_details = json.loads(usage.model_usage_details)
-            except:
-                pass
-
-        if model not in model_usage_details:
-            model_usage_details[model] = {'count': 0, 'tokens': 0, 'cost': 0.0}
-
-        model_usage_details[model]['count'] += 1
-        model_usage_details[model]['tokens'] += input_tokens + output_tokens
-        model_usage_details[model]['cost'] += cost
+        """记录 API 使用（先计入内存，定期批量回写 api_usage 表）"""
+        quota_engine.record(
+            user_id=user_id,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            cost=cost,
+            model=model,
+            team_id=team_id
+        )
+    
+    @classmethod
+    async def record_usage_async(
+        cls,
+        user_id: int,
+        input_tokens: int,
+        output_tokens: int,
+        cost: float,
+        model: str,
+        team_id: Optional[int] = None
+    ):
+        """record_usage 的异步版本"""
+        await quota_engine.record_async(
+            user_id=user_id,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            cost=cost,
+            model=model,
+            team_id=team_id
+        )
 
-        usage.model_usage_details = json.dumps(model_usage_details)
-        
-        db.add(usage)
-        db.commit()
+    @classmethod
+    def invalidate_quota_cache(cls, user_id: Optional[int] = None):
+        """配额配置变更后清除缓存的有效配额"""
+        quota_engine.invalidate_quota(user_id)
+    
+    @classmethod
+    def flush_usage(cls, db: Optional[Session] = None, user_id: Optional[int] = None) -> int:
+        """立即回写未保存的使用量（读取 api_usage 表之前调用）"""
+        return quota_engine.flush(db, user_id)
     
     @classmethod
     def get_quota_status(cls, db: Session, user_id: int, team_id: Optional[int] = None) -> Dict:
         """获取配额状态（配额 + 使用量 + 剩余）"""
-        quota = cls.get_effective_quota(db, user_id, team_id)
-        today_usage = cls.get_today_usage(db, user_id)
-        month_usage = cls.get_month_usage(db, user_id)
+        quota, today_usage, month_usage = quota_engine.usage(db, user_id, team_id, cls.get_effective_quota)
         
         # 计算剩余
-        remaining_requests_today = max(0, quota['requests_per_day'] - today_usage.request_count)
-        remaining_tokens_today = max(0, quota['tokens_per_day'] - today_usage.total_tokens)
-        remaining_cost_today = max(0, quota['cost_per_day'] - today_usage.total_cost)
+        remaining_requests_today = max(0, quota['requests_per_day'] - today_usage['request_count'])
+        remaining_tokens_today = max(0, quota['tokens_per_day'] - today_usage['total_tokens'])
+        remaining_cost_today = max(0, quota['cost_per_day'] - today_usage['total_cost'])
         
         remaining_requests_month = max(0, quota['requests_per_month'] - month_usage['request_count'])
         remaining_tokens_month = max(0, quota['tokens_per_month'] - month_usage['total_tokens'])
@@ -250,9 +297,9 @@ class QuotaService:
         
         return {
             'quota': quota,
-            'today_requests': today_usage.request_count,
-            'today_tokens': today_usage.total_tokens,
-            'today_cost': today_usage.total_cost,
+            'today_requests': today_usage['request_count'],
+            'today_tokens': today_usage['total_tokens'],
+            'today_cost': today_usage['total_cost'],
             'month_requests': month_usage['request_count'],
             'month_tokens': month_usage['total_tokens'],
             'month_cost': month_usage['total_cost'],
@@ -292,6 +339,7 @@ class QuotaService:
         db.add(quota)
         db.commit()
         db.refresh(quota)
+        cls.invalidate_quota_cache(user_id)
         
         return quota
     
@@ -320,6 +368,7 @@ class QuotaService:
         db.add(quota)
         db.commit()
         db.refresh(quota)
+        cls.invalidate_quota_cache()
         
         return quota
 
@@ -0,0 +1,187 @@
+"""执行结果缓存 - 完全相同的请求直接复用历史输出"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlmodel import Session, select
+
+from ..core.config import settings
+from ..core.database import engine
+from ..core.executors import run_in_db
+from ..core.metrics import cache_collector, registry
+from ..models.execution_history import ExecutionHistory
+
+
+def make_cache_key(
+    final_prompt: str,
+    system_prompt: Optional[str],
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    ai_config_id: Optional[int],
+) -> str:
+    """
+    规范化请求参数并计算 SHA-256 缓存键
+
+    参数以固定字段顺序序列化为 JSON，temperature 统一为浮点数，
+    保证 0 与 0.0、不同的字典顺序得到相同的键。
+    """
+    canonical = json.dumps(
+        {
+            "final_prompt": final_prompt or "",
+            "system_prompt": system_prompt or "",
+            "model": model or "",
+            "temperature": round(float(temperature), 4),
+            "max_tokens": int(max_tokens),
+            "ai_config_id": ai_config_id,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    两级结果缓存
+    1. 进程内 LRU（带 TTL），命中时不访问数据库
+    2. 执行历史表（cache_key 索引），进程重启或多实例部署时仍可复用
+
+    缓存按用户隔离，不同用户之间不会共享输出。
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: int = 3600, db_ttl: int = 7 * 24 * 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.db_ttl = db_ttl
+        # {(user_id, cache_key): (过期时间戳, 结果)}
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[float, Dict]]" = OrderedDict()
+        # 数据库线程池中的查询也会写入缓存，所有对 _entries 和计数的访问都需加锁
+        self._lock = threading.Lock()
+
+        # 统计计数
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def _get_memory(self, user_id: int, cache_key: str) -> Optional[Dict]:
+        key = (user_id, cache_key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, result = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return result
+
+    def _get_db(self, db: Session, user_id: int, cache_key: str) -> Optional[Dict]:
+        cutoff = datetime.utcnow() - timedelta(seconds=self.db_ttl)
+        history = db.exec(
+            select(ExecutionHistory).where(
+                ExecutionHistory.cache_key == cache_key,
+                ExecutionHistory.user_id == user_id,
+                ExecutionHistory.created_at >= cutoff,
+            ).order_by(ExecutionHistory.id.desc()).limit(1)
+        ).first()
+        if not history:
+            return None
+        return {
+            "output": history.output,
+            "content": history.output,  # 兼容字段
+            "model": history.model,
+            "input_tokens": history.input_tokens,
+            "output_tokens": history.output_tokens,
+            "total_tokens": history.total_tokens,
+            "cost": history.cost,
+            "finish_reason": "stop",
+            "response_time": history.response_time,
+            "cache_key": cache_key,
+        }
+
+    def _count(self, result: Optional[Dict]) -> Optional[Dict]:
+        """统计内存查找的结果，命中时返回带 is_cached=True 的副本"""
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return {**result, "is_cached": True}
+
+    def _get_from_db(self, db: Session, user_id: int, cache_key: str) -> Optional[Dict]:
+        result = self._get_db(db, user_id, cache_key)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.db_hits += 1
+        self.set(user_id, cache_key, result)
+        return {**result, "is_cached": True}
+
+    def _get_from_db_in_own_session(self, user_id: int, cache_key: str) -> Optional[Dict]:
+        """使用独立会话查询执行历史（在数据库线程池中调用）"""
+        with Session(engine) as db:
+            return self._get_from_db(db, user_id, cache_key)
+
+    def get(self, db: Optional[Session], user_id: int, cache_key: str) -> Optional[Dict]:
+        """查找缓存结果（先内存后数据库），命中时返回带 is_cached=True 的副本"""
+        result = self._get_memory(user_id, cache_key)
+        if result is None and db is not None:
+            return self._get_from_db(db, user_id, cache_key)
+        return self._count(result)
+
+    async def get_async(self, db: Optional[Session], user_id: int, cache_key: str) -> Optional[Dict]:
+        """
+        异步版本：内存未命中需要查询数据库时，查询在数据库线程池中执行
+
+        线程中使用独立会话，db 只表示是否查询执行历史：调用方的 Session 可能同时被
+        其他并发用例在事件循环中使用，不能交给其他线程。
+        """
+        result = self._get_memory(user_id, cache_key)
+        if result is None and db is not None:
+            return await run_in_db(self._get_from_db_in_own_session, user_id, cache_key)
+        return self._count(result)
+
+    def set(self, user_id: int, cache_key: str, result: Dict):
+        """写入内存缓存"""
+        key = (user_id, cache_key)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, {**result, "is_cached": False})
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """缓存统计"""
+        with self._lock:
+            size = len(self._entries)
+            hits, db_hits, misses = self.hits, self.db_hits, self.misses
+        total = hits + db_hits + misses
+        return {
+            "size": size,
+            "max_size": self.max_size,
+            "hits": hits,
+            "db_hits": db_hits,
+            "misses": misses,
+            "hit_rate": round((hits + db_hits) / total, 4) if total else 0.0,
+        }
+
+
+# 全局实例
+result_cache = ResultCache(
+    max_size=settings.RESULT_CACHE_SIZE,
+    ttl=settings.RESULT_CACHE_TTL,
+    db_ttl=settings.RESULT_CACHE_DB_TTL,
+)
+registry.add_collector(cache_collector("result", result_cache.stats))
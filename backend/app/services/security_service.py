@@ -1,14 +1,46 @@
 """安全审核服务 - 内容审核、敏感词检测、输出过滤"""
 import re
+import threading
 from typing import List, Dict, Tuple, Optional
 from datetime import datetime
 
+from .aho_corasick import AhoCorasickMatcher
+from .pii_scanner import PIIScanner
+
+# {词: [(排序键, 分类)]}，保证输出顺序与按词库顺序逐个匹配时一致
+WordCategories = Dict[str, List[Tuple[Tuple[int, int], str]]]
+
+
+class _WordIndex:
+    """敏感词自动机 + 词 -> 分类索引，两者作为一个整体替换，检测时始终一致"""
+
+    __slots__ = ('matcher', 'word_categories')
+
+    def __init__(self, matcher: AhoCorasickMatcher, word_categories: WordCategories):
+        self.matcher = matcher
+        self.word_categories = word_categories
+
+    @staticmethod
+    def categories_of(words: Dict[str, List[str]]) -> WordCategories:
+        """词 -> 所属分类及其在词库中的顺序"""
+        word_categories: WordCategories = {}
+        for category_index, (category, category_words) in enumerate(words.items()):
+            for word_index, word in enumerate(category_words):
+                word_categories.setdefault(word, []).append(((category_index, word_index), category))
+        return word_categories
+
+    @classmethod
+    def build(cls, words: Dict[str, List[str]]) -> '_WordIndex':
+        matcher = AhoCorasickMatcher(word for category_words in words.values() for word in category_words)
+        matcher.build()
+        return cls(matcher, cls.categories_of(words))
+
 
 class SecurityService:
     """安全审核服务"""
     
-    # 敏感词库（示例，实际应用中应从数据库或配置文件加载）
-    SENSITIVE_WORDS = {
+    # 内置敏感词库（数据库中启用的敏感词由 sensitive_word_store 合并加载）
+    BUILTIN_SENSITIVE_WORDS = {
         # 政治敏感
         'political': [
             '政治敏感词1', '政治敏感词2',  # 实际使用时替换为真实敏感词
@@ -31,6 +63,9 @@ class SecurityService:
         ]
     }
     
+    # 当前生效的敏感词库
+    SENSITIVE_WORDS = {category: list(words) for category, words in BUILTIN_SENSITIVE_WORDS.items()}
+    
     # 敏感信息正则模式
     PATTERNS = {
         'phone': r'1[3-9]\d{9}',  # 手机号
@@ -41,6 +76,27 @@ class SecurityService:
         'url': r'https?://[^\s]+',  # URL
     }
     
+    # 预编译的敏感信息扫描器（检测与脱敏共用）
+    _pii_scanner = PIIScanner(PATTERNS)
+    
+    # 敏感词索引（首次检测时按词库构建；增删词、重新加载词库时整体替换）
+    _index: Optional[_WordIndex] = None
+    # 词库版本号，词库每次变化时递增
+    _words_version = 0
+    # 修改词库时持有（检测不加锁，只读取当前的 _index）
+    _words_lock = threading.Lock()
+    
+    @staticmethod
+    def _get_index() -> _WordIndex:
+        """返回敏感词索引（懒加载）"""
+        index = SecurityService._index
+        if index is None:
+            with SecurityService._words_lock:
+                if SecurityService._index is None:
+                    SecurityService._index = _WordIndex.build(SecurityService.SENSITIVE_WORDS)
+                index = SecurityService._index
+        return index
+    
     @staticmethod
     def check_sensitive_words(content: str) -> Dict:
         """
@@ -67,17 +123,23 @@ class SecurityService:
         
         total_risk = 0
         
-        for category, words in SecurityService.SENSITIVE_WORDS.items():
-            for word in words:
-                if word in content:
-                    # 找到所有匹配位置
-                    for match in re.finditer(re.escape(word), content):
-                        violations.append({
-                            'type': category,
-                            'word': word,
-                            'position': match.start()
-                        })
-                        total_risk += risk_scores.get(category, 50)
+        # 一次扫描找出全部命中的词，再按词库顺序（分类、词）展开
+        index = SecurityService._get_index()
+        found = index.matcher.find_all(content)
+        if found:
+            hits = sorted(
+                (order, category, word)
+                for word in found
+                for order, category in index.word_categories.get(word, ())
+            )
+            for _, category, word in hits:
+                for position in found[word]:
+                    violations.append({
+                        'type': category,
+                        'word': word,
+                        'position': position
+                    })
+                    total_risk += risk_scores.get(category, 50)
         
         # 判断风险等级
         if total_risk == 0:
@@ -114,15 +176,18 @@ class SecurityService:
                 'detected': [{'type': str, 'value': str, 'position': int}]
             }
         """
+        return SecurityService._format_detected(SecurityService._pii_scanner.detect(content))
+    
+    @staticmethod
+    def _format_detected(found: Dict[str, list]) -> Dict:
+        """把扫描结果转换为接口返回格式"""
         detected = []
-        
-        for info_type, pattern in SecurityService.PATTERNS.items():
-            matches = re.finditer(pattern, content)
-            for match in matches:
+        for info_type, spans in found.items():
+            for start, _, value in spans:
                 detected.append({
                     'type': info_type,
-                    'value': match.group(0),
-                    'position': match.start()
+                    'value': value,
+                    'position': start
                 })
         
         return {
@@ -132,23 +197,26 @@ class SecurityService:
         }
     
     @staticmethod
-    def mask_sensitive_info(content: str, mask_char: str = '*') -> Tuple[str, List[Dict]]:
+    def mask_sensitive_info(
+        content: str,
+        mask_char: str = '*',
+        detected: Optional[Dict[str, list]] = None
+    ) -> Tuple[str, List[Dict]]:
         """
         脱敏处理敏感信息
         
         Args:
             content: 待脱敏的内容
             mask_char: 脱敏字符
+            detected: 已有的扫描结果（PIIScanner.detect 的返回值），传入时不再重复扫描
         
         Returns:
             (脱敏后的内容, 脱敏记录列表)
         """
-        masked_content = content
         masked_items = []
         
         # 脱敏手机号：保留前3位和后4位
-        def mask_phone(match):
-            phone = match.group(0)
+        def mask_phone(phone):
             masked = phone[:3] + mask_char * 4 + phone[-4:]
             masked_items.append({
                 'type': 'phone',
@@ -158,8 +226,7 @@ class SecurityService:
             return masked
         
         # 脱敏身份证号：保留前6位和后4位
-        def mask_id_card(match):
-            id_card = match.group(0)
+        def mask_id_card(id_card):
             masked = id_card[:6] + mask_char * 8 + id_card[-4:]
             masked_items.append({
                 'type': 'id_card',
@@ -169,8 +236,7 @@ class SecurityService:
             return masked
         
         # 脱敏邮箱：保留@前的前2位和@后的域名
-        def mask_email(match):
-            email = match.group(0)
+        def mask_email(email):
             if '@' in email:
                 local, domain = email.split('@', 1)
                 if len(local) > 2:
@@ -188,8 +254,8 @@ class SecurityService:
             return masked
         
         # 脱敏信用卡号：只显示后4位
-        def mask_credit_card(match):
-            card = match.group(0).replace(' ', '').replace('-', '')
+        def mask_credit_card(value):
+            card = value.replace(' ', '').replace('-', '')
             masked = mask_char * 12 + card[-4:]
             masked_items.append({
                 'type': 'credit_card',
@@ -198,11 +264,17 @@ class SecurityService:
             })
             return masked
         
-        # 应用脱敏
-        masked_content = re.sub(SecurityService.PATTERNS['phone'], mask_phone, masked_content)
-        masked_content = re.sub(SecurityService.PATTERNS['id_card'], mask_id_card, masked_content)
-        masked_content = re.sub(SecurityService.PATTERNS['email'], mask_email, masked_content)
-        masked_content = re.sub(SecurityService.PATTERNS['credit_card'], mask_credit_card, masked_content)
+        # 应用脱敏（依次处理手机号、身份证号、邮箱、信用卡号）
+        masked_content = SecurityService._pii_scanner.mask(
+            content,
+            {
+                'phone': mask_phone,
+                'id_card': mask_id_card,
+                'email': mask_email,
+                'credit_card': mask_credit_card,
+            },
+            detected
+        )
         
         return masked_content, masked_items
     
@@ -221,14 +293,15 @@ class SecurityService:
         # 敏感词检测
         sensitive_check = SecurityService.check_sensitive_words(content)
         
-        # 敏感信息检测
-        sensitive_info = SecurityService.detect_sensitive_info(content)
+        # 敏感信息检测（扫描结果同时用于脱敏）
+        found = SecurityService._pii_scanner.detect(content)
+        sensitive_info = SecurityService._format_detected(found)
         
         # 脱敏处理
         masked_content = content
         masked_items = []
         if auto_mask and sensitive_info['has_sensitive_info']:
-            masked_content, masked_items = SecurityService.mask_sensitive_info(content)
+            masked_content, masked_items = SecurityService.mask_sensitive_info(content, detected=found)
         
         # 综合判断
         is_approved = sensitive_check['is_safe'] and (
@@ -261,7 +334,8 @@ class SecurityService:
         
         if sensitive_info['has_sensitive_info']:
             suggestions.append(f"检测到{sensitive_info['count']}处敏感信息，建议脱敏处理")
-            info_types = set(item['type'] for item in sensitive_info['detected'])
+            # 按检测顺序去重，保证不同进程中的审核结果一致
+            info_types = dict.fromkeys(item['type'] for item in sensitive_info['detected'])
             for info_type in info_types:
                 type_names = {
                     'phone': '手机号',
@@ -279,19 +353,20 @@ class SecurityService:
         return suggestions
     
     @staticmethod
-    def batch_audit(contents: List[str], auto_mask: bool = False) -> List[Dict]:
+    def batch_audit(contents: List[str], auto_mask: bool = False, start: int = 0) -> List[Dict]:
         """
         批量审核
         
         Args:
             contents: 内容列表
             auto_mask: 是否自动脱敏
+            start: 第一条内容的序号（分块审核时使用）
         
         Returns:
             审核结果列表
         """
         results = []
-        for idx, content in enumerate(contents):
+        for idx, content in enumerate(contents, start):
             result = SecurityService.content_audit(content, auto_mask)
             result['index'] = idx
             results.append(result)
@@ -347,19 +422,42 @@ class SecurityService:
     
     @staticmethod
     def add_custom_sensitive_word(word: str, category: str = 'custom'):
-        """添加自定义敏感词（运行时）"""
-        if category not in SecurityService.SENSITIVE_WORDS:
-            SecurityService.SENSITIVE_WORDS[category] = []
-        
-        if word not in SecurityService.SENSITIVE_WORDS[category]:
-            SecurityService.SENSITIVE_WORDS[category].append(word)
+        """添加自定义敏感词（仅当前进程，持久化的敏感词通过 sensitive_word_store 加载）"""
+        with SecurityService._words_lock:
+            words = SecurityService.SENSITIVE_WORDS
+            if word in words.get(category, []):
+                return
+            index = SecurityService._index or _WordIndex.build(words)
+            words.setdefault(category, []).append(word)
+            index.matcher.add(word)
+            SecurityService._index = _WordIndex(index.matcher, _WordIndex.categories_of(words))
+            SecurityService._words_version += 1
     
     @staticmethod
     def remove_custom_sensitive_word(word: str, category: str = 'custom'):
-        """移除自定义敏感词（运行时）"""
-        if category in SecurityService.SENSITIVE_WORDS:
-            if word in SecurityService.SENSITIVE_WORDS[category]:
-                SecurityService.SENSITIVE_WORDS[category].remove(word)
+        """移除自定义敏感词（仅当前进程）"""
+        with SecurityService._words_lock:
+            words = SecurityService.SENSITIVE_WORDS
+            if word not in words.get(category, []):
+                return
+            index = SecurityService._index or _WordIndex.build(words)
+            words[category].remove(word)
+            index.matcher.remove(word)
+            SecurityService._index = _WordIndex(index.matcher, _WordIndex.categories_of(words))
+            SecurityService._words_version += 1
+    
+    @staticmethod
+    def set_sensitive_words(words: Dict[str, List[str]]):
+        """
+        整体替换敏感词库
+        
+        新的自动机在锁外构建完成后一次性替换，替换前后的检测请求分别完整地使用旧词库或新词库。
+        """
+        index = _WordIndex.build(words)
+        with SecurityService._words_lock:
+            SecurityService.SENSITIVE_WORDS = words
+            SecurityService._index = index
+            SecurityService._words_version += 1
     
     @staticmethod
     def get_sensitive_words() -> Dict[str, List[str]]:
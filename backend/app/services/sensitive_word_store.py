@@ -0,0 +1,141 @@
+"""敏感词库加载 - 从数据库加载敏感词，按版本号热加载，多个 worker 在数秒内收敛"""
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+
+from ..core.config import settings
+from ..core.database import engine
+from ..core.executors import run_in_db
+from ..models.audit_log import SensitiveWord, SensitiveWordVersion
+from .security_service import SecurityService
+
+logger = logging.getLogger(__name__)
+
+# 版本表只有一行
+VERSION_ROW_ID = 1
+
+
+class SensitiveWordStore:
+    """
+    数据库敏感词库
+
+    - 生效词库 = 内置敏感词 + sensitive_words 表中启用的敏感词
+    - 增删敏感词时在同一个事务中递增 sensitive_word_versions 的版本号
+    - 每个进程定期读取版本号（一次主键查询），变化时在线程中重新加载词库、构建自动机后整体替换；
+      检测请求本身不访问数据库
+    """
+
+    def __init__(self, reload_interval: float = 5):
+        self.reload_interval = reload_interval
+        # 当前进程已加载的数据库版本（None 表示尚未加载）
+        self.loaded_version: Optional[int] = None
+        self._lock = threading.Lock()
+        self._reload_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def get_version(db: Session) -> int:
+        """读取数据库中的词库版本号"""
+        version = db.exec(
+            select(SensitiveWordVersion.version).where(SensitiveWordVersion.id == VERSION_ROW_ID)
+        ).first()
+        return version or 0
+
+    @staticmethod
+    def _increment(db: Session) -> int:
+        result = db.exec(
+            update(SensitiveWordVersion)
+            .where(SensitiveWordVersion.id == VERSION_ROW_ID)
+            .values(version=SensitiveWordVersion.version + 1, updated_at=datetime.utcnow())
+        )
+        return result.rowcount
+
+    @staticmethod
+    def bump_version(db: Session):
+        """递增词库版本号（不提交，由调用方与敏感词的修改一起提交）"""
+        if SensitiveWordStore._increment(db):
+            return
+        # 版本行由迁移创建；用 create_all 建表的数据库在第一次修改敏感词时补建。
+        # 多个 worker 同时补建时，后插入的一方在保存点内主键冲突，回滚保存点后改为递增
+        try:
+            with db.begin_nested():
+                db.add(SensitiveWordVersion(id=VERSION_ROW_ID, version=1))
+        except IntegrityError:
+            SensitiveWordStore._increment(db)
+
+    @staticmethod
+    def load_words(db: Session) -> Dict[str, List[str]]:
+        """内置敏感词 + 数据库中启用的敏感词（按分类分组，分类内按添加顺序）"""
+        words = {category: list(items) for category, items in SecurityService.BUILTIN_SENSITIVE_WORDS.items()}
+        rows = db.exec(
+            select(SensitiveWord.word, SensitiveWord.category)
+            .where(SensitiveWord.is_active == True)
+            .order_by(SensitiveWord.id)
+        ).all()
+        for word, category in rows:
+            category_words = words.setdefault(category or 'custom', [])
+            if word not in category_words:
+                category_words.append(word)
+        return words
+
+    def refresh(self, db: Session, force: bool = False) -> bool:
+        """
+        版本号变化时重新加载词库
+
+        先读版本号再读敏感词：两次读取之间发生的修改会在下一次检查时再加载一次，不会遗漏。
+
+        Returns:
+            是否重新加载
+        """
+        with self._lock:
+            version = self.get_version(db)
+            if not force and version == self.loaded_version:
+                return False
+            SecurityService.set_sensitive_words(self.load_words(db))
+            self.loaded_version = version
+            return True
+
+    def reset(self):
+        """恢复为内置敏感词（未加载状态）"""
+        with self._lock:
+            SecurityService.set_sensitive_words(
+                {category: list(items) for category, items in SecurityService.BUILTIN_SENSITIVE_WORDS.items()}
+            )
+            self.loaded_version = None
+
+    def refresh_from_db(self, force: bool = False) -> bool:
+        """使用独立会话检查并重新加载（启动时和后台检查使用）"""
+        with Session(engine) as db:
+            return self.refresh(db, force)
+
+    async def _reload_loop(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                # 查询数据库和构建自动机都在数据库线程池中执行，不阻塞事件循环
+                await run_in_db(self.refresh_from_db)
+            except Exception as e:
+                logger.warning("敏感词库重新加载失败: %s", e)
+
+    def start(self):
+        """启动定期版本检查（在事件循环中调用）"""
+        if self.reload_interval <= 0:
+            return
+        if self._reload_task is None or self._reload_task.done():
+            self._reload_task = asyncio.get_running_loop().create_task(self._reload_loop())
+
+    async def stop(self):
+        """停止定期版本检查"""
+        if self._reload_task is not None:
+            self._reload_task.cancel()
+            await asyncio.gather(self._reload_task, return_exceptions=True)
+            self._reload_task = None
+
+
+# 全局实例
+sensitive_word_store = SensitiveWordStore(reload_interval=settings.SENSITIVE_WORDS_RELOAD_INTERVAL)
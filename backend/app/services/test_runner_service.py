@@ -1,28 +1,22 @@
+import asyncio
+import hashlib
 import time
-import re
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 
 from sqlmodel import Session, select
 
+from ..core.config import settings
 from ..core.database import engine
 from ..models.prompt import Prompt
 from ..models.prompt_version import PromptVersion
-from ..models.test_suite import PromptTestRun, PromptTestSuite
+from ..models.test_suite import PromptBaselineOutput, PromptTestRun, PromptTestSuite
+from ..services.cost_estimator import CostEstimator
 from ..services.evaluation_service import EvaluationService
 from ..services.openai_service import OpenAIService
-
-
-def replace_variables(content: str, variables: Dict[str, str]) -> str:
-    if not variables:
-        return content
-
-    result = content
-    for key, value in variables.items():
-        pattern = r"\{\{\s*" + re.escape(key) + r"(?::[^}]*)?\s*\}\}"
-        result = re.sub(pattern, str(value), result)
-
-    return result
+from ..utils.prompt_template import replace_variables
+from .concurrency import gather_bounded, user_llm_limiter
+from .job_service import JobCancelled
 
 
 class TestRunnerService:
@@ -39,16 +33,40 @@ class TestRunnerService:
         model: Optional[str] = None,
         temperature: float = 0.0,
         enable_evaluation: bool = True,
+        force_refresh: bool = False,
     ) -> PromptTestRun:
-        prompt = db.get(Prompt, suite.prompt_id)
-        if not prompt:
-            raise ValueError("Prompt 不存在")
+        run = TestRunnerService.create_run(
+            db=db,
+            suite=suite,
+            runner_user_id=runner_user_id,
+            candidate_version=candidate_version,
+            baseline_version=baseline_version,
+            trigger_source=trigger_source,
+        )
+        return await TestRunnerService.execute_run(
+            db=db,
+            suite=suite,
+            run=run,
+            model=model,
+            temperature=temperature,
+            enable_evaluation=enable_evaluation,
+            force_refresh=force_refresh,
+        )
 
-        runner_user_id = runner_user_id or suite.user_id
-        candidate_version = candidate_version or prompt.version
-        baseline_version = baseline_version or TestRunnerService.resolve_baseline_version(
-            suite, candidate_version
+    @staticmethod
+    def create_run(
+        db: Session,
+        suite: PromptTestSuite,
+        runner_user_id: Optional[int] = None,
+        candidate_version: Optional[int] = None,
+        baseline_version: Optional[int] = None,
+        trigger_source: str = "manual",
+        status: str = "running",
+    ) -> PromptTestRun:
+        _, candidate_version, baseline_version = TestRunnerService.resolve_versions(
+            db, suite, candidate_version, baseline_version
         )
+        runner_user_id = runner_user_id or suite.user_id
 
         run = PromptTestRun(
             suite_id=suite.id,
@@ -57,30 +75,114 @@ class TestRunnerService:
             candidate_version=candidate_version,
             baseline_version=baseline_version,
             trigger_source=trigger_source,
-            status="running",
+            status=status,
             summary={},
             results=[],
         )
         db.add(run)
         db.commit()
         db.refresh(run)
+        return run
+
+    @staticmethod
+    def resolve_versions(
+        db: Session,
+        suite: PromptTestSuite,
+        candidate_version: Optional[int] = None,
+        baseline_version: Optional[int] = None,
+    ) -> Tuple[Prompt, int, Optional[int]]:
+        """解析本次运行的候选版本（默认当前版本）和基线版本"""
+        prompt = db.get(Prompt, suite.prompt_id)
+        if not prompt:
+            raise ValueError("Prompt 不存在")
+
+        candidate_version = candidate_version or prompt.version
+        baseline_version = baseline_version or TestRunnerService.resolve_baseline_version(
+            suite, candidate_version
+        )
+        return prompt, candidate_version, baseline_version
+
+    @staticmethod
+    def estimate_run(
+        db: Session,
+        suite: PromptTestSuite,
+        candidate_version: Optional[int] = None,
+        baseline_version: Optional[int] = None,
+        model: Optional[str] = None,
+        enable_evaluation: bool = True,
+    ) -> Dict:
+        """
+        预估一次测试运行的 token 用量和费用（不调用模型）
+
+        基线版本按全部重新执行计算（不扣除可复用的已保存输出），是偏保守的预估。
+        """
+        prompt, candidate_version, baseline_version = TestRunnerService.resolve_versions(
+            db, suite, candidate_version, baseline_version
+        )
+        templates = [TestRunnerService.get_prompt_content_for_version(db, prompt, candidate_version)]
+        if baseline_version:
+            templates.append(
+                TestRunnerService.get_prompt_content_for_version(db, prompt, baseline_version)
+            )
+
+        estimate = CostEstimator.estimate(
+            templates=templates,
+            test_cases=suite.test_cases or [],
+            model=model or "gpt-3.5-turbo",
+            render=replace_variables,
+            enable_evaluation=enable_evaluation,
+        )
+        estimate["candidate_version"] = candidate_version
+        estimate["baseline_version"] = baseline_version
+        return estimate
+
+    @staticmethod
+    async def execute_run(
+        db: Session,
+        suite: PromptTestSuite,
+        run: PromptTestRun,
+        model: Optional[str] = None,
+        temperature: float = 0.0,
+        enable_evaluation: bool = True,
+        on_progress: Optional[Callable[[int], None]] = None,
+        concurrency: Optional[int] = None,
+        force_refresh: bool = False,
+    ) -> PromptTestRun:
+        """
+        执行测试运行；用例有界并发执行，每个用例完成后立即保存结果，
+        已保存结果的用例不会重复执行（用于后台任务恢复）。
+        """
+        run.status = "running"
+        run.error = None
+        run.completed_at = None
+        db.add(run)
+        db.commit()
 
         try:
+            prompt = db.get(Prompt, suite.prompt_id)
+            if not prompt:
+                raise ValueError("Prompt 不存在")
+
             candidate_content = TestRunnerService.get_prompt_content_for_version(
-                db, prompt, candidate_version
+                db, prompt, run.candidate_version
             )
             baseline_content = None
-            if baseline_version:
+            if run.baseline_version:
                 baseline_content = TestRunnerService.get_prompt_content_for_version(
-                    db, prompt, baseline_version
+                    db, prompt, run.baseline_version
                 )
 
-            results = []
-            for index, test_case in enumerate(suite.test_cases or [], start=1):
-                result = await TestRunnerService.run_case(
+            results = list(run.results or [])
+            completed = {item.get("case_index") for item in results}
+            user_id = run.user_id
+            prompt_id = suite.prompt_id
+            baseline_version = run.baseline_version
+
+            async def run_and_save(index: int, test_case: Dict) -> Dict:
+                result, baseline_memo = await TestRunnerService.run_case(
                     db=db,
-                    user_id=runner_user_id,
-                    prompt_id=suite.prompt_id,
+                    user_id=user_id,
+                    prompt_id=prompt_id,
                     case_index=index,
                     test_case=test_case,
                     candidate_content=candidate_content,
@@ -88,14 +190,50 @@ class TestRunnerService:
                     model=model or "gpt-3.5-turbo",
                     temperature=temperature,
                     enable_evaluation=enable_evaluation,
+                    baseline_version=baseline_version,
+                    force_refresh=force_refresh,
                 )
                 results.append(result)
 
+                # 增量保存：用例并发共享同一个会话，所有写入都集中在这里且中间没有 await，
+                # 提交不会穿插到其他用例进行中的查询里
+                try:
+                    if baseline_memo is not None:
+                        TestRunnerService.save_baseline_output(db, **baseline_memo)
+                    run.results = sorted(results, key=lambda item: item["case_index"])
+                    db.add(run)
+                    db.commit()
+                except Exception:
+                    db.rollback()
+                    raise
+                if on_progress:
+                    on_progress(len(results))
+                return result
+
+            # 多个用例并发执行，并发度由 TEST_SUITE_CONCURRENCY 控制
+            factories = [
+                (lambda index=index, test_case=test_case: run_and_save(index, test_case))
+                for index, test_case in enumerate(suite.test_cases or [], start=1)
+                if index not in completed
+            ]
+            await gather_bounded(factories, concurrency or settings.TEST_SUITE_CONCURRENCY)
+
+            results.sort(key=lambda item: item["case_index"])
             summary = TestRunnerService.build_summary(results)
             run.status = "completed"
             run.results = results
             run.summary = summary
             run.completed_at = datetime.utcnow()
+        except (asyncio.CancelledError, JobCancelled):
+            # 运行被取消（任务取消、请求中断或服务关闭）：记录终止状态后继续抛出，
+            # 不让运行记录停留在 running；后台任务恢复执行时会重新置为 running
+            db.rollback()
+            run.status = "cancelled"
+            run.error = "测试运行已取消"
+            run.completed_at = datetime.utcnow()
+            db.add(run)
+            db.commit()
+            raise
         except Exception as exc:
             run.status = "failed"
             run.error = str(exc)
@@ -144,44 +282,96 @@ class TestRunnerService:
         model: str,
         temperature: float,
         enable_evaluation: bool,
-    ) -> Dict:
+        baseline_version: Optional[int] = None,
+        force_refresh: bool = False,
+    ) -> Tuple[Dict, Optional[Dict]]:
+        """
+        执行单个用例，返回 (用例结果, 待保存的基线输出)。
+
+        候选和基线两条链路并发执行且共享 db，这里只做读取；需要保存的基线输出
+        以参数字典返回，由调用方传给 save_baseline_output 后统一提交。
+        """
         variables = test_case.get("variables") or {}
-        candidate_output, candidate_time, candidate_tokens, candidate_cost = await TestRunnerService.execute_prompt_content(
-            db=db,
-            user_id=user_id,
-            prompt_content=candidate_content,
-            variables=variables,
-            model=model,
-            temperature=temperature,
-        )
+        need_score = enable_evaluation or test_case.get("min_quality_score") is not None
 
-        baseline_output = None
-        baseline_score = None
-        if baseline_content:
-            baseline_output, _, _, _ = await TestRunnerService.execute_prompt_content(
+        async def run_branch(
+            prompt_content: str, is_baseline: bool
+        ) -> Tuple[str, float, int, float, Optional[float]]:
+            """执行一个版本并（可选）评测其输出；评测依赖执行结果，两个版本之间互不依赖"""
+            output, response_time, tokens, cost = await TestRunnerService.execute_prompt_content(
                 db=db,
                 user_id=user_id,
-                prompt_content=baseline_content,
+                prompt_content=prompt_content,
                 variables=variables,
                 model=model,
                 temperature=temperature,
             )
+            score = None
+            if need_score and (output or not is_baseline):
+                score = await TestRunnerService.evaluate_output(
+                    db=db,
+                    user_id=user_id,
+                    output=output,
+                    prompt_content=replace_variables(prompt_content, variables),
+                )
+            return output, response_time, tokens, cost, score
 
-        candidate_score = None
-        if enable_evaluation or test_case.get("min_quality_score") is not None:
-            candidate_score = await TestRunnerService.evaluate_output(
-                db=db,
-                user_id=user_id,
-                output=candidate_output,
-                prompt_content=replace_variables(candidate_content, variables),
-            )
-            if baseline_output:
-                baseline_score = await TestRunnerService.evaluate_output(
+        baseline_memo: Optional[Dict] = None
+
+        async def run_baseline_branch() -> Tuple[str, float, int, float, Optional[float]]:
+            """基线版本优先复用已保存的输出和评分（输入完全相同时）"""
+            nonlocal baseline_memo
+            if baseline_version is None:
+                return await run_branch(baseline_content, True)
+
+            case_hash = TestRunnerService.case_hash(baseline_content, variables)
+            memo = None
+            if not force_refresh:
+                memo = TestRunnerService.get_baseline_output(
+                    db, prompt_id, baseline_version, case_hash, model, temperature
+                )
+
+            if memo and (memo.score is not None or not need_score or not memo.output):
+                return memo.output, memo.response_time, memo.total_tokens, memo.cost, memo.score
+
+            if memo:
+                # 已有输出但缺少评分：只补做评测
+                output, response_time, tokens, cost = memo.output, memo.response_time, memo.total_tokens, memo.cost
+                score = await TestRunnerService.evaluate_output(
                     db=db,
                     user_id=user_id,
-                    output=baseline_output,
-                    prompt_content=replace_variables(baseline_content or "", variables),
+                    output=output,
+                    prompt_content=replace_variables(baseline_content, variables),
                 )
+            else:
+                output, response_time, tokens, cost, score = await run_branch(baseline_content, True)
+
+            baseline_memo = {
+                "prompt_id": prompt_id,
+                "version": baseline_version,
+                "case_hash": case_hash,
+                "model": model,
+                "temperature": temperature,
+                "output": output,
+                "score": score,
+                "response_time": response_time,
+                "total_tokens": tokens,
+                "cost": cost,
+            }
+            return output, response_time, tokens, cost, score
+
+        # 候选版本和基线版本两条链路并发执行
+        branches = [lambda: run_branch(candidate_content, False)]
+        if baseline_content:
+            branches.append(run_baseline_branch)
+        branch_results = await gather_bounded(branches, len(branches))
+
+        candidate_output, candidate_time, candidate_tokens, candidate_cost, candidate_score = branch_results[0]
+
+        baseline_output = None
+        baseline_score = None
+        if baseline_content:
+            baseline_output, _, _, _, baseline_score = branch_results[1]
 
         assertion_results, passed = TestRunnerService.evaluate_assertions(
             test_case=test_case,
@@ -194,7 +384,7 @@ class TestRunnerService:
         if baseline_score is not None and candidate_score is not None:
             regression = candidate_score + 0.5 < baseline_score
 
-        return {
+        result = {
             "case_index": case_index,
             "name": test_case.get("name") or f"Case {case_index}",
             "variables": variables,
@@ -210,6 +400,80 @@ class TestRunnerService:
             "cost": candidate_cost,
             "error": None,
         }
+        return result, baseline_memo
+
+    @staticmethod
+    def case_hash(prompt_content: str, variables: Dict) -> str:
+        """渲染后的 Prompt 的哈希；版本内容或变量变化时自动失效"""
+        final_prompt = replace_variables(prompt_content, variables)
+        return hashlib.sha256(final_prompt.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def get_baseline_output(
+        db: Session,
+        prompt_id: int,
+        version: int,
+        case_hash: str,
+        model: str,
+        temperature: float,
+    ) -> Optional[PromptBaselineOutput]:
+        return db.exec(
+            select(PromptBaselineOutput).where(
+                PromptBaselineOutput.prompt_id == prompt_id,
+                PromptBaselineOutput.version == version,
+                PromptBaselineOutput.case_hash == case_hash,
+                PromptBaselineOutput.model == model,
+                PromptBaselineOutput.temperature == temperature,
+            ).order_by(PromptBaselineOutput.id.desc()).limit(1)
+        ).first()
+
+    @staticmethod
+    def save_baseline_output(
+        db: Session,
+        prompt_id: int,
+        version: int,
+        case_hash: str,
+        model: str,
+        temperature: float,
+        output: str,
+        score: Optional[float],
+        response_time: float,
+        total_tokens: int,
+        cost: float,
+    ) -> PromptBaselineOutput:
+        """写入（或更新）基线输出，不提交；由调用方和用例结果一起提交"""
+        memo = TestRunnerService.get_baseline_output(
+            db, prompt_id, version, case_hash, model, temperature
+        )
+        if memo is None:
+            memo = PromptBaselineOutput(
+                prompt_id=prompt_id,
+                version=version,
+                case_hash=case_hash,
+                model=model,
+                temperature=temperature,
+                output=output,
+            )
+        memo.output = output
+        memo.score = score
+        memo.response_time = response_time
+        memo.total_tokens = total_tokens
+        memo.cost = cost
+        memo.updated_at = datetime.utcnow()
+        db.add(memo)
+        return memo
+
+    @staticmethod
+    def invalidate_baselines(db: Session, prompt_id: int, version: Optional[int] = None) -> int:
+        """删除已保存的基线输出，返回删除的条数"""
+        statement = select(PromptBaselineOutput).where(PromptBaselineOutput.prompt_id == prompt_id)
+        if version is not None:
+            statement = statement.where(PromptBaselineOutput.version == version)
+        memos = db.exec(statement).all()
+        for memo in memos:
+            db.delete(memo)
+        db.commit()
+        return len(memos)
 
     @staticmethod
     async def execute_prompt_content(
@@ -221,15 +485,16 @@ class TestRunnerService:
         temperature: float,
     ) -> Tuple[str, float, int, float]:
         final_prompt = replace_variables(prompt_content, variables)
-        start_time = time.time()
-        result = await OpenAIService.chat_completion(
-            prompt=final_prompt,
-            model=model,
-            temperature=temperature,
-            max_tokens=2000,
-            db=db,
-            user_id=user_id,
-        )
+        async with user_llm_limiter.acquire(user_id):
+            start_time = time.time()
+            result = await OpenAIService.chat_completion(
+                prompt=final_prompt,
+                model=model,
+                temperature=temperature,
+                max_tokens=2000,
+                db=db,
+                user_id=user_id,
+            )
         return (
             result.get("output", ""),
             time.time() - start_time,
@@ -241,12 +506,13 @@ class TestRunnerService:
     async def evaluate_output(
         db: Session, user_id: int, output: str, prompt_content: str
     ) -> float:
-        evaluation = await EvaluationService.evaluate_output_quality(
-            output_content=output,
-            prompt_content=prompt_content,
-            db=db,
-            user_id=user_id,
-        )
+        async with user_llm_limiter.acquire(user_id):
+            evaluation = await EvaluationService.evaluate_output_quality(
+                output_content=output,
+                prompt_content=prompt_content,
+                db=db,
+                user_id=user_id,
+            )
         return evaluation.get("overall_score", 0)
 
     @staticmethod
@@ -0,0 +1,153 @@
+"""
+Prompt 模板引擎 - 解析变量占位符，一次编译、多次渲染
+
+支持的占位符格式（与前端 extractVariablesEnhanced 一致）：
+    {{变量名}}                               简单文本变量
+    {{变量名:类型}}                          指定类型
+    {{变量名:类型:默认值}}                   指定默认值
+    {{变量名:select:默认值:选项1,选项2}}     下拉选择（有选项时默认值为第一个选项）
+    {{变量名:text:默认值:*}}                 必填标记
+
+模板按内容缓存编译结果（片段列表），渲染时线性拼接一次，与变量数量无关：
+- 提供了变量值时原样插入（变量值中的 {{...}} 不会被再次替换）
+- 未提供时使用默认值；没有默认值的占位符保留原文，并在 missing 中列出
+"""
+import re
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional
+
+from ..core.config import settings
+
+# 占位符：{{ 与 }} 之间不含花括号
+_PLACEHOLDER = re.compile(r'\{\{([^{}]+)\}\}')
+
+VARIABLE_TYPES = ('text', 'textarea', 'number', 'select', 'file')
+
+
+class Placeholder:
+    """一个变量占位符"""
+
+    __slots__ = ('name', 'type', 'default', 'options', 'required', 'raw')
+
+    def __init__(self, name: str, type: str, default: str, options: List[str], required: bool, raw: str):
+        self.name = name
+        self.type = type
+        self.default = default
+        self.options = options
+        self.required = required
+        self.raw = raw  # 占位符原文，未填写且没有默认值时保留
+
+    @classmethod
+    def parse(cls, raw: str, body: str) -> 'Placeholder':
+        """解析 {{...}} 内部的 变量名:类型:默认值:选项"""
+        parts = [part.strip() for part in body.split(':')]
+        name = parts[0]
+
+        var_type = parts[1].lower() if len(parts) > 1 else ''
+        if var_type not in VARIABLE_TYPES:
+            var_type = 'text'
+
+        default = parts[2] if len(parts) > 2 else ''
+
+        options: List[str] = []
+        required = False
+        if len(parts) > 3 and parts[3]:
+            if parts[3] == '*':
+                required = True
+            elif var_type == 'select':
+                options = [option.strip() for option in parts[3].split(',') if option.strip()]
+
+        # select 没有选项时，默认值部分可以直接写选项列表
+        if var_type == 'select' and not options and ',' in default:
+            options = [option.strip() for option in default.split(',') if option.strip()]
+        if var_type == 'select' and options:
+            default = options[0]
+
+        return cls(name, var_type, default, options, required, raw)
+
+    def to_dict(self) -> Dict:
+        return {
+            'name': self.name,
+            'type': self.type,
+            'default': self.default,
+            'options': self.options,
+            'required': self.required,
+        }
+
+
+class RenderResult(NamedTuple):
+    """渲染结果"""
+    text: str
+    missing: List[str]  # 未提供值且没有默认值的变量（按首次出现顺序）
+
+
+class CompiledTemplate:
+    """
+    编译后的模板
+
+    literals 比 placeholders 多一个元素，渲染结果为
+    literals[0] + value(placeholders[0]) + literals[1] + ... + literals[-1]
+    """
+
+    __slots__ = ('literals', 'placeholders', 'variables')
+
+    def __init__(self, content: str):
+        literals: List[str] = []
+        placeholders: List[Placeholder] = []
+        position = 0
+        for match in _PLACEHOLDER.finditer(content):
+            placeholder = Placeholder.parse(match.group(0), match.group(1))
+            if not placeholder.name:
+                continue
+            literals.append(content[position:match.start()])
+            placeholders.append(placeholder)
+            position = match.end()
+        literals.append(content[position:])
+
+        self.literals = literals
+        self.placeholders = placeholders
+        # 变量定义：同名变量以首次出现的占位符为准
+        variables: Dict[str, Placeholder] = {}
+        for placeholder in placeholders:
+            variables.setdefault(placeholder.name, placeholder)
+        self.variables = variables
+
+    def render(self, variables: Optional[Dict] = None) -> RenderResult:
+        """用一组变量值渲染模板"""
+        literals = self.literals
+        if not self.placeholders:
+            return RenderResult(literals[0], [])
+
+        variables = variables or {}
+        parts = [literals[0]]
+        missing: List[str] = []
+        for placeholder, literal in zip(self.placeholders, literals[1:]):
+            value = variables.get(placeholder.name)
+            if value is None:
+                if placeholder.default:
+                    value = placeholder.default
+                else:
+                    value = placeholder.raw
+                    if placeholder.name not in missing:
+                        missing.append(placeholder.name)
+            parts.append(str(value))
+            parts.append(literal)
+        return RenderResult(''.join(parts), missing)
+
+
+@lru_cache(maxsize=settings.PROMPT_TEMPLATE_CACHE_SIZE)
+def compile_template(content: str) -> CompiledTemplate:
+    """编译模板（按内容缓存，同一版本的 Prompt 只解析一次）"""
+    return CompiledTemplate(content)
+
+
+def render_template(content: str, variables: Optional[Dict] = None) -> RenderResult:
+    """渲染模板，同时返回未填写的变量"""
+    if not content:
+        return RenderResult(content, [])
+    return compile_template(content).render(variables)
+
+
+def replace_variables(content: str, variables: Optional[Dict] = None) -> str:
+    """替换 Prompt 中的变量（支持简单格式和增强格式）"""
+    return render_template(content, variables).text
@@ -1,24 +1,74 @@
 import re
-from typing import Dict
+from typing import Dict, List, Optional
 
+from .tokenizer import tokenizer_registry
 
-def count_tokens(text: str) -> int:
+# 估算算法使用的正则
+_CHINESE_CHAR = re.compile(r'[\u4e00-\u9fff]')
+_ENGLISH_WORD = re.compile(r'\b[a-zA-Z]+\b')
+_DIGIT = re.compile(r'[0-9]')
+
+# 模型价格（美元 / 1K tokens），未知模型按 gpt-3.5-turbo 计算
+MODEL_PRICES = {
+    "gpt-3.5-turbo": {"input": 0.0015, "output": 0.002},
+    "gpt-4": {"input": 0.03, "output": 0.06},
+    "deepseek-chat": {"input": 0.001, "output": 0.002},
+}
+DEFAULT_PRICE_MODEL = "gpt-3.5-turbo"
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    Token 计数
+
+    有该模型对应的 BPE 词表时精确计数（见 tokenizer.py），否则使用 estimate_tokens 估算。
+    """
+    if not text:
+        return 0
+
+    encoding = tokenizer_registry.for_model(model)
+    if encoding is not None:
+        return encoding.count(text)
+    return estimate_tokens(text)
+
+
+def count_tokens_batch(texts: List[str], model: Optional[str] = None) -> List[int]:
+    """
+    批量 Token 计数（与逐条 count_tokens 结果相同）
+
+    编码只解析一次，相同的文本只计数一次；BPE 的片段缓存在同一批文本之间共享，
+    同一模板渲染出的多条 Prompt 中重复的模板文本只需合并一次。
+    """
+    encoding = tokenizer_registry.for_model(model)
+    count = encoding.count if encoding is not None else estimate_tokens
+    counted: Dict[str, int] = {}
+    results = []
+    for text in texts:
+        if not text:
+            results.append(0)
+            continue
+        tokens = counted.get(text)
+        if tokens is None:
+            tokens = counted[text] = count(text)
+        results.append(tokens)
+    return results
+
+
+def estimate_tokens(text: str) -> int:
     """
-    简单的 Token 计数器（模拟）
-    实际项目中应使用 tiktoken 等专业库
-    这里使用简化算法：中文字符计2个token，英文单词计1个token
+    没有词表时的估算算法：中文字符计2个token，英文单词计1个token
     """
     if not text:
         return 0
     
     # 统计中文字符
-    chinese_chars = len(re.findall(r'[\u4e00-\u9fff]', text))
+    chinese_chars = len(_CHINESE_CHAR.findall(text))
     
     # 统计英文单词（简化处理）
-    english_words = len(re.findall(r'\b[a-zA-Z]+\b', text))
+    english_words = len(_ENGLISH_WORD.findall(text))
     
     # 统计数字和符号
-    others = len(re.findall(r'[0-9]', text))
+    others = len(_DIGIT.findall(text))
     
     # 简单估算
     total_tokens = chinese_chars * 2 + english_words + others // 4
@@ -26,18 +76,17 @@ def count_tokens(text: str) -> int:
     return max(total_tokens, 1)
 
 
+def get_model_price(model: Optional[str]) -> Dict[str, float]:
+    """模型价格（美元 / 1K tokens）"""
+    return MODEL_PRICES.get(model, MODEL_PRICES[DEFAULT_PRICE_MODEL])
+
+
 def estimate_cost(input_tokens: int, output_tokens: int, model: str = "gpt-3.5-turbo") -> float:
     """
     估算API调用成本（美元）
     这里使用模拟价格
     """
-    prices = {
-        "gpt-3.5-turbo": {"input": 0.0015, "output": 0.002},  # per 1K tokens
-        "gpt-4": {"input": 0.03, "output": 0.06},
-        "deepseek-chat": {"input": 0.001, "output": 0.002},
-    }
-    
-    price = prices.get(model, prices["gpt-3.5-turbo"])
+    price = get_model_price(model)
     
     input_cost = (input_tokens / 1000) * price["input"]
     output_cost = (output_tokens / 1000) * price["output"]
@@ -0,0 +1,320 @@
+"""
+BPE 分词器 - 从本地词表文件加载 tiktoken 格式的编码，按模型名选择编码
+
+词表文件放在 settings.TOKENIZER_VOCAB_DIR 下，文件名为 <编码名>.tiktoken，例如：
+    cl100k_base.tiktoken  (gpt-4 / gpt-3.5-turbo / text-embedding-3-*)
+    o200k_base.tiktoken   (gpt-4o / gpt-4.1 / o1 / o3 / o4-mini)
+文件格式与 tiktoken 一致：每行 "<base64 编码的字节序列> <rank>"。
+找不到词表文件时 get_encoding 返回 None，由调用方退回估算算法。
+"""
+import base64
+import heapq
+import logging
+import re
+import sys
+import threading
+import unicodedata
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Pattern, Tuple
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    # 可选依赖：regex 支持 \p{..} 字符类，预分词结果与 tiktoken 完全一致
+    import regex as _regex
+except ImportError:  # pragma: no cover - 取决于运行环境
+    _regex = None
+
+# 各编码的预分词正则（与 tiktoken 相同，需要 regex 模块）
+_PATTERNS = {
+    "r50k_base": r"""'(?:[sdmt]|ll|ve|re)| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+""",
+    "cl100k_base": (
+        r"""(?i:'s|'t|'re|'ve|'m|'ll|'d)|[^\r\n\p{L}\p{N}]?\p{L}+|\p{N}{1,3}| ?[^\s\p{L}\p{N}]+[\r\n]*"""
+        r"""|\s*[\r\n]+|\s+(?!\S)|\s+"""
+    ),
+    "o200k_base": "|".join([
+        r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]*[\p{Ll}\p{Lm}\p{Lo}\p{M}]+(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+        r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]+[\p{Ll}\p{Lm}\p{Lo}\p{M}]*(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+        r"""\p{N}{1,3}""",
+        r""" ?[^\s\p{L}\p{N}]+[\r\n/]*""",
+        r"""\s*[\r\n]+""",
+        r"""\s+(?!\S)""",
+        r"""\s+""",
+    ]),
+}
+_PATTERNS["p50k_base"] = _PATTERNS["r50k_base"]
+
+# 没有 regex 模块时使用的等价正则（标准库 re 不支持 \p{..}）：
+# 数字 [<num>] 为 \p{N} 全部字符（re 的 \d 只包含十进制数字，不含 ² ① Ⅻ 等）；
+# 字母 [^\W_<num>]，即 \w 去掉下划线和数字；“非字母数字”为 [^\w] 加上下划线。
+# <num> 在编译时替换为数字字符类，见 _numeric_class。
+# o200k 的大小写区分只对 ASCII 精确，其他语言的大小写字母按小写处理；
+# o200k 算作字母的组合符号（\p{M}）不在 \w 中，这里按标点处理。
+_FALLBACK_PATTERNS = {
+    "r50k_base": r"""'(?:[sdmt]|ll|ve|re)| ?[^\W_<num>]+| ?[<num>]+| ?(?:[^\s\w]|_)+|\s+(?!\S)|\s+""",
+    "cl100k_base": (
+        r"""(?i:'s|'t|'re|'ve|'m|'ll|'d)|(?:[^\r\n\w]|_)?[^\W_<num>]+|[<num>]{1,3}| ?(?:[^\s\w]|_)+[\r\n]*"""
+        r"""|\s*[\r\n]+|\s+(?!\S)|\s+"""
+    ),
+    "o200k_base": "|".join([
+        r"""(?:[^\r\n\w]|_)?[^\W_a-z<num>]*[^\W_A-Z<num>]+(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+        r"""(?:[^\r\n\w]|_)?[^\W_a-z<num>]+[^\W_A-Z<num>]*(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+        r"""[<num>]{1,3}""",
+        r""" ?(?:[^\s\w]|_)+[\r\n/]*""",
+        r"""\s*[\r\n]+""",
+        r"""\s+(?!\S)""",
+        r"""\s+""",
+    ]),
+}
+_FALLBACK_PATTERNS["p50k_base"] = _FALLBACK_PATTERNS["r50k_base"]
+
+# 模型名 -> 编码（精确匹配）
+MODEL_TO_ENCODING = {
+    "gpt-4": "cl100k_base",
+    "gpt-3.5-turbo": "cl100k_base",
+    "text-embedding-ada-002": "cl100k_base",
+    "text-davinci-003": "p50k_base",
+    "text-davinci-002": "p50k_base",
+    "davinci": "r50k_base",
+}
+
+# 模型名前缀 -> 编码（按顺序匹配，较长的前缀在前）
+MODEL_PREFIX_TO_ENCODING = (
+    ("gpt-4o", "o200k_base"),
+    ("gpt-4.1", "o200k_base"),
+    ("gpt-4.5", "o200k_base"),
+    ("gpt-5", "o200k_base"),
+    ("chatgpt-4o", "o200k_base"),
+    ("o1", "o200k_base"),
+    ("o3", "o200k_base"),
+    ("o4", "o200k_base"),
+    ("gpt-4", "cl100k_base"),
+    ("gpt-3.5-turbo", "cl100k_base"),
+    ("gpt-35-turbo", "cl100k_base"),  # Azure
+    ("text-embedding-3", "cl100k_base"),
+    ("ft:gpt-4o", "o200k_base"),
+    ("ft:gpt-4", "cl100k_base"),
+    ("ft:gpt-3.5-turbo", "cl100k_base"),
+)
+
+# 超过该字节数的片段使用堆实现的合并（O(n log n)），否则使用逐轮扫描（短片段更快）
+_HEAP_MERGE_THRESHOLD = 64
+_NO_RANK = sys.maxsize
+
+
+def load_tiktoken_bpe(path: Path) -> Dict[bytes, int]:
+    """读取 tiktoken 格式的词表：每行 "<base64> <rank>" """
+    ranks: Dict[bytes, int] = {}
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            token, rank = line.split()
+            ranks[base64.b64decode(token)] = int(rank)
+    return ranks
+
+
+@lru_cache(maxsize=1)
+def _numeric_class() -> str:
+    """\p{N}（Nd / Nl / No）全部字符组成的字符类内容（只在没有 regex 模块时计算一次）"""
+    ranges: List[Tuple[int, int]] = []
+    for code in range(sys.maxunicode + 1):
+        if unicodedata.category(chr(code))[0] != "N":
+            continue
+        if ranges and ranges[-1][1] == code - 1:
+            ranges[-1] = (ranges[-1][0], code)
+        else:
+            ranges.append((code, code))
+    return "".join(
+        re.escape(chr(start)) if start == end else f"{re.escape(chr(start))}-{re.escape(chr(end))}"
+        for start, end in ranges
+    )
+
+
+def _compile_pattern(name: str, pattern: Optional[str] = None) -> Pattern:
+    if pattern is not None:
+        return (_regex or re).compile(pattern)
+    if _regex is not None and name in _PATTERNS:
+        return _regex.compile(_PATTERNS[name])
+    fallback = _FALLBACK_PATTERNS.get(name, _FALLBACK_PATTERNS["cl100k_base"])
+    return re.compile(fallback.replace("<num>", _numeric_class()))
+
+
+class BPEEncoding:
+    """
+    字节级 BPE 编码（与 tiktoken 的 encode_ordinary 结果一致）
+
+    文本先按预分词正则切成片段，每个片段的 UTF-8 字节反复合并 rank 最小的相邻对。
+    片段的合并结果按字节内容缓存（LRU），常见单词、空白和标点只计算一次。
+    """
+
+    def __init__(self, name: str, ranks: Dict[bytes, int], pattern: Optional[str] = None, cache_size: int = 65536):
+        self.name = name
+        self._ranks = ranks
+        self._decoder: Optional[Dict[int, bytes]] = None
+        self._pattern = _compile_pattern(name, pattern)
+        self._encode_piece = lru_cache(maxsize=cache_size)(self._bpe)
+
+    @property
+    def n_vocab(self) -> int:
+        return len(self._ranks)
+
+    def _bpe(self, piece: bytes) -> Tuple[int, ...]:
+        """对一个片段执行 BPE 合并，返回 token 序列"""
+        ranks = self._ranks
+        rank = ranks.get(piece)
+        if rank is not None:
+            return (rank,)
+        if len(piece) > _HEAP_MERGE_THRESHOLD:
+            return self._bpe_heap(piece)
+
+        # bounds 为各部分的边界；pair_ranks[i] 为第 i、i+1 两部分合并后的 rank（不可合并为 _NO_RANK）
+        bounds = list(range(len(piece) + 1))
+        pair_ranks = [ranks.get(piece[i:i + 2], _NO_RANK) for i in range(len(piece) - 1)]
+        while pair_ranks:
+            # 合并 rank 最小的相邻对（rank 相同时取最左边的），之后只需更新两侧相邻对的 rank
+            min_rank = min(pair_ranks)
+            if min_rank == _NO_RANK:
+                break
+            i = pair_ranks.index(min_rank)
+            del bounds[i + 1]
+            del pair_ranks[i]
+            if i > 0:
+                pair_ranks[i - 1] = ranks.get(piece[bounds[i - 1]:bounds[i + 1]], _NO_RANK)
+            if i < len(pair_ranks):
+                pair_ranks[i] = ranks.get(piece[bounds[i]:bounds[i + 2]], _NO_RANK)
+        return tuple(ranks[piece[bounds[j]:bounds[j + 1]]] for j in range(len(bounds) - 1))
+
+    def _bpe_heap(self, piece: bytes) -> Tuple[int, ...]:
+        """长片段（例如不含空格的整段中文）：双向链表 + 最小堆，合并顺序与逐轮扫描相同"""
+        ranks = self._ranks
+        length = len(piece)
+        # 节点以起始字节位置标识；next_start[i] 为下一个节点的起始位置（末尾为 length）
+        next_start = list(range(1, length + 1))
+        prev_start = list(range(-1, length - 1))
+        alive = [True] * length
+
+        heap = []
+        for i in range(length - 1):
+            pair_rank = ranks.get(piece[i:i + 2])
+            if pair_rank is not None:
+                heap.append((pair_rank, i, i + 1, i + 2))
+        heapq.heapify(heap)
+
+        def push(left: int):
+            middle = next_start[left]
+            if middle >= length:
+                return
+            end = next_start[middle]
+            pair_rank = ranks.get(piece[left:end])
+            if pair_rank is not None:
+                heapq.heappush(heap, (pair_rank, left, middle, end))
+
+        while heap:
+            _, left, middle, end = heapq.heappop(heap)
+            # 跳过已失效的候选（任一侧已经参与过其他合并）
+            if not alive[left] or next_start[left] != middle or not alive[middle] or next_start[middle] != end:
+                continue
+            alive[middle] = False
+            next_start[left] = end
+            if end < length:
+                prev_start[end] = left
+            if prev_start[left] >= 0:
+                push(prev_start[left])
+            push(left)
+
+        tokens = []
+        start = 0
+        while start < length:
+            end = next_start[start]
+            tokens.append(ranks[piece[start:end]])
+            start = end
+        return tuple(tokens)
+
+    def encode(self, text: str) -> List[int]:
+        """编码为 token 序列（特殊 token 按普通文本处理）"""
+        tokens: List[int] = []
+        encode_piece = self._encode_piece
+        for piece in self._pattern.findall(text):
+            tokens.extend(encode_piece(piece.encode("utf-8")))
+        return tokens
+
+    def count(self, text: str) -> int:
+        """token 数量"""
+        if not text:
+            return 0
+        encode_piece = self._encode_piece
+        return sum(len(encode_piece(piece.encode("utf-8"))) for piece in self._pattern.findall(text))
+
+    def decode(self, tokens: List[int]) -> str:
+        if self._decoder is None:
+            self._decoder = {rank: token for token, rank in self._ranks.items()}
+        return b"".join(self._decoder[token] for token in tokens).decode("utf-8", errors="replace")
+
+    def cache_info(self):
+        return self._encode_piece.cache_info()
+
+    def cache_clear(self):
+        self._encode_piece.cache_clear()
+
+
+class TokenizerRegistry:
+    """按编码名加载并缓存 BPEEncoding；词表文件不存在时记住结果，不重复查找"""
+
+    def __init__(self, vocab_dir: str, default_encoding: str = "cl100k_base", cache_size: int = 65536):
+        self.vocab_dir = Path(vocab_dir)
+        self.default_encoding = default_encoding
+        self.cache_size = cache_size
+        self._encodings: Dict[str, Optional[BPEEncoding]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def encoding_name_for_model(model: Optional[str]) -> Optional[str]:
+        """模型名 -> 编码名（未知模型返回 None）"""
+        if not model:
+            return None
+        model = model.lower()
+        if model in MODEL_TO_ENCODING:
+            return MODEL_TO_ENCODING[model]
+        for prefix, encoding_name in MODEL_PREFIX_TO_ENCODING:
+            if model.startswith(prefix):
+                return encoding_name
+        return None
+
+    def get_encoding(self, name: str) -> Optional[BPEEncoding]:
+        """加载编码（词表文件不存在或无法解析时返回 None）"""
+        if name in self._encodings:
+            return self._encodings[name]
+        with self._lock:
+            if name not in self._encodings:
+                encoding = None
+                path = self.vocab_dir / f"{name}.tiktoken"
+                if path.is_file():
+                    try:
+                        encoding = BPEEncoding(name, load_tiktoken_bpe(path), cache_size=self.cache_size)
+                    except Exception as e:
+                        logger.warning("词表加载失败 %s: %s", path, e)
+                self._encodings[name] = encoding
+            return self._encodings[name]
+
+    def for_model(self, model: Optional[str]) -> Optional[BPEEncoding]:
+        """模型对应的编码；未知模型使用默认编码；没有可用词表时返回 None"""
+        name = self.encoding_name_for_model(model) or self.default_encoding
+        if not name:
+            return None
+        return self.get_encoding(name)
+
+    def clear(self):
+        with self._lock:
+            self._encodings.clear()
+
+
+# 全局实例
+tokenizer_registry = TokenizerRegistry(
+    vocab_dir=settings.TOKENIZER_VOCAB_DIR,
+    default_encoding=settings.TOKENIZER_DEFAULT_ENCODING,
+    cache_size=settings.TOKENIZER_CACHE_SIZE,
+)
@@ -0,0 +1,82 @@
+"""
+批量内容审核基准测试：内联审核 vs 不同进程数的进程池
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_batch_audit.py --items 400 --size 5000 --workers 1 2 4 8
+
+进程池的加速比取决于 CPU 核数；单核机器上进程池只会增加序列化开销。
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.audit_pool import AuditPool  # noqa: E402
+from app.services.security_service import SecurityService  # noqa: E402
+
+
+def make_contents(items: int, size: int, seed: int = 42):
+    rng = random.Random(seed)
+    fragments = [
+        "这是一段普通的业务描述文本，",
+        "请联系 13812345678 获取详情，",
+        "邮箱 someone@example.com，",
+        "身份证号 110101199003074578，",
+        "服务器地址 192.168.1.10，",
+        "包含暴力内容，",
+        "The quick brown fox jumps over the lazy dog. ",
+    ]
+    contents = []
+    for _ in range(items):
+        parts = []
+        length = 0
+        while length < size:
+            fragment = rng.choice(fragments)
+            parts.append(fragment)
+            length += len(fragment)
+        contents.append("".join(parts))
+    return contents
+
+
+def timed(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量内容审核基准测试")
+    parser.add_argument("--items", type=int, default=400, help="内容条数")
+    parser.add_argument("--size", type=int, default=5000, help="每条内容的字符数")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4], help="进程池大小")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数（取最快一次）")
+    parser.add_argument("--auto-mask", action="store_true", help="同时脱敏")
+    args = parser.parse_args()
+
+    contents = make_contents(args.items, args.size)
+    total_chars = sum(len(content) for content in contents)
+    print(f"CPU 核数: {os.cpu_count()}  内容: {args.items} 条 / {total_chars} 字符")
+
+    inline = timed(lambda: SecurityService.batch_audit(contents, args.auto_mask), args.repeat)
+    print(f"{'内联':<12}{inline * 1000:>10.1f} ms")
+
+    for workers in args.workers:
+        pool = AuditPool(workers=workers)
+        try:
+            # 预热：启动子进程并加载词库，不计入耗时
+            asyncio.run(pool.audit(contents[:workers * 2], args.auto_mask, inline=False))
+            elapsed = timed(lambda: asyncio.run(pool.audit(contents, args.auto_mask, inline=False)), args.repeat)
+        finally:
+            pool.shutdown()
+        print(f"{f'进程池 x{workers}':<12}{elapsed * 1000:>10.1f} ms  加速比 {inline / elapsed:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
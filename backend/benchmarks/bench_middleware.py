@@ -0,0 +1,152 @@
+"""
+中间件基准测试：纯 ASGI 中间件 vs 原 BaseHTTPMiddleware 实现
+
+在与 main.py 相同的中间件栈（频率限制 + 安全响应头 + 请求日志）下，
+分别请求 /health 和一个需要 JWT 认证的 GET 接口，统计每秒请求数。
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_middleware.py --requests 2000
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import Depends, FastAPI, HTTPException, Request  # noqa: E402
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer  # noqa: E402
+from httpx import ASGITransport, AsyncClient  # noqa: E402
+from starlette.middleware.base import BaseHTTPMiddleware  # noqa: E402
+
+from app.core import access_control  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.core.logger import logging_stats, setup_logging  # noqa: E402
+from app.core.security import create_access_token, decode_access_token  # noqa: E402
+
+settings.SECRET_KEY = settings.SECRET_KEY or "bench-secret-key"
+# 与应用相同的日志管道（访问日志经队列输出）
+setup_logging()
+
+
+class LegacyRateLimitMiddleware(BaseHTTPMiddleware):
+    """原实现：BaseHTTPMiddleware 版本的频率限制"""
+
+    def __init__(self, app, requests_per_minute: int, requests_per_hour: int):
+        super().__init__(app)
+        self.requests_per_minute = requests_per_minute
+        self.requests_per_hour = requests_per_hour
+        self.limiter = access_control.create_window_limiter((60, 3600), "ip")
+
+    async def dispatch(self, request: Request, call_next):
+        if request.method == "OPTIONS" or access_control.RateLimitMiddleware._is_excluded_path(request.url.path):
+            return await call_next(request)
+        exceeded, (minute_count, hour_count) = self.limiter.acquire(
+            access_control.get_client_ip(request.scope), (self.requests_per_minute, self.requests_per_hour)
+        )
+        response = await call_next(request)
+        response.headers['X-RateLimit-Limit-Minute'] = str(self.requests_per_minute)
+        response.headers['X-RateLimit-Limit-Hour'] = str(self.requests_per_hour)
+        response.headers['X-RateLimit-Remaining-Minute'] = str(max(0, self.requests_per_minute - minute_count - 1))
+        response.headers['X-RateLimit-Remaining-Hour'] = str(max(0, self.requests_per_hour - hour_count - 1))
+        return response
+
+
+class LegacySecurityHeadersMiddleware(BaseHTTPMiddleware):
+    """原实现：BaseHTTPMiddleware 版本的安全响应头"""
+
+    async def dispatch(self, request: Request, call_next):
+        response = await call_next(request)
+        for name, value in access_control.SecurityHeadersMiddleware.SECURITY_HEADERS.items():
+            response.headers[name] = value
+        return response
+
+
+class LegacyRequestLoggingMiddleware(BaseHTTPMiddleware):
+    """原实现：BaseHTTPMiddleware 版本的请求日志"""
+
+    async def dispatch(self, request: Request, call_next):
+        start_time = time.time()
+        response = await call_next(request)
+        print(
+            f"{request.method} {request.url.path} - IP: {access_control.get_client_ip(request.scope)} "
+            f"- Status: {response.status_code} - Time: {time.time() - start_time:.3f}s"
+        )
+        return response
+
+
+def make_app(legacy: bool) -> FastAPI:
+    app = FastAPI()
+    bearer = HTTPBearer()
+
+    def current_user_id(credentials: HTTPAuthorizationCredentials = Depends(bearer)) -> int:
+        payload = decode_access_token(credentials.credentials)
+        if payload is None:
+            raise HTTPException(status_code=401)
+        return int(payload["sub"])
+
+    @app.get("/health")
+    async def health():
+        return {"code": 0, "message": "success", "data": {"status": "healthy"}}
+
+    @app.get("/api/me")
+    async def me(user_id: int = Depends(current_user_id)):
+        return {"code": 0, "message": "success", "data": {"id": user_id}}
+
+    if legacy:
+        app.add_middleware(LegacyRequestLoggingMiddleware)
+        app.add_middleware(LegacySecurityHeadersMiddleware)
+        app.add_middleware(LegacyRateLimitMiddleware, requests_per_minute=10**9, requests_per_hour=10**9)
+    else:
+        app.add_middleware(access_control.RequestLoggingMiddleware)
+        app.add_middleware(access_control.SecurityHeadersMiddleware)
+        app.add_middleware(access_control.RateLimitMiddleware, requests_per_minute=10**9, requests_per_hour=10**9)
+    return app
+
+
+async def measure(app: FastAPI, path: str, requests: int, headers: dict) -> float:
+    """顺序发送请求，返回每秒请求数（日志输出被丢弃）"""
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://bench") as client:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(min(100, requests)):
+                await client.get(path, headers=headers)
+            started = time.perf_counter()
+            for _ in range(requests):
+                response = await client.get(path, headers=headers)
+            elapsed = time.perf_counter() - started
+            # 等待后台线程输出完剩余的日志
+            while logging_stats()["queued"]:
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.01)
+        assert response.status_code == 200 and "X-Frame-Options" in response.headers
+    return requests / elapsed
+
+
+async def run(requests: int, repeat: int):
+    token = create_access_token({"sub": "1"})
+    cases = [
+        ("/health", {}),
+        ("/api/me", {"Authorization": f"Bearer {token}"}),
+    ]
+    print(f"每个接口 {requests} 次请求，取 {repeat} 轮中最快一轮")
+    print(f"{'接口':<12}{'BaseHTTPMiddleware':>20}{'纯 ASGI':>12}{'提升':>10}")
+    for path, headers in cases:
+        legacy = max([await measure(make_app(True), path, requests, headers) for _ in range(repeat)])
+        asgi = max([await measure(make_app(False), path, requests, headers) for _ in range(repeat)])
+        print(f"{path:<12}{legacy:>17.0f} rps{asgi:>9.0f} rps{asgi / legacy:>9.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="中间件基准测试")
+    parser.add_argument("--requests", type=int, default=2000, help="每轮请求数")
+    parser.add_argument("--repeat", type=int, default=3, help="重复轮数（取最快一轮）")
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Token 计数基准测试：BPE 分词器 vs 原估算算法（吞吐量与准确度）
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_token_counter.py --vocab-dir data/tokenizers --encoding cl100k_base
+
+准确度以安装了 tiktoken 时的 tiktoken 结果为准（同时校验本实现与 tiktoken 完全一致），
+否则以本实现的 BPE 结果为准，只报告估算算法的偏差。
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.token_counter import estimate_tokens  # noqa: E402
+from app.utils.tokenizer import BPEEncoding, load_tiktoken_bpe  # noqa: E402
+
+SAMPLES = {
+    "英文": (
+        "Prompt engineering is the practice of designing inputs for generative AI models. "
+        "Well-structured prompts improve accuracy, reduce hallucinations and make outputs easier to parse. "
+    ),
+    "中文": "提示词工程是设计和优化输入以引导大语言模型生成期望输出的技术，良好的提示词可以显著提升回答的准确性和稳定性。",
+    "代码": (
+        "def estimate_cost(input_tokens: int, output_tokens: int, model: str) -> float:\n"
+        "    price = PRICES.get(model, PRICES['gpt-3.5-turbo'])\n"
+        "    return round(input_tokens / 1000 * price['input'] + output_tokens / 1000 * price['output'], 6)\n"
+    ),
+    "混合": "请把下面的 JSON 翻译成英文：{\"title\": \"季度报告\", \"revenue\": 1234567.89, \"growth\": \"12.5%\"} 😀\n",
+}
+
+
+def make_documents(sample: str, count: int, seed: int):
+    rng = random.Random(seed)
+    words = sample.split(" ") if " " in sample else list(sample)
+    joiner = " " if " " in sample else ""
+    return [joiner.join(rng.choice(words) for _ in range(rng.randint(20, 200))) for _ in range(count)]
+
+
+def throughput(func, documents, repeat: int) -> float:
+    """返回每秒处理的字符数（取最快一次）"""
+    chars = sum(len(document) for document in documents)
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for document in documents:
+            func(document)
+        best = min(best, time.perf_counter() - started)
+    return chars / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Token 计数基准测试")
+    parser.add_argument("--vocab-dir", default="data/tokenizers", help="词表目录")
+    parser.add_argument("--encoding", default="cl100k_base", help="编码名")
+    parser.add_argument("--documents", type=int, default=200, help="每类文本的文档数")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数（取最快一次）")
+    args = parser.parse_args()
+
+    path = os.path.join(args.vocab_dir, f"{args.encoding}.tiktoken")
+    if not os.path.isfile(path):
+        sys.exit(f"找不到词表文件 {path}")
+
+    started = time.perf_counter()
+    encoding = BPEEncoding(args.encoding, load_tiktoken_bpe(path))
+    print(f"词表 {args.encoding}: {encoding.n_vocab} 个 token，加载耗时 {time.perf_counter() - started:.2f}s")
+
+    try:
+        import tiktoken
+        reference = tiktoken.get_encoding(args.encoding)
+        truth_name = "tiktoken"
+    except ImportError:
+        reference = None
+        truth_name = "BPE"
+
+    print(f"{'文本':<6}{'估算 字符/秒':>14}{'BPE 冷缓存':>14}{'BPE 热缓存':>14}{'估算误差':>10}  准确度基准: {truth_name}")
+    for index, (name, sample) in enumerate(SAMPLES.items()):
+        documents = make_documents(sample, args.documents, index)
+
+        heuristic_speed = throughput(estimate_tokens, documents, args.repeat)
+        encoding.cache_clear()
+        cold_speed = throughput(encoding.count, documents, 1)
+        warm_speed = throughput(encoding.count, documents, args.repeat)
+
+        truth = [encoding.count(document) for document in documents]
+        if reference is not None:
+            expected = [len(reference.encode_ordinary(document)) for document in documents]
+            if expected != truth:
+                print(f"  [警告] {name}: BPE 结果与 tiktoken 不一致")
+            truth = expected
+        estimates = [estimate_tokens(document) for document in documents]
+        error = sum(abs(e - t) / t for e, t in zip(estimates, truth) if t) / len(truth)
+
+        print(f"{name:<6}{heuristic_speed:>14,.0f}{cold_speed:>14,.0f}{warm_speed:>14,.0f}{error:>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
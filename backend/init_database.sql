@@ -243,12 +243,14 @@ CREATE TABLE IF NOT EXISTS `execution_history` (
     `total_tokens` INT NOT NULL DEFAULT 0 COMMENT '总 Token 数',
     `cost` REAL NOT NULL DEFAULT 0.0 COMMENT '估算成本',
     `response_time` REAL NOT NULL DEFAULT 0.0 COMMENT '响应时间（秒）',
+    `cache_key` VARCHAR(64) NULL COMMENT '结果缓存键（请求参数哈希）',
     `created_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
 
     PRIMARY KEY (`id`),
     INDEX `idx_execution_history_user_id` (`user_id`),
     INDEX `idx_execution_history_prompt_id` (`prompt_id`),
     INDEX `idx_execution_history_created_at` (`created_at`),
+    INDEX `idx_execution_history_cache_key` (`cache_key`),
 
     CONSTRAINT `fk_exec_user` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE,
     CONSTRAINT `fk_exec_prompt` FOREIGN KEY (`prompt_id`) REFERENCES `prompts` (`id`) ON DELETE SET NULL
@@ -768,10 +770,83 @@ CREATE TABLE IF NOT EXISTS `comparison_reports` (
     CONSTRAINT `fk_cr_abtest` FOREIGN KEY (`abtest_id`) REFERENCES `abtest_results` (`id`) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='对比分析报告表';
 
+-- ==========================================
+-- 31. 后台任务表
+-- ==========================================
+
+CREATE TABLE IF NOT EXISTS `background_jobs` (
+    `id` INT NOT NULL AUTO_INCREMENT COMMENT '任务 ID',
+    `user_id` INT NOT NULL COMMENT '用户 ID',
+    `job_type` VARCHAR(50) NOT NULL COMMENT '任务类型: batch_test/test_suite/abtest',
+    `status` VARCHAR(20) NOT NULL DEFAULT 'pending' COMMENT '状态',
+    `payload` JSON NULL COMMENT '任务参数 JSON',
+    `resource_id` INT NULL COMMENT '关联记录 ID',
+    `progress_total` INT NOT NULL DEFAULT 0 COMMENT '总步数',
+    `progress_done` INT NOT NULL DEFAULT 0 COMMENT '已完成步数',
+    `cancel_requested` TINYINT(1) NOT NULL DEFAULT 0 COMMENT '是否请求取消',
+    `error` TEXT NULL COMMENT '错误信息',
+    `created_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+    `started_at` DATETIME NULL COMMENT '开始时间',
+    `completed_at` DATETIME NULL COMMENT '完成时间',
+    `updated_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '最后心跳时间',
+
+    PRIMARY KEY (`id`),
+    INDEX `idx_background_jobs_user_id` (`user_id`),
+    INDEX `idx_background_jobs_job_type` (`job_type`),
+    INDEX `idx_background_jobs_status` (`status`),
+    INDEX `idx_background_jobs_resource_id` (`resource_id`),
+
+    CONSTRAINT `fk_bj_user` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='后台任务表';
+
+-- ==========================================
+-- 32. Prompt 基线输出缓存表
+-- ==========================================
+
+CREATE TABLE IF NOT EXISTS `prompt_baseline_outputs` (
+    `id` INT NOT NULL AUTO_INCREMENT COMMENT '记录 ID',
+    `prompt_id` INT NOT NULL COMMENT 'Prompt ID',
+    `version` INT NOT NULL COMMENT '基线版本',
+    `case_hash` VARCHAR(64) NOT NULL COMMENT '渲染后 Prompt 的哈希',
+    `model` VARCHAR(100) NOT NULL COMMENT '模型',
+    `temperature` REAL NOT NULL DEFAULT 0.0 COMMENT '温度参数',
+    `output` TEXT NOT NULL COMMENT '基线输出',
+    `score` REAL NULL COMMENT '基线评分',
+    `response_time` REAL NOT NULL DEFAULT 0.0 COMMENT '响应时间（秒）',
+    `total_tokens` INT NOT NULL DEFAULT 0 COMMENT '总 Token 数',
+    `cost` REAL NOT NULL DEFAULT 0.0 COMMENT '估算成本',
+    `created_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+    `updated_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '更新时间',
+
+    PRIMARY KEY (`id`),
+    INDEX `idx_prompt_baseline_outputs_prompt_id` (`prompt_id`),
+    INDEX `idx_prompt_baseline_outputs_version` (`version`),
+    INDEX `idx_prompt_baseline_outputs_case_hash` (`case_hash`),
+
+    CONSTRAINT `fk_pbo_prompt` FOREIGN KEY (`prompt_id`) REFERENCES `prompts` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Prompt 基线输出缓存表';
+
+-- ==========================================
+-- 33. 敏感词库版本表
+-- ==========================================
+
+CREATE TABLE IF NOT EXISTS `sensitive_word_versions` (
+    `id` INT NOT NULL AUTO_INCREMENT COMMENT '记录 ID（固定为 1）',
+    `version` INT NOT NULL DEFAULT 0 COMMENT '敏感词库版本号，每次增删敏感词时递增',
+    `updated_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '更新时间',
+
+    PRIMARY KEY (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='敏感词库版本表';
+
 -- ==========================================
 -- 初始数据
 -- ==========================================
 
+-- 插入敏感词库版本行（固定 ID 为 1）
+INSERT INTO `sensitive_word_versions` (`id`, `version`)
+VALUES (1, 0)
+ON DUPLICATE KEY UPDATE `id` = `id`;
+
 -- 插入默认网站设置
 INSERT INTO `site_settings` (`id`, `site_name`, `site_description`, `site_keywords`)
 VALUES (1, 'AI Prompt Lab', '企业级 AI 提示词管理和测试平台', 'AI, Prompt, 工作台')
@@ -873,4 +948,4 @@ SET p.default_branch_id = b.default_id;
 -- 完成信息
 -- ==========================================
 -- 数据库初始化完成！
--- 共 24 张表，包含 Prompt Git 功能
\ No newline at end of file
+-- 共 26 张表，包含 Prompt Git 功能
\ No newline at end of file
@@ -0,0 +1,46 @@
+"""Add background jobs table
+
+Revision ID: 20261018_background_jobs
+Revises: 20260427_prompt_tests
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261018_background_jobs"
+down_revision = "20260427_prompt_tests"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "background_jobs",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("job_type", sa.String(50), nullable=False),
+        sa.Column("status", sa.String(20), nullable=False, default="pending"),
+        sa.Column("payload", sa.JSON(), nullable=True),
+        sa.Column("resource_id", sa.Integer(), nullable=True),
+        sa.Column("progress_total", sa.Integer(), nullable=False, default=0),
+        sa.Column("progress_done", sa.Integer(), nullable=False, default=0),
+        sa.Column("cancel_requested", sa.Boolean(), nullable=False, default=False),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("completed_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_background_jobs_user_id", "background_jobs", ["user_id"])
+    op.create_index("ix_background_jobs_job_type", "background_jobs", ["job_type"])
+    op.create_index("ix_background_jobs_status", "background_jobs", ["status"])
+    op.create_index("ix_background_jobs_resource_id", "background_jobs", ["resource_id"])
+
+
+def downgrade():
+    op.drop_index("ix_background_jobs_resource_id", table_name="background_jobs")
+    op.drop_index("ix_background_jobs_status", table_name="background_jobs")
+    op.drop_index("ix_background_jobs_job_type", table_name="background_jobs")
+    op.drop_index("ix_background_jobs_user_id", table_name="background_jobs")
+    op.drop_table("background_jobs")
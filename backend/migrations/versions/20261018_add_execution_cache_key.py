@@ -0,0 +1,24 @@
+"""Add result cache key to execution history
+
+Revision ID: 20261018_exec_cache_key
+Revises: 20261018_background_jobs
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261018_exec_cache_key"
+down_revision = "20261018_background_jobs"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("execution_history", sa.Column("cache_key", sa.String(64), nullable=True))
+    op.create_index("ix_execution_history_cache_key", "execution_history", ["cache_key"])
+
+
+def downgrade():
+    op.drop_index("ix_execution_history_cache_key", table_name="execution_history")
+    op.drop_column("execution_history", "cache_key")
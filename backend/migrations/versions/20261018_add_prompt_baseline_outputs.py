@@ -0,0 +1,43 @@
+"""Add memoized baseline outputs for prompt test suites
+
+Revision ID: 20261018_baseline_outputs
+Revises: 20261018_exec_cache_key
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261018_baseline_outputs"
+down_revision = "20261018_exec_cache_key"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "prompt_baseline_outputs",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("prompt_id", sa.Integer(), sa.ForeignKey("prompts.id"), nullable=False),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.Column("case_hash", sa.String(64), nullable=False),
+        sa.Column("model", sa.String(100), nullable=False),
+        sa.Column("temperature", sa.Float(), nullable=False, default=0.0),
+        sa.Column("output", sa.Text(), nullable=False),
+        sa.Column("score", sa.Float(), nullable=True),
+        sa.Column("response_time", sa.Float(), nullable=False, default=0.0),
+        sa.Column("total_tokens", sa.Integer(), nullable=False, default=0),
+        sa.Column("cost", sa.Float(), nullable=False, default=0.0),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_prompt_baseline_outputs_prompt_id", "prompt_baseline_outputs", ["prompt_id"])
+    op.create_index("ix_prompt_baseline_outputs_version", "prompt_baseline_outputs", ["version"])
+    op.create_index("ix_prompt_baseline_outputs_case_hash", "prompt_baseline_outputs", ["case_hash"])
+
+
+def downgrade():
+    op.drop_index("ix_prompt_baseline_outputs_case_hash", table_name="prompt_baseline_outputs")
+    op.drop_index("ix_prompt_baseline_outputs_version", table_name="prompt_baseline_outputs")
+    op.drop_index("ix_prompt_baseline_outputs_prompt_id", table_name="prompt_baseline_outputs")
+    op.drop_table("prompt_baseline_outputs")
@@ -0,0 +1,31 @@
+"""Add sensitive word dictionary version stamp
+
+Revision ID: 20261018_sensitive_word_ver
+Revises: 20261018_baseline_outputs
+Create Date: 2026-10-18
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "20261018_sensitive_word_ver"
+down_revision = "20261018_baseline_outputs"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    table = op.create_table(
+        "sensitive_word_versions",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("version", sa.Integer(), nullable=False, default=0),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+    )
+    # 唯一的版本行随表一起创建，修改敏感词时只需递增
+    op.bulk_insert(table, [{"id": 1, "version": 0, "updated_at": datetime.utcnow()}])
+
+
+def downgrade():
+    op.drop_table("sensitive_word_versions")
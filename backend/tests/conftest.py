@@ -6,11 +6,17 @@ from sqlmodel import SQLModel, Session, create_engine
 from sqlalchemy.pool import StaticPool
 from app.main import app
 from app.core import database
+from app.core.async_database import ThreadedSession, get_async_session
 from app.core.database import get_session
 from app.core.security import get_password_hash
 from app.models.user import User
 from app.core.access_control import RateLimitMiddleware
-from app.services import test_runner_service
+from app.api import batch_test as batch_test_api, run as run_api, security as security_api
+from app.services import job_service, openai_service, quota_engine as quota_engine_module, test_runner_service
+from app.services import result_cache as result_cache_module
+from app.services import sensitive_word_store as sensitive_word_store_module
+from app.services.ai_config_cache import ai_config_cache
+from app.services.result_cache import result_cache
 
 
 test_engine = create_engine(
@@ -20,6 +26,14 @@ test_engine = create_engine(
 )
 database.engine = test_engine
 test_runner_service.engine = test_engine
+job_service.engine = test_engine
+run_api.engine = test_engine
+security_api.engine = test_engine
+quota_engine_module.engine = test_engine
+sensitive_word_store_module.engine = test_engine
+openai_service.engine = test_engine
+result_cache_module.engine = test_engine
+batch_test_api.engine = test_engine
 for middleware in app.user_middleware:
     if middleware.cls is RateLimitMiddleware:
         middleware.kwargs["enabled"] = False
@@ -33,6 +47,10 @@ def db_session():
     """创建测试数据库会话"""
     SQLModel.metadata.drop_all(test_engine)
     SQLModel.metadata.create_all(test_engine)
+    result_cache.clear()
+    ai_config_cache.clear()
+    quota_engine_module.quota_engine.reset()
+    sensitive_word_store_module.sensitive_word_store.reset()
     session = Session(test_engine)
     yield session
     session.close()
@@ -44,7 +62,11 @@ async def client(db_session):
     async def override_get_session():
         yield db_session
 
+    async def override_get_async_session():
+        yield ThreadedSession(db_session)
+
     app.dependency_overrides[get_session] = override_get_session
+    app.dependency_overrides[get_async_session] = override_get_async_session
 
     transport = ASGITransport(app=app)
     async with AsyncClient(transport=transport, base_url="http://test") as ac:
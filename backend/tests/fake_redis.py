@@ -0,0 +1,205 @@
+"""
+本地 Redis 协议模拟服务（测试 RedisStateBackend 使用）
+
+只实现状态后端用到的命令：GET / MGET / SET / INCRBYFLOAT / PEXPIRE / DEL / SCAN /
+WATCH / UNWATCH / MULTI / EXEC / DISCARD / PING / AUTH / SELECT，并按 Redis 语义处理 WATCH 冲突。
+"""
+import fnmatch
+import socket
+import socketserver
+import threading
+import time
+
+
+class _Store:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data = {}  # key -> [value bytes, 过期时间毫秒或 None]
+        self.versions = {}  # key -> 修改版本号
+
+    def _now(self):
+        return int(time.time() * 1000)
+
+    def _touch(self, key):
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def _get(self, key):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= self._now():
+            del self.data[key]
+            self._touch(key)
+            return None
+        return entry[0]
+
+    def version(self, key):
+        self._get(key)
+        return self.versions.get(key, 0)
+
+    def execute(self, args):
+        name = args[0].decode().upper()
+        params = args[1:]
+        if name in ("PING",):
+            return "+PONG"
+        if name in ("AUTH", "SELECT"):
+            return "+OK"
+        if name == "GET":
+            return self._get(params[0])
+        if name == "MGET":
+            return [self._get(key) for key in params]
+        if name == "SET":
+            key, value = params[0], params[1]
+            options = [p.decode().upper() for p in params[2:]]
+            expires = None
+            if "PX" in options:
+                expires = self._now() + int(options[options.index("PX") + 1])
+            self.data[key] = [value, expires]
+            self._touch(key)
+            return "+OK"
+        if name == "INCRBYFLOAT":
+            key = params[0]
+            current = self._get(key)
+            value = float(current or 0) + float(params[1])
+            expires = self.data[key][1] if key in self.data else None
+            encoded = repr(value).encode()
+            self.data[key] = [encoded, expires]
+            self._touch(key)
+            return encoded
+        if name == "PEXPIRE":
+            key = params[0]
+            if self._get(key) is None:
+                return 0
+            self.data[key][1] = self._now() + int(params[1])
+            self._touch(key)
+            return 1
+        if name == "DEL":
+            removed = 0
+            for key in params:
+                if self._get(key) is not None:
+                    del self.data[key]
+                    self._touch(key)
+                    removed += 1
+            return removed
+        if name == "SCAN":
+            pattern = b"*"
+            if b"MATCH" in [p.upper() for p in params]:
+                upper = [p.upper() for p in params]
+                pattern = params[upper.index(b"MATCH") + 1]
+            keys = [k for k in list(self.data) if self._get(k) is not None
+                    and fnmatch.fnmatchcase(k.decode(), pattern.decode())]
+            return [b"0", keys]
+        return Exception(f"ERR unknown command '{name}'")
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.server.clients.append(self.connection)
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def _encode(self, value) -> bytes:
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, Exception):
+            return b"-" + str(value).encode() + b"\r\n"
+        if isinstance(value, str) and value.startswith("+"):
+            return value.encode() + b"\r\n"
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, bytes):
+            return b"$%d\r\n%s\r\n" % (len(value), value)
+        if isinstance(value, list):
+            return b"*%d\r\n" % len(value) + b"".join(self._encode(item) for item in value)
+        raise TypeError(value)
+
+    def handle(self):
+        store: _Store = self.server.store
+        watched = {}
+        queued = None
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            name = args[0].decode().upper()
+            with store.lock:
+                if name == "WATCH":
+                    for key in args[1:]:
+                        watched[key] = store.version(key)
+                    reply = "+OK"
+                elif name == "UNWATCH":
+                    watched = {}
+                    reply = "+OK"
+                elif name == "MULTI":
+                    queued = []
+                    reply = "+OK"
+                elif name == "DISCARD":
+                    queued = None
+                    watched = {}
+                    reply = "+OK"
+                elif name == "EXEC":
+                    dirty = any(store.version(key) != version for key, version in watched.items())
+                    if dirty:
+                        reply = None
+                        self.wfile.write(b"*-1\r\n")
+                    else:
+                        reply = [store.execute(command) for command in queued or []]
+                    queued = None
+                    watched = {}
+                    if dirty:
+                        continue
+                    if self.server.drop_exec_reply:
+                        # 模拟事务已执行、响应送达前连接断开
+                        self.server.drop_exec_reply = False
+                        return
+                elif queued is not None:
+                    queued.append(args)
+                    reply = "+QUEUED"
+                else:
+                    reply = store.execute(args)
+            self.wfile.write(self._encode(reply))
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.store = _Store()
+        self.clients = []
+        # 为 True 时下一个 EXEC 执行后不返回响应，直接断开连接
+        self.drop_exec_reply = False
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address
+        return f"redis://{host}:{port}/0"
+
+    def disconnect_clients(self):
+        """关闭全部客户端连接（模拟空闲超时或服务重启）"""
+        for connection in self.clients:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.clients = []
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
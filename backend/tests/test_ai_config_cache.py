@@ -0,0 +1,197 @@
+"""
+AI 配置解析缓存测试：重复调用不查库不解密、配置增删改和全局配置变更后失效、TTL 过期
+"""
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from httpx import AsyncClient
+from sqlmodel import Session
+
+from app.core.security import get_password_hash
+from app.models.ai_config import AIConfig
+from app.models.user import User
+from app.services import openai_service
+from app.services.ai_config_cache import AIConfigCache, ai_config_cache
+from app.services.encryption_service import EncryptionService
+from app.services.openai_service import OpenAIService
+
+
+async def get_token(client: AsyncClient, username: str, password: str) -> str:
+    response = await client.post(
+        "/api/auth/login",
+        json={"username": username, "password": password},
+    )
+    return (response.json().get("data") or {}).get("access_token", "")
+
+
+@pytest.fixture(autouse=True)
+def encryption_key(monkeypatch: pytest.MonkeyPatch):
+    """测试用的加密主密钥"""
+    monkeypatch.setattr(EncryptionService, "_MASTER_KEY", "test-master-key")
+    monkeypatch.setattr(EncryptionService, "_SALT", "test-salt")
+    monkeypatch.setattr(EncryptionService, "_cipher", None)
+
+
+@pytest.fixture
+def admin_user(db_session: Session):
+    user = User(
+        username="adminuser",
+        email="admin@example.com",
+        hashed_password=get_password_hash("testpassword123"),
+        role="admin",
+        is_active=True,
+    )
+    db_session.add(user)
+    db_session.commit()
+    db_session.refresh(user)
+    return user
+
+
+@pytest.fixture
+def decrypt_calls(monkeypatch: pytest.MonkeyPatch):
+    """统计 API Key 解密次数（每次未命中缓存的解析解密一次）"""
+    calls = []
+    decrypt = EncryptionService.decrypt_api_key
+
+    def counting_decrypt(value):
+        calls.append(value)
+        return decrypt(value)
+
+    monkeypatch.setattr(EncryptionService, "decrypt_api_key", staticmethod(counting_decrypt))
+    return calls
+
+
+def add_config(db: Session, user_id: int, model: str, is_global: bool = False) -> AIConfig:
+    config = AIConfig(
+        user_id=user_id,
+        name=f"{model} config",
+        base_url="https://api.example.com/v1",
+        api_key=EncryptionService.encrypt_api_key(f"sk-{model}"),
+        model=model,
+        is_global=is_global,
+    )
+    db.add(config)
+    db.commit()
+    db.refresh(config)
+    return config
+
+
+def test_repeated_resolution_skips_db_and_decrypt(db_session: Session, test_user, decrypt_calls):
+    config = add_config(db_session, test_user.id, "model-a")
+    hits_before = ai_config_cache.stats()["hits"]
+
+    for _ in range(5):
+        resolved, api_key = OpenAIService._resolve_ai_config(db_session, test_user.id)
+        assert (resolved.id, resolved.model, api_key) == (config.id, "model-a", "sk-model-a")
+    resolved, _ = OpenAIService._resolve_ai_config(db_session, test_user.id, config.id)
+    assert resolved.id == config.id
+
+    # 不指定配置和指定配置 ID 各解析一次
+    assert len(decrypt_calls) == 2
+    assert ai_config_cache.stats()["hits"] - hits_before == 4
+
+
+def test_errors_are_not_cached(db_session: Session, test_user, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(openai_service.settings, "ENABLE_DEFAULT_AI", False)
+    with pytest.raises(ValueError, match="未找到 AI 配置"):
+        OpenAIService._resolve_ai_config(db_session, test_user.id)
+
+    add_config(db_session, test_user.id, "model-a")
+    resolved, _ = OpenAIService._resolve_ai_config(db_session, test_user.id)
+    assert resolved.model == "model-a"
+
+
+def test_ttl_expiry(monkeypatch: pytest.MonkeyPatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.services.ai_config_cache.time.monotonic", lambda: now[0])
+    cache = AIConfigCache(ttl=10)
+    cache.set(1, None, "resolved")
+    assert cache.get(1) == "resolved"
+    now[0] += 11
+    assert cache.get(1) is None
+    assert cache.stats()["size"] == 0
+
+    disabled = AIConfigCache(ttl=0)
+    disabled.set(1, None, "resolved")
+    assert disabled.get(1) is None
+
+
+def test_concurrent_access_from_threads():
+    # 频繁切换线程，放大并发读写 OrderedDict 的竞争
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    cache = AIConfigCache(max_size=8, ttl=60)
+
+    def worker(seed: int):
+        for i in range(2000):
+            user_id = (seed + i) % 16
+            cache.set(user_id, None, f"config-{user_id}")
+            resolved = cache.get(user_id)
+            assert resolved in (None, f"config-{user_id}")
+            if i % 7 == 0:
+                cache.invalidate(user_id + 1)
+        return seed
+
+    try:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            assert sorted(executor.map(worker, range(8))) == list(range(8))
+    finally:
+        sys.setswitchinterval(interval)
+
+    stats = cache.stats()
+    assert stats["size"] <= 8
+    assert stats["hits"] + stats["misses"] == 8 * 2000
+
+
+@pytest.mark.asyncio
+async def test_ai_config_endpoints_invalidate_user_cache(
+    client: AsyncClient, db_session: Session, test_user, test_user2, decrypt_calls
+):
+    other = add_config(db_session, test_user2.id, "other-model")
+    OpenAIService._resolve_ai_config(db_session, test_user2.id)
+
+    token = await get_token(client, "testuser", "testpassword123")
+    headers = {"Authorization": f"Bearer {token}"}
+    response = await client.post(
+        "/api/ai-config/create",
+        headers=headers,
+        json={"name": "mine", "base_url": "https://api.example.com/v1", "api_key": "sk-mine", "model": "model-a"},
+    )
+    config_id = response.json()["data"]["id"]
+    assert OpenAIService._resolve_ai_config(db_session, test_user.id)[0].model == "model-a"
+
+    await client.put(f"/api/ai-config/{config_id}", headers=headers, json={"model": "model-b"})
+    assert OpenAIService._resolve_ai_config(db_session, test_user.id)[0].model == "model-b"
+
+    await client.delete(f"/api/ai-config/{config_id}", headers=headers)
+    with pytest.raises(ValueError):
+        OpenAIService._resolve_ai_config(db_session, test_user.id, config_id)
+
+    # 其他用户的缓存不受影响
+    calls = len(decrypt_calls)
+    assert OpenAIService._resolve_ai_config(db_session, test_user2.id)[0].id == other.id
+    assert len(decrypt_calls) == calls
+
+
+@pytest.mark.asyncio
+async def test_global_config_changes_invalidate_all_users(
+    client: AsyncClient, db_session: Session, admin_user, test_user, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(openai_service.settings, "ENABLE_DEFAULT_AI", False)
+    add_config(db_session, admin_user.id, "global-a", is_global=True)
+    assert OpenAIService._resolve_ai_config(db_session, test_user.id)[0].model == "global-a"
+
+    token = await get_token(client, "adminuser", "testpassword123")
+    headers = {"Authorization": f"Bearer {token}"}
+    response = await client.put(
+        "/api/system/global-ai-config",
+        headers=headers,
+        json={"enable_default_ai": True, "default_ai_model": "global-b"},
+    )
+    assert response.json()["code"] == 0
+    assert OpenAIService._resolve_ai_config(db_session, test_user.id)[0].model == "global-b"
+
+    await client.put("/api/system/global-ai-config", headers=headers, json={"enable_default_ai": False})
+    with pytest.raises(ValueError, match="未找到 AI 配置"):
+        OpenAIService._resolve_ai_config(db_session, test_user.id)
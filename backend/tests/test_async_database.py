@@ -0,0 +1,146 @@
+"""
+异步数据库会话测试：驱动 URL 转换、线程池回退不阻塞事件循环、异步驱动可用时的 AsyncSession
+"""
+import asyncio
+import threading
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import event
+from sqlmodel import Session, SQLModel, select
+
+from app.core.async_database import ThreadedSession, create_async_db_engine, get_async_session, to_async_url
+from app.main import app
+from app.models.execution_history import ExecutionHistory
+
+
+async def get_token(client: AsyncClient, username: str, password: str) -> str:
+    response = await client.post(
+        "/api/auth/login",
+        json={"username": username, "password": password},
+    )
+    return (response.json().get("data") or {}).get("access_token", "")
+
+
+def test_to_async_url():
+    assert to_async_url("mysql+pymysql://u:p@db:3306/app") == "mysql+aiomysql://u:p@db:3306/app"
+    assert to_async_url("mysql://u:p@db/app") == "mysql+aiomysql://u:p@db/app"
+    assert to_async_url("sqlite:///./app.db") == "sqlite+aiosqlite:///./app.db"
+    # 已经是异步驱动或未知驱动时保持不变
+    assert to_async_url("sqlite+aiosqlite:///x.db") == "sqlite+aiosqlite:///x.db"
+
+
+@pytest.mark.asyncio
+async def test_threaded_session_runs_off_event_loop(db_session: Session, test_user):
+    session = ThreadedSession(db_session)
+    loop_thread = threading.get_ident()
+    threads = []
+
+    def query(db: Session, user_id: int):
+        threads.append(threading.get_ident())
+        return db.exec(select(ExecutionHistory).where(ExecutionHistory.user_id == user_id)).all()
+
+    # 数据库操作期间事件循环仍可调度其他协程
+    ticks = []
+
+    async def ticker():
+        for _ in range(3):
+            ticks.append(1)
+            await asyncio.sleep(0)
+
+    results, _ = await asyncio.gather(session.run_sync(query, test_user.id), ticker())
+    assert results == []
+    assert threads and threads[0] != loop_thread
+    assert len(ticks) == 3
+
+    session.add(ExecutionHistory(user_id=test_user.id, prompt_content="p", final_prompt="p", model="m", output="o"))
+    await session.commit()
+    rows = (await session.exec(select(ExecutionHistory))).all()
+    assert len(rows) == 1
+    assert (await session.get(ExecutionHistory, rows[0].id)).output == "o"
+
+
+@pytest.mark.asyncio
+async def test_async_driver_session(tmp_path):
+    pytest.importorskip("aiosqlite")
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+    engine = create_async_db_engine(f"sqlite+aiosqlite:///{tmp_path / 'async.db'}")
+    assert engine is not None
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            session.add(ExecutionHistory(user_id=1, prompt_content="p", final_prompt="p", model="m", output="o"))
+            await session.commit()
+            rows = (await session.exec(select(ExecutionHistory))).all()
+            assert [row.output for row in rows] == ["o"]
+    finally:
+        await engine.dispose()
+
+
+def test_missing_driver_falls_back(monkeypatch: pytest.MonkeyPatch):
+    def missing_driver(*args, **kwargs):
+        raise ImportError("No module named 'aiomysql'")
+
+    monkeypatch.setattr("app.core.async_database.create_async_engine", missing_driver)
+    assert create_async_db_engine("mysql+aiomysql://u:p@db/app") is None
+
+
+@pytest.mark.asyncio
+async def test_async_endpoints(client: AsyncClient, db_session: Session, test_user):
+    db_session.add(ExecutionHistory(user_id=test_user.id, prompt_content="p", final_prompt="p", model="m", output="o"))
+    db_session.commit()
+    token = await get_token(client, "testuser", "testpassword123")
+    headers = {"Authorization": f"Bearer {token}"}
+
+    history = (await client.get("/api/execution_history/list", headers=headers)).json()
+    assert history["code"] == 0
+    assert history["data"]["total"] == 1
+
+    quota = (await client.get("/api/quota/status", headers=headers)).json()
+    assert quota["code"] == 0
+
+    prompts = (await client.get("/api/prompt/list", headers=headers)).json()
+    assert prompts["code"] == 0
+
+
+@pytest.mark.asyncio
+async def test_authentication_lookup_runs_off_event_loop(client: AsyncClient, db_session: Session, test_user):
+    token = await get_token(client, "testuser", "testpassword123")
+    loop_thread = threading.get_ident()
+    user_query_threads = []
+
+    def record_thread(conn, cursor, statement, parameters, context, executemany):
+        if "FROM users" in statement:
+            user_query_threads.append(threading.get_ident())
+
+    # 清空会话的对象缓存，认证时必须真正查询用户
+    db_session.expunge_all()
+    engine = db_session.get_bind()
+    event.listen(engine, "before_cursor_execute", record_thread)
+    try:
+        response = await client.get("/api/prompt/list", headers={"Authorization": f"Bearer {token}"})
+    finally:
+        event.remove(engine, "before_cursor_execute", record_thread)
+
+    assert response.json()["code"] == 0
+    assert user_query_threads
+    assert loop_thread not in user_query_threads
+
+
+@pytest.mark.asyncio
+async def test_sync_session_endpoint_does_not_open_async_session(client: AsyncClient, db_session: Session, test_user):
+    token = await get_token(client, "testuser", "testpassword123")
+    opened = []
+
+    async def counting_get_async_session():
+        opened.append(True)
+        yield ThreadedSession(db_session)
+
+    app.dependency_overrides[get_async_session] = counting_get_async_session
+    response = await client.get("/api/auth/me", headers={"Authorization": f"Bearer {token}"})
+
+    # 认证使用自己的短会话，使用同步会话的接口不会再额外借出一个异步会话
+    assert response.json()["code"] == 0
+    assert opened == []
@@ -0,0 +1,160 @@
+"""
+批量内容审核测试：进程池与内联审核结果一致、按输入顺序返回、词库变更后重建进程池
+"""
+import copy
+import json
+
+import pytest
+from httpx import AsyncClient
+from sqlmodel import Session, select
+
+from app.models.audit_log import AuditLog
+from app.services.audit_pool import AuditPool
+from app.services.security_service import SecurityService
+
+
+async def get_token(client: AsyncClient, username: str, password: str) -> str:
+    response = await client.post(
+        "/api/auth/login",
+        json={"username": username, "password": password},
+    )
+    return (response.json().get("data") or {}).get("access_token", "")
+
+
+def parse_sse(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+CONTENTS = [
+    "正常的内容",
+    "这里有暴力和血腥内容",
+    "联系电话 13812345678，邮箱 someone@example.com",
+    "身份证 110101199003074578",
+    "",
+    "普通文本" * 50,
+]
+
+
+def without_time(results):
+    """审核时间每次都不同，比较时去掉"""
+    return [{key: value for key, value in result.items() if key != "audit_time"} for result in results]
+
+
+def expected(contents, auto_mask=False):
+    results = []
+    for index, content in enumerate(contents):
+        result = SecurityService.content_audit(content, auto_mask)
+        result["index"] = index
+        results.append(result)
+    return without_time(results)
+
+
+@pytest.fixture(autouse=True)
+def restore_word_list():
+    original = copy.deepcopy(SecurityService.SENSITIVE_WORDS)
+    yield
+    SecurityService.set_sensitive_words(original)
+
+
+@pytest.fixture
+def pool():
+    pool = AuditPool(workers=2, inline_threshold=100000, chunk_size=2)
+    yield pool
+    pool.shutdown()
+
+
+def test_should_inline_by_threshold():
+    pool = AuditPool(workers=4, inline_threshold=100)
+    assert pool.should_inline(["a" * 200]) is True  # 只有一条
+    assert pool.should_inline(["a" * 40, "b" * 40]) is True
+    assert pool.should_inline(["a" * 60, "b" * 60]) is False
+    assert AuditPool(workers=1, inline_threshold=0).should_inline(["a", "b"]) is True
+
+
+def test_chunks_cover_input_in_order():
+    pool = AuditPool(workers=2, chunk_size=0)
+    contents = [str(i) for i in range(19)]
+    chunks = pool._chunks(contents)
+    assert [start for start, _ in chunks] == list(range(0, 19, 3))
+    assert [item for _, chunk in chunks for item in chunk] == contents
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("auto_mask", [False, True])
+async def test_pool_results_match_inline(pool, auto_mask):
+    contents = CONTENTS * 3
+    inline_results = await pool.audit(contents, auto_mask, inline=True)
+    pool_results = await pool.audit(contents, auto_mask, inline=False)
+    assert without_time(inline_results) == expected(contents, auto_mask)
+    assert without_time(pool_results) == without_time(inline_results)
+
+
+@pytest.mark.asyncio
+async def test_pool_reloads_when_word_list_changes(pool):
+    content = ["包含自定义违禁词的文本", "正常的内容"]
+    first = await pool.audit(content, inline=False)
+    assert first[0]["is_approved"] is True
+    executor = pool._executor
+
+    SecurityService.add_custom_sensitive_word("自定义违禁词", "custom")
+    second = await pool.audit(content, inline=False)
+    assert pool._executor is not executor
+    assert second[0]["is_approved"] is False
+    assert second[0]["sensitive_words"]["violations"][0]["word"] == "自定义违禁词"
+
+
+@pytest.mark.asyncio
+async def test_batch_audit_api(client: AsyncClient, test_user, db_session: Session):
+    token = await get_token(client, "testuser", "testpassword123")
+    response = await client.post(
+        "/api/security/audit/batch",
+        json={"contents": CONTENTS, "auto_mask": True},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    data = response.json()
+    assert data["code"] == 0
+    assert data["data"]["total"] == len(CONTENTS)
+    assert without_time(data["data"]["results"]) == expected(CONTENTS, auto_mask=True)
+    assert data["data"]["blocked"] == 1
+
+    log = db_session.exec(select(AuditLog).where(AuditLog.action == "content_audit_blocked")).one()
+    assert log.details == {"blocked_indexes": [1]}
+
+
+@pytest.mark.asyncio
+async def test_batch_audit_api_stream(client: AsyncClient, test_user, db_session: Session):
+    token = await get_token(client, "testuser", "testpassword123")
+    response = await client.post(
+        "/api/security/audit/batch",
+        json={"contents": CONTENTS, "stream": True},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    assert [event for event, _ in events] == ["item"] * len(CONTENTS) + ["done"]
+    assert without_time([data for _, data in events[:-1]]) == expected(CONTENTS)
+    # 未脱敏时包含敏感信息的内容也不通过
+    assert events[-1][1] == {"total": len(CONTENTS), "blocked": 3}
+
+    assert db_session.exec(select(AuditLog).where(AuditLog.action == "content_audit_blocked")).one()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("payload", [
+    {"contents": []},
+    {"contents": "不是列表"},
+    {"contents": ["ok", 1]},
+    {"contents": ["x"] * 1001},
+])
+async def test_batch_audit_api_validation(client: AsyncClient, test_user, payload):
+    token = await get_token(client, "testuser", "testpassword123")
+    response = await client.post(
+        "/api/security/audit/batch",
+        json=payload,
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.json()["code"] == 4001
@@ -332,7 +332,7 @@ async def test_run_prompt_test_suite_with_mocked_runner(
     run_response = await client.post(
         f"/api/test-suite/{suite_id}/run",
         headers=auth_headers(token),
-        json={"candidate_version": 1, "enable_evaluation": False},
+        json={"candidate_version": 1, "enable_evaluation": False, "sync": True},
     )
 
     assert run_response.status_code == 200
@@ -380,7 +380,7 @@ async def test_prompt_test_suite_run_records_failed_status_for_missing_version(
     response = await client.post(
         f"/api/test-suite/{suite.id}/run",
         headers=auth_headers(token),
-        json={"candidate_version": 999, "enable_evaluation": False},
+        json={"candidate_version": 999, "enable_evaluation": False, "sync": True},
     )
 
     assert response.status_code == 200
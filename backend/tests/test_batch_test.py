@@ -0,0 +1,220 @@
+"""批量测试并发执行测试"""
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import event
+from sqlmodel import Session, select
+
+from app.models.prompt import Prompt
+from app.models.quality_evaluation import BatchTestResult, QualityEvaluation
+from app.services import openai_service
+from app.services.ai_config_cache import ResolvedAIConfig
+from app.services.batch_test_service import BatchTestService
+from app.services.openai_service import OpenAIService
+
+
+async def get_token(client: AsyncClient, username: str, password: str) -> str:
+    response = await client.post(
+        "/api/auth/login",
+        json={"username": username, "password": password},
+    )
+    return (response.json().get("data") or {}).get("access_token", "")
+
+
+@pytest.mark.asyncio
+async def test_batch_test_runs_cases_concurrently_and_isolates_failures(
+    client: AsyncClient,
+    db_session: Session,
+    monkeypatch: pytest.MonkeyPatch,
+    test_user,
+    test_prompt: Prompt,
+):
+    in_flight = 0
+    max_in_flight = 0
+
+    async def fake_chat_completion(**kwargs):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        try:
+            # 让先提交的用例更晚返回，验证结果仍按用例顺序排列
+            await asyncio.sleep(0.05 if "case-1" in kwargs["prompt"] else 0.01)
+            if "boom" in kwargs["prompt"]:
+                raise ValueError("AI 调用失败: boom")
+            return {
+                "output": f"echo {kwargs['prompt']}",
+                "input_tokens": 3,
+                "output_tokens": 4,
+                "total_tokens": 7,
+                "cost": 0.001,
+            }
+        finally:
+            in_flight -= 1
+
+    monkeypatch.setattr(
+        "app.services.batch_test_service.OpenAIService.chat_completion",
+        fake_chat_completion,
+    )
+    test_prompt.content = "Input: {{value}}"
+    db_session.add(test_prompt)
+    db_session.commit()
+
+    token = await get_token(client, "testuser", "testpassword123")
+    response = await client.post(
+        "/api/batch-test",
+        headers={"Authorization": f"Bearer {token}"},
+        json={
+            "test_name": "concurrent",
+            "prompt_id": test_prompt.id,
+            "enable_evaluation": False,
+            "sync": True,
+            "test_cases": [
+                {"variables": {"value": "case-1"}},
+                {"variables": {"value": "boom"}},
+                {"variables": {"value": "case-3"}},
+                {"variables": {"value": "case-4"}},
+            ],
+        },
+    )
+
+    data = response.json()
+    assert data["code"] == 0
+    results = data["data"]["results"]
+    assert [item["test_case_index"] for item in results] == [1, 2, 3, 4]
+    assert results[0]["actual_output"] == "echo Input: case-1"
+    assert results[1]["success"] is False
+    assert "boom" in results[1]["error"]
+    assert data["data"]["success_count"] == 3
+    assert data["data"]["failure_count"] == 1
+    assert max_in_flight > 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_cases_keep_request_session_on_event_loop(
+    db_session: Session,
+    monkeypatch: pytest.MonkeyPatch,
+    test_user,
+    test_prompt: Prompt,
+):
+    loop_thread = threading.get_ident()
+    request_session_threads = set()
+    history_lookup_threads = []
+    ai_config_sessions = []
+
+    def track_request_session(orm_execute_state):
+        request_session_threads.add(threading.get_ident())
+
+    def track_history_lookup(conn, cursor, statement, parameters, context, executemany):
+        if "FROM execution_history" in statement:
+            history_lookup_threads.append(threading.get_ident())
+
+    def load_ai_config(db, user_id, ai_config_id=None):
+        ai_config_sessions.append(db)
+        return ResolvedAIConfig(None, "test", "http://llm", "m", "key")
+
+    async def create(**kwargs):
+        await asyncio.sleep(0.01)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="ok"), finish_reason="stop")],
+            usage=SimpleNamespace(prompt_tokens=3, completion_tokens=1, total_tokens=4),
+        )
+
+    @asynccontextmanager
+    async def acquire(**kwargs):
+        yield SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    monkeypatch.setattr(OpenAIService, "_load_ai_config", staticmethod(load_ai_config))
+    monkeypatch.setattr(openai_service.openai_client_pool, "acquire", acquire)
+
+    batch_test = BatchTestResult(
+        user_id=test_user.id,
+        test_name="sessions",
+        prompt_id=test_prompt.id,
+        test_cases=[{"variables": {"value": str(i)}} for i in range(6)],
+        results=[],
+        total_cases=6,
+        model="m",
+        temperature=0.0,
+    )
+    db_session.add(batch_test)
+    db_session.commit()
+
+    event.listen(db_session, "do_orm_execute", track_request_session)
+    event.listen(db_session.get_bind(), "before_cursor_execute", track_history_lookup)
+    try:
+        batch_test = await BatchTestService.run_batch(
+            db=db_session,
+            batch_test=batch_test,
+            prompt_content="Input: {{value}}",
+            enable_evaluation=False,
+            concurrency=4,
+        )
+    finally:
+        event.remove(db_session, "do_orm_execute", track_request_session)
+        event.remove(db_session.get_bind(), "before_cursor_execute", track_history_lookup)
+
+    assert batch_test.success_count == 6
+    # 请求的 Session 只在事件循环线程中使用；AI 配置和结果缓存的数据库查询在线程池中使用独立会话
+    assert request_session_threads == {loop_thread}
+    assert ai_config_sessions and all(db is not db_session for db in ai_config_sessions)
+    assert history_lookup_threads and loop_thread not in history_lookup_threads
+
+
+@pytest.mark.asyncio
+async def test_evaluation_rows_are_saved_with_each_case_result(
+    db_session: Session,
+    monkeypatch: pytest.MonkeyPatch,
+    test_user,
+    test_prompt: Prompt,
+):
+    pending_during_calls = []
+
+    async def fake_chat_completion(**kwargs):
+        await asyncio.sleep(0.01)
+        pending_during_calls.append(len(db_session.new))
+        return {"output": f"echo {kwargs['prompt']}", "input_tokens": 3, "output_tokens": 4,
+                "total_tokens": 7, "cost": 0.001}
+
+    async def fake_evaluate(**kwargs):
+        await asyncio.sleep(0.01)
+        pending_during_calls.append(len(db_session.new))
+        if "bad" in kwargs["prompt_content"]:
+            raise ValueError("evaluator down")
+        return {"overall_score": 8}
+
+    monkeypatch.setattr("app.services.batch_test_service.OpenAIService.chat_completion", fake_chat_completion)
+    monkeypatch.setattr(
+        "app.services.batch_test_service.EvaluationService.evaluate_output_quality", fake_evaluate
+    )
+
+    values = ["a", "bad", "c", "d"]
+    batch_test = BatchTestResult(
+        user_id=test_user.id,
+        test_name="evaluations",
+        prompt_id=test_prompt.id,
+        test_cases=[{"variables": {"value": value}} for value in values],
+        results=[],
+        total_cases=len(values),
+        model="m",
+        temperature=0.7,
+    )
+    db_session.add(batch_test)
+    db_session.commit()
+
+    batch_test = await BatchTestService.run_batch(
+        db=db_session,
+        batch_test=batch_test,
+        prompt_content="Input: {{value}}",
+        enable_evaluation=True,
+        concurrency=4,
+    )
+
+    # 用例执行期间会话中没有未提交的对象；评测失败的用例不影响其他用例的评测记录
+    assert set(pending_during_calls) == {0}
+    evaluations = db_session.exec(select(QualityEvaluation)).all()
+    assert sorted(item.prompt_content for item in evaluations) == ["Input: a", "Input: c", "Input: d"]
+    assert [item["quality_score"] for item in batch_test.results] == [8, 0, 8, 8]
@@ -0,0 +1,196 @@
+"""
+费用预估测试：批量计数与逐条计数一致、预估用量构成、配额不足时在调用模型之前拒绝
+"""
+import pytest
+from httpx import AsyncClient
+from sqlmodel import Session
+
+from app.models.prompt import Prompt
+from app.models.test_suite import PromptTestSuite
+from app.services.cost_estimator import CostEstimator
+from app.services.evaluation_service import EvaluationService
+from app.services.quota_service import QuotaService
+from app.utils.prompt_template import replace_variables
+from app.utils.token_counter import count_tokens, count_tokens_batch, estimate_cost
+
+
+async def get_token(client: AsyncClient, username: str, password: str) -> str:
+    response = await client.post(
+        "/api/auth/login",
+        json={"username": username, "password": password},
+    )
+    return (response.json().get("data") or {}).get("access_token", "")
+
+
+def forbid_llm_calls(monkeypatch: pytest.MonkeyPatch):
+    async def fail(**kwargs):
+        raise AssertionError("预检未通过时不应调用模型")
+
+    monkeypatch.setattr("app.services.openai_service.OpenAIService.chat_completion", fail)
+
+
+def test_count_tokens_batch_matches_single_counts():
+    texts = ["翻译：你好 world", "", "翻译：你好 world", "Summarize 12345 items"]
+    assert count_tokens_batch(texts, "gpt-4") == [count_tokens(text, "gpt-4") for text in texts]
+    assert count_tokens_batch([], "gpt-4") == []
+
+
+def test_estimate_counts_execution_and_evaluation_calls():
+    test_cases = [
+        {"variables": {"topic": "春天"}, "expected_output": "春天来了，万物复苏"},
+        {"variables": {"topic": "秋天"}},
+    ]
+    estimate = CostEstimator.estimate(
+        templates=["写一首关于{{topic}}的诗"],
+        test_cases=test_cases,
+        model="gpt-4",
+        render=replace_variables,
+        enable_evaluation=True,
+        output_tokens=100,
+    )
+
+    prompts = ["写一首关于春天的诗", "写一首关于秋天的诗"]
+    outputs = [count_tokens("春天来了，万物复苏", "gpt-4"), 100]
+    execution, evaluation = estimate["breakdown"]
+
+    assert execution["purpose"] == "execution" and execution["model"] == "gpt-4"
+    assert execution["calls"] == 2
+    assert execution["input_tokens"] == sum(count_tokens(prompt, "gpt-4") for prompt in prompts)
+    assert execution["output_tokens"] == sum(outputs)
+    assert execution["cost"] == estimate_cost(execution["input_tokens"], execution["output_tokens"], "gpt-4")
+
+    assert evaluation["model"] == EvaluationService.EVALUATION_MODEL
+    assert evaluation["calls"] == 2
+    assert evaluation["input_tokens"] == sum(
+        count_tokens(EvaluationService._build_evaluation_prompt("", prompt), EvaluationService.EVALUATION_MODEL)
+        + output
+        for prompt, output in zip(prompts, outputs)
+    )
+
+    assert estimate["case_count"] == 2
+    assert estimate["call_count"] == 4
+    assert estimate["total_tokens"] == estimate["input_tokens"] + estimate["output_tokens"]
+    assert estimate["estimated_cost"] == round(execution["cost"] + evaluation["cost"], 6)
+    assert estimate["max_cost"] > estimate["estimated_cost"]
+
+
+def test_estimate_without_evaluation_and_with_baseline():
+    test_cases = [{"variables": {"x": "1"}}, {"variables": {"x": "2"}, "min_quality_score": 7}]
+    estimate = CostEstimator.estimate(
+        templates=["v2 {{x}}", "v1 {{x}}"],
+        test_cases=test_cases,
+        model="gpt-3.5-turbo",
+        render=replace_variables,
+        enable_evaluation=False,
+    )
+    # 两个版本各执行一次；只有设置了 min_quality_score 的用例需要评测
+    assert [(item["purpose"], item["calls"]) for item in estimate["breakdown"]] == [
+        ("execution", 4),
+        ("evaluation", 2),
+    ]
+
+
+def test_check_budget(db_session: Session, test_user):
+    QuotaService.set_user_quota(db_session, test_user.id, tokens_per_day=1000, cost_per_day=0.5)
+
+    assert QuotaService.check_budget(db_session, test_user.id, requests=10, tokens=1000, cost=0.5) == (True, None)
+
+    allowed, reason = QuotaService.check_budget(db_session, test_user.id, requests=10, tokens=1001, cost=0.1)
+    assert allowed is False
+    assert "今日 Token 使用量" in reason
+
+    QuotaService.record_usage(db_session, test_user.id, input_tokens=100, output_tokens=0, cost=0.3, model="gpt-4")
+    allowed, reason = QuotaService.check_budget(db_session, test_user.id, requests=1, tokens=10, cost=0.3)
+    assert allowed is False
+    assert "今日费用" in reason
+
+
+@pytest.mark.asyncio
+async def test_estimate_endpoint_compares_models(client: AsyncClient, test_user, test_prompt: Prompt):
+    token = await get_token(client, "testuser", "testpassword123")
+    response = await client.post(
+        "/api/batch-test/estimate",
+        headers={"Authorization": f"Bearer {token}"},
+        json={
+            "prompt_id": test_prompt.id,
+            "models": ["gpt-3.5-turbo", "gpt-4"],
+            "enable_evaluation": False,
+            "test_cases": [{"variables": {}} for _ in range(3)],
+        },
+    )
+
+    data = response.json()
+    assert data["code"] == 0
+    cheap, expensive = data["data"]["estimates"]
+    assert (cheap["model"], expensive["model"]) == ("gpt-3.5-turbo", "gpt-4")
+    assert cheap["call_count"] == expensive["call_count"] == 3
+    assert expensive["estimated_cost"] > cheap["estimated_cost"]
+    assert cheap["quota_allowed"] is True
+
+
+@pytest.mark.asyncio
+async def test_batch_test_rejected_before_llm_calls(
+    client: AsyncClient,
+    monkeypatch: pytest.MonkeyPatch,
+    db_session: Session,
+    test_user,
+    test_prompt: Prompt,
+):
+    forbid_llm_calls(monkeypatch)
+    QuotaService.set_user_quota(db_session, test_user.id, tokens_per_day=100)
+
+    token = await get_token(client, "testuser", "testpassword123")
+    response = await client.post(
+        "/api/batch-test",
+        headers={"Authorization": f"Bearer {token}"},
+        json={
+            "test_name": "over budget",
+            "prompt_id": test_prompt.id,
+            "sync": True,
+            "test_cases": [{"variables": {}} for _ in range(5)],
+        },
+    )
+
+    data = response.json()
+    assert data["code"] == 3006
+    assert "今日 Token 使用量" in data["message"]
+    assert data["data"]["call_count"] == 10
+    assert data["data"]["total_tokens"] > 100
+
+    response = await client.get("/api/batch-test/list", headers={"Authorization": f"Bearer {token}"})
+    assert response.json()["data"]["total"] == 0
+
+
+@pytest.mark.asyncio
+async def test_test_suite_run_rejected_before_llm_calls(
+    client: AsyncClient,
+    monkeypatch: pytest.MonkeyPatch,
+    db_session: Session,
+    test_user,
+    test_prompt: Prompt,
+):
+    forbid_llm_calls(monkeypatch)
+    suite = PromptTestSuite(
+        user_id=test_user.id,
+        prompt_id=test_prompt.id,
+        name="budget",
+        test_cases=[{"variables": {"x": str(i)}} for i in range(3)],
+    )
+    db_session.add(suite)
+    db_session.commit()
+    db_session.refresh(suite)
+    QuotaService.set_user_quota(db_session, test_user.id, requests_per_day=5)
+
+    token = await get_token(client, "testuser", "testpassword123")
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = await client.post(f"/api/test-suite/{suite.id}/estimate", headers=headers, json={})
+    data = response.json()
+    assert data["code"] == 0
+    assert data["data"]["call_count"] == 6
+    assert data["data"]["quota_allowed"] is False
+
+    response = await client.post(f"/api/test-suite/{suite.id}/run", headers=headers, json={"sync": True})
+    data = response.json()
+    assert data["code"] == 3006
+    assert "今日 API 调用次数" in data["message"]
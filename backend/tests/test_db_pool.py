@@ -0,0 +1,129 @@
+"""
+数据库连接池统计测试：等待时间直方图、超时与慢获取警告、连接存活时间、连接池配置、管理员接口
+"""
+import threading
+import time
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.pool import QueuePool
+from sqlmodel import Session
+
+from app.core import db_pool
+from app.core.db_pool import PoolMonitor, instrumented_pool_class, pool_options
+from app.core.security import get_password_hash
+from app.models.user import User
+
+
+async def get_token(client: AsyncClient, username: str, password: str) -> str:
+    response = await client.post(
+        "/api/auth/login",
+        json={"username": username, "password": password},
+    )
+    return (response.json().get("data") or {}).get("access_token", "")
+
+
+@pytest.fixture
+def monitored_engine(tmp_path):
+    """单连接、不允许溢出的连接池"""
+    monitor = PoolMonitor("test", slow_checkout=0.05)
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=instrumented_pool_class(QueuePool, monitor),
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.2,
+    )
+    monitor.attach(engine)
+    yield engine, monitor
+    engine.dispose()
+
+
+def test_checkout_stats(monitored_engine):
+    engine, monitor = monitored_engine
+    for _ in range(3):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    stats = monitor.stats(engine.pool)
+    assert stats["checkouts"] == 3 and stats["checkins"] == 3
+    assert stats["connects"] == 1  # 连接被复用
+    assert stats["wait"]["count"] == 3
+    assert stats["wait"]["histogram"][-1] == {"le": "+Inf", "count": 3}
+    assert stats["connection_age"]["open"] == 1
+    assert (stats["size"], stats["checked_out"], stats["checked_in"]) == (1, 0, 1)
+
+
+def test_timeout_and_slow_checkout_warnings(monitored_engine, caplog: pytest.LogCaptureFixture):
+    engine, monitor = monitored_engine
+    held = engine.connect()
+    assert monitor.stats(engine.pool)["checked_out"] == 1
+
+    with pytest.raises(exc.TimeoutError):
+        engine.connect()
+    assert monitor.stats()["timeouts"] == 1
+    assert "获取连接超时" in caplog.records[-1].getMessage()
+    assert caplog.records[-1].timed_out is True
+    caplog.clear()
+
+    # 另一个线程 0.1 秒后归还连接，本次获取较慢但成功
+    threading.Timer(0.1, held.close).start()
+    with engine.connect():
+        pass
+    stats = monitor.stats()
+    assert stats["slow_checkouts"] == 2
+    assert stats["wait"]["max"] >= 0.2
+    assert "获取连接较慢" in caplog.records[-1].getMessage()
+    assert caplog.records[-1].pool == "test"
+
+    # 统计在连接池重建后保留
+    engine.dispose()
+    with engine.connect():
+        pass
+    assert monitor.stats()["checkouts"] == 3
+
+
+def test_connection_age(monitored_engine):
+    engine, monitor = monitored_engine
+    with engine.connect():
+        pass
+    time.sleep(0.05)
+    assert monitor.stats()["connection_age"]["max"] >= 0.05
+    engine.dispose()
+    assert monitor.stats()["connection_age"]["open"] == 0
+    assert monitor.stats()["disconnects"] == 1
+
+
+def test_pool_options_follow_settings(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(db_pool.settings, "DB_POOL_SIZE", 3)
+    monkeypatch.setattr(db_pool.settings, "DB_MAX_OVERFLOW", 4)
+    monkeypatch.setattr(db_pool.settings, "DB_POOL_TIMEOUT", 5)
+    monkeypatch.setattr(db_pool.settings, "DB_POOL_RECYCLE", 60)
+    options = pool_options(PoolMonitor("x"))
+    assert (options["pool_size"], options["max_overflow"], options["pool_timeout"], options["pool_recycle"]) == (
+        3, 4, 5, 60
+    )
+    assert issubclass(options["poolclass"], QueuePool)
+
+
+@pytest.mark.asyncio
+async def test_db_pool_endpoint_requires_admin(client: AsyncClient, db_session: Session, test_user):
+    db_session.add(User(
+        username="adminuser",
+        email="admin@example.com",
+        hashed_password=get_password_hash("testpassword123"),
+        role="admin",
+        is_active=True,
+    ))
+    db_session.commit()
+
+    token = await get_token(client, "testuser", "testpassword123")
+    response = await client.get("/api/admin/db-pool", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 403
+
+    token = await get_token(client, "adminuser", "testpassword123")
+    response = await client.get("/api/admin/db-pool", headers={"Authorization": f"Bearer {token}"})
+    data = response.json()["data"]
+    assert data["sync"]["name"] == "sync"
+    assert "histogram" in data["sync"]["wait"]
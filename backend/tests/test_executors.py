@@ -0,0 +1,134 @@
+"""
+线程池测试：在事件循环外执行、排队与耗时统计、取消排队任务、登录的 bcrypt 校验不阻塞事件循环
+"""
+import asyncio
+import contextvars
+import threading
+import time
+
+import pytest
+from httpx import AsyncClient
+from sqlmodel import Session
+
+from app.core import executors
+from app.core.executors import ManagedExecutor
+from app.core.security import get_password_hash
+from app.models.user import User
+
+
+async def get_token(client: AsyncClient, username: str, password: str) -> str:
+    response = await client.post(
+        "/api/auth/login",
+        json={"username": username, "password": password},
+    )
+    return (response.json().get("data") or {}).get("access_token", "")
+
+
+@pytest.fixture
+def executor():
+    executor = ManagedExecutor("test", max_workers=1)
+    yield executor
+    executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_runs_in_worker_thread(executor: ManagedExecutor):
+    request_id = contextvars.ContextVar("request_id")
+    request_id.set("r-1")
+
+    def work(a, b=0):
+        return threading.current_thread().name, request_id.get(), a + b
+
+    name, value, total = await executor.run(work, 1, b=2)
+    assert name.startswith("test-pool")
+    assert (value, total) == ("r-1", 3)
+
+    with pytest.raises(ZeroDivisionError):
+        await executor.run(lambda: 1 / 0)
+
+    stats = executor.stats()
+    assert (stats["completed"], stats["errors"], stats["queued"], stats["active"]) == (2, 1, 0, 0)
+
+
+@pytest.mark.asyncio
+async def test_queue_depth_and_latency(executor: ManagedExecutor):
+    release = threading.Event()
+
+    first = asyncio.ensure_future(executor.run(release.wait, 5))
+    second = asyncio.ensure_future(executor.run(lambda: "done"))
+    await asyncio.sleep(0.05)
+
+    stats = executor.stats()
+    assert (stats["active"], stats["queued"]) == (1, 1)
+
+    release.set()
+    assert await second == "done"
+    assert await first is True
+    stats = executor.stats()
+    assert (stats["active"], stats["queued"], stats["completed"]) == (0, 0, 2)
+    assert stats["wait_max"] >= 0.04
+    assert stats["run_max"] >= 0.04
+
+
+@pytest.mark.asyncio
+async def test_cancelled_queued_task_is_not_run(executor: ManagedExecutor):
+    release = threading.Event()
+    calls = []
+
+    first = asyncio.ensure_future(executor.run(release.wait, 5))
+    queued = asyncio.ensure_future(executor.run(calls.append, 1))
+    await asyncio.sleep(0.01)
+    queued.cancel()
+    await asyncio.sleep(0.01)
+    assert executor.stats()["queued"] == 0
+
+    release.set()
+    await first
+    assert calls == []
+
+
+@pytest.mark.asyncio
+async def test_login_password_check_does_not_block_event_loop(
+    client: AsyncClient, test_user, monkeypatch: pytest.MonkeyPatch
+):
+    def slow_verify(plain, hashed):
+        time.sleep(0.3)
+        return True
+
+    monkeypatch.setattr("app.api.auth.verify_password", slow_verify)
+    completed = executors.crypto_executor.stats()["completed"]
+
+    ticks = []
+
+    async def ticker():
+        while len(ticks) < 10:
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(0.01)
+
+    token, _ = await asyncio.gather(get_token(client, "testuser", "testpassword123"), ticker())
+    assert token
+    # 密码校验期间事件循环仍在调度其他协程
+    assert ticks[-1] - ticks[0] < 0.3
+    assert executors.crypto_executor.stats()["completed"] == completed + 1
+
+
+@pytest.mark.asyncio
+async def test_executor_stats_endpoint(client: AsyncClient, db_session: Session, test_user):
+    db_session.add(User(
+        username="adminuser",
+        email="admin@example.com",
+        hashed_password=get_password_hash("testpassword123"),
+        role="admin",
+        is_active=True,
+    ))
+    db_session.commit()
+
+    token = await get_token(client, "testuser", "testpassword123")
+    response = await client.get("/api/admin/executors", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 403
+
+    token = await get_token(client, "adminuser", "testpassword123")
+    response = await client.get("/api/admin/executors", headers={"Authorization": f"Bearer {token}"})
+    data = response.json()["data"]
+    assert set(data) == {"db", "crypto", "file", "state"}
+    assert data["crypto"]["completed"] >= 1
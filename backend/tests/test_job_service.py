@@ -0,0 +1,213 @@
+"""后台任务队列测试"""
+import asyncio
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import event
+from sqlmodel import Session
+
+from app.core import database
+
+from app.models.background_job import BackgroundJob, JobStatus
+from app.models.prompt import Prompt
+from app.models.quality_evaluation import BatchTestResult
+from app.services.job_service import JobService, job_service
+
+
+async def get_token(client: AsyncClient, username: str, password: str) -> str:
+    response = await client.post(
+        "/api/auth/login",
+        json={"username": username, "password": password},
+    )
+    return (response.json().get("data") or {}).get("access_token", "")
+
+
+def fake_result(prompt: str) -> dict:
+    return {
+        "output": f"echo {prompt}",
+        "input_tokens": 3,
+        "output_tokens": 4,
+        "total_tokens": 7,
+        "cost": 0.001,
+    }
+
+
+@pytest.mark.asyncio
+async def test_batch_test_submits_background_job_and_persists_results(
+    client: AsyncClient,
+    db_session: Session,
+    monkeypatch: pytest.MonkeyPatch,
+    test_user,
+    test_prompt: Prompt,
+):
+    async def fake_chat_completion(**kwargs):
+        await asyncio.sleep(0.01)
+        return fake_result(kwargs["prompt"])
+
+    monkeypatch.setattr(
+        "app.services.batch_test_service.OpenAIService.chat_completion",
+        fake_chat_completion,
+    )
+
+    token = await get_token(client, "testuser", "testpassword123")
+    headers = {"Authorization": f"Bearer {token}"}
+    response = await client.post(
+        "/api/batch-test",
+        headers=headers,
+        json={
+            "test_name": "async batch",
+            "prompt_id": test_prompt.id,
+            "enable_evaluation": False,
+            "test_cases": [{"variables": {"name": str(i)}} for i in range(3)],
+        },
+    )
+
+    data = response.json()
+    assert data["code"] == 0
+    job = data["data"]
+    assert job["job_type"] == "batch_test"
+    assert job["status"] == JobStatus.PENDING
+    assert job["progress_total"] == 3
+
+    await job_service.wait_idle()
+
+    status_response = await client.get(f"/api/jobs/{job['id']}", headers=headers)
+    status = status_response.json()["data"]
+    assert status["status"] == JobStatus.COMPLETED
+    assert status["progress_done"] == 3
+    assert status["progress_percent"] == 100
+
+    db_session.expire_all()
+    batch_test = db_session.get(BatchTestResult, job["resource_id"])
+    assert batch_test.success_count == 3
+    assert [item["test_case_index"] for item in batch_test.results] == [1, 2, 3]
+    assert batch_test.completed_at is not None
+
+    list_response = await client.get("/api/jobs/list", headers=headers)
+    assert list_response.json()["data"]["total"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cancel_running_job_keeps_completed_cases(
+    client: AsyncClient,
+    db_session: Session,
+    monkeypatch: pytest.MonkeyPatch,
+    test_user,
+    test_prompt: Prompt,
+):
+    monkeypatch.setattr("app.services.batch_test_service.settings.BATCH_TEST_CONCURRENCY", 1)
+    first_case_done = asyncio.Event()
+    release = asyncio.Event()
+
+    async def fake_chat_completion(**kwargs):
+        if first_case_done.is_set():
+            await release.wait()
+        first_case_done.set()
+        return fake_result(kwargs["prompt"])
+
+    monkeypatch.setattr(
+        "app.services.batch_test_service.OpenAIService.chat_completion",
+        fake_chat_completion,
+    )
+
+    token = await get_token(client, "testuser", "testpassword123")
+    headers = {"Authorization": f"Bearer {token}"}
+    response = await client.post(
+        "/api/batch-test",
+        headers=headers,
+        json={
+            "test_name": "cancel batch",
+            "prompt_id": test_prompt.id,
+            "enable_evaluation": False,
+            "test_cases": [{"variables": {"name": str(i)}} for i in range(3)],
+        },
+    )
+    job_id = response.json()["data"]["id"]
+
+    await asyncio.wait_for(first_case_done.wait(), timeout=2)
+    await asyncio.sleep(0.05)
+
+    cancel_response = await client.post(f"/api/jobs/{job_id}/cancel", headers=headers)
+    assert cancel_response.json()["data"]["cancel_requested"] is True
+
+    await job_service.wait_idle()
+
+    db_session.expire_all()
+    job = db_session.get(BackgroundJob, job_id)
+    assert job.status == JobStatus.CANCELLED
+    batch_test = db_session.get(BatchTestResult, job.resource_id)
+    assert len(batch_test.results) == 1
+    assert batch_test.results[0]["success"] is True
+
+
+@pytest.mark.asyncio
+async def test_job_owner_check(
+    client: AsyncClient,
+    db_session: Session,
+    test_user,
+    test_user2,
+):
+    job = BackgroundJob(user_id=test_user.id, job_type="batch_test", status=JobStatus.COMPLETED)
+    db_session.add(job)
+    db_session.commit()
+    db_session.refresh(job)
+
+    token = await get_token(client, "testuser2", "testpassword123")
+    response = await client.get(
+        f"/api/jobs/{job.id}",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.json()["code"] == 4004
+
+
+@pytest.mark.asyncio
+async def test_poll_claims_jobs_submitted_elsewhere_off_event_loop(db_session: Session, test_user):
+    now = datetime.utcnow()
+    # 其他进程提交的任务、心跳超时的运行中任务会被认领；仍有心跳的运行中任务不会
+    queued = BackgroundJob(user_id=test_user.id, job_type="echo", progress_total=2)
+    stale = BackgroundJob(
+        user_id=test_user.id, job_type="echo", status=JobStatus.RUNNING,
+        progress_total=2, updated_at=now - timedelta(hours=1),
+    )
+    alive = BackgroundJob(user_id=test_user.id, job_type="echo", status=JobStatus.RUNNING, updated_at=now)
+    db_session.add_all([queued, stale, alive])
+    db_session.commit()
+    job_ids = [queued.id, stale.id, alive.id]
+
+    service = JobService(worker_count=2, poll_interval=0.01)
+    handled = []
+
+    @service.register("echo")
+    async def echo(db, job, ctx):
+        handled.append(job.id)
+        ctx.report_progress(1)
+        await asyncio.sleep(0)
+        ctx.report_progress(2)
+
+    loop_thread = threading.get_ident()
+    job_threads = []
+
+    def track(conn, cursor, statement, parameters, context, executemany):
+        if "background_jobs" in statement:
+            job_threads.append(threading.get_ident())
+
+    event.listen(database.engine, "before_cursor_execute", track)
+    try:
+        service.start()
+        for _ in range(200):
+            if len(handled) == 2 and not service._running:
+                break
+            await asyncio.sleep(0.01)
+        await service.stop()
+    finally:
+        event.remove(database.engine, "before_cursor_execute", track)
+
+    assert sorted(handled) == sorted(job_ids[:2])
+    assert job_threads and loop_thread not in job_threads
+
+    db_session.expire_all()
+    jobs = [db_session.get(BackgroundJob, job_id) for job_id in job_ids]
+    assert [job.status for job in jobs] == [JobStatus.COMPLETED, JobStatus.COMPLETED, JobStatus.RUNNING]
+    assert [job.progress_done for job in jobs[:2]] == [2, 2]
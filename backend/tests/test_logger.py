@@ -0,0 +1,66 @@
+"""
+日志管道测试：JSON 行格式与结构化字段、队列异步输出、队列满时丢弃而不阻塞
+"""
+import io
+import json
+import logging
+import queue
+import sys
+
+import pytest
+
+from app.core.logger import JSONFormatter, NonBlockingQueueHandler, TextFormatter, logging_stats, setup_logging
+
+
+def make_record(msg: str, *args, **extra) -> logging.LogRecord:
+    record = logging.getLogger("app.test").makeRecord("app.test", logging.INFO, __file__, 1, msg, args, None, extra=extra)
+    return record
+
+
+def test_json_formatter_includes_extra_fields():
+    line = JSONFormatter().format(make_record("用户 %s 登录", "alice", user_id=1, path="/api/auth/login"))
+    data = json.loads(line)
+    assert data["message"] == "用户 alice 登录"
+    assert (data["level"], data["logger"]) == ("INFO", "app.test")
+    assert (data["user_id"], data["path"]) == (1, "/api/auth/login")
+    assert "\n" not in line
+
+    text = TextFormatter().format(make_record("done", status=200))
+    assert text.endswith("INFO app.test: done status=200")
+
+
+def test_queue_handler_prepares_record_and_drops_when_full():
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = logging.getLogger("app.test").makeRecord(
+            "app.test", logging.ERROR, __file__, 1, "失败 %d", (3,), sys.exc_info(), extra={"job_id": 7}
+        )
+
+    handler.handle(record)
+    handler.handle(make_record("第二条"))
+    assert handler.dropped == 1
+
+    queued = handler.queue.get_nowait()
+    assert (queued.msg, queued.args, queued.exc_info) == ("失败 3", None, None)
+    assert "ValueError: boom" in queued.exc_text
+    assert queued.job_id == 7
+    assert "ValueError: boom" in json.loads(JSONFormatter().format(queued))["exc"]
+
+
+def test_setup_logging_writes_json_lines_from_background_thread(monkeypatch: pytest.MonkeyPatch):
+    output = io.StringIO()
+    monkeypatch.setattr(sys, "stdout", output)
+    handler = setup_logging(level="INFO", log_format="json", queue_size=100)
+    try:
+        logging.getLogger("app.test").info("hello", extra={"request_id": "r-1"})
+        logging.getLogger("app.test").debug("hidden")
+        assert logging_stats()["dropped"] == 0
+    finally:
+        # 停止输出线程会先输出队列中剩余的记录
+        setup_logging()
+    assert handler not in logging.getLogger().handlers
+
+    lines = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [(line["message"], line["request_id"]) for line in lines] == [("hello", "r-1")]
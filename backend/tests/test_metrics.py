@@ -0,0 +1,194 @@
+"""
+监控指标测试：文本格式、按路由模板统计请求和 SQL、LLM 调用 / 限流 / 配额拒绝的计数、/metrics 访问令牌
+"""
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from sqlmodel import Session
+
+from app.core.access_control import MetricsMiddleware, RateLimitMiddleware
+from app.core.metrics import MetricsRegistry, cache_collector, method_label, model_label, provider_label, registry
+from app.services import openai_service
+from app.services.ai_config_cache import ResolvedAIConfig
+from app.services.openai_service import OpenAIService
+from app.services.quota_service import QuotaService
+
+
+async def get_token(client: AsyncClient, username: str, password: str) -> str:
+    response = await client.post(
+        "/api/auth/login",
+        json={"username": username, "password": password},
+    )
+    return (response.json().get("data") or {}).get("access_token", "")
+
+
+def sample(name: str, suffix: str = "", **labels) -> float:
+    """全局注册表中某个样本的当前值（不存在时为 0）"""
+    for family, _, _, samples in registry.collect():
+        if family != name:
+            continue
+        for sample_suffix, sample_labels, value in samples:
+            if sample_suffix == suffix and all(sample_labels.get(k) == str(v) for k, v in labels.items()):
+                return value
+    return 0
+
+
+def test_render_text_format():
+    metrics = MetricsRegistry()
+    requests = metrics.counter("demo_requests_total", "请求数", ("path",))
+    latency = metrics.histogram("demo_latency_seconds", "耗时", buckets=(0.1, 1.0))
+    requests.labels(path='/a"b').inc()
+    requests.labels(path='/a"b').inc(2)
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(3)
+    metrics.add_collector(cache_collector("one", lambda: {"hits": 3, "misses": 1, "size": 2}))
+    metrics.add_collector(cache_collector("two", lambda: {"hits": 0, "db_hits": 1, "misses": 0, "size": 0}))
+
+    text = metrics.render()
+    assert '# TYPE demo_requests_total counter\ndemo_requests_total{path="/a\\"b"} 3\n' in text
+    assert 'demo_latency_seconds_bucket{le="0.1"} 1\n' in text
+    assert 'demo_latency_seconds_bucket{le="1.0"} 2\n' in text
+    assert 'demo_latency_seconds_bucket{le="+Inf"} 3\n' in text
+    assert "demo_latency_seconds_sum 3.55\n" in text
+    assert "demo_latency_seconds_count 3\n" in text
+    # 多个 collector 的同名指标族只输出一次
+    assert text.count("# TYPE cache_requests_total counter") == 1
+    assert 'cache_requests_total{cache="two",result="db_hit"} 1\n' in text
+
+    with pytest.raises(ValueError):
+        metrics.counter("demo_requests_total", "重复注册")
+
+
+@pytest.mark.asyncio
+async def test_requests_labeled_by_route_template_with_db_queries(client: AsyncClient, test_user):
+    token = await get_token(client, "testuser", "testpassword123")
+    route = "/api/prompt/{prompt_id}"
+    before = sample("http_requests_total", method="GET", route=route, status=200)
+    queries_before = sample("http_request_db_queries", "_sum", route=route)
+
+    for prompt_id in (101, 102):
+        await client.get(f"/api/prompt/{prompt_id}", headers={"Authorization": f"Bearer {token}"})
+    await client.get("/no-such-path")
+
+    assert sample("http_requests_total", method="GET", route=route, status=200) == before + 2
+    assert sample("http_requests_total", method="GET", route="unmatched", status=404) >= 1
+    # 实际路径不会成为标签
+    assert sample("http_requests_total", route="/api/prompt/101") == 0
+    # 认证和查询 Prompt 的 SQL 计入该请求（会话的操作在数据库线程池中执行）
+    assert sample("http_request_db_queries", "_sum", route=route) >= queries_before + 2
+    assert sample("db_queries_total", operation="select") > 0
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_requires_token(client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    # 未配置令牌时不对外提供
+    monkeypatch.setattr("app.main.settings.METRICS_TOKEN", "")
+    assert (await client.get("/metrics")).status_code == 404
+
+    monkeypatch.setattr("app.main.settings.METRICS_TOKEN", "scrape-secret")
+    assert (await client.get("/metrics")).status_code == 401
+    assert (await client.get("/metrics", headers={"Authorization": "Bearer wrong"})).status_code == 401
+    response = await client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE http_request_duration_seconds histogram" in response.text
+    assert 'executor_completed_total{executor="db"}' in response.text
+    assert 'cache_requests_total{cache="ai_config",result="hit"}' in response.text
+
+
+def test_labels_are_bounded():
+    assert provider_label("https://api.openai.com/v1") == "openai"
+    assert provider_label("https://api.deepseek.com") == "deepseek"
+    assert provider_label("https://my-proxy-123.example.com/v1") == "other"
+    assert provider_label(None) == "other"
+
+    assert model_label("gpt-3.5-turbo") == "gpt-3.5-turbo"
+    assert model_label("gpt-4o-mini-2024-07-18") == "gpt-4o"
+    assert model_label("deepseek-reasoner") == "deepseek"
+    assert model_label("anything-the-user-typed-42") == "other"
+    assert model_label("") == "other"
+
+    assert method_label("GET") == "GET"
+    assert method_label("FOO123") == "other"
+
+
+@pytest.mark.asyncio
+async def test_llm_call_metrics(monkeypatch: pytest.MonkeyPatch):
+    resolved = ResolvedAIConfig(1, "demo", "https://api.deepseek.com/v1", "deepseek-chat", "sk-demo")
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        if len(calls) > 1:
+            raise RuntimeError("upstream down")
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="hi"), finish_reason="stop")],
+            usage=SimpleNamespace(prompt_tokens=12, completion_tokens=3, total_tokens=15),
+        )
+
+    @asynccontextmanager
+    async def acquire(**kwargs):
+        yield SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    async def resolve(db, user_id, ai_config_id=None):
+        return resolved, resolved.api_key
+
+    monkeypatch.setattr(OpenAIService, "_resolve_ai_config_async", staticmethod(resolve))
+    monkeypatch.setattr(openai_service.openai_client_pool, "acquire", acquire)
+
+    labels = {"provider": "deepseek", "model": "deepseek-chat"}
+    # 用户自定义的 base_url 和模型名不会成为新的标签值
+    other = {"provider": "other", "model": "other"}
+    other_before = sample("llm_requests_total", status="ok", **other)
+    ok_before = sample("llm_requests_total", status="ok", **labels)
+    error_before = sample("llm_requests_total", status="error", **labels)
+    input_before = sample("llm_tokens_total", type="input", **labels)
+    output_before = sample("llm_tokens_total", type="output", **labels)
+
+    result = await OpenAIService.chat_completion("hello", model="deepseek-chat", db=object(), user_id=1, use_cache=False)
+    with pytest.raises(ValueError):
+        await OpenAIService.chat_completion("hello", model="deepseek-chat", db=object(), user_id=1, use_cache=False)
+    calls.clear()
+    resolved.base_url = "https://proxy.internal.example/v1"
+    await OpenAIService.chat_completion("hello", model="my-finetune-xyz", db=object(), user_id=1, use_cache=False)
+
+    assert sample("llm_requests_total", status="ok", **labels) == ok_before + 1
+    assert sample("llm_requests_total", status="error", **labels) == error_before + 1
+    assert sample("llm_tokens_total", type="input", **labels) == input_before + 12
+    assert sample("llm_tokens_total", type="output", **labels) == output_before + 3
+    assert sample("llm_cost_usd_total", **labels) >= result["cost"]
+    assert sample("llm_request_duration_seconds", "_count", **labels) >= 2
+    assert sample("llm_requests_total", status="ok", **other) == other_before + 1
+    assert sample("llm_requests_total", model="my-finetune-xyz") == 0
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_and_quota_rejections(db_session: Session, test_user):
+    app = FastAPI()
+    app.add_middleware(RateLimitMiddleware, requests_per_minute=1, requests_per_hour=100)
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/ping")
+    def ping():
+        return {"ok": True}
+
+    rejected_before = sample("rate_limit_rejections_total", scope="ip", window="minute")
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as local:
+        assert (await local.get("/ping")).status_code == 200
+        assert (await local.get("/ping")).status_code == 429
+    assert sample("rate_limit_rejections_total", scope="ip", window="minute") == rejected_before + 1
+    # 被中间件拒绝的请求没有匹配路由
+    assert sample("http_requests_total", method="GET", route="unmatched", status=429) >= 1
+
+    quota_before = sample("quota_rejections_total", check="request")
+    budget_before = sample("quota_rejections_total", check="budget")
+    QuotaService.set_user_quota(db_session, test_user.id, requests_per_day=1)
+    assert QuotaService.check_quota(db_session, test_user.id, reserve=True)[0] is True
+    assert QuotaService.check_quota(db_session, test_user.id, reserve=True)[0] is False
+    assert QuotaService.check_budget(db_session, test_user.id, requests=5, tokens=0, cost=0)[0] is False
+    assert sample("quota_rejections_total", check="request") == quota_before + 1
+    assert sample("quota_rejections_total", check="budget") == budget_before + 1
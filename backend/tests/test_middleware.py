@@ -0,0 +1,177 @@
+"""
+纯 ASGI 中间件测试：安全响应头、频率限制响应头与 429、请求日志、流式响应和后台任务透传
+"""
+import asyncio
+import time
+
+import pytest
+from fastapi import BackgroundTasks, FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from httpx import ASGITransport, AsyncClient
+
+from app.core.access_control import (
+    IPWhitelistMiddleware,
+    RateLimitMiddleware,
+    RequestLoggingMiddleware,
+    SecurityHeadersMiddleware,
+)
+
+
+def make_app(**rate_limit) -> FastAPI:
+    """与 main.py 相同的中间件顺序"""
+    app = FastAPI()
+    app.add_middleware(RequestLoggingMiddleware)
+    app.add_middleware(SecurityHeadersMiddleware)
+    app.add_middleware(RateLimitMiddleware, **rate_limit)
+    return app
+
+
+def test_security_and_rate_limit_headers():
+    app = make_app(requests_per_minute=5, requests_per_hour=100)
+
+    @app.get("/ping")
+    def ping():
+        return {"ok": True}
+
+    @app.get("/health")
+    def health():
+        return {"ok": True}
+
+    client = TestClient(app)
+    response = client.get("/ping")
+    assert response.json() == {"ok": True}
+    assert response.headers["X-Frame-Options"] == "DENY"
+    assert response.headers["Content-Security-Policy"] == "default-src 'self'"
+    assert response.headers["X-RateLimit-Limit-Minute"] == "5"
+    assert response.headers["X-RateLimit-Remaining-Minute"] == "4"
+    assert response.headers["X-RateLimit-Remaining-Hour"] == "99"
+
+    # 排除的路径不计数、不加限流响应头
+    health = client.get("/health")
+    assert "X-RateLimit-Limit-Minute" not in health.headers
+    assert health.headers["X-Content-Type-Options"] == "nosniff"
+
+
+def test_rate_limited_response_skips_inner_middleware(caplog: pytest.LogCaptureFixture):
+    app = make_app(requests_per_minute=1, requests_per_hour=100)
+
+    @app.get("/ping")
+    def ping():
+        return {"ok": True}
+
+    client = TestClient(app)
+    assert client.get("/ping").status_code == 200
+    blocked = client.get("/ping")
+    assert blocked.status_code == 429
+    assert blocked.json()["message"] == "请求过于频繁，每分钟限制1次请求"
+    # 频率限制在最外层，被拒绝的请求不经过内层中间件
+    assert "X-Frame-Options" not in blocked.headers
+    assert [record.path for record in caplog.records if record.name == "app.access"] == ["/ping"]
+
+    # OPTIONS 预检不计数
+    assert client.options("/ping").status_code != 429
+
+
+def access_records(caplog: pytest.LogCaptureFixture):
+    return [record for record in caplog.records if record.name == "app.access"]
+
+
+def test_request_logging(caplog: pytest.LogCaptureFixture):
+    app = make_app(enabled=False)
+
+    @app.get("/ok")
+    def ok():
+        return {"ok": True}
+
+    @app.get("/boom")
+    def boom():
+        raise RuntimeError("boom")
+
+    client = TestClient(app, raise_server_exceptions=False)
+    client.get("/ok", headers={"X-Forwarded-For": "10.1.2.3, 10.0.0.1"})
+    assert client.get("/boom").status_code == 500
+
+    ok_record, boom_record = access_records(caplog)
+    assert ok_record.getMessage() == "GET /ok 200"
+    assert (ok_record.levelname, ok_record.status, ok_record.client_ip) == ("INFO", 200, "10.1.2.3")
+    assert ok_record.duration_ms >= 0 and not hasattr(ok_record, "slow")
+    assert (boom_record.path, boom_record.status) == ("/boom", 500)
+
+
+def test_slow_requests_and_sampling(caplog: pytest.LogCaptureFixture, monkeypatch: pytest.MonkeyPatch):
+    app = FastAPI()
+    app.add_middleware(RequestLoggingMiddleware, slow_threshold=0.05, sample_rates={"/hot": 0.1, "/hot/slow": 0.0})
+
+    @app.get("/hot")
+    def hot():
+        return {"ok": True}
+
+    @app.get("/hot/slow")
+    def hot_slow():
+        time.sleep(0.06)
+        return {"ok": True}
+
+    client = TestClient(app)
+    monkeypatch.setattr("app.core.access_control.random.random", lambda: 0.5)
+    for _ in range(3):
+        client.get("/hot")
+    assert access_records(caplog) == []
+
+    monkeypatch.setattr("app.core.access_control.random.random", lambda: 0.05)
+    client.get("/hot")
+    (sampled,) = access_records(caplog)
+    assert sampled.sample_rate == 0.1
+
+    # 慢请求不受采样影响，以 WARNING 级别记录
+    caplog.clear()
+    client.get("/hot/slow")
+    (slow,) = access_records(caplog)
+    assert slow.levelname == "WARNING" and slow.slow is True
+
+
+@pytest.mark.asyncio
+async def test_streaming_and_background_tasks_pass_through():
+    app = make_app(enabled=False)
+    done = []
+    chunks_sent = []
+
+    @app.get("/stream")
+    async def stream():
+        async def events():
+            for i in range(3):
+                chunks_sent.append(i)
+                yield f"data: {i}\n\n"
+                await asyncio.sleep(0)
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/task")
+    async def task(background_tasks: BackgroundTasks):
+        background_tasks.add_task(done.append, "ran")
+        return {"ok": True}
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        async with client.stream("GET", "/stream") as response:
+            assert response.headers["X-Frame-Options"] == "DENY"
+            body = "".join([chunk async for chunk in response.aiter_text()])
+        assert body == "data: 0\n\ndata: 1\n\ndata: 2\n\n"
+        assert chunks_sent == [0, 1, 2]
+
+        assert (await client.post("/task")).json() == {"ok": True}
+        assert done == ["ran"]
+
+
+def test_ip_whitelist():
+    app = FastAPI()
+    app.add_middleware(IPWhitelistMiddleware, whitelist=["10.0.0.1"], enabled=True)
+
+    @app.get("/ping")
+    def ping():
+        return {"ok": True}
+
+    client = TestClient(app)
+    assert client.get("/ping", headers={"X-Real-IP": "10.0.0.1"}).status_code == 200
+    denied = client.get("/ping", headers={"X-Real-IP": "10.0.0.2"})
+    assert denied.status_code == 403
+    assert denied.json()["code"] == 403
@@ -0,0 +1,49 @@
+"""OpenAI 客户端连接池测试"""
+import pytest
+
+from app.services.openai_client_pool import OpenAIClientPool
+
+
+@pytest.mark.asyncio
+async def test_pool_reuses_client_for_same_config():
+    pool = OpenAIClientPool(max_size=4)
+
+    async with pool.acquire("sk-test", "https://api.example.com/v1", 30) as first:
+        pass
+    async with pool.acquire("sk-test", "https://api.example.com/v1/", 30) as second:
+        pass
+    async with pool.acquire("sk-other", "https://api.example.com/v1", 30) as third:
+        pass
+
+    assert first is second
+    assert third is not first
+    stats = pool.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+    assert stats["size"] == 2
+
+    await pool.aclose()
+    assert pool.stats()["size"] == 0
+
+
+@pytest.mark.asyncio
+async def test_pool_evicts_least_recently_used_client():
+    pool = OpenAIClientPool(max_size=2)
+
+    async with pool.acquire("key-a", "https://a.example.com", 30) as client_a:
+        pass
+    async with pool.acquire("key-b", "https://b.example.com", 30):
+        pass
+    async with pool.acquire("key-a", "https://a.example.com", 30):
+        pass
+    async with pool.acquire("key-c", "https://c.example.com", 30):
+        pass
+
+    assert pool.stats()["evictions"] == 1
+    async with pool.acquire("key-a", "https://a.example.com", 30) as again_a:
+        assert again_a is client_a
+    async with pool.acquire("key-b", "https://b.example.com", 30):
+        pass
+    assert pool.stats()["misses"] == 4
+
+    await pool.aclose()
@@ -0,0 +1,80 @@
+"""
+敏感信息扫描器测试：检测与脱敏结果与逐个模式 finditer / 依次 re.sub 完全一致
+"""
+import random
+import re
+
+import pytest
+
+from app.services.security_service import SecurityService
+
+
+def reference_detect(content):
+    detected = []
+    for info_type, pattern in SecurityService.PATTERNS.items():
+        for match in re.finditer(pattern, content):
+            detected.append({'type': info_type, 'value': match.group(0), 'position': match.start()})
+    return detected
+
+
+def reference_mask(content, mask_char='*'):
+    items = []
+
+    def mask_phone(match):
+        phone = match.group(0)
+        masked = phone[:3] + mask_char * 4 + phone[-4:]
+        items.append({'type': 'phone', 'original': phone, 'masked': masked})
+        return masked
+
+    def mask_id_card(match):
+        id_card = match.group(0)
+        masked = id_card[:6] + mask_char * 8 + id_card[-4:]
+        items.append({'type': 'id_card', 'original': id_card, 'masked': masked})
+        return masked
+
+    def mask_email(match):
+        email = match.group(0)
+        local, domain = email.split('@', 1)
+        masked_local = local[:2] + mask_char * (len(local) - 2) if len(local) > 2 else local
+        masked = f"{masked_local}@{domain}"
+        items.append({'type': 'email', 'original': email, 'masked': masked})
+        return masked
+
+    def mask_credit_card(match):
+        card = match.group(0).replace(' ', '').replace('-', '')
+        masked = mask_char * 12 + card[-4:]
+        items.append({'type': 'credit_card', 'original': card, 'masked': masked})
+        return masked
+
+    patterns = SecurityService.PATTERNS
+    content = re.sub(patterns['phone'], mask_phone, content)
+    content = re.sub(patterns['id_card'], mask_id_card, content)
+    content = re.sub(patterns['email'], mask_email, content)
+    content = re.sub(patterns['credit_card'], mask_credit_card, content)
+    return content, items
+
+
+FRAGMENTS = [
+    '13812345678', '110101199003071234', '11010119900307123X', '6222 0212 3456 7890',
+    '6222-0212-3456-7890', '192.168.1.1', 'user.name@example.com', 'ab@x.io', 'a@b.com@c.org',
+    'https://example.com/a?b=c', 'http://10.0.0.1:8080/x', '1', '9', '0', ' ', '-', '.', '@', 'X',
+    'x', '中文', 'hello', '\n', '1381234567812345678', '99999999999999999999999',
+]
+
+
+@pytest.mark.parametrize('mask_char', ['*', 'X', '1', '@', '##'])
+def test_scanner_matches_reference(mask_char):
+    rng = random.Random(hash(mask_char) & 0xffff)
+    for _ in range(400):
+        content = ''.join(rng.choice(FRAGMENTS) for _ in range(rng.randint(0, 25)))
+        assert SecurityService.detect_sensitive_info(content)['detected'] == reference_detect(content)
+        assert SecurityService.mask_sensitive_info(content, mask_char) == reference_mask(content, mask_char)
+
+
+def test_content_audit_reuses_scan_result():
+    content = '电话13812345678，邮箱 someone@example.com，身份证110101199003071234'
+    result = SecurityService.content_audit(content, auto_mask=True)
+    masked, items = reference_mask(content)
+    assert result['masked_content'] == masked
+    assert result['masked_items'] == items
+    assert result['sensitive_info']['detected'] == reference_detect(content)
@@ -0,0 +1,115 @@
+"""
+Prompt 模板引擎测试：占位符解析、默认值与未填写变量、一次渲染、与原逐变量替换结果一致
+"""
+import random
+import re
+
+import pytest
+from httpx import AsyncClient
+
+from app.utils.prompt_template import compile_template, render_template, replace_variables
+
+
+def legacy_replace_variables(content: str, variables: dict) -> str:
+    """原实现：每个变量编译一个正则并扫描整个 Prompt"""
+    result = content
+    for key, value in variables.items():
+        pattern = r'\{\{\s*' + re.escape(key) + r'(?::[^}]*)?\s*\}\}'
+        result = re.sub(pattern, lambda _: str(value), result)
+    return result
+
+
+async def get_token(client: AsyncClient, username: str, password: str) -> str:
+    response = await client.post(
+        "/api/auth/login",
+        json={"username": username, "password": password},
+    )
+    return (response.json().get("data") or {}).get("access_token", "")
+
+
+def test_parse_placeholders():
+    template = compile_template(
+        "{{name}} {{ age : number }} {{tone:select::正式,轻松}} {{lang:select:中文:中文,英文}} "
+        "{{topic:text:春天:*}} {{name:textarea}} {{x:unknown:默认}}"
+    )
+    variables = {name: placeholder.to_dict() for name, placeholder in template.variables.items()}
+
+    assert list(variables) == ["name", "age", "tone", "lang", "topic", "x"]
+    assert variables["name"]["type"] == "text"  # 同名变量以首次出现为准
+    assert variables["age"]["type"] == "number"
+    assert variables["tone"] == {
+        "name": "tone", "type": "select", "default": "正式", "options": ["正式", "轻松"], "required": False
+    }
+    assert variables["lang"]["default"] == "中文"
+    assert variables["topic"]["required"] is True and variables["topic"]["default"] == "春天"
+    assert variables["x"]["type"] == "text" and variables["x"]["default"] == "默认"
+
+
+def test_render_fills_defaults_and_reports_missing():
+    content = "写一篇关于{{topic}}的{{style:select:散文,诗歌}}，字数{{count:number:500}}，{{topic}}为主题"
+
+    text, missing = render_template(content, {"count": "800"})
+    assert text == "写一篇关于{{topic}}的散文，字数800，{{topic}}为主题"
+    assert missing == ["topic"]
+
+    text, missing = render_template(content, {"topic": "春天", "style": "诗歌"})
+    assert text == "写一篇关于春天的诗歌，字数500，春天为主题"
+    assert missing == []
+
+
+def test_values_are_inserted_literally():
+    content = "A={{a}} B={{b}}"
+    # 变量值中的反斜杠和占位符都原样保留，不会被再次替换
+    assert replace_variables(content, {"a": r"C:\new\1", "b": 1}) == r"A=C:\new\1 B=1"
+    assert replace_variables(content, {"a": "{{b}}", "b": "x"}) == "A={{b}} B=x"
+    assert replace_variables("没有变量", {"a": "1"}) == "没有变量"
+    assert replace_variables("", {"a": "1"}) == ""
+    assert replace_variables("{{}} {{ }} {{{a}}}", {"a": "1"}) == "{{}} {{ }} {1}"
+
+
+def test_matches_legacy_replacement():
+    rng = random.Random(7)
+    names = ["name", "topic", "变量", "a_1"]
+    suffixes = ["", ":text", ": textarea ", ":select:x,y", ":number::*"]
+    for _ in range(200):
+        parts = []
+        for _ in range(rng.randint(0, 8)):
+            parts.append(rng.choice(["文本", " text ", "\n", "{", "}", "{{", "}}"]))
+            parts.append("{{" + rng.choice(["", " "]) + rng.choice(names) + rng.choice(suffixes) + "}}")
+        content = "".join(parts)
+        variables = {name: rng.choice(["值", "v", ""]) for name in names}
+        assert replace_variables(content, variables) == legacy_replace_variables(content, variables)
+
+
+def test_compiled_templates_are_cached():
+    content = "缓存测试 {{q}}"
+    assert compile_template(content) is compile_template("缓存测试 " + "{{q}}")
+    hits = compile_template.cache_info().hits
+    render_template(content, {"q": "1"})
+    assert compile_template.cache_info().hits == hits + 1
+
+
+@pytest.mark.asyncio
+async def test_run_reports_missing_variables(client: AsyncClient, monkeypatch: pytest.MonkeyPatch, test_user):
+    async def fake_chat_completion(**kwargs):
+        return {
+            "output": "ok",
+            "model": kwargs["model"],
+            "input_tokens": 1,
+            "output_tokens": 1,
+            "total_tokens": 2,
+            "cost": 0.0,
+        }
+
+    monkeypatch.setattr("app.api.run.OpenAIService.chat_completion", fake_chat_completion)
+    token = await get_token(client, "testuser", "testpassword123")
+    response = await client.post(
+        "/api/run",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"prompt_content": "{{a}} {{b:text:默认}} {{c}}", "variables": {"a": "1"}},
+    )
+
+    data = response.json()
+    assert data["code"] == 0
+    assert data["data"]["final_prompt"] == "1 默认 {{c}}"
+    assert data["data"]["missing_variables"] == ["c"]
@@ -0,0 +1,114 @@
+"""
+SQL 查询分析测试：语句模板归一化、查询预算断言、N+1 检测、分析中间件的响应头和日志
+"""
+import logging
+
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from sqlmodel import Session, select
+
+from app.core.access_control import QueryProfilerMiddleware
+from app.core.query_profiler import assert_query_budget, profile_queries, statement_preview, statement_template
+from app.models.prompt import Prompt
+from app.models.user import User
+
+
+async def get_token(client: AsyncClient, username: str, password: str) -> str:
+    response = await client.post(
+        "/api/auth/login",
+        json={"username": username, "password": password},
+    )
+    return (response.json().get("data") or {}).get("access_token", "")
+
+
+def add_prompts(db: Session, user_id: int, count: int):
+    for i in range(count):
+        db.add(Prompt(user_id=user_id, title=f"prompt {i}", content=f"content {i}"))
+    db.commit()
+
+
+def test_statement_template_normalizes_in_lists():
+    one = statement_template("SELECT *\n  FROM prompt WHERE id IN (?)")
+    many = statement_template("SELECT * FROM prompt WHERE id IN (?, ?, ?)")
+    named = statement_template("SELECT * FROM prompt WHERE id IN (%(id_1)s, %(id_2)s)")
+    assert one == many == "SELECT * FROM prompt WHERE id IN (?)"
+    assert named == "SELECT * FROM prompt WHERE id IN (?)"
+    assert statement_preview("SELECT prompt.id, prompt.title FROM prompt WHERE prompt.id = ?") == (
+        "SELECT ... FROM prompt WHERE prompt.id = ?"
+    )
+
+
+def test_query_budget_detects_n_plus_one(db_session: Session, test_user):
+    add_prompts(db_session, test_user.id, 6)
+    prompts = db_session.exec(select(Prompt)).all()
+
+    with pytest.raises(AssertionError, match="语句执行了 6 次"):
+        with assert_query_budget(max_repeats=1):
+            for prompt in prompts:
+                db_session.exec(select(User).where(User.id == prompt.user_id)).first()
+
+    user_ids = {prompt.user_id for prompt in prompts}
+    with assert_query_budget(max_queries=1, max_repeats=1) as profile:
+        db_session.exec(select(User).where(User.id.in_(user_ids))).all()
+    assert profile.count == 1
+    assert profile.summary(threshold=1)["repeated"] == []
+
+
+def test_nested_profiles_do_not_leak(db_session: Session, test_user):
+    with profile_queries() as outer:
+        db_session.exec(select(User)).all()
+        with profile_queries() as inner:
+            db_session.exec(select(Prompt)).all()
+    assert (outer.count, inner.count) == (1, 1)
+
+
+@pytest.mark.asyncio
+async def test_prompt_list_query_count_does_not_grow_with_rows(client: AsyncClient, db_session: Session, test_user):
+    token = await get_token(client, "testuser", "testpassword123")
+    headers = {"Authorization": f"Bearer {token}"}
+
+    add_prompts(db_session, test_user.id, 2)
+    with profile_queries() as few:
+        response = await client.get("/api/prompt/list", headers=headers)
+    assert response.json()["code"] == 0
+
+    add_prompts(db_session, test_user.id, 10)
+    with assert_query_budget(max_queries=few.count, max_repeats=1):
+        response = await client.get("/api/prompt/list", headers=headers)
+    assert len(response.json()["data"]["items"]) == 12
+
+
+@pytest.mark.asyncio
+async def test_middleware_headers_and_n_plus_one_log(
+    db_session: Session, test_user, caplog: pytest.LogCaptureFixture
+):
+    add_prompts(db_session, test_user.id, 4)
+    app = FastAPI()
+    app.add_middleware(QueryProfilerMiddleware, threshold=3)
+
+    @app.get("/authors")
+    def authors():
+        prompts = db_session.exec(select(Prompt)).all()
+        return [db_session.get(User, prompt.user_id, populate_existing=True).username for prompt in prompts]
+
+    @app.get("/one")
+    def one():
+        return db_session.exec(select(Prompt)).first().title
+
+    caplog.set_level(logging.DEBUG, logger="app.db_profile")
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as local:
+        response = await local.get("/authors")
+        assert response.headers["x-db-query-count"] == "5"
+        assert response.headers["x-db-n-plus-one"] == "1"
+        assert float(response.headers["x-db-query-time"]) >= 0
+
+        response = await local.get("/one")
+        assert (response.headers["x-db-query-count"], response.headers["x-db-n-plus-one"]) == ("1", "0")
+
+    warning, debug = [record for record in caplog.records if record.name == "app.db_profile"]
+    assert warning.levelno == logging.WARNING
+    assert (warning.route, warning.query_count) == ("/authors", 5)
+    assert warning.repeated[0]["count"] == 4
+    assert warning.repeated[0]["statement"].startswith("SELECT ... FROM users WHERE users.id = ?")
+    assert (debug.levelno, debug.repeated) == (logging.DEBUG, [])
@@ -0,0 +1,140 @@
+"""配额引擎测试"""
+import asyncio
+import threading
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+from sqlmodel import Session, select
+
+from app.core import database
+from app.core.state_backend import MemoryStateBackend
+from app.models.api_quota import ApiUsage
+from app.services.quota_engine import QuotaEngine, quota_engine
+from app.services.quota_service import QuotaService
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(database.engine, "before_cursor_execute", self)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(database.engine, "before_cursor_execute", self)
+
+
+def test_check_quota_hits_database_only_when_cold(db_session: Session, test_user):
+    with QueryCounter() as cold:
+        assert QuotaService.check_quota(db_session, test_user.id) == (True, None)
+    assert cold.count > 0
+
+    with QueryCounter() as warm:
+        for _ in range(20):
+            QuotaService.check_quota(db_session, test_user.id, reserve=True)
+            QuotaService.record_usage(db_session, test_user.id, 10, 5, 0.01, "gpt-4")
+    assert warm.count == 0
+
+    status = QuotaService.get_quota_status(db_session, test_user.id)
+    assert status["today_requests"] == 20
+    assert status["month_tokens"] == 300
+
+
+def test_reservation_is_atomic_with_check(db_session: Session, test_user):
+    QuotaService.set_user_quota(db_session, test_user.id, requests_per_day=2)
+
+    assert QuotaService.check_quota(db_session, test_user.id, reserve=True)[0] is True
+    assert QuotaService.check_quota(db_session, test_user.id, reserve=True)[0] is True
+    allowed, message = QuotaService.check_quota(db_session, test_user.id, reserve=True)
+    assert allowed is False
+    assert "今日 API 调用次数已达上限" in message
+
+    # 释放一次预留后额度恢复
+    QuotaService.release_quota(test_user.id)
+    assert QuotaService.check_quota(db_session, test_user.id, reserve=True)[0] is True
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_leaked_reservation_expires_while_user_stays_active(db_session: Session, test_user):
+    QuotaService.set_user_quota(db_session, test_user.id, requests_per_day=3)
+    loader = QuotaService.get_effective_quota
+    clock = FakeClock()
+    engine = QuotaEngine(reservation_ttl=60, backend=MemoryStateBackend(), clock=clock)
+
+    # 两个预留没有 record / release（如流式响应从未被迭代）
+    assert engine.check(db_session, test_user.id, None, loader, reserve=True)[0] is True
+    assert engine.check(db_session, test_user.id, None, loader, reserve=True)[0] is True
+
+    # 用户持续调用：后续的预留和释放不会延长泄漏预留的有效期
+    for _ in range(6):
+        clock.now += 10
+        assert engine.check(db_session, test_user.id, None, loader, reserve=True)[0] is True
+        engine.release(test_user.id)
+    assert engine.check(db_session, test_user.id, None, loader, reserve=True)[0] is True
+    assert engine.check(db_session, test_user.id, None, loader)[0] is False
+
+    # 超过 reservation_ttl 加一个时间片后，只剩最近的一个预留
+    clock.now += 10
+    assert engine.check(db_session, test_user.id, None, loader, reserve=True)[0] is True
+    assert engine.check(db_session, test_user.id, None, loader, reserve=True)[0] is True
+    assert engine.check(db_session, test_user.id, None, loader)[0] is False
+
+
+def test_flush_writes_behind_and_warms_from_aggregate(db_session: Session, test_user):
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    db_session.add(ApiUsage(user_id=test_user.id, usage_date=today, request_count=3, total_tokens=30, total_cost=0.3))
+    db_session.commit()
+
+    QuotaService.check_quota(db_session, test_user.id, reserve=True)
+    QuotaService.record_usage(db_session, test_user.id, 7, 3, 0.1, "gpt-4")
+    assert db_session.exec(select(ApiUsage)).one().request_count == 3
+
+    assert QuotaService.flush_usage(db_session) == 1
+    db_session.expire_all()
+    usage = db_session.exec(select(ApiUsage)).one()
+    assert usage.request_count == 4
+    assert usage.total_tokens == 40
+    assert "gpt-4" in usage.model_usage_details
+
+    # 冷启动后从聚合查询恢复
+    quota_engine.reset()
+    status = QuotaService.get_quota_status(db_session, test_user.id)
+    assert status["today_requests"] == 4
+    assert status["month_tokens"] == 40
+
+
+@pytest.mark.asyncio
+async def test_periodic_flush_runs_off_event_loop(db_session: Session, test_user):
+    loop_thread = threading.get_ident()
+    flush_threads = []
+    engine = QuotaEngine(flush_interval=0.01, backend=MemoryStateBackend())
+    flush = engine.flush
+
+    def tracking_flush(*args, **kwargs):
+        flush_threads.append(threading.get_ident())
+        return flush(*args, **kwargs)
+
+    engine.flush = tracking_flush
+    engine.record(test_user.id, 7, 3, 0.1, "gpt-4")
+    engine.start()
+    for _ in range(100):
+        if flush_threads:
+            break
+        await asyncio.sleep(0.01)
+    await engine.stop()
+
+    assert flush_threads and loop_thread not in flush_threads
+    usage = db_session.exec(select(ApiUsage).where(ApiUsage.user_id == test_user.id)).one()
+    assert usage.total_tokens == 10
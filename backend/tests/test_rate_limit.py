@@ -0,0 +1,110 @@
+"""
+滑动窗口限流引擎测试
+"""
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.access_control import RateLimitMiddleware
+from app.core.rate_limiter import SlidingWindowLimiter
+from app.services.rate_limit import RateLimitService
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_acquire_blocks_at_limit_without_recording():
+    clock = FakeClock()
+    limiter = SlidingWindowLimiter((60,), clock=clock)
+
+    for _ in range(3):
+        exceeded, _ = limiter.acquire("k", (3,))
+        assert exceeded is None
+
+    exceeded, counts = limiter.acquire("k", (3,))
+    assert exceeded == 0
+    assert counts == [3]
+    # 被拒绝的请求不计数
+    assert limiter.counts("k") == [3]
+
+
+def test_previous_bucket_decays_over_window():
+    clock = FakeClock(6000.0)  # 对齐到 60 秒桶的起点
+    limiter = SlidingWindowLimiter((60,), clock=clock)
+    limiter.hit("k", amount=10)
+
+    clock.now += 60  # 进入下一个桶，上一桶全部仍在窗口内
+    assert limiter.counts("k") == [10]
+
+    clock.now += 30  # 上一桶一半移出窗口
+    assert limiter.counts("k") == [5]
+
+    clock.now += 30  # 上一桶完全移出窗口
+    assert limiter.counts("k") == [0]
+
+
+def test_idle_keys_are_evicted():
+    clock = FakeClock()
+    limiter = SlidingWindowLimiter((60, 3600), clock=clock)
+    limiter.hit("a")
+    limiter.hit("b")
+    assert len(limiter) == 2
+
+    clock.now += 2 * 3600 + 1
+    limiter.hit("c")
+    assert len(limiter) == 1
+    assert limiter.counts("a") == [0, 0]
+
+
+def test_max_keys_bounds_memory():
+    limiter = SlidingWindowLimiter((60,), max_keys=100, clock=FakeClock())
+    for i in range(1000):
+        limiter.hit(i)
+    assert len(limiter) == 100
+    # 最近访问的键保留
+    assert limiter.counts(999) == [1]
+
+
+def test_rate_limit_service_messages_and_stats():
+    service = RateLimitService()
+    service.max_requests_per_minute = 2
+
+    assert service.check_rate_limit(1) == (True, None)
+    service.record_request(1)
+    service.record_request(1)
+
+    allowed, message = service.check_rate_limit(1)
+    assert allowed is False
+    assert message == "每分钟请求次数超限（2次）"
+    # 其他用户不受影响
+    assert service.check_rate_limit(2) == (True, None)
+
+    stats = service.get_usage_stats(1)
+    assert stats["requests_last_minute"] == 2
+    assert stats["requests_last_day"] == 2
+    assert stats["limit_per_minute"] == 2
+
+
+def test_middleware_returns_429_per_ip():
+    app = FastAPI()
+    app.add_middleware(RateLimitMiddleware, requests_per_minute=2, requests_per_hour=100)
+
+    @app.get("/ping")
+    def ping():
+        return {"ok": True}
+
+    client = TestClient(app)
+    first = client.get("/ping", headers={"X-Forwarded-For": "10.0.0.1"})
+    assert first.status_code == 200
+    assert first.headers["X-RateLimit-Remaining-Minute"] == "1"
+
+    assert client.get("/ping", headers={"X-Forwarded-For": "10.0.0.1"}).status_code == 200
+    blocked = client.get("/ping", headers={"X-Forwarded-For": "10.0.0.1"})
+    assert blocked.status_code == 429
+    assert blocked.json()["data"]["window"] == "1分钟"
+
+    assert client.get("/ping", headers={"X-Forwarded-For": "10.0.0.2"}).status_code == 200
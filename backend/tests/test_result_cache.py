@@ -0,0 +1,140 @@
+"""执行结果缓存测试"""
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import pytest
+from httpx import AsyncClient
+from sqlmodel import Session, select
+
+from app.models.execution_history import ExecutionHistory
+from app.services.openai_service import OpenAIService
+from app.services.result_cache import ResultCache, make_cache_key, result_cache
+
+
+async def get_token(client: AsyncClient, username: str, password: str) -> str:
+    response = await client.post(
+        "/api/auth/login",
+        json={"username": username, "password": password},
+    )
+    return (response.json().get("data") or {}).get("access_token", "")
+
+
+@pytest.fixture
+def fake_llm(monkeypatch: pytest.MonkeyPatch):
+    """替换 AI 配置和 OpenAI 客户端，记录真实调用次数"""
+    calls = []
+
+    class FakeCompletions:
+        async def create(self, **kwargs):
+            calls.append(kwargs)
+            return SimpleNamespace(
+                choices=[SimpleNamespace(
+                    message=SimpleNamespace(content=f"answer #{len(calls)}"),
+                    finish_reason="stop",
+                )],
+                usage=SimpleNamespace(prompt_tokens=5, completion_tokens=3, total_tokens=8),
+            )
+
+    fake_client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+
+    @asynccontextmanager
+    async def fake_acquire(**kwargs):
+        yield fake_client
+
+    monkeypatch.setattr(
+        OpenAIService,
+        "_resolve_ai_config",
+        staticmethod(lambda db, user_id, ai_config_id=None: (SimpleNamespace(id=7, base_url="http://llm", model="m"), "key")),
+    )
+    monkeypatch.setattr("app.services.openai_service.openai_client_pool.acquire", fake_acquire)
+    return calls
+
+
+def test_cache_key_is_canonical():
+    base = make_cache_key("hi", None, "gpt-4", 0, 100, 1)
+    assert base == make_cache_key("hi", "", "gpt-4", 0.0, 100, 1)
+    assert base != make_cache_key("hi", None, "gpt-4", 0, 100, 2)
+    assert base != make_cache_key("hi", "be brief", "gpt-4", 0, 100, 1)
+
+
+def test_concurrent_access_from_threads():
+    # 数据库线程池回填缓存的同时事件循环也在读写，频繁切换线程放大竞争
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    cache = ResultCache(max_size=8, ttl=60)
+
+    def worker(seed: int):
+        for i in range(2000):
+            user_id = (seed + i) % 16
+            cache.set(user_id, "key", {"output": f"out-{user_id}"})
+            result = cache.get(None, user_id, "key")
+            assert result is None or result["output"] == f"out-{user_id}"
+            if i % 97 == 0:
+                cache.clear()
+        return seed
+
+    try:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            assert sorted(executor.map(worker, range(8))) == list(range(8))
+    finally:
+        sys.setswitchinterval(interval)
+
+    stats = cache.stats()
+    assert stats["size"] <= 8
+    assert stats["hits"] + stats["misses"] == 8 * 2000
+
+
+@pytest.mark.asyncio
+async def test_deterministic_calls_skip_llm(db_session: Session, fake_llm):
+    first = await OpenAIService.chat_completion(prompt="hi", model="m", temperature=0, db=db_session, user_id=1)
+    second = await OpenAIService.chat_completion(prompt="hi", model="m", temperature=0, db=db_session, user_id=1)
+
+    assert len(fake_llm) == 1
+    assert first["is_cached"] is False
+    assert second["is_cached"] is True
+    assert second["output"] == first["output"]
+
+    # 其他用户不共享缓存
+    await OpenAIService.chat_completion(prompt="hi", model="m", temperature=0, db=db_session, user_id=2)
+    assert len(fake_llm) == 2
+
+
+@pytest.mark.asyncio
+async def test_non_deterministic_calls_require_opt_in(db_session: Session, fake_llm):
+    await OpenAIService.chat_completion(prompt="hi", model="m", temperature=0.7, db=db_session, user_id=1)
+    again = await OpenAIService.chat_completion(prompt="hi", model="m", temperature=0.7, db=db_session, user_id=1)
+    assert again["is_cached"] is False
+
+    cached = await OpenAIService.chat_completion(
+        prompt="hi", model="m", temperature=0.7, db=db_session, user_id=1, use_cache=True
+    )
+    assert cached["is_cached"] is True
+    assert len(fake_llm) == 2
+
+
+@pytest.mark.asyncio
+async def test_run_reuses_execution_history_across_restarts(
+    client: AsyncClient,
+    db_session: Session,
+    test_user,
+    fake_llm,
+):
+    token = await get_token(client, "testuser", "testpassword123")
+    payload = {"prompt_content": "Tell a joke", "temperature": 0.9, "use_cache": True}
+
+    first = await client.post("/api/run", headers={"Authorization": f"Bearer {token}"}, json=payload)
+    assert first.json()["data"]["is_cached"] is False
+
+    # 模拟进程重启：内存缓存清空，只能从执行历史表命中
+    result_cache.clear()
+    second = await client.post("/api/run", headers={"Authorization": f"Bearer {token}"}, json=payload)
+    data = second.json()["data"]
+    assert data["is_cached"] is True
+    assert data["output"] == first.json()["data"]["output"]
+    assert len(fake_llm) == 1
+
+    history = db_session.exec(select(ExecutionHistory)).all()
+    assert len(history) == 1
+    assert history[0].cache_key is not None
@@ -0,0 +1,231 @@
+"""流式执行 Prompt（SSE）测试"""
+import json
+import threading
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from httpx import AsyncClient
+from openai import BadRequestError
+from sqlmodel import Session, select
+
+from app.api import run as run_api
+from app.models.api_quota import ApiUsage
+from app.models.execution_history import ExecutionHistory
+from app.services import openai_service
+from app.services.openai_service import OpenAIService
+from app.services.quota_service import QuotaService
+
+
+async def get_token(client: AsyncClient, username: str, password: str) -> str:
+    response = await client.post(
+        "/api/auth/login",
+        json={"username": username, "password": password},
+    )
+    return (response.json().get("data") or {}).get("access_token", "")
+
+
+def parse_sse(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.mark.asyncio
+async def test_run_stream_relays_deltas_and_records_history(
+    client: AsyncClient,
+    db_session: Session,
+    monkeypatch: pytest.MonkeyPatch,
+    test_user,
+):
+    async def fake_stream(**kwargs):
+        yield {"type": "delta", "content": "Hello", "output_tokens": 1}
+        yield {"type": "delta", "content": " world", "output_tokens": 2}
+        yield {
+            "type": "done",
+            "output": "Hello world",
+            "model": kwargs["model"],
+            "input_tokens": 5,
+            "output_tokens": 2,
+            "total_tokens": 7,
+            "cost": 0.001,
+        }
+
+    monkeypatch.setattr(OpenAIService, "chat_completion_stream", fake_stream)
+
+    token = await get_token(client, "testuser", "testpassword123")
+    response = await client.post(
+        "/api/run/stream",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"prompt_content": "Say {{word}}", "variables": {"word": "hi"}},
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    assert [name for name, _ in events] == ["delta", "delta", "done"]
+    assert events[1][1] == {"content": " world", "output_tokens": 2}
+    done = events[-1][1]
+    assert done["output"] == "Hello world"
+    assert done["final_prompt"] == "Say hi"
+    assert done["total_tokens"] == 7
+
+    db_session.expire_all()
+    history = db_session.exec(select(ExecutionHistory)).all()
+    assert len(history) == 1
+    assert history[0].output == "Hello world"
+    QuotaService.flush_usage(db_session)
+    usage = db_session.exec(select(ApiUsage).where(ApiUsage.user_id == test_user.id)).one()
+    assert usage.total_tokens == 7
+
+
+@pytest.mark.asyncio
+async def test_chat_completion_stream_closes_upstream_when_consumer_stops(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    closed = []
+
+    class FakeStream:
+        def __init__(self):
+            self.chunks = [
+                SimpleNamespace(
+                    usage=None,
+                    choices=[SimpleNamespace(delta=SimpleNamespace(content=text), finish_reason=None)],
+                )
+                for text in ["one", "two", "three"]
+            ]
+
+        def __aiter__(self):
+            return self._iterate()
+
+        async def _iterate(self):
+            for chunk in self.chunks:
+                yield chunk
+
+        async def close(self):
+            closed.append(True)
+
+    class FakeCompletions:
+        async def create(self, **kwargs):
+            assert kwargs["stream"] is True
+            return FakeStream()
+
+    fake_client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+
+    @asynccontextmanager
+    async def fake_acquire(**kwargs):
+        yield fake_client
+
+    monkeypatch.setattr(
+        OpenAIService,
+        "_resolve_ai_config",
+        staticmethod(lambda db, user_id, ai_config_id=None: (SimpleNamespace(base_url="http://llm", model="m"), "key")),
+    )
+    monkeypatch.setattr("app.services.openai_service.openai_client_pool.acquire", fake_acquire)
+
+    stream = OpenAIService.chat_completion_stream(prompt="hi", model="m", db=object(), user_id=1)
+    first = await stream.__anext__()
+    assert first == {"type": "delta", "content": "one", "output_tokens": 1}
+    await stream.aclose()
+
+    assert closed == [True]
+
+
+@pytest.mark.asyncio
+async def test_chat_completion_stream_uses_usage_from_final_chunk(monkeypatch: pytest.MonkeyPatch):
+    requests = []
+
+    async def iterate():
+        for text in ["Hello", " world"]:
+            yield SimpleNamespace(
+                usage=None,
+                choices=[SimpleNamespace(delta=SimpleNamespace(content=text), finish_reason=None)],
+            )
+        # include_usage 时最后一个 chunk 没有 choices，只有整个请求的 usage
+        yield SimpleNamespace(
+            usage=SimpleNamespace(prompt_tokens=21, completion_tokens=7, total_tokens=28),
+            choices=[],
+        )
+
+    class FakeStream:
+        def __aiter__(self):
+            return iterate()
+
+        async def close(self):
+            pass
+
+    async def create(**kwargs):
+        requests.append(kwargs)
+        # 第二个服务商不支持 stream_options
+        if kwargs.get("extra_body") and "legacy" in resolved.base_url:
+            request = httpx.Request("POST", resolved.base_url)
+            raise BadRequestError("unknown field stream_options", response=httpx.Response(400, request=request), body=None)
+        return FakeStream()
+
+    @asynccontextmanager
+    async def fake_acquire(**kwargs):
+        yield SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    resolved = SimpleNamespace(base_url="http://llm", model="m")
+    monkeypatch.setattr(
+        OpenAIService,
+        "_resolve_ai_config",
+        staticmethod(lambda db, user_id, ai_config_id=None: (resolved, "key")),
+    )
+    monkeypatch.setattr("app.services.openai_service.openai_client_pool.acquire", fake_acquire)
+    monkeypatch.setattr(openai_service, "_stream_usage_unsupported", set())
+
+    async def run():
+        return [event async for event in OpenAIService.chat_completion_stream(prompt="hi", model="m", db=object(), user_id=1)]
+
+    events = await run()
+    assert requests[0]["extra_body"] == {"stream_options": {"include_usage": True}}
+    assert [event["content"] for event in events[:-1]] == ["Hello", " world"]
+    assert (events[-1]["input_tokens"], events[-1]["output_tokens"], events[-1]["total_tokens"]) == (21, 7, 28)
+
+    # 拒绝该参数的服务商去掉参数重试，之后不再携带
+    requests.clear()
+    resolved.base_url = "http://legacy-llm"
+    assert (await run())[-1]["total_tokens"] == 28
+    assert (await run())[-1]["total_tokens"] == 28
+    assert ["extra_body" in kwargs for kwargs in requests] == [True, False, False]
+
+
+@pytest.mark.asyncio
+async def test_run_and_stream_record_off_event_loop(
+    client: AsyncClient,
+    monkeypatch: pytest.MonkeyPatch,
+    test_user,
+):
+    loop_thread = threading.get_ident()
+    record_threads = []
+    record = run_api._record_execution
+
+    def tracking_record(*args, **kwargs):
+        record_threads.append(threading.get_ident())
+        return record(*args, **kwargs)
+
+    async def fake_stream(**kwargs):
+        yield {"type": "delta", "content": "Hi", "output_tokens": 1}
+        yield {"type": "done", "output": "Hi", "model": kwargs["model"],
+               "input_tokens": 3, "output_tokens": 1, "total_tokens": 4, "cost": 0.0}
+
+    async def fake_completion(**kwargs):
+        return {"output": "Hi", "model": kwargs["model"], "input_tokens": 3,
+                "output_tokens": 1, "total_tokens": 4, "cost": 0.0}
+
+    monkeypatch.setattr(run_api, "_record_execution", tracking_record)
+    monkeypatch.setattr(OpenAIService, "chat_completion_stream", fake_stream)
+    monkeypatch.setattr(OpenAIService, "chat_completion", fake_completion)
+
+    token = await get_token(client, "testuser", "testpassword123")
+    headers = {"Authorization": f"Bearer {token}"}
+    body = {"prompt_content": "Say hi"}
+    assert (await client.post("/api/run/stream", headers=headers, json=body)).status_code == 200
+    assert (await client.post("/api/run", headers=headers, json=body)).json()["code"] == 0
+
+    assert len(record_threads) == 2
+    assert loop_thread not in record_threads
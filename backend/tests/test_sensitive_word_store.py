@@ -0,0 +1,188 @@
+"""
+数据库敏感词库测试：启动加载、版本号热加载、多进程收敛、整体替换
+"""
+import asyncio
+import threading
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import event
+from sqlmodel import Session
+
+from app.core.security import get_password_hash
+from app.models.audit_log import SensitiveWord
+from app.models.user import User
+from app.services.security_service import SecurityService
+from app.services.sensitive_word_store import SensitiveWordStore, sensitive_word_store
+
+
+async def get_token(client: AsyncClient, username: str, password: str) -> str:
+    response = await client.post(
+        "/api/auth/login",
+        json={"username": username, "password": password},
+    )
+    return (response.json().get("data") or {}).get("access_token", "")
+
+
+def detected_words(content: str):
+    return [v["word"] for v in SecurityService.check_sensitive_words(content)["violations"]]
+
+
+@pytest.fixture
+def admin_user(db_session: Session):
+    user = User(
+        username="adminuser",
+        email="admin@example.com",
+        hashed_password=get_password_hash("testpassword123"),
+        role="admin",
+        is_active=True,
+    )
+    db_session.add(user)
+    db_session.commit()
+    db_session.refresh(user)
+    return user
+
+
+def add_word(db: Session, word: str, category: str = "custom", is_active: bool = True):
+    db.add(SensitiveWord(word=word, category=category, is_active=is_active))
+    SensitiveWordStore.bump_version(db)
+    db.commit()
+
+
+def test_load_merges_builtin_and_active_db_words(db_session: Session):
+    add_word(db_session, "数据库词一")
+    add_word(db_session, "停用的词", is_active=False)
+    add_word(db_session, "暴力", category="nsfw")  # 与内置词重复
+
+    store = SensitiveWordStore()
+    assert store.refresh(db_session) is True
+    assert store.loaded_version == 3
+
+    words = SecurityService.get_sensitive_words()
+    assert words["custom"] == ["数据库词一"]
+    assert words["nsfw"] == SecurityService.BUILTIN_SENSITIVE_WORDS["nsfw"]
+    assert detected_words("数据库词一和停用的词") == ["数据库词一"]
+
+    # 版本号未变化时只读取版本号，不重新加载
+    version = SecurityService._words_version
+    assert store.refresh(db_session) is False
+    assert SecurityService._words_version == version
+
+
+def test_first_edits_from_two_workers_both_bump_version(db_session: Session):
+    """两个 worker 同时第一次修改敏感词：都没有更新到版本行，后插入的一方不会主键冲突"""
+    created = []
+
+    def create_row_concurrently(conn, cursor, statement, parameters, context, executemany):
+        # 本次 UPDATE 没有命中之后、插入版本行之前，另一个 worker 创建了版本行
+        if statement.startswith("UPDATE sensitive_word_versions") and not created:
+            created.append(True)
+            other = conn.connection.cursor()
+            other.execute(
+                "INSERT INTO sensitive_word_versions (id, version, updated_at) "
+                "VALUES (1, 1, '2026-01-01 00:00:00')"
+            )
+            other.close()
+
+    bind = db_session.get_bind()
+    event.listen(bind, "after_cursor_execute", create_row_concurrently)
+    try:
+        add_word(db_session, "并发添加的词")
+    finally:
+        event.remove(bind, "after_cursor_execute", create_row_concurrently)
+
+    assert created == [True]
+    assert SensitiveWordStore.get_version(db_session) == 2
+    assert db_session.get(SensitiveWord, 1).word == "并发添加的词"
+
+
+@pytest.mark.asyncio
+async def test_api_changes_propagate_to_other_workers(client: AsyncClient, admin_user, db_session: Session):
+    token = await get_token(client, "adminuser", "testpassword123")
+    headers = {"Authorization": f"Bearer {token}"}
+
+    # 另一个 worker 已加载当前版本
+    other = SensitiveWordStore()
+    other.refresh(db_session)
+
+    response = await client.post(
+        "/api/security/sensitive-words",
+        json={"word": "新增违禁词", "category": "custom"},
+        headers=headers,
+    )
+    word_id = response.json()["data"]["id"]
+    # 处理请求的 worker 立即生效
+    assert detected_words("一段新增违禁词文本") == ["新增违禁词"]
+    assert SensitiveWordStore.get_version(db_session) == 1
+
+    # 模拟另一个 worker 的进程内词库仍是旧版本
+    SecurityService.set_sensitive_words(
+        {category: list(words) for category, words in SecurityService.BUILTIN_SENSITIVE_WORDS.items()}
+    )
+    assert detected_words("一段新增违禁词文本") == []
+    assert other.refresh(db_session) is True
+    assert detected_words("一段新增违禁词文本") == ["新增违禁词"]
+
+    response = await client.delete(f"/api/security/sensitive-words/{word_id}", headers=headers)
+    assert response.json()["code"] == 0
+    assert detected_words("一段新增违禁词文本") == []
+    assert other.refresh(db_session) is True
+    assert SensitiveWordStore.get_version(db_session) == 2
+
+
+@pytest.mark.asyncio
+async def test_background_reload_converges(db_session: Session):
+    store = SensitiveWordStore(reload_interval=0.02)
+    store.refresh(db_session)
+    store.start()
+    try:
+        add_word(db_session, "后台加载词")
+        for _ in range(100):
+            if detected_words("后台加载词"):
+                break
+            await asyncio.sleep(0.02)
+        assert detected_words("后台加载词") == ["后台加载词"]
+        assert store.loaded_version == 1
+    finally:
+        await store.stop()
+
+
+def test_reset_restores_builtin_words(db_session: Session):
+    add_word(db_session, "临时词")
+    sensitive_word_store.refresh(db_session)
+    assert detected_words("临时词") == ["临时词"]
+
+    sensitive_word_store.reset()
+    assert detected_words("临时词") == []
+    assert sensitive_word_store.loaded_version is None
+
+
+def test_set_sensitive_words_swaps_atomically():
+    """替换词库时，并发检测看到的始终是完整的旧词库或新词库"""
+    old_words = {"a": ["甲词"]}
+    new_words = {"b": ["乙词"]}
+    allowed = ([{"type": "a", "word": "甲词", "position": 0}], [{"type": "b", "word": "乙词", "position": 2}])
+    SecurityService.set_sensitive_words(old_words)
+
+    errors = []
+    stop = threading.Event()
+
+    def reader():
+        while not stop.is_set():
+            violations = SecurityService.check_sensitive_words("甲词乙词")["violations"]
+            if violations not in allowed:
+                errors.append(violations)
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    try:
+        for i in range(200):
+            SecurityService.set_sensitive_words(new_words if i % 2 else old_words)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        sensitive_word_store.reset()
+
+    assert errors == []
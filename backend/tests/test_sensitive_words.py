@@ -0,0 +1,85 @@
+"""
+敏感词 Aho-Corasick 匹配测试：结果与逐词 re.finditer 扫描完全一致
+"""
+import copy
+import random
+import re
+
+import pytest
+
+from app.services.aho_corasick import AhoCorasickMatcher
+from app.services.security_service import SecurityService
+
+
+def reference_violations(content: str):
+    """原实现：逐个分类、逐个词扫描"""
+    violations = []
+    for category, words in SecurityService.SENSITIVE_WORDS.items():
+        for word in words:
+            if word in content:
+                for match in re.finditer(re.escape(word), content):
+                    violations.append({'type': category, 'word': word, 'position': match.start()})
+    return violations
+
+
+@pytest.fixture(autouse=True)
+def restore_word_list():
+    original = copy.deepcopy(SecurityService.SENSITIVE_WORDS)
+    yield
+    SecurityService.set_sensitive_words(original)
+
+
+def test_matcher_finds_overlapping_words_like_finditer():
+    matcher = AhoCorasickMatcher(["he", "she", "his", "hers", "aa"])
+    text = "ushers and his aaaa"
+    found = matcher.find_all(text)
+    for word in ["he", "she", "his", "hers", "aa"]:
+        expected = [m.start() for m in re.finditer(re.escape(word), text)]
+        assert found.get(word, []) == expected
+
+
+def test_matcher_incremental_add_and_remove():
+    matcher = AhoCorasickMatcher(["abc"])
+    matcher.add("bc")
+    assert matcher.find_all("xabcx") == {"abc": [1], "bc": [2]}
+
+    matcher.remove("abc")
+    assert matcher.find_all("xabcx") == {"bc": [2]}
+
+    # 引用计数：同一个词属于两个分类时，移除一次后仍然有效
+    matcher.add("bc")
+    matcher.remove("bc")
+    assert matcher.find_all("bc") == {"bc": [0]}
+
+
+def test_check_sensitive_words_matches_reference_output():
+    SecurityService.add_custom_sensitive_word('暴力', 'custom')  # 同一个词属于两个分类
+    SecurityService.add_custom_sensitive_word('力血', 'custom')  # 与已有词重叠
+
+    alphabet = list('色情暴力血腥毒品枪支爆炸诈骗传销的了是') + ['非法集资', '种族歧视']
+    rng = random.Random(7)
+    for _ in range(200):
+        content = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 60)))
+        result = SecurityService.check_sensitive_words(content)
+        assert result['violations'] == reference_violations(content)
+
+
+def test_add_and_remove_custom_word_updates_matcher():
+    content = '这里有一个自定义敏感词'
+    assert SecurityService.check_sensitive_words(content)['violations'] == []
+
+    SecurityService.add_custom_sensitive_word('自定义敏感词', 'custom')
+    result = SecurityService.check_sensitive_words(content)
+    assert result['violations'] == [{'type': 'custom', 'word': '自定义敏感词', 'position': 5}]
+
+    SecurityService.remove_custom_sensitive_word('自定义敏感词', 'custom')
+    assert SecurityService.check_sensitive_words(content)['violations'] == []
+
+
+def test_large_word_list():
+    for i in range(5000):
+        SecurityService.add_custom_sensitive_word(f'词条{i:05d}', 'bulk')
+    content = '前缀词条01234后缀，还有暴力和词条04999'
+    result = SecurityService.check_sensitive_words(content)
+    assert result['violations'] == reference_violations(content)
+    assert [v['word'] for v in result['violations']] == ['暴力', '词条01234', '词条04999']
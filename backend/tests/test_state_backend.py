@@ -0,0 +1,228 @@
+"""
+共享状态后端测试：三种实现的原子检查与递增、跨实例共享计数
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+from sqlmodel import Session
+
+from app.core.rate_limiter import SharedWindowLimiter, SlidingWindowLimiter, create_window_limiter
+from app.core.state_backend import MemoryStateBackend, RedisStateBackend, SQLiteStateBackend
+from app.models.api_quota import ApiUsage
+from app.services.quota_engine import QuotaEngine
+from app.services.quota_service import QuotaService
+from tests.fake_redis import FakeRedisServer
+
+
+@pytest.fixture
+def redis_server():
+    with FakeRedisServer() as server:
+        yield server
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend_factory(request, tmp_path):
+    """返回一个工厂：同一个测试里多次调用得到指向同一份存储的多个后端实例（模拟多个进程）"""
+    created = []
+    if request.param == "memory":
+        shared = MemoryStateBackend()
+        factory = lambda: shared
+    elif request.param == "sqlite":
+        path = str(tmp_path / "state.db")
+        factory = lambda: SQLiteStateBackend(path)
+    else:
+        server = request.getfixturevalue("redis_server")
+        factory = lambda: RedisStateBackend(server.url, prefix="test:")
+
+    def make():
+        backend = factory()
+        created.append(backend)
+        return backend
+
+    yield make
+    for backend in created:
+        backend.close()
+
+
+def test_incr_and_get(backend_factory):
+    backend = backend_factory()
+    assert backend.incr([("a", 2, None), ("b", 0.5, 60)]) == {"a": 0.0, "b": 0.0}
+    assert backend.incr([("a", 3, None)]) == {"a": 2.0}
+    assert backend.get_many(["a", "b", "missing"]) == {"a": 5.0, "b": 0.5, "missing": 0.0}
+
+    backend.set_many([("a", 1, None)])
+    assert backend.get_many(["a"]) == {"a": 1.0}
+
+    backend.clear("a")
+    assert backend.get_many(["a", "b"]) == {"a": 0.0, "b": 0.5}
+
+
+def test_check_and_incr_rejects_without_writing(backend_factory):
+    backend = backend_factory()
+    conditions = [([("n", 1.0)], 2)]
+    assert backend.check_and_incr([("n", 1, None)], conditions)[0] is None
+    assert backend.check_and_incr([("n", 1, None)], conditions)[0] is None
+    failed, values = backend.check_and_incr([("n", 1, None)], conditions)
+    assert failed == 0
+    assert values["n"] == 2.0
+    assert backend.get_many(["n"])["n"] == 2.0
+
+
+def test_ttl_expires_keys(backend_factory):
+    backend = backend_factory()
+    backend.incr([("short", 1, 0.05)])
+    assert backend.get_many(["short"])["short"] == 1.0
+    time.sleep(0.15)
+    assert backend.get_many(["short"])["short"] == 0.0
+
+
+def test_concurrent_check_and_incr_never_exceeds_limit(backend_factory):
+    """多个实例、多个线程同时抢占额度，成功次数严格等于上限"""
+    backends = [backend_factory() for _ in range(2)]
+    limit = 40
+
+    def attempt(i):
+        failed, _ = backends[i % 2].check_and_incr([("slots", 1, None)], [([("slots", 1.0)], limit)])
+        return failed is None
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        granted = sum(pool.map(attempt, range(120)))
+
+    assert granted == limit
+    assert backends[0].get_many(["slots"])["slots"] == limit
+
+
+def test_shared_window_limiter_across_instances(tmp_path):
+    path = str(tmp_path / "state.db")
+    first = create_window_limiter((60,), "ip", backend=SQLiteStateBackend(path))
+    second = create_window_limiter((60,), "ip", backend=SQLiteStateBackend(path))
+    assert isinstance(first, SharedWindowLimiter)
+
+    assert first.acquire("1.2.3.4", (3,))[0] is None
+    assert second.acquire("1.2.3.4", (3,))[0] is None
+    assert first.acquire("1.2.3.4", (3,))[0] is None
+    # 两个“进程”合计达到上限
+    exceeded, counts = second.acquire("1.2.3.4", (3,))
+    assert exceeded == 0
+    assert counts[0] >= 3
+    assert second.acquire("5.6.7.8", (3,))[0] is None
+
+
+def test_memory_backend_purges_expired_keys_without_evicting_live_ones():
+    backend = MemoryStateBackend(max_keys=10)
+    backend.incr([(f"expired:{i}", 1, 0.01) for i in range(8)])
+    time.sleep(0.02)
+    backend.incr([(f"live:{i}", 1, 60) for i in range(30)])
+
+    # 超出 max_keys 时只清理过期的键，仍有效的计数不会被淘汰
+    assert backend.get_many([f"live:{i}" for i in range(30)]) == {f"live:{i}": 1.0 for i in range(30)}
+    assert not any(key.startswith("expired:") for key in backend._data)
+
+
+def test_memory_backend_keeps_local_limiter():
+    assert isinstance(create_window_limiter((60,), "ip", backend=MemoryStateBackend()), SlidingWindowLimiter)
+
+
+def test_quota_engine_shares_counters_between_processes(db_session: Session, test_user, redis_server):
+    QuotaService.set_user_quota(db_session, test_user.id, requests_per_day=3)
+    loader = QuotaService.get_effective_quota
+    engines = [
+        QuotaEngine(backend=RedisStateBackend(redis_server.url, prefix="test:"))
+        for _ in range(2)
+    ]
+
+    assert engines[0].check(db_session, test_user.id, None, loader, reserve=True)[0] is True
+    engines[0].record(test_user.id, 10, 5, 0.01, "gpt-4")
+    assert engines[1].check(db_session, test_user.id, None, loader, reserve=True)[0] is True
+    assert engines[0].check(db_session, test_user.id, None, loader, reserve=True)[0] is True
+
+    # 第三个“进程”看到前两个进程的用量和预留
+    allowed, message = engines[1].check(db_session, test_user.id, None, loader, reserve=True)
+    assert allowed is False
+    assert "今日 API 调用次数已达上限" in message
+
+    _, today, month = engines[1].usage(db_session, test_user.id, None, loader)
+    assert today["request_count"] == 1
+    assert month["total_tokens"] == 15
+
+    # 释放预留后另一个进程可以继续使用
+    engines[0].release(test_user.id)
+    assert engines[1].check(db_session, test_user.id, None, loader, reserve=True)[0] is True
+
+    for engine in engines:
+        engine.backend.close()
+
+
+def test_quota_engine_seeds_shared_counters_once(db_session: Session, test_user, tmp_path):
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    db_session.add(ApiUsage(user_id=test_user.id, usage_date=today, request_count=5, total_tokens=50, total_cost=0.5))
+    db_session.commit()
+
+    path = str(tmp_path / "state.db")
+    engines = [QuotaEngine(backend=SQLiteStateBackend(path)) for _ in range(2)]
+    loader = QuotaService.get_effective_quota
+
+    for engine in engines:
+        _, today_usage, _ = engine.usage(db_session, test_user.id, None, loader)
+        # 数据库基数只加载一次，不会因为两个进程各自加载而翻倍
+        assert today_usage["request_count"] == 5
+
+
+def test_redis_replaces_idle_connection_closed_by_server(redis_server):
+    backend = RedisStateBackend(redis_server.url, prefix="test:")
+    backend.incr([("hits", 1, None)])
+    redis_server.disconnect_clients()
+    time.sleep(0.05)
+
+    # 发送前发现连接已关闭，换新连接执行，只累加一次
+    backend.incr([("hits", 1, None)])
+    assert backend.get_many(["hits"]) == {"hits": 2.0}
+    backend.close()
+
+
+def test_redis_does_not_replay_increment_when_reply_is_lost(redis_server):
+    backend = RedisStateBackend(redis_server.url, prefix="test:")
+    backend.get_many(["hits"])
+    redis_server.drop_exec_reply = True
+
+    # 事务已经执行但响应丢失：不能重试，否则计数会被累加两次
+    with pytest.raises((ConnectionError, OSError)):
+        backend.incr([("hits", 1, None)])
+    with pytest.raises((ConnectionError, OSError)):
+        redis_server.drop_exec_reply = True
+        backend.check_and_incr([("hits", 1, None)], [([("hits", 1.0)], 10)])
+    assert backend.get_many(["hits"]) == {"hits": 2.0}
+    backend.close()
+
+
+@pytest.mark.asyncio
+async def test_shared_backend_io_runs_off_event_loop(db_session: Session, test_user, tmp_path):
+    loop_thread = threading.get_ident()
+    io_threads = []
+
+    class TrackingBackend(SQLiteStateBackend):
+        def get_many(self, keys):
+            io_threads.append(threading.get_ident())
+            return super().get_many(keys)
+
+        def check_and_incr(self, increments, conditions=()):
+            io_threads.append(threading.get_ident())
+            return super().check_and_incr(increments, conditions)
+
+    backend = TrackingBackend(str(tmp_path / "state.db"))
+    limiter = create_window_limiter((60,), "ip", backend=backend)
+    assert (await limiter.acquire_async("1.2.3.4", (3,)))[0] is None
+    assert await limiter.counts_async("1.2.3.4") == [1.0]
+
+    engine = QuotaEngine(backend=backend)
+    loader = QuotaService.get_effective_quota
+    assert (await engine.check_async(test_user.id, None, loader, reserve=True))[0] is True
+    await engine.record_async(test_user.id, 10, 5, 0.01, "gpt-4")
+    assert io_threads and loop_thread not in io_threads
+
+    _, today, _ = engine.usage(db_session, test_user.id, None, loader)
+    assert today["request_count"] == 1
+    backend.close()
@@ -0,0 +1,283 @@
+"""测试集运行器并发执行测试"""
+import asyncio
+
+import pytest
+from sqlalchemy import event
+from sqlmodel import Session, select
+
+from app.models.prompt import Prompt
+from app.models.prompt_version import PromptVersion
+from app.models.test_suite import PromptBaselineOutput, PromptTestSuite
+from app.services.test_runner_service import TestRunnerService
+
+
+class InFlightCounter:
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+
+    async def track(self, delay: float):
+        self.current += 1
+        self.peak = max(self.peak, self.current)
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self.current -= 1
+
+
+@pytest.fixture
+def fake_llm(monkeypatch: pytest.MonkeyPatch):
+    counter = InFlightCounter()
+
+    async def fake_chat_completion(**kwargs):
+        await counter.track(0.05)
+        return {"output": f"out: {kwargs['prompt']}", "total_tokens": 10, "cost": 0.001}
+
+    async def fake_evaluate(**kwargs):
+        await counter.track(0.05)
+        return {"overall_score": 8 if "v2" in kwargs["prompt_content"] else 7}
+
+    monkeypatch.setattr(
+        "app.services.test_runner_service.OpenAIService.chat_completion",
+        fake_chat_completion,
+    )
+    monkeypatch.setattr(
+        "app.services.test_runner_service.EvaluationService.evaluate_output_quality",
+        fake_evaluate,
+    )
+    return counter
+
+
+@pytest.mark.asyncio
+async def test_run_case_runs_candidate_and_baseline_branches_concurrently(db_session: Session, fake_llm):
+    result, baseline_memo = await TestRunnerService.run_case(
+        db=db_session,
+        user_id=1,
+        prompt_id=1,
+        case_index=1,
+        test_case={"variables": {"x": "1"}},
+        candidate_content="v2 {{x}}",
+        baseline_content="v1 {{x}}",
+        model="m",
+        temperature=0.0,
+        enable_evaluation=True,
+    )
+
+    assert fake_llm.peak == 2
+    assert result["candidate_output"] == "out: v2 1"
+    assert result["baseline_output"] == "out: v1 1"
+    assert result["candidate_score"] == 8
+    assert result["baseline_score"] == 7
+    assert result["regression"] is False
+    assert baseline_memo is None
+
+
+@pytest.mark.asyncio
+async def test_execute_run_runs_cases_concurrently_in_order(
+    db_session: Session,
+    test_user,
+    test_prompt: Prompt,
+    fake_llm,
+):
+    test_prompt.content = "v2 {{x}}"
+    test_prompt.version = 2
+    db_session.add(test_prompt)
+    db_session.add(PromptVersion(prompt_id=test_prompt.id, version=2, title=test_prompt.title, content="v2 {{x}}"))
+    suite = PromptTestSuite(
+        user_id=test_user.id,
+        prompt_id=test_prompt.id,
+        name="parallel",
+        test_cases=[{"name": f"case {i}", "variables": {"x": str(i)}} for i in range(4)],
+    )
+    db_session.add(suite)
+    db_session.commit()
+    db_session.refresh(suite)
+
+    run = TestRunnerService.create_run(db=db_session, suite=suite, candidate_version=2, baseline_version=1)
+    run = await TestRunnerService.execute_run(
+        db=db_session,
+        suite=suite,
+        run=run,
+        model="m",
+        enable_evaluation=False,
+        concurrency=4,
+    )
+
+    assert run.status == "completed"
+    assert [item["case_index"] for item in run.results] == [1, 2, 3, 4]
+    # 4 个用例 × 候选/基线两条链路同时进行
+    assert fake_llm.peak == 8
+    assert run.summary["total_cases"] == 4
+
+
+@pytest.mark.asyncio
+async def test_concurrent_cases_do_not_commit_while_siblings_are_in_flight(
+    db_session: Session,
+    test_user,
+    test_prompt: Prompt,
+    fake_llm,
+):
+    v1 = db_session.exec(
+        select(PromptVersion).where(PromptVersion.prompt_id == test_prompt.id, PromptVersion.version == 1)
+    ).one()
+    v1.content = "v1 {{x}}"
+    db_session.add(v1)
+    test_prompt.content = "v2 {{x}}"
+    test_prompt.version = 2
+    db_session.add(test_prompt)
+    db_session.add(PromptVersion(prompt_id=test_prompt.id, version=2, title=test_prompt.title, content="v2 {{x}}"))
+    suite = PromptTestSuite(
+        user_id=test_user.id,
+        prompt_id=test_prompt.id,
+        name="single writer",
+        test_cases=[{"variables": {"x": str(i)}} for i in range(4)],
+    )
+    db_session.add(suite)
+    db_session.commit()
+    db_session.refresh(suite)
+
+    run = TestRunnerService.create_run(db=db_session, suite=suite, candidate_version=2, baseline_version=1)
+    commits_in_flight = []
+
+    def record_commit(session):
+        commits_in_flight.append(fake_llm.current)
+
+    event.listen(db_session, "after_commit", record_commit)
+    try:
+        run = await TestRunnerService.execute_run(
+            db=db_session,
+            suite=suite,
+            run=run,
+            model="m",
+            enable_evaluation=True,
+            concurrency=4,
+        )
+    finally:
+        event.remove(db_session, "after_commit", record_commit)
+
+    assert run.status == "completed"
+    # 基线链路不再单独提交：每个用例一次进度提交（含基线输出），加上开始和结束
+    assert len(commits_in_flight) == 4 + 2
+    memos = db_session.exec(select(PromptBaselineOutput)).all()
+    assert len(memos) == 4
+    assert all(memo.score == 7 for memo in memos)
+
+
+@pytest.mark.asyncio
+async def test_baseline_outputs_are_memoized_until_refresh(
+    db_session: Session,
+    test_user,
+    test_prompt: Prompt,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    calls = []
+
+    async def fake_chat_completion(**kwargs):
+        calls.append(kwargs["prompt"])
+        return {"output": f"out: {kwargs['prompt']}", "total_tokens": 10, "cost": 0.001}
+
+    async def fake_evaluate(**kwargs):
+        return {"overall_score": 7}
+
+    monkeypatch.setattr(
+        "app.services.test_runner_service.OpenAIService.chat_completion",
+        fake_chat_completion,
+    )
+    monkeypatch.setattr(
+        "app.services.test_runner_service.EvaluationService.evaluate_output_quality",
+        fake_evaluate,
+    )
+
+    test_prompt.content = "v2 {{x}}"
+    test_prompt.version = 2
+    db_session.add(test_prompt)
+    suite = PromptTestSuite(
+        user_id=test_user.id,
+        prompt_id=test_prompt.id,
+        name="memo",
+        test_cases=[{"variables": {"x": "1"}}],
+    )
+    db_session.add(suite)
+    db_session.commit()
+    db_session.refresh(suite)
+
+    async def run_once(force_refresh: bool = False):
+        return await TestRunnerService.run_suite(
+            db=db_session,
+            suite=suite,
+            candidate_version=2,
+            baseline_version=1,
+            model="m",
+            enable_evaluation=True,
+            force_refresh=force_refresh,
+        )
+
+    first = await run_once()
+    assert len(calls) == 2
+    assert first.results[0]["baseline_score"] == 7
+
+    second = await run_once()
+    assert len(calls) == 3  # 只重新执行候选版本
+    assert second.results[0]["baseline_output"] == first.results[0]["baseline_output"]
+    assert second.results[0]["baseline_score"] == 7
+
+    await run_once(force_refresh=True)
+    assert len(calls) == 5
+
+    assert TestRunnerService.invalidate_baselines(db_session, test_prompt.id, version=1) == 1
+    await run_once()
+    assert len(calls) == 7
+
+
+@pytest.mark.asyncio
+async def test_cancelled_run_is_not_left_running(
+    db_session: Session,
+    test_user,
+    test_prompt: Prompt,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    started = asyncio.Event()
+
+    async def slow_chat_completion(**kwargs):
+        if kwargs["prompt"] == "case 2":
+            started.set()
+            await asyncio.sleep(60)
+        return {"output": "out", "total_tokens": 10, "cost": 0.001}
+
+    monkeypatch.setattr(
+        "app.services.test_runner_service.OpenAIService.chat_completion",
+        slow_chat_completion,
+    )
+
+    test_prompt.content = "case {{x}}"
+    db_session.add(test_prompt)
+    suite = PromptTestSuite(
+        user_id=test_user.id,
+        prompt_id=test_prompt.id,
+        name="cancel",
+        test_cases=[{"variables": {"x": str(i)}} for i in (1, 2)],
+    )
+    db_session.add(suite)
+    db_session.commit()
+    db_session.refresh(suite)
+
+    run = TestRunnerService.create_run(db=db_session, suite=suite, candidate_version=1)
+    task = asyncio.ensure_future(TestRunnerService.execute_run(
+        db=db_session,
+        suite=suite,
+        run=run,
+        model="m",
+        enable_evaluation=False,
+        concurrency=1,
+    ))
+    await asyncio.wait_for(started.wait(), timeout=5)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    # 取消前已完成的用例结果保留，状态为终止状态
+    db_session.expire_all()
+    db_session.refresh(run)
+    assert run.status == "cancelled"
+    assert run.completed_at is not None
+    assert [item["case_index"] for item in run.results] == [1]
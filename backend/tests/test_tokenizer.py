@@ -0,0 +1,156 @@
+"""
+BPE 分词器测试：合并结果与参考实现一致、词表加载、模型到编码的映射、无词表时退回估算
+"""
+import base64
+import random
+from collections import Counter
+
+import pytest
+
+from app.utils import token_counter
+from app.utils.tokenizer import BPEEncoding, TokenizerRegistry, load_tiktoken_bpe, tokenizer_registry
+
+CORPUS = (
+    "Hello world! The quick brown fox jumps over the lazy dog. "
+    "def count_tokens(text): return len(text.split())\n\n"
+    "提示词工程是一门设计输入以获得更好输出的技术。我们测试中文分词效果。"
+    "Numbers 12345 and 3.14159, emoji 😀 and symbols <>{}[]."
+) * 3
+
+
+def train_ranks(text: str, merges: int) -> dict:
+    """在语料上训练一个小词表：256 个单字节 + 按频率合并的字节对"""
+    ranks = {bytes([i]): i for i in range(256)}
+    words = [[bytes([b]) for b in piece.encode("utf-8")] for piece in text.split(" ")]
+    for _ in range(merges):
+        pairs = Counter()
+        for word in words:
+            for a, b in zip(word, word[1:]):
+                pairs[a + b] += 1
+        if not pairs:
+            break
+        best = max(pairs, key=lambda pair: (pairs[pair], pair))
+        if best in ranks:
+            break
+        ranks[best] = len(ranks)
+        for word in words:
+            i = 0
+            while i < len(word) - 1:
+                if word[i] + word[i + 1] == best:
+                    word[i:i + 2] = [best]
+                else:
+                    i += 1
+    return ranks
+
+
+def reference_bpe(ranks: dict, piece: bytes):
+    """tiktoken 的合并语义：每次合并 rank 最小的相邻对"""
+    parts = [piece[i:i + 1] for i in range(len(piece))]
+    while True:
+        candidates = [
+            (ranks[parts[i] + parts[i + 1]], i)
+            for i in range(len(parts) - 1)
+            if parts[i] + parts[i + 1] in ranks
+        ]
+        if not candidates:
+            return [ranks[part] for part in parts]
+        _, i = min(candidates)
+        parts[i:i + 2] = [parts[i] + parts[i + 1]]
+
+
+def write_vocab(path, ranks: dict):
+    with open(path, "wb") as f:
+        for token, rank in sorted(ranks.items(), key=lambda item: item[1]):
+            f.write(base64.b64encode(token) + b" " + str(rank).encode() + b"\n")
+
+
+@pytest.fixture(scope="module")
+def ranks():
+    return train_ranks(CORPUS, 300)
+
+
+@pytest.fixture
+def vocab_dir(tmp_path, ranks):
+    write_vocab(tmp_path / "cl100k_base.tiktoken", ranks)
+    return tmp_path
+
+
+def test_bpe_matches_reference(ranks):
+    encoding = BPEEncoding("cl100k_base", ranks)
+    rng = random.Random(3)
+    samples = CORPUS.split(" ") + ["".join(rng.choice(CORPUS) for _ in range(rng.randint(1, 40))) for _ in range(200)]
+    for sample in samples:
+        piece = sample.encode("utf-8")
+        assert list(encoding._bpe(piece)) == reference_bpe(ranks, piece)
+
+
+def test_heap_merge_matches_scan_merge_on_long_pieces(ranks):
+    encoding = BPEEncoding("cl100k_base", ranks)
+    rng = random.Random(5)
+    for _ in range(30):
+        piece = "".join(rng.choice(CORPUS) for _ in range(rng.randint(30, 400))).encode("utf-8")
+        assert list(encoding._bpe_heap(piece)) == reference_bpe(ranks, piece)
+
+
+def test_encode_decode_roundtrip_and_count(ranks):
+    encoding = BPEEncoding("cl100k_base", ranks)
+    for text in [CORPUS, "  leading spaces\r\n\r\ntrailing   ", "混合 mixed 文本 123456789 😀😀", ""]:
+        tokens = encoding.encode(text)
+        assert encoding.decode(tokens) == text
+        assert encoding.count(text) == len(tokens)
+    # 训练语料中的高频词被合并为更少的 token
+    assert encoding.count("Hello world") < len("Hello world".encode("utf-8"))
+    assert encoding.cache_info().hits > 0
+
+
+def test_fallback_pretokenizer_splits_like_cl100k(ranks):
+    encoding = BPEEncoding("cl100k_base", ranks)
+    assert encoding._pattern.findall("Hello world's 12345 中文\n\n") == [
+        "Hello", " world", "'s", " ", "123", "45", " 中文", "\n\n"
+    ]
+    # 非十进制的数字字符（上标、带圈数字、罗马数字）与 \p{N} 一样按数字切分，不并入字母
+    assert encoding._pattern.findall("x² ①② Ⅻ ٣٤") == ["x", "²", " ", "①②", " ", "Ⅻ", " ", "٣٤"]
+    o200k = BPEEncoding("o200k_base", ranks)
+    assert o200k._pattern.findall("Ab² x①②③④") == ["Ab", "²", " x", "①②③", "④"]
+
+
+def test_load_tiktoken_bpe(vocab_dir, ranks):
+    assert load_tiktoken_bpe(vocab_dir / "cl100k_base.tiktoken") == ranks
+
+
+def test_model_to_encoding():
+    assert TokenizerRegistry.encoding_name_for_model("gpt-4o-mini") == "o200k_base"
+    assert TokenizerRegistry.encoding_name_for_model("o3-mini") == "o200k_base"
+    assert TokenizerRegistry.encoding_name_for_model("gpt-4-turbo") == "cl100k_base"
+    assert TokenizerRegistry.encoding_name_for_model("GPT-3.5-Turbo-0125") == "cl100k_base"
+    assert TokenizerRegistry.encoding_name_for_model("deepseek-chat") is None
+    assert TokenizerRegistry.encoding_name_for_model(None) is None
+
+
+def test_registry_uses_default_encoding_and_caches_missing(vocab_dir):
+    registry = TokenizerRegistry(str(vocab_dir), default_encoding="cl100k_base")
+    encoding = registry.for_model("deepseek-chat")
+    assert encoding is not None and encoding.name == "cl100k_base"
+    assert registry.for_model("gpt-4") is encoding
+    # o200k 词表不存在
+    assert registry.for_model("gpt-4o") is None
+    assert registry._encodings["o200k_base"] is None
+
+    assert TokenizerRegistry(str(vocab_dir), default_encoding="").for_model("deepseek-chat") is None
+
+
+def test_count_tokens_falls_back_to_estimate(tmp_path, vocab_dir, monkeypatch):
+    text = "提示词 prompt engineering 12345678"
+
+    monkeypatch.setattr(tokenizer_registry, "vocab_dir", tmp_path / "missing")
+    tokenizer_registry.clear()
+    assert token_counter.count_tokens(text, "gpt-4") == token_counter.estimate_tokens(text)
+
+    monkeypatch.setattr(tokenizer_registry, "vocab_dir", vocab_dir)
+    tokenizer_registry.clear()
+    try:
+        encoding = tokenizer_registry.for_model("gpt-4")
+        assert token_counter.count_tokens(text, "gpt-4") == len(encoding.encode(text))
+        assert token_counter.count_tokens("", "gpt-4") == 0
+    finally:
+        tokenizer_registry.clear()
@@ -310,8 +310,8 @@ export const runAPI = {
 // A/B 测试 API
 export const abtestAPI = {
   // 创建 A/B 测试
-  create: (data: ABTestData & { enable_evaluation?: boolean, generate_report?: boolean }) => 
-    request.post<APIResponse<any>>('/api/abtest', data),
+  create: (data: ABTestData & { enable_evaluation?: boolean, generate_report?: boolean, sync?: boolean }) => 
+    request.post<APIResponse<any>>('/api/abtest', { sync: true, ...data }),
   
   // 获取测试列表
   getList: (params?: { skip?: number, limit?: number }) => 
@@ -347,8 +347,9 @@ export const batchTestAPI = {
     model?: string
     temperature?: number
     enable_evaluation?: boolean
+    sync?: boolean
   }) => 
-    request.post<APIResponse<any>>('/api/batch-test', data),
+    request.post<APIResponse<any>>('/api/batch-test', { sync: true, ...data }),
   
   // 获取批量测试列表
   getList: (params?: { skip?: number, limit?: number }) => 
@@ -394,7 +395,12 @@ export const testSuiteAPI = {
     model?: string
     temperature?: number
     enable_evaluation?: boolean
-  }) => request.post<APIResponse<any>>(`/api/test-suite/${id}/run`, data),
+    force_refresh?: boolean
+    sync?: boolean
+  }) => request.post<APIResponse<any>>(`/api/test-suite/${id}/run`, { sync: true, ...data }),
+
+  invalidateBaselines: (promptId: number, version?: number) =>
+    request.delete<APIResponse<{ deleted: number }>>(`/api/test-suite/prompt/${promptId}/baselines`, { params: { version } }),
 
   getRunDetail: (id: number) =>
     request.get<APIResponse<any>>(`/api/test-suite/runs/${id}`),
@@ -403,6 +409,21 @@ export const testSuiteAPI = {
     request.get<APIResponse<{ items: any[], total: number }>>('/api/test-suite/runs', { params })
 }
 
+// 后台任务 API
+export const jobAPI = {
+  // 获取任务列表
+  getList: (params?: { job_type?: string, status?: string, skip?: number, limit?: number }) =>
+    request.get<APIResponse<{ items: any[], total: number }>>('/api/jobs/list', { params }),
+
+  // 获取任务状态和进度
+  getDetail: (id: number) =>
+    request.get<APIResponse<any>>(`/api/jobs/${id}`),
+
+  // 取消任务
+  cancel: (id: number) =>
+    request.post<APIResponse<any>>(`/api/jobs/${id}/cancel`)
+}
+
 // Prompt 优化 API
 export const optimizationAPI = {
   // 分析并优化 Prompt